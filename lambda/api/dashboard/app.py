@@ -31,6 +31,17 @@ LISTING_FETCH_SIZE = int(os.environ.get('LISTING_FETCH_SIZE', '300'))
 s3_bucket = os.environ.get('OUTPUT_BUCKET', 'real-estate-ai-data')
 s3_client = boto3.client('s3', region_name=get_aws_region())
 
+# Where card thumbnails are served from (unset: cards use the listing photos)
+THUMBNAIL_BASE_URL = os.environ.get('THUMBNAIL_BASE_URL', '')
+
+
+def card_image_urls(property_data):
+    """Card thumbnails when they are served from THUMBNAIL_BASE_URL, otherwise the listing photos"""
+    thumbnail_urls = property_data.get('thumbnail_urls') or []
+    if THUMBNAIL_BASE_URL and thumbnail_urls and all(url.startswith(THUMBNAIL_BASE_URL) for url in thumbnail_urls):
+        return thumbnail_urls
+    return property_data.get('image_urls', [])
+
 
 def decimal_to_float(obj):
     """Convert DynamoDB Decimal objects to Python float for JSON serialization"""
@@ -181,7 +192,7 @@ def lambda_handler(event, context):
                 'FilterExpression': filter_expr,
                 'ProjectionExpression': 'property_id, price, size_sqft, beds, baths, '
                                        'city, #st, zip_code, address, property_type, '
-                                       'listing_url, image_urls, image_count, '
+                                       'listing_url, image_urls, image_count, thumbnail_urls, '
                                        'price_per_sqft, city_discount_pct, city_median_price_per_sqft, '
                                        'days_on_market, analysis_date, first_seen_date, '
                                        'year_built, lot_size_sqft, hoa_fee, mls_id',
@@ -220,8 +231,8 @@ def lambda_handler(event, context):
             # Convert Decimal to float
             property_data = decimal_to_float(item)
 
-            # Add first image URL if available
-            image_urls = property_data.get('image_urls', [])
+            # Add first image URL if available (the card-sized thumbnail when there is one)
+            image_urls = card_image_urls(property_data)
             if image_urls and len(image_urls) > 0:
                 property_data['image_url'] = image_urls[0]
 
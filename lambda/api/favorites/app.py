@@ -22,6 +22,17 @@ lambda_client = boto3.client('lambda', region_name=get_aws_region())
 preferences_table = dynamodb.Table(os.environ.get('PREFERENCES_TABLE', 'real-estate-ai-user-preferences'))
 properties_table = dynamodb.Table(os.environ.get('PROPERTIES_TABLE', 'real-estate-ai-properties'))
 
+# Where card thumbnails are served from (unset: cards use the listing photos)
+THUMBNAIL_BASE_URL = os.environ.get('THUMBNAIL_BASE_URL', '')
+
+
+def card_image_urls(property_data):
+    """Card thumbnails when they are served from THUMBNAIL_BASE_URL, otherwise the listing photos"""
+    thumbnail_urls = property_data.get('thumbnail_urls') or []
+    if THUMBNAIL_BASE_URL and thumbnail_urls and all(url.startswith(THUMBNAIL_BASE_URL) for url in thumbnail_urls):
+        return thumbnail_urls
+    return property_data.get('image_urls', [])
+
 
 def decimal_to_float(obj):
     """Convert DynamoDB Decimal objects to Python float for JSON serialization"""
@@ -182,7 +193,7 @@ def add_preference(event, user_id, preference_type):
         ).get('Item', {})
 
         # Create preference record with US property fields
-        image_urls = property_data.get('image_urls', [])
+        image_urls = card_image_urls(property_data)
         first_image = image_urls[0] if image_urls else None
 
         preference_item = {
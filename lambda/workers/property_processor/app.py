@@ -6,19 +6,38 @@ Scrapes property details and saves to DynamoDB
 import os
 import time
 import json
-import random
 import threading
+import uuid
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from queue import Queue
+from queue import Queue, Empty
 from decimal import Decimal
 import boto3
+from botocore.exceptions import ClientError
 
 # Import core scraper functions
 from core_scraper import (
-    create_session, extract_realtor_property_details,
-    extract_property_id_from_url, create_property_id_key
+    create_session, get_session_pool, fetch_redfin_property_page, extract_property_id_from_url,
+    create_property_id_key, detail_page_hash
 )
+from rate_limiter import RateLimiter
+from async_pipeline import ASYNC_SESSION_AVAILABLE, process_urls_async
+from batch_planner import DEFAULT_CLAIM_INCREMENT, BatchPlanner
+from circuit_breaker import DEFAULT_OPEN_SECONDS, DEFAULT_THRESHOLD, get_circuit_breaker
+from parse_pool import ParsePool, parse_page_bytes
+from html_archive import get_html_archive
+from write_buffer import WriteBuffer, batch_write_items, mark_urls_processed, processed_url_update
+from property_ids import assign_canonical_ids, merge_duplicate_properties
+from thumbnails import get_thumbnail_store, process_thumbnails
+from refetch_policy import DEFAULT_REFETCH_BUDGET, run_refetch_policy
+from retry_schedule import DEFAULT_MAX_ATTEMPTS, classify_error, schedule_retries
+from url_leases import (
+    DEFAULT_LEASE_SECONDS, PENDING_INDEX, backfill_pending_index, claim_listed_urls, claim_pending_urls,
+    claimed_url_info, is_conditional_check_failure, release_leases
+)
+
+# Seconds kept back from the SQS invocation's remaining time for the final write flush
+SQS_RUNTIME_MARGIN_SECONDS = 60
 
 
 def get_aws_region():
@@ -48,44 +67,6 @@ class SessionLogger:
         self._logger.debug(f"[{self.session_id}] {message}")
 
 
-class RateLimiter:
-    """Thread-safe rate limiter"""
-
-    def __init__(self, min_delay=3.0, max_delay=8.0):
-        self.min_delay = min_delay
-        self.max_delay = max_delay
-        self.last_request_time = 0
-        self.lock = threading.Lock()
-        self.consecutive_errors = 0
-        self.backoff_multiplier = 1.0
-
-    def wait(self):
-        """Wait for appropriate delay between requests"""
-        with self.lock:
-            current_time = time.time()
-            base_delay = random.uniform(self.min_delay, self.max_delay)
-            delay = base_delay * self.backoff_multiplier
-
-            elapsed = current_time - self.last_request_time
-            if elapsed < delay:
-                time.sleep(delay - elapsed)
-
-            self.last_request_time = time.time()
-
-    def record_error(self, is_rate_limit=False):
-        """Record error and increase backoff"""
-        with self.lock:
-            self.consecutive_errors += 1
-            if is_rate_limit or self.consecutive_errors > 3:
-                self.backoff_multiplier = min(self.backoff_multiplier * 1.5, 5.0)
-
-    def record_success(self):
-        """Record success and reduce backoff"""
-        with self.lock:
-            self.consecutive_errors = 0
-            self.backoff_multiplier = max(self.backoff_multiplier * 0.9, 1.0)
-
-
 def setup_dynamodb():
     """Setup DynamoDB resources"""
     region = get_aws_region()
@@ -100,27 +81,43 @@ def setup_dynamodb():
     return properties_table, url_tracking_table
 
 
+def setup_preferences_table(event):
+    """User preferences table from the event or USER_PREFERENCES_TABLE (None if not configured)"""
+    table_name = event.get('preferences_table', os.environ.get('USER_PREFERENCES_TABLE', ''))
+    if not table_name:
+        return None
+    return boto3.resource('dynamodb', region_name=get_aws_region()).Table(table_name)
+
+
 def scan_unprocessed_urls(url_table, limit=100, logger=None):
-    """Get unprocessed URLs from tracking table"""
+    """
+    Get unprocessed URLs from tracking table with a full-table scan
+
+    Fallback for tables without the pending-index (see claim_urls). Scan's
+    Limit counts items read, not matches, so pages are followed until limit
+    URLs are found or the table ends. URLs whose next retry is not due are skipped.
+    """
     urls = []
+    Attr = boto3.dynamodb.conditions.Attr
 
     try:
         scan_kwargs = {
-            'FilterExpression': boto3.dynamodb.conditions.Attr('processed').eq(''),
-            'Limit': limit
+            'FilterExpression': Attr('processed').eq('') & (
+                Attr('next_attempt_at').not_exists() | Attr('next_attempt_at').lt(int(time.time()))
+            )
         }
 
-        response = url_table.scan(**scan_kwargs)
-        items = response.get('Items', [])
+        while len(urls) < limit:
+            response = url_table.scan(**scan_kwargs)
 
-        for item in items:
-            url = item.get('url')
-            if url:
-                urls.append({
-                    'url': url,
-                    'city': item.get('city', ''),
-                    'price': item.get('price', 0)
-                })
+            for item in response.get('Items', []):
+                url = item.get('url')
+                if url and len(urls) < limit:
+                    urls.append(claimed_url_info(item))
+
+            if 'LastEvaluatedKey' not in response:
+                break
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
 
         if logger:
             logger.info(f"Found {len(urls)} unprocessed URLs")
@@ -132,18 +129,38 @@ def scan_unprocessed_urls(url_table, limit=100, logger=None):
     return urls
 
 
-def mark_url_processed(url, url_table, logger=None):
-    """Mark URL as processed"""
+def claim_urls(url_table, config, owner, logger=None):
+    """
+    Lease up to batch_size pending URLs from the pending-index
+
+    Falls back to scanning for processed = '' when the index does not exist yet
+    """
     try:
-        url_table.update_item(
-            Key={'url': url},
-            UpdateExpression="SET #p = :p",
-            ExpressionAttributeNames={'#p': 'processed'},
-            ExpressionAttributeValues={':p': 'Y'}
+        return claim_pending_urls(
+            url_table, owner, config['batch_size'], config.get('lease_seconds', DEFAULT_LEASE_SECONDS), logger
         )
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ('ValidationException', 'ResourceNotFoundException'):
+            raise
+        if logger:
+            logger.warning(f"{PENDING_INDEX} unavailable ({str(e)}), scanning for unprocessed URLs")
+        return scan_unprocessed_urls(url_table, limit=config['batch_size'], logger=logger)
+
+
+def mark_url_processed(url, url_table, logger=None, url_info=None):
+    """
+    Mark URL as processed (which also takes it out of the pending-index)
+
+    The content_hash and fetched_at of url_info, when set, are recorded for the refetch policy
+    """
+    try:
+        url_table.update_item(**processed_url_update(dict(url_info or {}, url=url)))
         return True
     except Exception as e:
-        if logger:
+        if is_conditional_check_failure(e):
+            if logger:
+                logger.info(f"Not marking {url} processed: no longer leased to this worker")
+        elif logger:
             logger.error(f"Error marking URL processed: {str(e)}")
         return False
 
@@ -159,8 +176,211 @@ def convert_floats_to_decimal(obj):
     return obj
 
 
-def save_property_to_dynamodb(property_data, table, logger=None):
-    """Save property data to DynamoDB"""
+# Attributes the processor owns on META items, compared field by field on upsert.
+# Anything else on the item (price tracking, analyzer output, first_seen_date) is left alone.
+PROPERTY_RECORD_FIELDS = (
+    'listing_url', 'listing_status',
+    'price', 'price_per_sqft', 'size_sqft', 'beds', 'baths', 'lot_size_sqft', 'lot_size_acres',
+    'year_built', 'property_type',
+    'address', 'city', 'state', 'zip_code', 'latitude', 'longitude',
+    'hoa_fee', 'mls_number', 'redfin_id', 'listing_source', 'date_listed', 'date_updated', 'days_on_market',
+    'parking', 'amenities', 'description',
+    'image_count', 'image_urls',
+)
+
+
+def build_property_record(property_data):
+    """Build the DynamoDB META record for extracted property data"""
+    now = datetime.now()
+    record = {
+        'property_id': property_data['property_id'],
+        'sort_key': 'META',
+        'listing_url': property_data.get('listing_url', ''),
+        'listing_status': 'active',
+        'analysis_date': now.isoformat(),
+        'first_seen_date': now.isoformat(),
+
+        # Core property fields
+        'price': property_data.get('price', 0),
+        'price_per_sqft': property_data.get('price_per_sqft', 0),
+        'size_sqft': property_data.get('size_sqft', 0),
+        'beds': property_data.get('beds', 0),
+        'baths': property_data.get('baths', 0),
+        'lot_size_sqft': property_data.get('lot_size_sqft', 0),
+        'lot_size_acres': property_data.get('lot_size_acres', 0),
+        'year_built': property_data.get('year_built', 0),
+        'property_type': property_data.get('property_type', ''),
+
+        # Location
+        'address': property_data.get('address', ''),
+        'city': property_data.get('city', ''),
+        'state': property_data.get('state', ''),
+        'zip_code': property_data.get('zip_code', ''),
+        'latitude': property_data.get('latitude', 0),
+        'longitude': property_data.get('longitude', 0),
+
+        # Listing details
+        'hoa_fee': property_data.get('hoa_fee', 0),
+        'mls_number': property_data.get('mls_number', ''),
+        'redfin_id': property_data.get('redfin_id', ''),
+        'listing_source': property_data.get('listing_source', ''),
+        'date_listed': property_data.get('date_listed', ''),
+        'date_updated': property_data.get('date_updated', ''),
+        'days_on_market': property_data.get('days_on_market', 0),
+
+        # Amenities
+        'parking': property_data.get('parking', ''),
+        'amenities': property_data.get('amenities', []),
+        'description': property_data.get('description', '')[:500] if property_data.get('description') else '',
+
+        # Media
+        'image_count': property_data.get('image_count', 0),
+        'image_urls': property_data.get('image_urls', [])[:10],  # Store first 10
+
+        # Metadata
+        'extraction_timestamp': property_data.get('extraction_timestamp', now.isoformat()),
+    }
+
+    # Remove empty values and convert floats to Decimal
+    # Keep empty lists as they're valid, just remove None, empty strings, and zeros
+    record = {k: v for k, v in record.items() if v is not None and v != '' and v != 0 and v != []}
+    record = convert_floats_to_decimal(record)
+
+    # Ensure required keys are present
+    record['property_id'] = property_data['property_id']
+    record['sort_key'] = 'META'
+
+    return record
+
+
+def stored_record_projection():
+    """ProjectionExpression and names for reading the processor-owned attributes of META items"""
+    fields = ('property_id',) + PROPERTY_RECORD_FIELDS
+    names = {f"#f{i}": field for i, field in enumerate(fields)}
+    return ', '.join(names), names
+
+
+def get_stored_record(property_id, table):
+    """GetItem the processor-owned attributes of a META item (None if it does not exist)"""
+    projection, names = stored_record_projection()
+    response = table.get_item(
+        Key={'property_id': property_id, 'sort_key': 'META'},
+        ProjectionExpression=projection,
+        ExpressionAttributeNames=names
+    )
+    return response.get('Item')
+
+
+def get_stored_records(property_ids, table, logger=None):
+    """
+    BatchGetItem the processor-owned attributes of META items (100 keys per call)
+
+    Returns dict of property_id -> item for the properties that exist
+    """
+    client = table.meta.client
+    projection, names = stored_record_projection()
+    property_ids = list(dict.fromkeys(property_ids))
+    found = {}
+
+    for start in range(0, len(property_ids), 100):
+        request_items = {
+            table.name: {
+                'Keys': [{'property_id': pid, 'sort_key': 'META'} for pid in property_ids[start:start + 100]],
+                'ProjectionExpression': projection,
+                'ExpressionAttributeNames': names
+            }
+        }
+
+        for attempt in range(5):
+            response = client.batch_get_item(RequestItems=request_items)
+            for item in response.get('Responses', {}).get(table.name, []):
+                found[item['property_id']] = item
+
+            request_items = response.get('UnprocessedKeys') or {}
+            if not request_items:
+                break
+            time.sleep(0.1 * (2 ** attempt))
+
+        if request_items:
+            raise RuntimeError(f"{len(request_items[table.name]['Keys'])} keys unprocessed after retries")
+
+    if logger:
+        logger.debug(f"Read {len(found)}/{len(property_ids)} stored property records")
+
+    return found
+
+
+def build_property_update(record, existing):
+    """
+    Build UpdateItem arguments that write only the attributes that changed
+
+    Extracted fields that differ are SET, fields that are now empty are
+    REMOVEd, and first_seen_date is only set if missing. Returns None when
+    the stored item already matches the record.
+    """
+    changed = [f for f in PROPERTY_RECORD_FIELDS if f in record and existing.get(f) != record[f]]
+    removed = [f for f in PROPERTY_RECORD_FIELDS if f not in record and f in existing]
+    if not changed and not removed:
+        return None
+
+    names = {'#analysis_date': 'analysis_date', '#first_seen': 'first_seen_date'}
+    values = {':now': record['analysis_date']}
+    assignments = ['#analysis_date = :now', '#first_seen = if_not_exists(#first_seen, :now)']
+
+    if 'extraction_timestamp' in record:
+        names['#extracted'] = 'extraction_timestamp'
+        values[':extracted'] = record['extraction_timestamp']
+        assignments.append('#extracted = :extracted')
+
+    for i, field in enumerate(changed):
+        names[f"#s{i}"] = field
+        values[f":s{i}"] = record[field]
+        assignments.append(f"#s{i} = :s{i}")
+
+    # New photos make the stored thumbnails stale; the thumbnail stage rebuilds them
+    if 'image_urls' in changed or 'image_urls' in removed:
+        removed = removed + ['thumbnail_urls', 'thumbnail_attempts']
+
+    expression = 'SET ' + ', '.join(assignments)
+    if removed:
+        for i, field in enumerate(removed):
+            names[f"#r{i}"] = field
+        expression += ' REMOVE ' + ', '.join(f"#r{i}" for i in range(len(removed)))
+
+    return {
+        'UpdateExpression': expression,
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values
+    }
+
+
+def write_property_record(record, existing, table):
+    """
+    Create, update or skip one META record given its stored item (None if new)
+
+    Returns the write performed: 'created', 'updated' or 'unchanged'
+    """
+    if existing is None:
+        table.put_item(Item=record)
+        return 'created'
+
+    update = build_property_update(record, existing)
+    if update is None:
+        return 'unchanged'
+
+    table.update_item(Key={'property_id': record['property_id'], 'sort_key': 'META'}, **update)
+    return 'updated'
+
+
+def save_property_to_dynamodb(property_data, table, logger=None, upsert=True):
+    """
+    Save property data to DynamoDB
+
+    With upsert (the default) only changed attributes are written and an
+    unchanged page sends no write; upsert=False overwrites the whole item.
+
+    Returns the write performed ('created', 'updated', 'unchanged', 'replaced') or False
+    """
     try:
         if 'error' in property_data:
             return False
@@ -170,72 +390,20 @@ def save_property_to_dynamodb(property_data, table, logger=None):
                 logger.warning("No property_id, skipping save")
             return False
 
-        # Build DynamoDB record
-        now = datetime.now()
-        record = {
-            'property_id': property_data['property_id'],
-            'sort_key': 'META',
-            'listing_url': property_data.get('listing_url', ''),
-            'listing_status': 'active',
-            'analysis_date': now.isoformat(),
-            'first_seen_date': now.isoformat(),
-
-            # Core property fields
-            'price': property_data.get('price', 0),
-            'price_per_sqft': property_data.get('price_per_sqft', 0),
-            'size_sqft': property_data.get('size_sqft', 0),
-            'beds': property_data.get('beds', 0),
-            'baths': property_data.get('baths', 0),
-            'lot_size_sqft': property_data.get('lot_size_sqft', 0),
-            'lot_size_acres': property_data.get('lot_size_acres', 0),
-            'year_built': property_data.get('year_built', 0),
-            'property_type': property_data.get('property_type', ''),
-
-            # Location
-            'address': property_data.get('address', ''),
-            'city': property_data.get('city', ''),
-            'state': property_data.get('state', ''),
-            'zip_code': property_data.get('zip_code', ''),
-            'latitude': property_data.get('latitude', 0),
-            'longitude': property_data.get('longitude', 0),
-
-            # Listing details
-            'hoa_fee': property_data.get('hoa_fee', 0),
-            'mls_number': property_data.get('mls_number', ''),
-            'redfin_id': property_data.get('redfin_id', ''),
-            'listing_source': property_data.get('listing_source', ''),
-            'date_listed': property_data.get('date_listed', ''),
-            'date_updated': property_data.get('date_updated', ''),
-            'days_on_market': property_data.get('days_on_market', 0),
-
-            # Amenities
-            'parking': property_data.get('parking', ''),
-            'amenities': property_data.get('amenities', []),
-            'description': property_data.get('description', '')[:500] if property_data.get('description') else '',
-
-            # Media
-            'image_count': property_data.get('image_count', 0),
-            'image_urls': property_data.get('image_urls', [])[:10],  # Store first 10
-
-            # Metadata
-            'extraction_timestamp': property_data.get('extraction_timestamp', now.isoformat()),
-        }
-
-        # Remove empty values and convert floats to Decimal
-        # Keep empty lists as they're valid, just remove None, empty strings, and zeros
-        record = {k: v for k, v in record.items() if v is not None and v != '' and v != 0 and v != []}
-        record = convert_floats_to_decimal(record)
+        # Re-scrapes of a known home write to the key it was first stored under
+        assign_canonical_ids([property_data], table, logger)
+        record = build_property_record(property_data)
 
-        # Ensure required keys are present
-        record['property_id'] = property_data['property_id']
-        record['sort_key'] = 'META'
-
-        table.put_item(Item=record)
+        if upsert:
+            write = write_property_record(record, get_stored_record(record['property_id'], table), table)
+        else:
+            table.put_item(Item=record)
+            write = 'replaced'
 
         if logger:
-            logger.debug(f"Saved property {property_data['property_id']}")
+            logger.debug(f"Saved property {property_data['property_id']} ({write})")
 
-        return True
+        return write
 
     except Exception as e:
         if logger:
@@ -243,39 +411,161 @@ def save_property_to_dynamodb(property_data, table, logger=None):
         return False
 
 
-def process_single_url(url_info, session, rate_limiter, properties_table, url_table, logger=None):
-    """Process a single URL"""
+def write_property_batch(batch, properties_table, url_table, logger=None, mark_processed=True, upsert=True):
+    """
+    Write a batch of extracted properties, then mark their URLs processed
+
+    New properties go out in 25-item BatchWriteItem calls and the batch's URLs
+    are flipped to processed the same way. With upsert, properties that
+    already exist are read back in one BatchGetItem and only their changed
+    attributes are written (nothing at all if unchanged); upsert=False
+    overwrites every item.
+
+    Args:
+        batch: List of (url_info, property_data); property_data None is a
+            page unchanged since its last fetch - only its URL is marked processed
+        mark_processed: False leaves URL tracking untouched (archive re-extraction)
+
+    Returns:
+        One result dict ({'success', 'url', 'error'}) per batch item
+    """
+    outcomes = []
+    records = []
+    saved = []
+
+    try:
+        # Re-scrapes of a known home write to the key it was first stored under
+        assign_canonical_ids([property_data for _, property_data in batch if property_data], properties_table, logger)
+    except Exception as e:
+        if logger:
+            logger.error(f"Error resolving property IDs: {str(e)}")
+        return [{'success': False, 'url': url_info['url'], 'error': 'Failed to save'} for url_info, _ in batch]
+
+    for url_info, property_data in batch:
+        if property_data is None:
+            saved.append((url_info, 'page_unchanged'))
+        elif not property_data.get('property_id'):
+            if logger:
+                logger.warning("No property_id, skipping save")
+            outcomes.append({'success': False, 'url': url_info['url'], 'error': 'Failed to save',
+                             'error_class': 'parse'})
+        else:
+            records.append((url_info, build_property_record(property_data)))
+
+    try:
+        stored = get_stored_records([r['property_id'] for _, r in records], properties_table, logger) if upsert else {}
+        new_items = [record for _, record in records if record['property_id'] not in stored]
+        unwritten = batch_write_items(
+            properties_table.meta.client, properties_table.name, new_items, ('property_id', 'sort_key'), logger
+        )
+    except Exception as e:
+        if logger:
+            logger.error(f"Error saving property batch: {str(e)}")
+        return outcomes + [{'success': False, 'url': u['url'], 'error': 'Failed to save'} for u, _ in records + saved]
+
+    unwritten_ids = {item['property_id'] for item in unwritten}
+
+    for url_info, record in records:
+        if record['property_id'] in unwritten_ids:
+            outcomes.append({'success': False, 'url': url_info['url'], 'error': 'Failed to save'})
+            continue
+
+        if record['property_id'] not in stored:
+            write = 'created' if upsert else 'replaced'
+        else:
+            try:
+                write = write_property_record(record, stored[record['property_id']], properties_table)
+            except Exception as e:
+                if logger:
+                    logger.error(f"Error updating property {record['property_id']}: {str(e)}")
+                outcomes.append({'success': False, 'url': url_info['url'], 'error': 'Failed to save'})
+                continue
+
+        saved.append((url_info, write))
+
+    if mark_processed and saved:
+        try:
+            # URLs left unmarked are simply picked up (and upserted unchanged) next run
+            mark_urls_processed([url_info for url_info, _ in saved], url_table, logger)
+        except Exception as e:
+            if logger:
+                logger.error(f"Error marking batch URLs processed: {str(e)}")
+
+    for url_info, write in saved:
+        outcomes.append({'success': True, 'url': url_info['url'], 'write': write})
+
+    if logger:
+        logger.debug(f"Saved batch of {len(saved)}/{len(records)} properties")
+
+    return outcomes
+
+
+def process_single_url(url_info, session, rate_limiter, properties_table, url_table, logger=None,
+                       parse_pool=None, html_archive=None, upsert=True, write_buffer=None):
+    """
+    Process a single URL
+
+    A page whose normalized hash (detail_page_hash) matches the one recorded
+    at its last fetch (url_info['content_hash']) is marked processed without parsing or writing.
+    With a write_buffer the extracted property is queued for a batched write
+    and None is returned; the buffer reports the URL's result when it flushes.
+    """
     url = url_info['url']
 
     try:
-        # Rate limit
-        rate_limiter.wait()
+        # Only the fetch holds a slot (paced, and bounded by the adaptive concurrency limit)
+        with rate_limiter.slot():
+            html_bytes, property_data = fetch_redfin_property_page(url, session, logger)
+
+        page_unchanged = False
+        if html_bytes is not None:
+            page_hash = detail_page_hash(html_bytes)
+            page_unchanged = page_hash == url_info.get('content_hash')
+            url_info['content_hash'] = page_hash
+            url_info['fetched_at'] = int(time.time())
+
+            if page_unchanged:
+                property_data = None
+            else:
+                if html_archive:
+                    html_archive.put(url, html_bytes, url_info.get('city'))
+                if parse_pool:
+                    property_data = parse_pool.parse(html_bytes, url)
+                else:
+                    property_data = parse_page_bytes(html_bytes, url)
 
-        # Extract property details
-        property_data = extract_realtor_property_details(url, session, logger)
+        if page_unchanged or (property_data and 'error' not in property_data):
+            rate_limiter.record_success()
 
-        if property_data and 'error' not in property_data:
             # Add city from tracking table if not extracted
-            if not property_data.get('city') and url_info.get('city'):
+            if property_data and not property_data.get('city') and url_info.get('city'):
                 property_data['city'] = url_info['city']
 
+            if write_buffer:
+                write_buffer.add(url_info, property_data)
+                return None
+
+            if page_unchanged:
+                mark_url_processed(url, url_table, logger, url_info)
+                return {'success': True, 'url': url, 'write': 'page_unchanged'}
+
             # Save to DynamoDB
-            saved = save_property_to_dynamodb(property_data, properties_table, logger)
+            saved = save_property_to_dynamodb(property_data, properties_table, logger, upsert)
 
             if saved:
-                rate_limiter.record_success()
-                mark_url_processed(url, url_table, logger)
-                return {'success': True, 'url': url}
+                mark_url_processed(url, url_table, logger, url_info)
+                return {'success': True, 'url': url, 'write': saved}
             else:
                 return {'success': False, 'url': url, 'error': 'Failed to save'}
 
         else:
             error = property_data.get('error', 'Unknown error') if property_data else 'No data'
-            if '403' in str(error):
-                rate_limiter.record_error(is_rate_limit=True)
+            error_class = classify_error(error)
+            if error_class == 'blocked':
+                rate_limiter.record_error(is_rate_limit=True, retry_after=property_data.get('retry_after'))
             else:
                 rate_limiter.record_error()
-            return {'success': False, 'url': url, 'error': error}
+            return {'success': False, 'url': url, 'error': error, 'error_class': error_class}
 
     except Exception as e:
         rate_limiter.record_error()
@@ -284,57 +574,541 @@ def process_single_url(url_info, session, rate_limiter, properties_table, url_ta
         return {'success': False, 'url': url, 'error': str(e)}
 
 
-def process_urls(urls, config, logger=None):
-    """Process multiple URLs"""
-    if not urls:
-        return {'processed': 0, 'success': 0, 'failed': 0}
+def record_result(results, result, total, lock, logger=None):
+    """Aggregate one URL result into the shared results dict"""
+    with lock:
+        results['processed'] += 1
 
-    properties_table, url_table = setup_dynamodb()
+        if result.get('success'):
+            results['success'] += 1
+            if result.get('write'):
+                writes = results.setdefault('writes', {})
+                writes[result['write']] = writes.get(result['write'], 0) + 1
+            if logger:
+                logger.info(f"Processed {results['processed']}/{total}: {result['url'][:50]}...")
+        else:
+            results['failed'] += 1
+            results['errors'].append({
+                'url': result['url'],
+                'error': result.get('error', 'Unknown'),
+                'error_class': result.get('error_class')
+            })
 
-    rate_limiter = RateLimiter(
-        min_delay=config.get('min_delay', 3.0),
-        max_delay=config.get('max_delay', 8.0)
-    )
 
-    session = create_session(logger)
-    results = {'processed': 0, 'success': 0, 'failed': 0, 'errors': []}
+def process_url_queue(url_queue, results, total, deadline, rate_limiter, lock, logger=None,
+                      parse_pool=None, html_archive=None, upsert=True, write_buffer=None, breaker=None,
+                      tables=None):
+    """
+    Worker loop: take URLs off the queue until it is empty, the deadline passes or the breaker opens
 
-    max_runtime = config.get('max_runtime_seconds', 840)  # 14 minutes default
-    start_time = time.time()
+    Each worker has its own session and table resources (neither is
+    thread-safe); the rate limiter, deadline, breaker, write buffer and
+    results are shared.
+
+    Args:
+        tables: This worker's (properties_table, url_table), created before
+            the worker threads start (default: created here)
+    """
+    properties_table, url_table = tables or setup_dynamodb()
+    session = create_session(logger)
 
     try:
-        for url_info in urls:
-            # Check runtime
-            elapsed = time.time() - start_time
-            if elapsed > max_runtime:
-                if logger:
-                    logger.info(f"Max runtime reached ({elapsed:.0f}s), stopping")
+        while True:
+            if time.time() > deadline:
+                break
+            if breaker and breaker.is_open():
+                break
+
+            try:
+                url_info = url_queue.get_nowait()
+            except Empty:
                 break
 
             result = process_single_url(
                 url_info, session, rate_limiter,
-                properties_table, url_table, logger
+                properties_table, url_table, logger, parse_pool, html_archive, upsert, write_buffer
             )
+            if result:
+                record_result(results, result, total, lock, logger)
+            # A buffered write returns None: the fetch got through
+            if breaker and result and result.get('error_class') == 'blocked':
+                breaker.record_block(result.get('error'))
+            elif breaker and (not result or result.get('success')):
+                breaker.record_success()
+
+            # Swap a blocked session for a fresh one (new cookies, new connection)
+            if getattr(session, 'blocked', False):
+                session.close()
+                session = create_session(logger)
+
+    finally:
+        session.close()
 
-            results['processed'] += 1
 
-            if result.get('success'):
-                results['success'] += 1
-                if logger:
-                    logger.info(f"Processed {results['processed']}/{len(urls)}: {url_info['url'][:50]}...")
+def create_rate_limiter(config, max_workers=None):
+    """RateLimiter with the configured request pacing"""
+    return RateLimiter(
+        min_delay=config.get('min_delay', 3.0),
+        max_delay=config.get('max_delay', 8.0),
+        max_concurrency=max_workers or max(1, int(config.get('max_workers', 1)))
+    )
+
+
+def create_parse_pool(config, logger=None):
+    """ParsePool with the configured process count, or None when parsing stays inline"""
+    if int(config.get('parse_processes', 0)) > 0:
+        return ParsePool(config['parse_processes'], config.get('detail_extractor'), logger)
+    return None
+
+
+def process_urls(urls, config, logger=None, rate_limiter=None, breaker=None, parse_pool=None, html_archive=None,
+                 worker_tables=None):
+    """
+    Process multiple URLs
+
+    max_workers URLs are in flight at once; request pacing and the adaptive
+    concurrency limit come from one shared RateLimiter, and all workers stop
+    taking new URLs at the same runtime deadline, or as soon as the circuit
+    breaker opens (URLs not started by then are returned as 'unstarted').
+
+    Args:
+        rate_limiter: RateLimiter to keep pacing and backoff across calls
+            (default: a new one per call)
+        breaker: Optional CircuitBreaker shared by all workers
+        parse_pool: ParsePool kept warm across calls and shut down by the
+            caller (default: one per call when parse_processes is set)
+        html_archive: HtmlArchive kept across calls (default: one per call
+            when archiving is configured)
+        worker_tables: Table pairs from create_worker_tables() kept across
+            calls (default: created per call)
+    """
+    if not urls:
+        return {'processed': 0, 'success': 0, 'failed': 0}
+
+    max_workers = max(1, min(int(config.get('max_workers', 1)), len(urls)))
+    rate_limiter = rate_limiter or create_rate_limiter(config, max_workers)
+
+    # Start parse processes before any fetch threads exist
+    owns_parse_pool = parse_pool is None
+    if owns_parse_pool:
+        parse_pool = create_parse_pool(config, logger)
+
+    html_archive = html_archive or get_html_archive(config, logger)
+
+    try:
+        if config.get('engine') == 'async':
+            if ASYNC_SESSION_AVAILABLE:
+                results = process_urls_pipelined(urls, config, rate_limiter, max_workers, logger,
+                                                 parse_pool, html_archive, breaker, worker_tables)
             else:
-                results['failed'] += 1
-                results['errors'].append({
-                    'url': result['url'],
-                    'error': result.get('error', 'Unknown')
-                })
+                if logger:
+                    logger.warning("curl_cffi AsyncSession not available, using the threaded engine")
+                results = process_urls_threaded(urls, config, rate_limiter, max_workers, logger,
+                                                parse_pool, html_archive, breaker, worker_tables)
+        else:
+            results = process_urls_threaded(urls, config, rate_limiter, max_workers, logger,
+                                            parse_pool, html_archive, breaker, worker_tables)
+    finally:
+        if parse_pool and owns_parse_pool:
+            parse_pool.shutdown()
+
+    if parse_pool:
+        results['parse_pool'] = parse_pool.stats()
+        if logger:
+            logger.info(f"Parse pool: {json.dumps(results['parse_pool'])}")
+
+    if html_archive:
+        results['html_archive'] = dict(html_archive.stats)
+        if logger:
+            logger.info(f"HTML archive: {json.dumps(results['html_archive'])}")
+
+    if breaker:
+        results['circuit_breaker'] = breaker.summary()
+
+    return results
+
+
+def create_worker_tables(max_workers):
+    """
+    Create one (properties_table, url_table) pair per worker plus one for the write buffer
+
+    boto3.resource() on the shared default session races when called from
+    several threads at once, and table resources are not thread-safe, so
+    every thread gets its own pair, created up front on the calling thread.
+    The write buffer's pair is the last one.
+    """
+    return [setup_dynamodb() for _ in range(max_workers + 1)]
 
+
+def process_urls_threaded(urls, config, rate_limiter, max_workers, logger=None, parse_pool=None, html_archive=None,
+                          breaker=None, worker_tables=None):
+    """Process URLs on max_workers threads fed from one queue"""
+    results = {'processed': 0, 'success': 0, 'failed': 0, 'errors': []}
+    lock = threading.Lock()
+
+    max_runtime = config.get('max_runtime_seconds', 840)  # 14 minutes default
+    deadline = time.time() + max_runtime
+
+    url_queue = Queue()
+    for url_info in urls:
+        url_queue.put(url_info)
+
+    if logger:
+        logger.info(f"Processing {len(urls)} URLs with {max_workers} worker(s)")
+
+    if not worker_tables or len(worker_tables) <= max_workers:
+        worker_tables = create_worker_tables(max_workers)
+
+    upsert = config.get('write_mode', 'upsert') != 'put'
+    write_buffer = None
+    if config.get('write_buffer', True):
+        # Flushes are serialized by the buffer, so one pair of tables serves every worker
+        properties_table, url_table = worker_tables[-1]
+        write_buffer = WriteBuffer(
+            lambda batch, batch_logger: write_property_batch(batch, properties_table, url_table, batch_logger,
+                                                             upsert=upsert),
+            lambda outcome: record_result(results, outcome, len(urls), lock, logger),
+            batch_size=config.get('write_batch_size', 25),
+            deadline=deadline,
+            flush_window=config.get('flush_window_seconds', 30),
+            logger=logger
+        )
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(
+                    process_url_queue, url_queue, results, len(urls),
+                    deadline, rate_limiter, lock, logger, parse_pool, html_archive, upsert, write_buffer, breaker,
+                    tables
+                )
+                for tables in worker_tables[:max_workers]
+            ]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    if logger:
+                        logger.error(f"Worker failed: {str(e)}")
     finally:
-        session.close()
+        if write_buffer:
+            write_buffer.flush()
+
+    if time.time() > deadline and logger:
+        logger.info(f"Max runtime reached ({max_runtime:.0f}s), stopped with {url_queue.qsize()} URLs left")
+    elif breaker and breaker.is_open() and logger:
+        logger.warning(f"Circuit breaker open, stopped with {url_queue.qsize()} URLs left")
+
+    results['unstarted'] = []
+    while not url_queue.empty():
+        results['unstarted'].append(url_queue.get_nowait())
+
+    results['rate_limiter'] = rate_limiter.stats()
+    results['session_pool'] = dict(get_session_pool().stats)
+    if write_buffer:
+        results['write_buffer'] = dict(write_buffer.stats)
+    if logger:
+        logger.info(f"Rate limiter: {json.dumps(results['rate_limiter'])}")
+        logger.info(f"Session pool: {json.dumps(results['session_pool'])}")
+
+    return results
+
+
+def process_urls_pipelined(urls, config, rate_limiter, max_workers, logger=None, parse_pool=None, html_archive=None,
+                           breaker=None, worker_tables=None):
+    """Process URLs with the asyncio fetch -> parse -> write pipeline"""
+    # Batches are written from one thread, so the write buffer's pair is enough
+    properties_table, url_table = worker_tables[-1] if worker_tables else setup_dynamodb()
+
+    upsert = config.get('write_mode', 'upsert') != 'put'
+
+    def write_batch(batch, batch_logger=None):
+        return write_property_batch(batch, properties_table, url_table, batch_logger, upsert=upsert)
+
+    pipeline_config = dict(config, fetch_workers=max_workers)
+    results = process_urls_async(urls, pipeline_config, rate_limiter, write_batch, logger,
+                                 parse_pool=parse_pool, html_archive=html_archive, breaker=breaker)
+
+    results['rate_limiter'] = rate_limiter.stats()
+    if logger:
+        logger.info(f"Rate limiter: {json.dumps(results['rate_limiter'])}")
+        logger.info(f"Pipeline: {json.dumps(results['pipeline'])}")
 
     return results
 
 
+def reextract_archive(html_archive, config, logger=None, urls=None):
+    """
+    Re-run the detail extractor over archived pages and rewrite their records
+
+    Makes no HTTP requests: pages come from the archive, are parsed in worker
+    processes and written in BatchWriteItem batches. URL tracking is left as is.
+
+    Args:
+        html_archive: HtmlArchive to read from
+        urls: Only these listing URLs (default: every archived URL)
+    """
+    if urls:
+        pointers = [p for p in (html_archive.get_pointer(url) for url in urls) if p]
+    else:
+        pointers = list(html_archive.iter_pointers())
+    if config.get('limit'):
+        pointers = pointers[:int(config['limit'])]
+
+    results = {'processed': 0, 'success': 0, 'failed': 0, 'errors': [], 'archived': len(pointers)}
+    if not pointers:
+        return results
+
+    processes = int(config.get('parse_processes') or os.cpu_count() or 1)
+    deadline = time.time() + config.get('max_runtime_seconds', 840)
+    lock = threading.Lock()
+    properties_table, url_table = setup_dynamodb()
+
+    if logger:
+        logger.info(f"Re-extracting {len(pointers)} archived pages with {processes} parse process(es)")
+
+    def load_and_parse(pointer):
+        html_bytes = html_archive.read_object(pointer['sha256'])
+        return parse_pool.parse(html_bytes, pointer['url'])
+
+    def flush(batch):
+        outcomes = write_property_batch(batch, properties_table, url_table, logger, mark_processed=False,
+                                        upsert=config.get('write_mode', 'upsert') != 'put')
+        for outcome in outcomes:
+            record_result(results, outcome, len(pointers), lock, logger)
+
+    parse_pool = ParsePool(processes, config.get('detail_extractor'), logger)
+    try:
+        # Reader threads overlap S3 reads; each blocks on its page's parse process
+        with ThreadPoolExecutor(max_workers=max(1, int(config.get('max_workers', 4)))) as readers:
+            futures = {readers.submit(load_and_parse, pointer): pointer for pointer in pointers}
+            batch = []
+            for future in as_completed(futures):
+                pointer = futures[future]
+                try:
+                    property_data = future.result()
+                except Exception as e:
+                    record_result(results, {'success': False, 'url': pointer['url'], 'error': str(e)},
+                                  len(pointers), lock, logger)
+                    continue
+
+                if not property_data.get('city') and pointer.get('city'):
+                    property_data['city'] = pointer['city']
+                batch.append(({'url': pointer['url'], 'city': pointer.get('city', '')}, property_data))
+                if len(batch) >= 25:
+                    flush(batch)
+                    batch = []
+
+                if time.time() > deadline:
+                    for pending in futures:
+                        pending.cancel()
+                    if logger:
+                        logger.info("Max runtime reached, stopping re-extraction")
+                    break
+
+            if batch:
+                flush(batch)
+    finally:
+        parse_pool.shutdown()
+
+    results['parse_pool'] = parse_pool.stats()
+    return results
+
+
+def merge_results(total, results):
+    """Add one round's process_urls results into the invocation totals"""
+    for key in ('processed', 'success', 'failed'):
+        total[key] = total.get(key, 0) + results.get(key, 0)
+    total.setdefault('errors', []).extend(results.get('errors', []))
+    for write, count in results.get('writes', {}).items():
+        writes = total.setdefault('writes', {})
+        writes[write] = writes.get(write, 0) + count
+    return total
+
+
+def process_pending_urls(url_table, config, owner, context=None, logger=None, breaker=None):
+    """
+    Claim and process pending URLs in small rounds until the invocation's time is used up
+
+    Each round leases as many URLs as the BatchPlanner says still fit,
+    processes them with a deadline that leaves the planner's end reserve
+    free, and settles them (failures scheduled, unstarted URLs released)
+    before the next claim. Pacing, backoff, the parse processes, the HTML
+    archive and the worker tables carry over between rounds; no more
+    rounds are claimed once the circuit breaker is open.
+
+    Returns:
+        Totals over all rounds plus 'claimed' and the 'planner' summary
+    """
+    planner = BatchPlanner(
+        context,
+        max_runtime_seconds=config.get('max_runtime_seconds', 840),
+        flush_window=config.get('flush_window_seconds', 30),
+        claim_increment=config.get('claim_increment', DEFAULT_CLAIM_INCREMENT),
+        initial_url_seconds=(config.get('min_delay', 3.0) + config.get('max_delay', 8.0)) / 2,
+        logger=logger
+    )
+    rate_limiter = create_rate_limiter(config)
+    totals = {'processed': 0, 'success': 0, 'failed': 0, 'errors': [], 'claimed': 0}
+
+    # One pool for the whole invocation - forked before any fetch threads exist
+    parse_pool = create_parse_pool(config, logger)
+    html_archive = get_html_archive(config, logger)
+    worker_tables = create_worker_tables(max(1, int(config.get('max_workers', 1))))
+    try:
+        run_claim_rounds(planner, url_table, config, owner, totals, rate_limiter, logger, breaker, parse_pool,
+                         html_archive, worker_tables)
+    finally:
+        if parse_pool:
+            parse_pool.shutdown()
+
+    totals['planner'] = planner.summary()
+    totals['rate_limiter'] = rate_limiter.stats()
+    if parse_pool:
+        totals['parse_pool'] = parse_pool.stats()
+    if html_archive:
+        totals['html_archive'] = dict(html_archive.stats)
+    if breaker:
+        totals['circuit_breaker'] = breaker.summary()
+    if logger:
+        logger.info(f"Planner: {json.dumps(totals['planner'])}")
+
+    return totals
+
+
+def run_claim_rounds(planner, url_table, config, owner, totals, rate_limiter, logger=None, breaker=None,
+                     parse_pool=None, html_archive=None, worker_tables=None):
+    """Claim, process and settle rounds of pending URLs until the planner or the breaker stops them"""
+    while True:
+        if breaker and breaker.is_open():
+            if logger:
+                logger.warning(f"Circuit breaker open for {breaker.seconds_until_close()}s, no more claims")
+            break
+
+        size = planner.next_claim_size()
+        if size < 1:
+            if logger:
+                logger.info(f"Stopping claims with {planner.remaining_seconds():.0f}s left for the final flush")
+            break
+
+        urls = claim_urls(url_table, dict(config, batch_size=size), owner, logger)
+        if not urls:
+            break
+
+        started = time.time()
+        results = process_urls(urls, dict(config, max_runtime_seconds=planner.work_seconds()), logger, rate_limiter,
+                               breaker, parse_pool, html_archive, worker_tables)
+        settle_claimed_urls(urls, results, url_table, config, owner, logger)
+        planner.record_round(len(urls), results['processed'], time.time() - started)
+
+        totals['claimed'] += len(urls)
+        merge_results(totals, results)
+
+
+def is_sqs_event(event):
+    """True for an SQS event source batch"""
+    records = event.get('Records') or []
+    return bool(records) and all(record.get('eventSource') == 'aws:sqs' for record in records)
+
+
+def parse_sqs_messages(records, logger=None):
+    """
+    Read url_info dicts from SQS message bodies
+
+    Returns:
+        (url_infos, {url: [messageId, ...]}, messageIds that could not be parsed)
+    """
+    url_infos = []
+    message_ids = {}
+    bad_messages = []
+
+    for record in records:
+        try:
+            body = json.loads(record['body'])
+            url = body['url']
+        except (KeyError, TypeError, ValueError) as e:
+            if logger:
+                logger.warning(f"Unreadable message {record.get('messageId')}: {str(e)}")
+            bad_messages.append(record.get('messageId'))
+            continue
+
+        # The same URL can arrive twice (at-least-once delivery); process it once
+        if url not in message_ids:
+            url_infos.append({'url': url, 'city': body.get('city', ''), 'price': body.get('price', 0)})
+        message_ids.setdefault(url, []).append(record['messageId'])
+
+    return url_infos, message_ids, bad_messages
+
+
+def settle_claimed_urls(urls, results, url_table, config, owner, logger=None):
+    """
+    Record failures in the retry schedule and hand back unstarted URLs
+
+    Returns:
+        URLs left to retry right away: unstarted ones (leases released) and
+        failures that could not be recorded (their leases still expire)
+    """
+    _, unrecorded = schedule_retries(
+        results.get('errors', []), urls, url_table, config.get('retry_max_attempts', DEFAULT_MAX_ATTEMPTS), logger
+    )
+    unstarted = results.pop('unstarted', [])
+    release_leases(unstarted, url_table, owner, logger)
+    return set(unrecorded) | {url_info['url'] for url_info in unstarted}
+
+
+def process_sqs_batch(records, context, url_table, config, owner, logger=None, breaker=None):
+    """
+    Process the URLs in an SQS batch and report partial failures
+
+    Each URL is leased before it is fetched, so queue redeliveries and the
+    polling processor never work on it twice. URLs that are processed, or
+    failed and now wait in the retry schedule, are acknowledged; URLs leased
+    elsewhere or left unstarted at the deadline are reported, so SQS
+    redelivers only those messages (and moves them to the DLQ after
+    maxReceiveCount).
+
+    While the circuit breaker is open the whole batch is acknowledged
+    without fetching: the URLs stay pending in the tracking table, and a
+    polling run picks them up once Redfin stops blocking.
+
+    Returns:
+        (batch response {'batchItemFailures': [...]}, processing results)
+    """
+    url_infos, message_ids, failed_messages = parse_sqs_messages(records, logger)
+    if breaker and breaker.is_open():
+        if logger:
+            logger.warning(f"Circuit breaker open for {breaker.seconds_until_close()}s, "
+                           f"acknowledging {len(records)} messages without fetching")
+        response = {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failed_messages]}
+        return response, {'processed': 0, 'success': 0, 'failed': 0, 'skipped': len(url_infos)}
+
+    claimed, statuses = claim_listed_urls(
+        url_table, url_infos, owner, config.get('lease_seconds', DEFAULT_LEASE_SECONDS), logger
+    )
+    retry_urls = {url for url, status in statuses.items() if status == 'busy'}
+
+    results = {'processed': 0, 'success': 0, 'failed': 0}
+    if claimed:
+        # Stop taking new URLs in time to flush writes before the invocation times out
+        batch_config = dict(config)
+        if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+            remaining = context.get_remaining_time_in_millis() / 1000 - SQS_RUNTIME_MARGIN_SECONDS
+            batch_config['max_runtime_seconds'] = max(1, min(config['max_runtime_seconds'], remaining))
+
+        results = process_urls(claimed, batch_config, logger, breaker=breaker)
+        retry_urls |= settle_claimed_urls(claimed, results, url_table, config, owner, logger)
+
+    for url in retry_urls:
+        failed_messages.extend(message_ids.get(url, []))
+
+    if logger:
+        logger.info(f"SQS batch: {len(records)} messages, {len(claimed)} claimed, "
+                    f"{len(failed_messages)} reported for retry")
+
+    response = {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failed_messages]}
+    return response, results
+
+
 def lambda_handler(event, context):
     """AWS Lambda handler"""
     session_id = event.get('session_id', f'processor-{int(time.time())}')
@@ -345,20 +1119,171 @@ def lambda_handler(event, context):
 
     try:
         # Setup
-        _, url_table = setup_dynamodb()
+        properties_table, url_table = setup_dynamodb()
+
+        # Queue-triggered invocations run alongside each other and the polling run, each with its
+        # own RateLimiter, so they take a share of the delay budget; the polling run keeps all of it
+        rate_shares = max(1, int(os.environ.get('RATE_LIMIT_SHARES', 1))) if is_sqs_event(event) else 1
 
         # Get configuration
         config = {
-            'min_delay': float(os.environ.get('MIN_DELAY', 3)),
-            'max_delay': float(os.environ.get('MAX_DELAY', 8)),
+            'min_delay': float(os.environ.get('MIN_DELAY', 3)) * rate_shares,
+            'max_delay': float(os.environ.get('MAX_DELAY', 8)) * rate_shares,
             'max_runtime_seconds': int(os.environ.get('MAX_RUNTIME_MINUTES', 14)) * 60,
-            'batch_size': int(os.environ.get('BATCH_SIZE', 50))
+            'max_workers': int(os.environ.get('MAX_WORKERS', 4)),
+            'engine': os.environ.get('PROCESSOR_ENGINE', 'threads'),
+            'parse_workers': int(os.environ.get('PARSE_WORKERS', 2)),
+            'parse_processes': int(os.environ.get('PARSE_PROCESSES', 0)),
+            'write_mode': os.environ.get('WRITE_MODE', 'upsert'),
+            'write_buffer': os.environ.get('WRITE_BUFFER', 'true').lower() not in ('false', '0', 'no'),
+            'html_archive_bucket': event.get('html_archive_bucket', os.environ.get('HTML_ARCHIVE_BUCKET', '')),
+            'html_archive_dir': event.get('html_archive_dir', os.environ.get('HTML_ARCHIVE_DIR', '')),
+            'claim_increment': int(os.environ.get('CLAIM_INCREMENT', DEFAULT_CLAIM_INCREMENT)),
+            'flush_window_seconds': float(os.environ.get('FLUSH_WINDOW_SECONDS', 30)),
+            'lease_seconds': int(os.environ.get('LEASE_SECONDS', DEFAULT_LEASE_SECONDS)),
+            'retry_max_attempts': int(os.environ.get('RETRY_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)),
+            'thumbnail_bucket': event.get('thumbnail_bucket', os.environ.get('THUMBNAIL_BUCKET', '')),
+            'thumbnail_dir': event.get('thumbnail_dir', os.environ.get('THUMBNAIL_DIR', '')),
+            'thumbnail_base_url': os.environ.get('THUMBNAIL_BASE_URL', ''),
+            'thumbnail_count': int(os.environ.get('THUMBNAIL_COUNT', 3)),
+            'thumbnail_min_delay': float(os.environ.get('THUMBNAIL_MIN_DELAY', 0.5)),
+            'thumbnail_max_delay': float(os.environ.get('THUMBNAIL_MAX_DELAY', 1.5)),
+            'thumbnail_batch_size': int(event.get('limit', os.environ.get('THUMBNAIL_BATCH_SIZE', 200))),
+            'refetch_budget': int(event.get('budget', os.environ.get('REFETCH_BUDGET', DEFAULT_REFETCH_BUDGET))),
+            'breaker_threshold': int(os.environ.get('BREAKER_THRESHOLD', DEFAULT_THRESHOLD)),
+            'breaker_open_seconds': int(os.environ.get('BREAKER_OPEN_SECONDS', DEFAULT_OPEN_SECONDS))
         }
 
-        # Get unprocessed URLs
-        urls = scan_unprocessed_urls(url_table, limit=config['batch_size'], logger=logger)
+        # SQS event source: process the batch's URLs, report the messages to retry
+        if is_sqs_event(event):
+            owner = getattr(context, 'aws_request_id', None) or f"{session_id}-{uuid.uuid4().hex[:8]}"
+            breaker = get_circuit_breaker(config, properties_table, logger)
+            response, results = process_sqs_batch(event['Records'], context, url_table, config, owner, logger, breaker)
+            logger.info(f"SQS batch complete: {results['success']} success, {results['failed']} failed")
+            return response
+
+        # One-off migration: put pending URLs from before the index into it
+        if event.get('mode') == 'backfill_pending':
+            added = backfill_pending_index(url_table, logger)
+            return {
+                'statusCode': 200,
+                'body': json.dumps({
+                    'message': 'Pending index backfilled',
+                    'session_id': session_id,
+                    'added': added
+                })
+            }
 
-        if not urls:
+        # Scheduled stage: put the detail pages most likely to have changed back on the pending-index
+        if event.get('mode') == 'refetch':
+            summary = run_refetch_policy(
+                properties_table, url_table, setup_preferences_table(event), config['refetch_budget'],
+                dry_run=bool(event.get('dry_run')), logger=logger
+            )
+            return {
+                'statusCode': 200,
+                'body': json.dumps({
+                    'message': 'Refetches queued',
+                    'session_id': session_id,
+                    'dry_run': bool(event.get('dry_run')),
+                    'properties': summary['properties'],
+                    'favorites': summary['favorites'],
+                    'due': summary['due'],
+                    'queued': summary['queued'],
+                    'candidates': summary['candidates']
+                })
+            }
+
+        # Background stage: thumbnails for properties that have photos but none yet
+        if event.get('mode') == 'thumbnails':
+            store = get_thumbnail_store(config, logger)
+            if not store:
+                # Not an error: without a place to serve thumbnails from, cards keep the listing photos
+                return {
+                    'statusCode': 200,
+                    'body': json.dumps({
+                        'message': 'Thumbnails skipped: needs THUMBNAIL_BUCKET and THUMBNAIL_BASE_URL '
+                                   '(or THUMBNAIL_DIR), and Pillow',
+                        'session_id': session_id,
+                        'timestamp': datetime.now().isoformat()
+                    })
+                }
+
+            results = process_thumbnails(properties_table, store, config, logger)
+            return {
+                'statusCode': 200,
+                'body': json.dumps({
+                    'message': 'Thumbnails complete',
+                    'session_id': session_id,
+                    'properties': results['properties'],
+                    'thumbnails': results['thumbnails'],
+                    'retry': results['retry'],
+                    'failed': results['failed'],
+                    'store': results['store'],
+                    'timestamp': datetime.now().isoformat()
+                })
+            }
+
+        # One-off migration: fold duplicate items of the same home and build the ID map
+        if event.get('mode') == 'merge_duplicates':
+            summary = merge_duplicate_properties(
+                properties_table, setup_preferences_table(event), dry_run=bool(event.get('dry_run')), logger=logger
+            )
+            return {
+                'statusCode': 200,
+                'body': json.dumps({
+                    'message': 'Duplicate properties merged',
+                    'session_id': session_id,
+                    'dry_run': bool(event.get('dry_run')),
+                    'homes': summary['homes'],
+                    'duplicate_keys': summary['duplicate_keys'],
+                    'moved_preferences': summary['moved_preferences'],
+                    'merged': summary['merged']
+                })
+            }
+
+        # Offline re-extraction: parse archived pages again, no HTTP requests
+        if event.get('mode') == 'reextract':
+            html_archive = get_html_archive(config, logger)
+            if not html_archive:
+                raise ValueError("reextract mode needs HTML_ARCHIVE_BUCKET or HTML_ARCHIVE_DIR")
+
+            results = reextract_archive(
+                html_archive, dict(config, limit=event.get('limit')), logger, urls=event.get('urls')
+            )
+            logger.info(f"Re-extraction complete: {results['success']} success, {results['failed']} failed")
+
+            return {
+                'statusCode': 200,
+                'body': json.dumps({
+                    'message': 'Re-extraction complete',
+                    'session_id': session_id,
+                    'archived': results['archived'],
+                    'processed': results['processed'],
+                    'success': results['success'],
+                    'failed': results['failed'],
+                    'timestamp': datetime.now().isoformat()
+                })
+            }
+
+        # Lease pending URLs a round at a time (unique owner per invocation, so parallel runs never share work)
+        # Redfin is blocking: leave the pending URLs for a run after the breaker closes
+        breaker = get_circuit_breaker(config, properties_table, logger)
+        if breaker and breaker.is_open():
+            logger.warning(f"Circuit breaker open for another {breaker.seconds_until_close()}s, skipping this run")
+            return {
+                'statusCode': 200,
+                'body': json.dumps({
+                    'message': 'Circuit breaker open',
+                    'session_id': session_id,
+                    'circuit_breaker': breaker.summary()
+                })
+            }
+
+        owner = getattr(context, 'aws_request_id', None) or f"{session_id}-{uuid.uuid4().hex[:8]}"
+        results = process_pending_urls(url_table, config, owner, context, logger, breaker)
+
+        if not results['claimed']:
             logger.info("No unprocessed URLs found")
             return {
                 'statusCode': 200,
@@ -368,9 +1293,6 @@ def lambda_handler(event, context):
                 })
             }
 
-        # Process URLs
-        results = process_urls(urls, config, logger)
-
         logger.info(f"Processing complete: {results['success']} success, {results['failed']} failed")
 
         return {
@@ -381,12 +1303,18 @@ def lambda_handler(event, context):
                 'processed': results['processed'],
                 'success': results['success'],
                 'failed': results['failed'],
+                'writes': results.get('writes', {}),
+                'planner': results['planner'],
+                'circuit_breaker': results.get('circuit_breaker'),
                 'timestamp': datetime.now().isoformat()
             })
         }
 
     except Exception as e:
         logger.error(f"Lambda failed: {str(e)}")
+        if is_sqs_event(event):
+            # Retry the whole batch
+            return {'batchItemFailures': [{'itemIdentifier': record['messageId']} for record in event['Records']]}
         return {
             'statusCode': 500,
             'body': json.dumps({
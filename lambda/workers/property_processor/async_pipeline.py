@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Asyncio staged pipeline for the property processor
+fetch (curl_cffi AsyncSession) -> parse (executor) -> batched DynamoDB writes,
+connected by bounded queues so network waits, parsing and DynamoDB latency
+overlap instead of adding up per URL
+"""
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from curl_cffi.requests import AsyncSession
+    ASYNC_SESSION_AVAILABLE = True
+except ImportError:
+    AsyncSession = None
+    ASYNC_SESSION_AVAILABLE = False
+
+from core_scraper import check_detail_response, detail_page_hash, get_detail_extractor
+from retry_schedule import classify_error
+
+# Queue sentinel telling the next stage to finish
+STOP = object()
+
+
+def create_async_session():
+    """Create an AsyncSession with the same Chrome impersonation as create_session()"""
+    return AsyncSession(impersonate="chrome120")
+
+
+class StageStats:
+    """Item count and busy time for one pipeline stage"""
+
+    def __init__(self):
+        self.items = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+
+    def record(self, seconds, success=True):
+        self.items += 1
+        if not success:
+            self.failed += 1
+        self.busy_seconds += seconds
+
+    def summary(self, elapsed):
+        return {
+            'items': self.items,
+            'failed': self.failed,
+            'busy_seconds': round(self.busy_seconds, 3),
+            'items_per_second': round(self.items / elapsed, 3) if elapsed > 0 else 0.0
+        }
+
+
+class QueueMonitor:
+    """Samples queue depths at a fixed interval"""
+
+    def __init__(self, queues, interval=0.25):
+        self.queues = queues
+        self.interval = interval
+        self.samples = {name: [] for name in queues}
+
+    def sample(self):
+        for name, queue in self.queues.items():
+            self.samples[name].append(queue.qsize())
+
+    async def run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def summary(self):
+        summary = {}
+        for name, queue in self.queues.items():
+            depths = self.samples[name] or [0]
+            summary[name] = {
+                'maxsize': queue.maxsize,
+                'max_depth': max(depths),
+                'mean_depth': round(sum(depths) / len(depths), 2)
+            }
+        return summary
+
+
+async def run_pipeline(urls, config, rate_limiter, write_batch, logger=None, session_factory=None,
+                       parse_pool=None, html_archive=None, breaker=None):
+    """
+    Run the fetch -> parse -> write pipeline over urls
+
+    Args:
+        urls: List of url_info dicts ({'url', 'city', ...})
+        config: fetch_workers, parse_workers, write_batch_size, queue_size,
+            max_runtime_seconds, detail_extractor
+        rate_limiter: Shared RateLimiter (paces fetches, AIMD limits fetchers)
+        write_batch: Blocking callable(batch, logger) taking a list of
+            (url_info, property_data) and returning one result dict per item;
+            property_data is None for a page whose hash matches url_info's content_hash
+        session_factory: Returns a new AsyncSession (defaults to Chrome impersonation)
+        parse_pool: Optional ParsePool - pages are parsed in worker processes
+            instead of the parse_workers thread executor
+        html_archive: Optional HtmlArchive - raw pages are archived before parsing
+        breaker: Optional CircuitBreaker - fetchers stop taking URLs while it is open
+
+    Returns:
+        results dict as returned by process_urls, plus a 'pipeline' summary
+        and the 'unstarted' url_info dicts left when the deadline hit
+    """
+    session_factory = session_factory or create_async_session
+    loop = asyncio.get_running_loop()
+    parse_page = get_detail_extractor(config.get('detail_extractor'))
+
+    fetch_workers = max(1, int(config.get('fetch_workers', 4)))
+    parse_workers = max(1, int(config.get('parse_workers', 2)))
+    batch_size = max(1, min(int(config.get('write_batch_size', 25)), 25))
+    queue_size = max(1, int(config.get('queue_size', 2 * batch_size)))
+    flush_interval = float(config.get('flush_interval_seconds', 1.0))
+    deadline = time.time() + config.get('max_runtime_seconds', 840)
+
+    results = {'processed': 0, 'success': 0, 'failed': 0, 'errors': []}
+    stages = {'fetch': StageStats(), 'parse': StageStats(), 'write': StageStats()}
+
+    url_queue = asyncio.Queue()
+    for url_info in urls:
+        url_queue.put_nowait(url_info)
+    parse_queue = asyncio.Queue(maxsize=queue_size)
+    write_queue = asyncio.Queue(maxsize=queue_size)
+    monitor = QueueMonitor({'parse': parse_queue, 'write': write_queue})
+
+    parse_executor = ThreadPoolExecutor(max_workers=parse_workers)
+    # boto3 resources are not thread-safe - all writes go through one thread
+    write_executor = ThreadPoolExecutor(max_workers=1)
+    # Breaker calls can read/write DynamoDB - keep them off the event loop
+    breaker_executor = ThreadPoolExecutor(max_workers=1)
+
+    sessions = {'current': session_factory(), 'retired': []}
+
+    def record(result):
+        results['processed'] += 1
+        if result.get('success'):
+            results['success'] += 1
+            if result.get('write'):
+                writes = results.setdefault('writes', {})
+                writes[result['write']] = writes.get(result['write'], 0) + 1
+            if logger:
+                logger.info(f"Processed {results['processed']}/{len(urls)}: {result['url'][:50]}...")
+        else:
+            results['failed'] += 1
+            results['errors'].append({
+                'url': result['url'],
+                'error': result.get('error', 'Unknown'),
+                'error_class': result.get('error_class')
+            })
+
+    async def call_breaker(method, *args):
+        return await loop.run_in_executor(breaker_executor, method, *args)
+
+    async def fetch_worker(index):
+        while time.time() <= deadline and not url_queue.empty():
+            # Workers above the adaptive concurrency limit sit out
+            if index >= max(1, int(rate_limiter.concurrency_limit)):
+                await asyncio.sleep(0.5)
+                continue
+
+            if breaker and await call_breaker(breaker.is_open):
+                return
+
+            try:
+                url_info = url_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            url = url_info['url']
+            await rate_limiter.wait_async()
+
+            start = time.perf_counter()
+            session = sessions['current']
+            try:
+                response = await session.get(url, headers={'Referer': 'https://www.redfin.com/'}, timeout=30)
+                error = check_detail_response(response, url, logger=logger)
+            except Exception as e:
+                error = {'error': str(e), 'url': url}
+            stages['fetch'].record(time.perf_counter() - start, success=not error)
+
+            if error:
+                message = error.get('error', '')
+                error_class = classify_error(message)
+                if error_class == 'blocked':
+                    rate_limiter.record_error(is_rate_limit=True, retry_after=error.get('retry_after'))
+                    if breaker:
+                        await call_breaker(breaker.record_block, message)
+                else:
+                    rate_limiter.record_error()
+                # Blocked: later fetches use a fresh session (new cookies, new connection)
+                if error_class == 'blocked' and not message.startswith('429') and sessions['current'] is session:
+                    sessions['retired'].append(session)
+                    sessions['current'] = session_factory()
+                record({'success': False, 'url': url, 'error': message, 'error_class': error_class})
+                continue
+
+            rate_limiter.record_success()
+            if breaker:
+                await call_breaker(breaker.record_success)
+            page_hash = detail_page_hash(response.content)
+            page_unchanged = page_hash == url_info.get('content_hash')
+            url_info['content_hash'] = page_hash
+            url_info['fetched_at'] = int(time.time())
+            if page_unchanged:
+                # Same page as the last fetch: the writer only marks the URL processed
+                await write_queue.put((url_info, None))
+                continue
+
+            # Worker processes take the raw bytes; the thread executor takes text
+            page = response.content if parse_pool else response.text
+            raw = response.content if html_archive else None
+            await parse_queue.put((url_info, page, raw))
+
+    async def parse_worker():
+        while True:
+            item = await parse_queue.get()
+            if item is STOP:
+                return
+
+            url_info, page, raw = item
+            start = time.perf_counter()
+            try:
+                if html_archive:
+                    await loop.run_in_executor(
+                        parse_executor, html_archive.put, url_info['url'], raw, url_info.get('city')
+                    )
+                if parse_pool:
+                    property_data = await asyncio.wrap_future(parse_pool.submit(page, url_info['url']))
+                else:
+                    property_data = await loop.run_in_executor(
+                        parse_executor, parse_page, page, url_info['url'], logger
+                    )
+            except Exception as e:
+                stages['parse'].record(time.perf_counter() - start, success=False)
+                if logger:
+                    logger.error(f"Error extracting {url_info['url']}: {str(e)}")
+                record({'success': False, 'url': url_info['url'], 'error': str(e), 'error_class': 'parse'})
+                continue
+            stages['parse'].record(time.perf_counter() - start)
+
+            # Add city from tracking table if not extracted
+            if not property_data.get('city') and url_info.get('city'):
+                property_data['city'] = url_info['city']
+
+            await write_queue.put((url_info, property_data))
+
+    async def flush(batch):
+        start = time.perf_counter()
+        try:
+            outcomes = await loop.run_in_executor(write_executor, write_batch, batch, logger)
+        except Exception as e:
+            outcomes = [{'success': False, 'url': url_info['url'], 'error': str(e), 'error_class': 'write'}
+                        for url_info, _ in batch]
+        elapsed = time.perf_counter() - start
+        for outcome in outcomes:
+            stages['write'].record(elapsed / len(outcomes), success=outcome.get('success', False))
+            record(outcome)
+
+    async def writer():
+        batch = []
+        while True:
+            try:
+                item = await asyncio.wait_for(write_queue.get(), timeout=flush_interval)
+            except asyncio.TimeoutError:
+                item = None
+
+            if item is STOP:
+                break
+            if item is not None:
+                batch.append(item)
+            # Full batch, or the queue went quiet with a partial one
+            if len(batch) >= batch_size or (item is None and batch):
+                await flush(batch)
+                batch = []
+
+        if batch:
+            await flush(batch)
+
+    started = time.perf_counter()
+    monitor_task = asyncio.create_task(monitor.run())
+    try:
+        parsers = [asyncio.create_task(parse_worker()) for _ in range(parse_workers)]
+        writer_task = asyncio.create_task(writer())
+
+        await asyncio.gather(*(fetch_worker(i) for i in range(fetch_workers)))
+        for _ in parsers:
+            await parse_queue.put(STOP)
+        await asyncio.gather(*parsers)
+        await write_queue.put(STOP)
+        await writer_task
+
+    finally:
+        monitor_task.cancel()
+        for session in [sessions['current']] + sessions['retired']:
+            try:
+                await session.close()
+            except Exception:
+                pass
+        parse_executor.shutdown(wait=False)
+        write_executor.shutdown(wait=False)
+        breaker_executor.shutdown(wait=False)
+
+    elapsed = time.perf_counter() - started
+    if url_queue.qsize() and logger:
+        logger.info(f"Max runtime reached, stopped with {url_queue.qsize()} URLs left")
+
+    results['unstarted'] = []
+    while not url_queue.empty():
+        results['unstarted'].append(url_queue.get_nowait())
+
+    results['pipeline'] = {
+        'elapsed_seconds': round(elapsed, 3),
+        'fetch_workers': fetch_workers,
+        'parse_workers': parse_workers,
+        'write_batch_size': batch_size,
+        'unstarted_urls': len(results['unstarted']),
+        'stages': {name: stats.summary(elapsed) for name, stats in stages.items()},
+        'queues': monitor.summary()
+    }
+    return results
+
+
+def process_urls_async(urls, config, rate_limiter, write_batch, logger=None, session_factory=None,
+                       parse_pool=None, html_archive=None, breaker=None):
+    """Synchronous entry point for the Lambda handler"""
+    return asyncio.run(run_pipeline(urls, config, rate_limiter, write_batch, logger, session_factory,
+                                    parse_pool, html_archive, breaker))
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Deadline-aware claiming for the polling processor
+An invocation used to lease a fixed batch of URLs and stop at a fixed
+runtime, so it either ran out of URLs with billed time left or was still
+fetching when the runtime hit. URLs are now claimed a few at a time against
+the time Lambda reports as left: a running estimate of seconds per URL sizes
+each claim to what still fits, and a reserve at the end (write flush window,
+one fetch timeout, settling leases) is never handed out, so the last URLs
+finish and their writes flush before the invocation is stopped
+"""
+import time
+
+DEFAULT_CLAIM_INCREMENT = 12
+# A fetch started just before the deadline can take this long to finish
+FETCH_TIMEOUT_SECONDS = 30
+# Recording retries and releasing unstarted leases after the last round
+SETTLE_SECONDS = 5
+# Weight of the latest round in the seconds-per-URL estimate
+LATENCY_SMOOTHING = 0.5
+
+
+class BatchPlanner:
+    """
+    Sizes claims from the invocation's remaining time and observed URL latency
+
+    Uses context.get_remaining_time_in_millis() when a Lambda context is
+    given, and max_runtime_seconds from creation otherwise (local runs).
+    """
+
+    def __init__(self, context=None, max_runtime_seconds=840, flush_window=30.0,
+                 claim_increment=DEFAULT_CLAIM_INCREMENT, initial_url_seconds=5.0, logger=None):
+        self.context = context if hasattr(context, 'get_remaining_time_in_millis') else None
+        self.deadline = time.time() + max_runtime_seconds
+        self.reserve_seconds = flush_window + FETCH_TIMEOUT_SECONDS + SETTLE_SECONDS
+        self.claim_increment = max(1, int(claim_increment))
+        self.url_seconds = max(0.01, float(initial_url_seconds))
+        self.logger = logger
+        self.stats = {'rounds': 0, 'claimed': 0, 'processed': 0}
+
+    def remaining_seconds(self):
+        """Seconds until the invocation is stopped"""
+        if self.context:
+            return self.context.get_remaining_time_in_millis() / 1000
+        return self.deadline - time.time()
+
+    def work_seconds(self):
+        """Seconds left for fetching new URLs (the end reserve excluded)"""
+        return max(0.0, self.remaining_seconds() - self.reserve_seconds)
+
+    def next_claim_size(self):
+        """URLs to claim next: at most claim_increment, and only as many as the estimate says still fit"""
+        fits = int(self.work_seconds() / self.url_seconds)
+        return max(0, min(self.claim_increment, fits))
+
+    def record_round(self, claimed, processed, elapsed):
+        """Fold a finished round (wall seconds for processed URLs) into the seconds-per-URL estimate"""
+        self.stats['rounds'] += 1
+        self.stats['claimed'] += claimed
+        self.stats['processed'] += processed
+        if processed:
+            observed = elapsed / processed
+            self.url_seconds = LATENCY_SMOOTHING * observed + (1 - LATENCY_SMOOTHING) * self.url_seconds
+
+        if self.logger:
+            self.logger.debug(f"Round {self.stats['rounds']}: {processed}/{claimed} URLs in {elapsed:.1f}s, "
+                              f"{self.url_seconds:.2f}s per URL, {self.work_seconds():.0f}s of work time left")
+
+    def summary(self):
+        return dict(self.stats, url_seconds=round(self.url_seconds, 3),
+                    remaining_seconds=round(self.remaining_seconds(), 1))
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Shared circuit breaker for Redfin blocking
+Once a run of detail fetches in a row comes back blocked (403/429 or a
+challenge page), the breaker opens: every worker stops fetching and the
+state is written to the properties table as "open until T", so other
+invocations and the next scheduled runs back off too instead of spending
+their Lambda time on delays. Each consecutive trip doubles how long it stays
+open; the first success after it closes again resets that
+
+State item (properties table):
+    BREAKER#<name> / STATE    {'open_until', 'opened_at', 'trips', 'reason'}
+"""
+import time
+import threading
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+from url_leases import is_conditional_check_failure
+
+DEFAULT_THRESHOLD = 5
+DEFAULT_OPEN_SECONDS = 1800
+MAX_OPEN_SECONDS = 6 * 3600
+# How often an invocation re-reads the shared state
+REFRESH_SECONDS = 30
+
+
+def breaker_key(name):
+    """Properties-table key of a breaker's state item"""
+    return {'property_id': f"BREAKER#{name}", 'sort_key': 'STATE'}
+
+
+class CircuitBreaker:
+    """
+    Thread-safe breaker whose open state is shared through DynamoDB
+
+    table is the properties table resource (only its low-level client is
+    used, so the breaker is safe to share between worker threads).
+    """
+
+    def __init__(self, table, name='redfin', threshold=DEFAULT_THRESHOLD, open_seconds=DEFAULT_OPEN_SECONDS,
+                 logger=None):
+        self.client = table.meta.client
+        self.table_name = table.name
+        self.key = breaker_key(name)
+        self.threshold = max(1, int(threshold))
+        self.open_seconds = open_seconds
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.consecutive_blocks = 0
+        self.open_until = 0
+        self.trips = 0
+        self.refreshed_at = None
+        self.stats = {'blocks': 0, 'successes': 0, 'trips': 0, 'refreshes': 0}
+
+    def refresh(self, force=False):
+        """Re-read the shared state (at most every REFRESH_SECONDS unless forced)"""
+        now = time.time()
+        with self.lock:
+            if not force and self.refreshed_at is not None and now - self.refreshed_at < REFRESH_SECONDS:
+                return
+            self.refreshed_at = now
+
+        try:
+            item = self.client.get_item(TableName=self.table_name, Key=self.key, ConsistentRead=True).get('Item')
+        except Exception as e:
+            if self.logger:
+                self.logger.warning(f"Could not read circuit breaker state: {str(e)}")
+            return
+
+        with self.lock:
+            self.stats['refreshes'] += 1
+            if item:
+                self.open_until = max(self.open_until, int(item.get('open_until', 0)))
+                self.trips = int(item.get('trips', 0))
+
+    def is_open(self):
+        """True while fetching should stop"""
+        self.refresh()
+        with self.lock:
+            return time.time() < self.open_until
+
+    def seconds_until_close(self):
+        with self.lock:
+            return max(0, int(self.open_until - time.time()))
+
+    def record_success(self):
+        with self.lock:
+            self.stats['successes'] += 1
+            self.consecutive_blocks = 0
+            reset = self.trips > 0
+            self.trips = 0
+
+        if reset:
+            # Closed and working again: the next trip starts from open_seconds
+            try:
+                self.client.update_item(
+                    TableName=self.table_name, Key=self.key,
+                    UpdateExpression='SET trips = :zero', ExpressionAttributeValues={':zero': 0}
+                )
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning(f"Could not reset circuit breaker trips: {str(e)}")
+
+    def record_block(self, reason=''):
+        """Count a blocked fetch; opens the breaker at threshold blocks in a row"""
+        with self.lock:
+            self.stats['blocks'] += 1
+            self.consecutive_blocks += 1
+            if self.consecutive_blocks < self.threshold or time.time() < self.open_until:
+                return
+            self.consecutive_blocks = 0
+            self.trips += 1
+            self.stats['trips'] += 1
+            trips = self.trips
+            open_until = int(time.time() + min(self.open_seconds * 2 ** (trips - 1), MAX_OPEN_SECONDS))
+            self.open_until = open_until
+
+        if self.logger:
+            self.logger.warning(f"Circuit breaker open until {datetime.fromtimestamp(open_until).isoformat()} "
+                                f"(trip {trips}, {self.threshold} blocked fetches in a row: {reason})")
+        self.persist(open_until, trips, reason)
+
+    def persist(self, open_until, trips, reason):
+        """Write the open state unless another worker already opened it for longer"""
+        try:
+            self.client.update_item(
+                TableName=self.table_name, Key=self.key,
+                UpdateExpression='SET open_until = :until, opened_at = :now, trips = :trips, reason = :reason',
+                ConditionExpression='attribute_not_exists(open_until) OR open_until < :until',
+                ExpressionAttributeValues={':until': open_until, ':now': datetime.now().isoformat(),
+                                           ':trips': trips, ':reason': str(reason)[:200]}
+            )
+        except ClientError as e:
+            if is_conditional_check_failure(e):
+                self.refresh(force=True)
+            elif self.logger:
+                self.logger.warning(f"Could not persist circuit breaker state: {str(e)}")
+        except Exception as e:
+            if self.logger:
+                self.logger.warning(f"Could not persist circuit breaker state: {str(e)}")
+
+    def summary(self):
+        with self.lock:
+            return dict(self.stats, open_until=self.open_until, consecutive_blocks=self.consecutive_blocks)
+
+
+def get_circuit_breaker(config, table, logger=None):
+    """Build the breaker from processor config, or None when it is off (threshold 0)"""
+    threshold = int(config.get('breaker_threshold', DEFAULT_THRESHOLD))
+    if threshold <= 0:
+        return None
+    return CircuitBreaker(table, threshold=threshold,
+                          open_seconds=int(config.get('breaker_open_seconds', DEFAULT_OPEN_SECONDS)),
+                          logger=logger)
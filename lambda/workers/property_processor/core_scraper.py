@@ -8,11 +8,16 @@ import time
 import random
 import re
 import json
+import html
+import hashlib
 from bs4 import BeautifulSoup
+from lxml import etree
 from datetime import datetime
 from urllib.parse import urlparse
 import os
 
+from session_pool import SessionPool
+
 # Try to use curl_cffi for browser impersonation
 try:
     from curl_cffi import requests as curl_requests
@@ -21,8 +26,10 @@ except ImportError:
     import requests as curl_requests
     CURL_CFFI_AVAILABLE = False
 
+DEFAULT_COOKIE_PATH = '/tmp/redfin_cookies.json'
 
-def create_session(logger=None):
+
+def _create_http_session(logger=None):
     """Create HTTP session with browser impersonation"""
     if CURL_CFFI_AVAILABLE:
         session = curl_requests.Session(impersonate="chrome120")
@@ -46,6 +53,46 @@ def create_session(logger=None):
     return session
 
 
+# Sessions survive warm Lambda invocations: keep-alive connections (HTTP/2 via
+# curl_cffi's Chrome impersonation) and cookies are reused instead of rebuilt
+_session_pool = None
+
+
+def get_session_pool():
+    """Return the module-level session pool, creating it on first use"""
+    global _session_pool
+    if _session_pool is None:
+        _session_pool = SessionPool(
+            _create_http_session,
+            max_requests_per_session=int(os.environ.get('SESSION_MAX_REQUESTS', '200')),
+            max_idle=int(os.environ.get('SESSION_POOL_SIZE', '4')),
+            cookie_path=os.environ.get('SESSION_COOKIE_PATH', DEFAULT_COOKIE_PATH) or None
+        )
+    return _session_pool
+
+
+def create_session(logger=None):
+    """
+    Get an HTTP session with browser impersonation
+
+    Sessions come from the warm pool unless SESSION_POOL=false; close() hands
+    the session back to the pool.
+    """
+    if os.environ.get('SESSION_POOL', 'true').lower() in ('false', '0', 'no'):
+        return _create_http_session(logger)
+    return get_session_pool().acquire(logger)
+
+
+def create_image_session(logger=None):
+    """
+    HTTP session for the photo CDN
+
+    Never taken from the detail-page pool, so photo downloads neither use up
+    its sessions' request budgets nor share their cookies.
+    """
+    return _create_http_session(logger)
+
+
 def parse_us_price(price_text):
     """Parse US price text like '$450,000' to integer USD"""
     if not price_text:
@@ -99,78 +146,149 @@ def create_property_id_key(raw_property_id, date_str=None):
     return f"PROP#{date_str}_{raw_property_id}"
 
 
-def extract_redfin_property_details(url, session=None, logger=None):
+# Real detail pages run to hundreds of KB; bot-wall and challenge pages are a few KB
+CHALLENGE_PAGE_MAX_BYTES = 32 * 1024
+CHALLENGE_MARKERS = (
+    b'captcha', b'px-block', b'challenge-platform', b'cf-chl', b'_incapsula_resource', b'distil_r',
+    b'are you a robot', b'verify you are a human', b'access to this page has been denied',
+    b'request unsuccessful', b'unusual traffic'
+)
+
+
+def detect_challenge_page(body):
     """
-    Extract property details from a Redfin property detail page
+    Cheap bot-wall check run before any parsing
 
-    Returns dict with US property fields or None on error
+    Only small pages are searched for challenge markers, so a full listing
+    that mentions a captcha in a script is never flagged.
+
+    Returns a short reason, or None for a page worth parsing
     """
-    if session is None:
-        session = create_session(logger)
+    if not body or len(body) > CHALLENGE_PAGE_MAX_BYTES:
+        return None
+
+    head = body.lower() if isinstance(body, bytes) else body.lower().encode('utf-8', errors='replace')
+    for marker in CHALLENGE_MARKERS:
+        if marker in head:
+            return f"challenge marker '{marker.decode()}' in {len(body)}-byte page"
+    return None
+
+
+def check_detail_response(response, url, session=None, logger=None):
+    """
+    Map blocking/missing responses to an error dict
+
+    The one place a detail response is classified: 403/429 and challenge
+    pages are blocks, an empty 200 is a plain fetch error.
+
+    Returns None when the response is a page worth parsing
+    """
+    if response.status_code == 403:
+        if logger:
+            logger.warning(f"403 Forbidden for {url}")
+        # Cookies/connection are burned - the pool replaces this session
+        if hasattr(session, 'mark_blocked'):
+            session.mark_blocked()
+        return {'error': '403 Forbidden', 'url': url, 'retry_after': response.headers.get('Retry-After')}
+
+    if response.status_code == 429:
+        if logger:
+            logger.warning(f"429 Too Many Requests for {url}")
+        return {'error': '429 Too Many Requests', 'url': url, 'retry_after': response.headers.get('Retry-After')}
+
+    if response.status_code == 404:
+        if logger:
+            logger.warning(f"404 Not Found for {url}")
+        return {'error': '404 Not Found', 'url': url}
+
+    if response.status_code == 200 and not response.content:
+        if logger:
+            logger.warning(f"Empty page for {url}")
+        return {'error': 'Empty page', 'url': url}
+
+    reason = detect_challenge_page(response.content)
+    if reason:
+        if logger:
+            logger.warning(f"Challenge page for {url}: {reason}")
+        if hasattr(session, 'mark_blocked'):
+            session.mark_blocked()
+        return {'error': f"Challenge page: {reason}", 'url': url}
 
+    response.raise_for_status()
+    return None
+
+
+# Parts of a detail page that change on every request without the listing changing.
+# JSON-LD scripts are kept: the extractor reads listing data from them.
+VOLATILE_PAGE_PATTERNS = [
+    re.compile(r'<script\b(?![^>]*application/ld\+json)[^>]*>.*?</script>', re.I | re.S),
+    re.compile(r'<style\b[^>]*>.*?</style>', re.I | re.S),
+    re.compile(r'<!--.*?-->', re.S),
+    re.compile(r'<meta\b[^>]*name="[^"]*(?:csrf|token)[^"]*"[^>]*>', re.I),
+    re.compile(r'\s(?:nonce|data-reactid|data-rf-request-id)="[^"]*"', re.I),
+]
+INTER_TAG_WHITESPACE_PATTERN = re.compile(rb'>\s+<')
+WHITESPACE_PATTERN = re.compile(rb'\s+')
+
+
+def detail_page_hash(html_bytes):
+    """
+    SHA-256 of a detail page with its per-request parts stripped
+
+    Scripts (other than JSON-LD), styles, comments, tokens and nonces are
+    removed and whitespace collapsed, so two fetches of an unchanged listing
+    hash the same.
+    """
+    text = html_bytes.decode('utf-8', errors='replace') if isinstance(html_bytes, bytes) else html_bytes or ''
+    for pattern in VOLATILE_PAGE_PATTERNS:
+        text = pattern.sub('', text)
+    normalized = INTER_TAG_WHITESPACE_PATTERN.sub(b'><', text.encode('utf-8'))
+    return hashlib.sha256(WHITESPACE_PATTERN.sub(b' ', normalized).strip()).hexdigest()
+
+
+def fetch_redfin_property_page(url, session, logger=None):
+    """
+    Fetch a detail page without parsing it
+
+    Returns (raw HTML bytes, None), or (None, error dict) when blocked/missing
+    """
     try:
         headers = {'Referer': 'https://www.redfin.com/'}
         response = session.get(url, headers=headers, timeout=30)
 
-        if response.status_code == 403:
-            if logger:
-                logger.warning(f"403 Forbidden for {url}")
-            return {'error': '403 Forbidden', 'url': url}
+        error = check_detail_response(response, url, session, logger)
+        if error:
+            return None, error
 
-        if response.status_code == 404:
-            if logger:
-                logger.warning(f"404 Not Found for {url}")
-            return {'error': '404 Not Found', 'url': url}
+        return response.content, None
 
-        response.raise_for_status()
+    except Exception as e:
+        if logger:
+            logger.error(f"Error fetching {url}: {str(e)}")
+        return None, {'error': str(e), 'url': url}
 
-        soup = BeautifulSoup(response.text, 'lxml')
-
-        # Initialize property data
-        property_data = {
-            'listing_url': url,
-            'extraction_timestamp': datetime.now().isoformat(),
-        }
-
-        # Extract property ID from URL
-        raw_id = extract_property_id_from_url(url)
-        if raw_id:
-            property_data['property_id'] = create_property_id_key(raw_id)
-            property_data['redfin_id'] = raw_id
-
-        # Extract from meta tags (most reliable for Redfin)
-        meta_data = extract_redfin_meta_data(soup, logger)
-        property_data.update(meta_data)
-
-        # Extract from JSON-LD
-        json_data = extract_json_ld_data(soup, logger)
-        for key, value in json_data.items():
-            if key not in property_data or not property_data.get(key):
-                property_data[key] = value
-
-        # Fall back to HTML parsing for missing fields
-        html_data = extract_html_data(soup, logger)
-        for key, value in html_data.items():
-            if key not in property_data or not property_data.get(key):
-                property_data[key] = value
-
-        # Calculate derived fields
-        if property_data.get('price') and property_data.get('size_sqft'):
-            try:
-                price = float(property_data['price'])
-                sqft = float(property_data['size_sqft'])
-                if sqft > 0:
-                    property_data['price_per_sqft'] = round(price / sqft, 2)
-            except (ValueError, TypeError):
-                pass
 
-        # Extract images
-        images = extract_property_images(soup, logger)
-        if images:
-            property_data['image_urls'] = images[:20]  # Limit to 20 images
-            property_data['image_count'] = len(images)
+def extract_redfin_property_details(url, session=None, logger=None, extractor=None):
+    """
+    Extract property details from a Redfin property detail page
 
-        return property_data
+    Args:
+        extractor: 'fast' (single-pass lxml) or 'soup' - see get_detail_extractor()
+
+    Returns dict with US property fields or None on error
+    """
+    if session is None:
+        session = create_session(logger)
+
+    try:
+        headers = {'Referer': 'https://www.redfin.com/'}
+        response = session.get(url, headers=headers, timeout=30)
+
+        error = check_detail_response(response, url, session, logger)
+        if error:
+            return error
+
+        return get_detail_extractor(extractor)(response.text, url, logger)
 
     except Exception as e:
         if logger:
@@ -178,31 +296,112 @@ def extract_redfin_property_details(url, session=None, logger=None):
         return {'error': str(e), 'url': url}
 
 
+def parse_redfin_property_page(html_content, url, logger=None):
+    """
+    Parse a fetched Redfin detail page into property fields
+
+    CPU-only half of extract_redfin_property_details - no network access,
+    so it can run in an executor.
+    """
+    soup = BeautifulSoup(html_content, 'lxml')
+
+    return assemble_property_data(
+        url,
+        extract_redfin_meta_data(soup, logger),
+        extract_json_ld_data(soup, logger),
+        extract_html_data(soup, logger),
+        extract_property_images(soup, logger)
+    )
+
+
+def assemble_property_data(url, meta_data, json_data, html_data, images):
+    """Merge the per-source extraction results into property_data"""
+    # Initialize property data
+    property_data = {
+        'listing_url': url,
+        'extraction_timestamp': datetime.now().isoformat(),
+    }
+
+    # Extract property ID from URL
+    raw_id = extract_property_id_from_url(url)
+    if raw_id:
+        property_data['property_id'] = create_property_id_key(raw_id)
+        property_data['redfin_id'] = raw_id
+
+    # Meta tags first (most reliable for Redfin)
+    property_data.update(meta_data)
+
+    # Then JSON-LD
+    for key, value in json_data.items():
+        if key not in property_data or not property_data.get(key):
+            property_data[key] = value
+
+    # Fall back to HTML parsing for missing fields
+    for key, value in html_data.items():
+        if key not in property_data or not property_data.get(key):
+            property_data[key] = value
+
+    # Calculate derived fields
+    if property_data.get('price') and property_data.get('size_sqft'):
+        try:
+            price = float(property_data['price'])
+            sqft = float(property_data['size_sqft'])
+            if sqft > 0:
+                property_data['price_per_sqft'] = round(price / sqft, 2)
+        except (ValueError, TypeError):
+            pass
+
+    # Images
+    if images:
+        property_data['image_urls'] = images[:20]  # Limit to 20 images
+        property_data['image_count'] = len(images)
+
+    return property_data
+
+
+META_MAPPING = {
+    'twitter:text:price': 'price',
+    'twitter:text:beds': 'beds',
+    'twitter:text:baths': 'baths',
+    'twitter:text:sqft': 'size_sqft',
+    'twitter:text:street_address': 'address',
+    'twitter:text:city': 'city',
+    'twitter:text:state_code': 'state',
+    'twitter:text:zip': 'zip_code',
+    'twitter:text:description_simple': 'description',
+    'twitter:text:listing_source': 'listing_source',
+}
+GEO_META_NAME = 'ICBM'
+META_PRICE_PATTERN = re.compile(r'\$?([\d,]+)')
+META_NUMBER_PATTERN = re.compile(r'([\d,]+)')
+
+
 def extract_redfin_meta_data(soup, logger=None):
     """Extract property data from Redfin meta tags"""
-    data = {}
+    meta_contents = {}
+    for meta_name in list(META_MAPPING) + [GEO_META_NAME]:
+        meta = soup.find('meta', {'name': meta_name})
+        meta_contents[meta_name] = meta.get('content') if meta else None
 
-    meta_mapping = {
-        'twitter:text:price': 'price',
-        'twitter:text:beds': 'beds',
-        'twitter:text:baths': 'baths',
-        'twitter:text:sqft': 'size_sqft',
-        'twitter:text:street_address': 'address',
-        'twitter:text:city': 'city',
-        'twitter:text:state_code': 'state',
-        'twitter:text:zip': 'zip_code',
-        'twitter:text:description_simple': 'description',
-        'twitter:text:listing_source': 'listing_source',
-    }
+    return parse_meta_contents(meta_contents, logger)
 
-    try:
-        for meta_name, field in meta_mapping.items():
-            meta = soup.find('meta', {'name': meta_name})
-            if meta and meta.get('content'):
-                content = meta['content']
 
+def parse_meta_contents(meta_contents, logger=None):
+    """
+    Convert meta tag contents into property fields
+
+    Args:
+        meta_contents: dict of meta name -> content of the first meta tag
+            with that name (None when missing)
+    """
+    data = {}
+
+    try:
+        for meta_name, field in META_MAPPING.items():
+            content = meta_contents.get(meta_name)
+            if content:
                 if field == 'price':
-                    price_match = re.search(r'\$?([\d,]+)', content)
+                    price_match = META_PRICE_PATTERN.search(content)
                     if price_match:
                         data[field] = int(price_match.group(1).replace(',', ''))
                 elif field in ['beds']:
@@ -216,19 +415,18 @@ def extract_redfin_meta_data(soup, logger=None):
                     except ValueError:
                         pass
                 elif field == 'size_sqft':
-                    sqft_match = re.search(r'([\d,]+)', content)
+                    sqft_match = META_NUMBER_PATTERN.search(content)
                     if sqft_match:
                         data[field] = int(sqft_match.group(1).replace(',', ''))
                 elif field == 'description':
-                    import html
                     data[field] = html.unescape(content)[:1000]
                 else:
                     data[field] = content
 
         # Extract geo coordinates
-        geo_meta = soup.find('meta', {'name': 'ICBM'})
-        if geo_meta and geo_meta.get('content'):
-            coords = geo_meta['content'].split(',')
+        geo_content = meta_contents.get(GEO_META_NAME)
+        if geo_content:
+            coords = geo_content.split(',')
             if len(coords) == 2:
                 try:
                     data['latitude'] = float(coords[0].strip())
@@ -245,13 +443,24 @@ def extract_redfin_meta_data(soup, logger=None):
 
 def extract_json_ld_data(soup, logger=None):
     """Extract property data from JSON-LD structured data"""
+    try:
+        script_strings = [script.string for script in soup.find_all('script', type='application/ld+json')]
+    except Exception as e:
+        if logger:
+            logger.debug(f"JSON-LD extraction error: {str(e)}")
+        return {}
+
+    return parse_json_ld_strings(script_strings, logger)
+
+
+def parse_json_ld_strings(script_strings, logger=None):
+    """Parse the contents of application/ld+json script tags (in page order)"""
     data = {}
 
     try:
-        script_tags = soup.find_all('script', type='application/ld+json')
-        for script in script_tags:
+        for script_string in script_strings:
             try:
-                json_data = json.loads(script.string)
+                json_data = json.loads(script_string)
 
                 if isinstance(json_data, list):
                     for item in json_data:
@@ -302,7 +511,6 @@ def parse_json_ld_item(item):
 
         # Description
         if item.get('description'):
-            import html
             data['description'] = html.unescape(item['description'])[:1000]
 
         # Name/Title
@@ -479,6 +687,237 @@ def extract_property_images(soup, logger=None):
     return images
 
 
+# Single-pass (lxml) detail page extraction
+# Produces the same property_data as parse_redfin_property_page with one tree
+# walk and one text extraction instead of a find()/find_all()/get_text() per field
+
+# Tags whose strings BeautifulSoup's get_text() leaves out
+NON_TEXT_TAGS = frozenset(['script', 'style', 'template', 'rt', 'rp'])
+DETAIL_META_NAMES = frozenset(list(META_MAPPING) + [GEO_META_NAME])
+REDFIN_PHOTO_MARKER = 'cdn-redfin.com/photo'
+LARGE_PHOTO_MARKERS = ('bigphoto', 'mbpaddedwide', 'genMid')
+
+YEAR_BUILT_PATTERN = re.compile(r'(?:built|year built)[\s:]*(\d{4})', re.IGNORECASE)
+LOT_ACRES_PATTERN = re.compile(r'([\d,\.]+)\s*(?:acre|ac)\b', re.IGNORECASE)
+LOT_SQFT_PATTERN = re.compile(r'lot[\s:]*size[\s:]*[^\d]*([\d,]+)\s*(?:sq\s*ft|sqft)', re.IGNORECASE)
+HOA_PATTERN = re.compile(r'hoa[\s:]*\$?([\d,]+)', re.IGNORECASE)
+MLS_PATTERN = re.compile(r'MLS#?\s*[:\s]?(\d+)')
+DAYS_ON_MARKET_PATTERN = re.compile(r'(\d+)\s*days?\s*on\s*redfin', re.IGNORECASE)
+
+# Property type keywords in priority order, combined into one pattern. Every
+# alternative matches whole words and none can start inside another's match,
+# so one finditer pass finds every type present on the page.
+PROPERTY_TYPE_PATTERNS = [
+    ('single_family', r'single family|single-family', 'Single Family'),
+    ('condo', r'condo|condominium', 'Condo'),
+    ('townhouse', r'townhouse|townhome', 'Townhouse'),
+    ('multi_family', r'multi-?family|duplex|triplex', 'Multi-Family'),
+    ('land', r'land|lot|vacant', 'Land'),
+    ('mobile', r'mobile|manufactured', 'Mobile'),
+]
+PROPERTY_TYPE_PATTERN = re.compile(
+    '|'.join(rf'(?P<{group}>\b(?:{pattern})\b)' for group, pattern, _ in PROPERTY_TYPE_PATTERNS),
+    re.IGNORECASE
+)
+
+
+def _parse_html_document(html_content):
+    """Parse HTML with lxml, returning the root element or None for empty input"""
+    parser = etree.HTMLParser()
+    try:
+        return etree.fromstring(html_content, parser)
+    except ValueError:
+        # lxml rejects str input that carries an XML encoding declaration
+        if isinstance(html_content, str):
+            return etree.fromstring(html_content.encode('utf-8'), parser)
+        raise
+    except etree.XMLSyntaxError:
+        return None
+
+
+class DetailPageScan:
+    """Everything the extractors need from a detail page, collected in one walk"""
+
+    def __init__(self):
+        self.meta_contents = {}
+        self.json_ld_strings = []
+        self.meta_images = []
+        self.preload_images = []
+        self.img_sources = []
+        self.text_parts = []
+
+    def walk(self, root):
+        stack = [(root, True)]
+        while stack:
+            node, in_text = stack.pop()
+            if isinstance(node, str):
+                # Tail string queued behind its element
+                self.text_parts.append(node)
+                continue
+
+            tag = node.tag
+            if tag == 'meta':
+                self._meta(node)
+            elif tag == 'link':
+                self._link(node)
+            elif tag == 'img':
+                src = node.get('src') or node.get('data-src')
+                if src:
+                    self.img_sources.append(src)
+            elif tag == 'script' and node.get('type') == 'application/ld+json':
+                self.json_ld_strings.append(node.text)
+
+            text_ok = in_text and tag not in NON_TEXT_TAGS
+            if text_ok and node.text:
+                self.text_parts.append(node.text)
+
+            # Push children in reverse so they pop in document order
+            for child in reversed(node):
+                if text_ok and child.tail:
+                    stack.append((child.tail, False))
+                if isinstance(child.tag, str):
+                    stack.append((child, text_ok))
+
+        return self
+
+    def _meta(self, node):
+        name = node.get('name')
+        if name in DETAIL_META_NAMES and name not in self.meta_contents:
+            self.meta_contents[name] = node.get('content')
+
+        image_name = name or node.get('property')
+        content = node.get('content')
+        if image_name and 'image' in image_name.lower() and content:
+            self.meta_images.append(content)
+
+    def _link(self, node):
+        rel = node.get('rel')
+        if rel and 'preload' in rel.split() and node.get('as') == 'image':
+            href = node.get('href')
+            if href:
+                self.preload_images.append(href)
+
+    def page_text(self):
+        """Equivalent of soup.get_text(' ', strip=True)"""
+        return ' '.join(part for part in (p.strip() for p in self.text_parts) if part)
+
+    def images(self):
+        """Same selection and order as extract_property_images"""
+        images = []
+        seen = set()
+
+        for img_url in self.meta_images + self.preload_images:
+            if REDFIN_PHOTO_MARKER in img_url and img_url not in seen:
+                seen.add(img_url)
+                images.append(img_url)
+
+        for src in self.img_sources:
+            if REDFIN_PHOTO_MARKER in src and src not in seen:
+                # Skip small thumbnails
+                if any(marker in src for marker in LARGE_PHOTO_MARKERS):
+                    seen.add(src)
+                    images.append(src)
+
+        return images
+
+
+def parse_page_text_fields(original_text, logger=None):
+    """Text-derived fields of extract_html_data, from the page text computed once"""
+    data = {}
+
+    try:
+        page_text = original_text.lower()
+
+        # Year built
+        year_match = YEAR_BUILT_PATTERN.search(page_text)
+        if year_match:
+            year = int(year_match.group(1))
+            if 1800 <= year <= datetime.now().year:
+                data['year_built'] = year
+
+        # Lot size in acres
+        lot_match = LOT_ACRES_PATTERN.search(page_text)
+        if lot_match:
+            try:
+                acres = float(lot_match.group(1).replace(',', ''))
+                if 0 < acres < 10000:  # Sanity check
+                    data['lot_size_acres'] = acres
+                    data['lot_size_sqft'] = int(acres * 43560)
+            except ValueError:
+                pass
+
+        # Lot size in sqft (if not already set)
+        if 'lot_size_sqft' not in data:
+            lot_sqft_match = LOT_SQFT_PATTERN.search(page_text)
+            if lot_sqft_match:
+                try:
+                    data['lot_size_sqft'] = int(lot_sqft_match.group(1).replace(',', ''))
+                except ValueError:
+                    pass
+
+        # Property type - highest-priority type present anywhere on the page
+        found_types = {match.lastgroup for match in PROPERTY_TYPE_PATTERN.finditer(page_text)}
+        for group, _, prop_type in PROPERTY_TYPE_PATTERNS:
+            if group in found_types:
+                data['property_type'] = prop_type
+                break
+
+        # HOA fee
+        hoa_match = HOA_PATTERN.search(page_text)
+        if hoa_match:
+            try:
+                data['hoa_fee'] = int(hoa_match.group(1).replace(',', ''))
+            except ValueError:
+                pass
+
+        # MLS number (original case)
+        mls_match = MLS_PATTERN.search(original_text)
+        if mls_match:
+            data['mls_number'] = mls_match.group(1)
+
+        # Days on market
+        dom_match = DAYS_ON_MARKET_PATTERN.search(page_text)
+        if dom_match:
+            try:
+                data['days_on_market'] = int(dom_match.group(1))
+            except ValueError:
+                pass
+
+    except Exception as e:
+        if logger:
+            logger.debug(f"HTML extraction error: {str(e)}")
+
+    return data
+
+
+def parse_redfin_property_page_fast(html_content, url, logger=None):
+    """Single-pass lxml equivalent of parse_redfin_property_page"""
+    scan = DetailPageScan()
+    root = _parse_html_document(html_content)
+    if root is not None:
+        scan.walk(root)
+
+    return assemble_property_data(
+        url,
+        parse_meta_contents(scan.meta_contents, logger),
+        parse_json_ld_strings(scan.json_ld_strings, logger),
+        parse_page_text_fields(scan.page_text(), logger),
+        scan.images()
+    )
+
+
+DETAIL_EXTRACTORS = {
+    'soup': parse_redfin_property_page,
+    'fast': parse_redfin_property_page_fast,
+}
+
+
+def get_detail_extractor(name=None):
+    """Return the detail page parser for a name (DETAIL_EXTRACTOR env, default 'fast')"""
+    name = name or os.environ.get('DETAIL_EXTRACTOR', 'fast')
+    return DETAIL_EXTRACTORS.get(name, parse_redfin_property_page_fast)
+
+
 def download_image(url, session, timeout=15, logger=None):
     """Download a single image and return bytes"""
     try:
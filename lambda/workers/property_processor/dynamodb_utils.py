@@ -8,6 +8,8 @@ from datetime import datetime
 import time
 from decimal import Decimal
 
+from write_buffer import mark_urls_processed
+
 def convert_to_decimal(value):
     """Convert numeric values to Decimal for DynamoDB"""
     if isinstance(value, float):
@@ -621,20 +623,14 @@ def mark_urls_batch_processed(url_items, table, logger=None):
     if not url_items:
         return successfully_marked
     
-    # Since BatchWriter doesn't support update_item, use individual update calls
-    for url_item in url_items:
-        try:
-            url = url_item.get('url') if isinstance(url_item, dict) else url_item
-            table.update_item(
-                Key={'url': url},
-                UpdateExpression="SET #processed = :processed",
-                ExpressionAttributeNames={'#processed': 'processed'},
-                ExpressionAttributeValues={':processed': 'Y'}
-            )
-            successfully_marked.append(url_item)
-        except Exception as e:
-            if logger:
-                logger.warning(f"Failed to mark URL {url} as processed: {str(e)}")
+    url_infos = [item if isinstance(item, dict) else {'url': item} for item in url_items]
+    try:
+        failed_urls = set(mark_urls_processed(url_infos, table, logger))
+        successfully_marked.extend(item for item, url_info in zip(url_items, url_infos, strict=True)
+                                   if url_info['url'] not in failed_urls)
+    except Exception as e:
+        if logger:
+            logger.warning(f"Failed to batch mark {len(url_infos)} URLs as processed: {str(e)}")
     
     if logger:
         logger.debug(f"Successfully marked {len(successfully_marked)}/{len(url_items)} URLs as processed")
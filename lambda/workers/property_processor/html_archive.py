@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Raw HTML archive for Redfin detail pages
+Every fetched page is stored zstd-compressed under the SHA-256 of its bytes,
+with a small pointer per URL naming the latest hash, so extractor fixes can be
+re-run over the archive instead of re-scraping Redfin
+
+Layout (local directory or S3 bucket, same keys under the prefix):
+    objects/ab/<sha256>.html.zst    compressed page bytes, written once
+    urls/<sha1(url)>.json           {'url', 'sha256', 'size', 'city', 'fetched_at'}
+"""
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+
+import boto3
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+DEFAULT_PREFIX = 'html-archive/'
+DEFAULT_LEVEL = 10
+
+
+def content_hash(html_bytes):
+    """SHA-256 of the raw page bytes"""
+    return hashlib.sha256(html_bytes).hexdigest()
+
+
+class HtmlArchive:
+    """
+    Content-addressed, zstd-compressed store of fetched detail pages
+
+    Uses a local directory when root_dir is given (tests, local runs) and
+    S3 otherwise. Objects are immutable, so a page whose bytes were already
+    archived costs only a pointer write.
+    """
+
+    def __init__(self, bucket=None, root_dir=None, prefix=DEFAULT_PREFIX, level=DEFAULT_LEVEL, logger=None):
+        if not ZSTD_AVAILABLE:
+            raise ImportError("zstandard is required for the HTML archive")
+        if not bucket and not root_dir:
+            raise ValueError("HtmlArchive needs a bucket or a root_dir")
+
+        self.bucket = bucket
+        self.root_dir = root_dir
+        self.prefix = prefix if bucket else ''
+        self.level = level
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.known_hashes = set()
+        self._s3 = None
+        self.stats = {'pages': 0, 'new_objects': 0, 'duplicates': 0, 'bytes_in': 0, 'bytes_stored': 0, 'failed': 0}
+
+    def _s3_client(self):
+        # Worker threads share one client; creating it is not thread-safe, using it is
+        with self.lock:
+            if self._s3 is None:
+                self._s3 = boto3.client('s3', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
+        return self._s3
+
+    def _count(self, **increments):
+        with self.lock:
+            for stat, value in increments.items():
+                self.stats[stat] += value
+
+    def object_key(self, sha256):
+        return f"{self.prefix}objects/{sha256[:2]}/{sha256}.html.zst"
+
+    def pointer_key(self, url):
+        return f"{self.prefix}urls/{hashlib.sha1(url.encode('utf-8')).hexdigest()}.json"
+
+    # Storage primitives
+
+    def _exists(self, key):
+        if self.root_dir:
+            return os.path.exists(os.path.join(self.root_dir, key))
+        try:
+            self._s3_client().head_object(Bucket=self.bucket, Key=key)
+            return True
+        except Exception:
+            return False
+
+    def _write(self, key, data, content_type):
+        if self.root_dir:
+            path = os.path.join(self.root_dir, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        else:
+            self._s3_client().put_object(Bucket=self.bucket, Key=key, Body=data, ContentType=content_type)
+
+    def _read(self, key):
+        if self.root_dir:
+            with open(os.path.join(self.root_dir, key), 'rb') as f:
+                return f.read()
+        return self._s3_client().get_object(Bucket=self.bucket, Key=key)['Body'].read()
+
+    def _list(self, prefix):
+        if self.root_dir:
+            directory = os.path.join(self.root_dir, prefix)
+            if os.path.isdir(directory):
+                for name in sorted(os.listdir(directory)):
+                    if name.endswith('.json'):
+                        yield f"{prefix}{name}"
+            return
+
+        paginator = self._s3_client().get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                yield obj['Key']
+
+    # Archive API
+
+    def put(self, url, html_bytes, city=None):
+        """
+        Archive a fetched page and point its URL at it
+
+        Returns the content hash, or None if the write failed (never raises)
+        """
+        try:
+            sha256 = content_hash(html_bytes)
+            key = self.object_key(sha256)
+
+            with self.lock:
+                known = sha256 in self.known_hashes
+            if known or self._exists(key):
+                self._count(pages=1, duplicates=1, bytes_in=len(html_bytes))
+            else:
+                compressed = zstandard.ZstdCompressor(level=self.level).compress(html_bytes)
+                self._write(key, compressed, 'application/zstd')
+                self._count(pages=1, new_objects=1, bytes_in=len(html_bytes), bytes_stored=len(compressed))
+            with self.lock:
+                self.known_hashes.add(sha256)
+
+            pointer = {
+                'url': url,
+                'sha256': sha256,
+                'size': len(html_bytes),
+                'city': city or '',
+                'fetched_at': datetime.now().isoformat()
+            }
+            self._write(self.pointer_key(url), json.dumps(pointer).encode('utf-8'), 'application/json')
+            return sha256
+
+        except Exception as e:
+            self._count(failed=1)
+            if self.logger:
+                self.logger.warning(f"Failed to archive {url}: {str(e)}")
+            return None
+
+    def get_pointer(self, url):
+        """Return the pointer for a URL, or None if it was never archived"""
+        try:
+            return json.loads(self._read(self.pointer_key(url)))
+        except Exception:
+            return None
+
+    def read_object(self, sha256):
+        """Return the decompressed page bytes for a content hash"""
+        return zstandard.ZstdDecompressor().decompress(self._read(self.object_key(sha256)))
+
+    def get(self, url):
+        """Return the latest archived page bytes for a URL, or None"""
+        pointer = self.get_pointer(url)
+        if not pointer:
+            return None
+        return self.read_object(pointer['sha256'])
+
+    def iter_pointers(self):
+        """Yield every URL pointer in the archive"""
+        for key in self._list(f"{self.prefix}urls/"):
+            try:
+                yield json.loads(self._read(key))
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning(f"Skipping unreadable archive pointer {key}: {str(e)}")
+
+
+def get_html_archive(config, logger=None):
+    """Build the archive from processor config, or None when archiving is off"""
+    if not (config.get('html_archive_dir') or config.get('html_archive_bucket')):
+        return None
+    if not ZSTD_AVAILABLE:
+        if logger:
+            logger.warning("zstandard not available, HTML archive disabled")
+        return None
+
+    return HtmlArchive(
+        bucket=config.get('html_archive_bucket') or None,
+        root_dir=config.get('html_archive_dir') or None,
+        logger=logger
+    )
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Process pool for detail page parsing
+Parsing is CPU-bound and holds the GIL; handing raw HTML bytes to worker
+processes lets fetch threads keep the network busy while parsing uses every core
+"""
+import os
+import time
+import threading
+import multiprocessing
+from queue import Queue
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from core_scraper import get_detail_extractor
+
+
+def parse_page_bytes(html_bytes, url, extractor=None):
+    """Worker-side entry point: decode raw HTML and return property_data as a plain dict"""
+    html_content = html_bytes.decode('utf-8', errors='replace')
+    return get_detail_extractor(extractor)(html_content, url, None)
+
+
+def _noop():
+    return os.getpid()
+
+
+def _pipe_worker(conn):
+    """Child process loop for PipeProcessPool"""
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+
+        fn, args = task
+        try:
+            conn.send((True, fn(*args)))
+        except Exception as e:
+            conn.send((False, e))
+
+
+class PipeProcessPool:
+    """
+    Minimal process pool over multiprocessing Pipes
+
+    AWS Lambda has no /dev/shm, so ProcessPoolExecutor (which needs POSIX
+    semaphores for its queues) cannot start there. Pipes work: each worker
+    process is driven by one feeder thread that pulls tasks from a shared
+    queue, sends them down the pipe and resolves the task's Future.
+    """
+
+    def __init__(self, max_workers):
+        context = multiprocessing.get_context('fork')
+        self.tasks = Queue()
+        self.processes = []
+        self.threads = []
+
+        for _ in range(max_workers):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_pipe_worker, args=(child_conn,), daemon=True)
+            process.start()
+            child_conn.close()
+            self.processes.append(process)
+
+            thread = threading.Thread(target=self._feed, args=(parent_conn,), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _feed(self, conn):
+        while True:
+            item = self.tasks.get()
+            if item is None:
+                try:
+                    conn.send(None)
+                except OSError:
+                    pass
+                conn.close()
+                return
+
+            future, fn, args = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                conn.send((fn, args))
+                ok, value = conn.recv()
+            except (EOFError, OSError) as e:
+                future.set_exception(RuntimeError(f"Parse worker died: {str(e)}"))
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.tasks.put((future, fn, args))
+        return future
+
+    def shutdown(self, wait=True):
+        for _ in self.threads:
+            self.tasks.put(None)
+        if wait:
+            for thread in self.threads:
+                thread.join()
+            for process in self.processes:
+                process.join(timeout=5)
+
+
+class ParsePool:
+    """
+    Detail page parsing in worker processes
+
+    Uses ProcessPoolExecutor where the host supports it and falls back to
+    PipeProcessPool (e.g. on Lambda). Worker processes are all started up
+    front, before any fetch threads exist, so fork never copies a held lock.
+    """
+
+    def __init__(self, processes, extractor=None, logger=None):
+        self.processes = max(1, int(processes))
+        self.extractor = extractor
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.pages = 0
+        self.failed = 0
+        self.wait_seconds = 0.0
+
+        try:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.processes, mp_context=multiprocessing.get_context('fork')
+            )
+            # Start every worker now (fork context launches them all on first submit)
+            self.executor.submit(_noop).result(timeout=30)
+            self.kind = 'process_pool'
+        except (OSError, NotImplementedError, ImportError) as e:
+            if logger:
+                logger.info(f"ProcessPoolExecutor unavailable ({str(e)}), using pipe-based workers")
+            self.executor = PipeProcessPool(self.processes)
+            self.kind = 'pipe_pool'
+
+        if logger:
+            logger.info(f"Parsing detail pages in {self.processes} worker process(es) ({self.kind})")
+
+    def submit(self, html_bytes, url):
+        """Queue a page for parsing; returns a Future resolving to property_data"""
+        return self.executor.submit(parse_page_bytes, html_bytes, url, self.extractor)
+
+    def parse(self, html_bytes, url):
+        """Parse a page in a worker process, blocking the calling thread (not the GIL)"""
+        start = time.perf_counter()
+        try:
+            return self.submit(html_bytes, url).result()
+        except Exception:
+            with self.lock:
+                self.failed += 1
+            raise
+        finally:
+            with self.lock:
+                self.pages += 1
+                self.wait_seconds += time.perf_counter() - start
+
+    def stats(self):
+        with self.lock:
+            return {
+                'kind': self.kind,
+                'processes': self.processes,
+                'pages': self.pages,
+                'failed': self.failed,
+                'avg_parse_wait_seconds': round(self.wait_seconds / self.pages, 4) if self.pages else 0.0
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
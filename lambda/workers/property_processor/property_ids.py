@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Canonical property IDs for Redfin homes
+Property keys carry the date a home was first seen (PROP#<date>_<id>), so a
+home re-scraped on another day used to get a second item. Each home now has
+one mapping item in the properties table, REDFIN#<id> / REDFIN_ID, pointing
+at its canonical property_id: resolving an ID is one GetItem (or one
+BatchGetItem per 100 homes) and the first writer of a mapping wins
+"""
+import time
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+from core_scraper import create_property_id_key, extract_property_id_from_url
+
+ID_MAP_SORT_KEY = 'REDFIN_ID'
+
+
+def id_map_key(raw_property_id):
+    """Properties-table key of a home's ID mapping item"""
+    return {'property_id': f"REDFIN#{raw_property_id}", 'sort_key': ID_MAP_SORT_KEY}
+
+
+def get_item_raw_id(item):
+    """Redfin home ID of a stored META item (redfin_id, listing URL, then key)"""
+    if item.get('redfin_id'):
+        return str(item['redfin_id'])
+
+    raw_property_id = extract_property_id_from_url(item.get('listing_url', ''))
+    if raw_property_id:
+        return raw_property_id
+
+    # Format: PROP#YYYYMMDD_123456 or PROP#123456
+    property_id = item.get('property_id') or ''
+    if property_id.startswith('PROP#'):
+        return property_id[5:].split('_', 1)[-1] or None
+
+    return None
+
+
+def lookup_property_ids(raw_property_ids, table, logger=None):
+    """
+    BatchGetItem the mapping items of several homes (100 keys per call)
+
+    Returns dict of raw ID -> canonical property_id for the homes already mapped
+    """
+    client = table.meta.client
+    raw_property_ids = list(dict.fromkeys(raw_property_ids))
+    found = {}
+
+    for start in range(0, len(raw_property_ids), 100):
+        request_items = {
+            table.name: {
+                'Keys': [id_map_key(raw_id) for raw_id in raw_property_ids[start:start + 100]],
+                'ProjectionExpression': 'property_id, canonical_id'
+            }
+        }
+
+        for attempt in range(5):
+            response = client.batch_get_item(RequestItems=request_items)
+            for item in response.get('Responses', {}).get(table.name, []):
+                found[item['property_id'].split('#', 1)[1]] = item['canonical_id']
+
+            request_items = response.get('UnprocessedKeys') or {}
+            if not request_items:
+                break
+            time.sleep(0.1 * (2 ** attempt))
+
+        if request_items:
+            raise RuntimeError(f"{len(request_items[table.name]['Keys'])} ID mappings unprocessed after retries")
+
+    if logger:
+        logger.debug(f"Resolved {len(found)}/{len(raw_property_ids)} property IDs from the ID map")
+
+    return found
+
+
+def register_property_id(raw_property_id, property_id, table):
+    """
+    Create a home's mapping unless one exists
+
+    Returns the canonical property_id - property_id, or the one another
+    writer registered first
+    """
+    try:
+        table.meta.client.put_item(
+            TableName=table.name,
+            Item=dict(id_map_key(raw_property_id), canonical_id=property_id,
+                      created_at=datetime.now().isoformat()),
+            ConditionExpression='attribute_not_exists(property_id)'
+        )
+        return property_id
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            raise
+
+    response = table.meta.client.get_item(TableName=table.name, Key=id_map_key(raw_property_id), ConsistentRead=True)
+    return response['Item']['canonical_id']
+
+
+def assign_canonical_ids(properties, table, logger=None):
+    """
+    Point extracted properties at their homes' canonical property_id
+
+    Homes without a mapping are registered under the key they were
+    extracted with. Properties without a redfin_id keep their property_id.
+
+    Args:
+        properties: property_data dicts, updated in place
+    """
+    raw_ids = [p['redfin_id'] for p in properties if p.get('redfin_id') and p.get('property_id')]
+    if not raw_ids:
+        return properties
+
+    canonical = lookup_property_ids(raw_ids, table, logger)
+    for property_data in properties:
+        raw_id = property_data.get('redfin_id')
+        if not raw_id or not property_data.get('property_id'):
+            continue
+        if raw_id not in canonical:
+            canonical[raw_id] = register_property_id(raw_id, property_data['property_id'], table)
+        property_data['property_id'] = canonical[raw_id]
+
+    return properties
+
+
+def resolve_property_id(raw_property_id, table, logger=None):
+    """Canonical property_id of one home, registering a new one if it is unmapped"""
+    canonical = lookup_property_ids([raw_property_id], table, logger)
+    if raw_property_id in canonical:
+        return canonical[raw_property_id]
+    return register_property_id(raw_property_id, create_property_id_key(raw_property_id), table)
+
+
+def scan_property_items(table, logger=None):
+    """Every item of the properties table, grouped by property_id"""
+    items = {}
+    scan_kwargs = {}
+
+    while True:
+        response = table.scan(**scan_kwargs)
+        for item in response.get('Items', []):
+            items.setdefault(item['property_id'], []).append(item)
+
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    if logger:
+        logger.info(f"Scanned {sum(len(v) for v in items.values())} items for {len(items)} keys")
+
+    return items
+
+
+def merge_property_items(metas):
+    """
+    Merge the META items of one home into one
+
+    The earliest-seen item's key is kept (user preferences are most likely
+    to point at it); extracted fields come from the most recent analysis and
+    first_seen_date is the earliest of all.
+    """
+    by_age = sorted(metas, key=lambda m: (m.get('first_seen_date') or m.get('analysis_date') or '', m['property_id']))
+    latest = max(metas, key=lambda m: m.get('analysis_date') or '')
+
+    merged = dict(by_age[0])
+    merged.update({k: v for k, v in latest.items() if k not in ('property_id', 'sort_key', 'first_seen_date')})
+    first_seen = [m['first_seen_date'] for m in metas if m.get('first_seen_date')]
+    if first_seen:
+        merged['first_seen_date'] = min(first_seen)
+
+    return merged
+
+
+def merge_duplicate_properties(table, preferences_table=None, dry_run=False, logger=None):
+    """
+    One-off migration: fold each home's duplicate items into one and write the ID map
+
+    For every home the merged META item is written under the canonical key,
+    the other keys' non-META items (price history) move under it, the
+    duplicates are deleted and the mapping item is written. With a
+    preferences_table, user preferences on a duplicate move to the
+    canonical key.
+
+    Returns:
+        Summary dict with 'homes', 'duplicate_keys', 'merged' (old -> canonical)
+    """
+    items_by_key = scan_property_items(table, logger)
+    homes = {}
+    mapped = set()
+
+    for property_id, items in items_by_key.items():
+        if property_id.startswith('REDFIN#'):
+            mapped.add(property_id.split('#', 1)[1])
+        for item in items:
+            if item.get('sort_key') == 'META' and property_id.startswith('PROP#'):
+                raw_id = get_item_raw_id(item)
+                if raw_id:
+                    homes.setdefault(raw_id, []).append(item)
+
+    merged_keys = {}
+    for raw_id, metas in homes.items():
+        if len(metas) == 1:
+            if not dry_run and raw_id not in mapped:
+                register_property_id(raw_id, metas[0]['property_id'], table)
+            continue
+
+        merged = merge_property_items(metas)
+        canonical_id = merged['property_id']
+        duplicates = [m['property_id'] for m in metas if m['property_id'] != canonical_id]
+        for duplicate in duplicates:
+            merged_keys[duplicate] = canonical_id
+
+        if dry_run:
+            continue
+
+        with table.batch_writer(overwrite_by_pkeys=['property_id', 'sort_key']) as batch:
+            batch.put_item(Item=merged)
+            for duplicate in duplicates:
+                for item in items_by_key[duplicate]:
+                    if item['sort_key'] != 'META':
+                        batch.put_item(Item=dict(item, property_id=canonical_id))
+                    batch.delete_item(Key={'property_id': duplicate, 'sort_key': item['sort_key']})
+
+        # Overwrite rather than register: the map must name the key that survived
+        table.put_item(Item=dict(id_map_key(raw_id), canonical_id=canonical_id,
+                                 created_at=datetime.now().isoformat()))
+
+    moved_preferences = 0
+    if preferences_table is not None and merged_keys and not dry_run:
+        moved_preferences = repoint_preferences(preferences_table, merged_keys, logger)
+
+    summary = {
+        'homes': len(homes),
+        'duplicate_keys': len(merged_keys),
+        'moved_preferences': moved_preferences,
+        'merged': merged_keys
+    }
+    if logger:
+        logger.info(f"Merged {len(merged_keys)} duplicate keys across {len(homes)} homes"
+                    f"{' (dry run)' if dry_run else ''}")
+
+    return summary
+
+
+def repoint_preferences(preferences_table, merged_keys, logger=None):
+    """Move user preferences from merged duplicate keys to the canonical key"""
+    moved = 0
+    scan_kwargs = {}
+
+    while True:
+        response = preferences_table.scan(**scan_kwargs)
+        for item in response.get('Items', []):
+            canonical_id = merged_keys.get(item.get('property_id'))
+            if not canonical_id:
+                continue
+            preferences_table.put_item(Item=dict(item, property_id=canonical_id))
+            preferences_table.delete_item(Key={'user_id': item['user_id'], 'property_id': item['property_id']})
+            moved += 1
+
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    if logger:
+        logger.info(f"Moved {moved} user preferences to canonical property IDs")
+
+    return moved
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Thread-safe request pacing for Redfin
+Token-bucket rate limiting (no sleeping while holding the lock), AIMD
+adjustment of allowed concurrency, Retry-After support and counters
+"""
+import time
+import random
+import asyncio
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+def parse_retry_after(value):
+    """Parse a Retry-After header (seconds or HTTP date) into seconds, or None"""
+    if value is None or value == '':
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = parsedate_to_datetime(str(value))
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class RateLimiter:
+    """
+    Thread-safe rate limiter for parallel requests
+
+    Pacing is a token bucket in its virtual-scheduling form: each wait()
+    reserves the next send time under the lock (a random delay between
+    min_delay and max_delay, scaled by the backoff multiplier) and then
+    sleeps outside the lock, so waiting threads never serialize behind a
+    sleeper. burst > 1 lets that many requests go out back to back after
+    an idle period.
+
+    Concurrency is gated separately through slot(): the allowed number of
+    in-flight requests grows additively on success and halves on 403/429.
+    """
+
+    def __init__(self, min_delay=3.0, max_delay=8.0, burst=1, max_concurrency=1, initial_concurrency=None):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.burst = max(1, burst)
+        self.max_concurrency = max(1, max_concurrency)
+
+        self.lock = threading.Lock()
+        self.slot_available = threading.Condition(self.lock)
+
+        # Token bucket state (theoretical arrival time of the next request)
+        self.next_send_time = 0.0
+        self.consecutive_errors = 0
+        self.backoff_multiplier = 1.0
+
+        # AIMD concurrency state
+        self.concurrency_limit = float(initial_concurrency or self.max_concurrency)
+        self.in_flight = 0
+
+        # Counters
+        self.started_at = time.monotonic()
+        self.requests = 0
+        self.successes = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.total_slot_wait_seconds = 0.0
+
+    def _mean_delay(self):
+        return (self.min_delay + self.max_delay) / 2.0
+
+    def _reserve(self):
+        """Reserve the next send time; returns seconds the caller must sleep"""
+        with self.lock:
+            now = time.monotonic()
+            # Up to burst-1 intervals of idle credit may be spent immediately
+            tolerance = (self.burst - 1) * self._mean_delay() * self.backoff_multiplier
+            send_time = max(now, self.next_send_time - tolerance)
+            delay = random.uniform(self.min_delay, self.max_delay) * self.backoff_multiplier
+            self.next_send_time = max(self.next_send_time, send_time) + delay
+
+            sleep_time = send_time - now
+            self.requests += 1
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+            return sleep_time
+
+    def _finish_wait(self, sleep_time):
+        with self.lock:
+            self.waiting -= 1
+            self.total_wait_seconds += max(sleep_time, 0.0)
+            self.max_wait_seconds = max(self.max_wait_seconds, sleep_time)
+
+    def wait(self):
+        """Wait for appropriate delay between requests"""
+        sleep_time = self._reserve()
+        try:
+            if sleep_time > 0:
+                time.sleep(sleep_time)
+        finally:
+            self._finish_wait(sleep_time)
+
+    async def wait_async(self):
+        """wait() for asyncio callers - sleeps without blocking the event loop"""
+        sleep_time = self._reserve()
+        try:
+            if sleep_time > 0:
+                await asyncio.sleep(sleep_time)
+        finally:
+            self._finish_wait(sleep_time)
+
+    def acquire_slot(self, timeout=None):
+        """Block until an in-flight slot is free under the current concurrency limit"""
+        start = time.monotonic()
+        with self.slot_available:
+            while self.in_flight >= max(1, int(self.concurrency_limit)):
+                remaining = None if timeout is None else timeout - (time.monotonic() - start)
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.slot_available.wait(remaining)
+            self.in_flight += 1
+            self.total_slot_wait_seconds += time.monotonic() - start
+        return True
+
+    def release_slot(self):
+        with self.slot_available:
+            self.in_flight = max(0, self.in_flight - 1)
+            self.slot_available.notify()
+
+    @contextmanager
+    def slot(self):
+        """Hold an in-flight slot and pace the request: `with limiter.slot(): fetch()`"""
+        self.acquire_slot()
+        try:
+            self.wait()
+            yield
+        finally:
+            self.release_slot()
+
+    def record_error(self, is_rate_limit=False, retry_after=None):
+        """
+        Record an error and increase backoff if needed
+
+        Args:
+            is_rate_limit: True for 403/429 responses (halves allowed concurrency)
+            retry_after: Retry-After header value or seconds - no request is
+                sent by any thread before it expires
+        """
+        retry_seconds = parse_retry_after(retry_after)
+        with self.slot_available:
+            self.errors += 1
+            self.consecutive_errors += 1
+            if is_rate_limit:
+                self.rate_limited += 1
+                self.concurrency_limit = max(1.0, self.concurrency_limit / 2.0)
+            if is_rate_limit or self.consecutive_errors > 3:
+                self.backoff_multiplier = min(self.backoff_multiplier * 1.5, 5.0)
+            if retry_seconds:
+                self.next_send_time = max(self.next_send_time, time.monotonic() + retry_seconds)
+
+    def record_success(self):
+        """Record successful request and reset backoff"""
+        with self.slot_available:
+            self.successes += 1
+            self.consecutive_errors = 0
+            self.backoff_multiplier = max(self.backoff_multiplier * 0.9, 1.0)
+            # Additive increase: about +1 slot per window of successful requests
+            previous_limit = int(self.concurrency_limit)
+            self.concurrency_limit = min(
+                float(self.max_concurrency),
+                self.concurrency_limit + 1.0 / max(self.concurrency_limit, 1.0)
+            )
+            if int(self.concurrency_limit) > previous_limit:
+                self.slot_available.notify_all()
+
+    def stats(self):
+        """Counters for the run summary"""
+        with self.lock:
+            elapsed = max(time.monotonic() - self.started_at, 1e-9)
+            return {
+                'requests': self.requests,
+                'successes': self.successes,
+                'errors': self.errors,
+                'rate_limited': self.rate_limited,
+                'request_rate_per_min': round(self.requests / elapsed * 60, 2),
+                'avg_wait_seconds': round(self.total_wait_seconds / self.requests, 3) if self.requests else 0.0,
+                'max_wait_seconds': round(self.max_wait_seconds, 3),
+                'total_slot_wait_seconds': round(self.total_slot_wait_seconds, 3),
+                'max_waiting': self.max_waiting,
+                'concurrency_limit': int(self.concurrency_limit),
+                'backoff_multiplier': round(self.backoff_multiplier, 2),
+            }
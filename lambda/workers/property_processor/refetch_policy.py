@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Freshness policy for detail-page refetches
+A detail page used to be fetched once, when its URL was new. A background
+stage now scores every stored home on how likely its page has changed since
+the last fetch - listing age, time since that fetch, card price or status
+changes seen by the collector, and whether a user favorited it - and puts the
+most overdue URLs back on the pending-index, up to a budget per run, so the
+rate-limited fetch budget goes to pages that are likely to have changed
+
+The processor records the SHA-256 of every fetched page, with its
+per-request scripts and tokens stripped, on its tracking item (content_hash,
+fetched_at); a refetched page with the same hash is marked processed without
+being parsed or written
+"""
+import time
+from datetime import datetime
+
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+from url_leases import is_conditional_check_failure, pending_shard_for
+
+# Refetch interval by listing age: (max age in days, hours between fetches)
+REFETCH_INTERVALS = ((7, 24), (30, 72), (90, 168), (None, 336))
+# Favorited homes are refetched this much more often
+FAVORITE_INTERVAL_FACTOR = 0.25
+# Added to the score of a home whose card price or status changed since its last fetch
+CARD_CHANGE_BOOST = 2.0
+# Never refetch a page fetched less than this long ago, whatever changed
+MIN_REFETCH_HOURS = 6
+DEFAULT_REFETCH_BUDGET = 200
+
+# Sparse GSI on listing_url: META items only, projecting PROPERTY_FIELDS
+REFETCH_INDEX = 'refetch-index'
+
+PROPERTY_FIELDS = (
+    'property_id', 'listing_url', 'city', 'days_on_market', 'first_seen_date', 'extraction_timestamp',
+    'last_price_update', 'card_status_changed_at'
+)
+
+
+def to_epoch(value):
+    """Epoch seconds of a stored timestamp (epoch number or ISO string), None if unset or unreadable"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            return None
+    return float(value)
+
+
+def listing_age_days(item, now):
+    """Days on market now: days_on_market at extraction plus the days since, else days since first seen"""
+    extracted = to_epoch(item.get('extraction_timestamp'))
+    if item.get('days_on_market') and extracted:
+        return float(item['days_on_market']) + (now - extracted) / 86400
+
+    first_seen = to_epoch(item.get('first_seen_date'))
+    if first_seen:
+        return (now - first_seen) / 86400
+    return 0.0
+
+
+def refetch_interval_hours(age_days, favorited=False):
+    """Hours a page is considered fresh: new listings change most, favorites matter most"""
+    factor = FAVORITE_INTERVAL_FACTOR if favorited else 1
+    for max_age, hours in REFETCH_INTERVALS:
+        if max_age is None or age_days <= max_age:
+            return hours * factor
+
+
+def last_fetch_time(item, fetch_state):
+    """When the page was last fetched: the tracking item's fetched_at, else the record's extraction time"""
+    fetched_at = to_epoch((fetch_state or {}).get('fetched_at'))
+    return fetched_at or to_epoch(item.get('extraction_timestamp')) or to_epoch(item.get('first_seen_date'))
+
+
+def refetch_score(item, fetch_state=None, favorited=False, now=None):
+    """
+    How overdue a home's detail page is
+
+    Hours since the last fetch over the refetch interval (1.0 = due), plus
+    CARD_CHANGE_BOOST if the card price or status changed since that fetch.
+    Pages fetched less than MIN_REFETCH_HOURS ago score 0.
+    """
+    now = now or time.time()
+    fetched = last_fetch_time(item, fetch_state)
+    if fetched is None:
+        return CARD_CHANGE_BOOST
+
+    hours_since = (now - fetched) / 3600
+    if hours_since < MIN_REFETCH_HOURS:
+        return 0.0
+
+    score = hours_since / refetch_interval_hours(listing_age_days(item, now), favorited)
+
+    card_changes = [to_epoch(item.get(field)) for field in ('last_price_update', 'card_status_changed_at')]
+    if any(changed and changed > fetched for changed in card_changes):
+        score += CARD_CHANGE_BOOST
+
+    return score
+
+
+def plan_refetches(properties, fetch_states, favorite_ids, budget=DEFAULT_REFETCH_BUDGET, now=None):
+    """
+    Pick the most overdue pages, up to budget
+
+    URLs that are pending (new, or already waiting for a retry) or failed
+    for good are left alone.
+
+    Args:
+        properties: META items (PROPERTY_FIELDS)
+        fetch_states: dict of URL -> tracking item
+        favorite_ids: property_ids at least one user favorited
+
+    Returns:
+        Due candidates ({'url', 'property_id', 'city', 'score'}), most overdue first
+    """
+    now = now or time.time()
+    candidates = []
+
+    for item in properties:
+        url = item.get('listing_url')
+        if not url:
+            continue
+        fetch_state = fetch_states.get(url)
+        if fetch_state is not None and fetch_state.get('processed') != 'Y':
+            continue
+
+        score = refetch_score(item, fetch_state, item['property_id'] in favorite_ids, now)
+        if score >= 1.0:
+            candidates.append({'url': url, 'property_id': item['property_id'], 'city': item.get('city', ''),
+                               'score': round(score, 3)})
+
+    candidates.sort(key=lambda c: c['score'], reverse=True)
+    return candidates[:budget]
+
+
+def scan_all(table, scan_kwargs):
+    items = []
+    while True:
+        response = table.scan(**scan_kwargs)
+        items.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return items
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def scan_refetch_properties(table, logger=None):
+    """
+    META items with the fields the policy scores on
+
+    Reads the refetch-index, which holds only META items and only those
+    fields, so price history and ID mapping items are never read. Falls back
+    to a filtered scan of the whole table while the index is being built.
+    """
+    names = {f"#f{i}": field for i, field in enumerate(PROPERTY_FIELDS)}
+    scan_kwargs = {
+        'FilterExpression': Attr('sort_key').eq('META'),
+        'ProjectionExpression': ', '.join(names),
+        'ExpressionAttributeNames': names
+    }
+    try:
+        items = scan_all(table, dict(scan_kwargs, IndexName=REFETCH_INDEX))
+    except ClientError as e:
+        if logger:
+            logger.warning(f"{REFETCH_INDEX} unavailable, scanning the properties table: {str(e)}")
+        items = scan_all(table, scan_kwargs)
+
+    if logger:
+        logger.info(f"Read {len(items)} properties to score for refetch")
+
+    return items
+
+
+def scan_fetch_states(url_table, logger=None):
+    """
+    Tracking items by URL ({'url', 'processed', 'fetched_at'})
+
+    Every tracked URL is read, since pending and failed ones must be known
+    to be skipped; the projection keeps each one to a few bytes, so a run
+    costs about one read unit per 4 KB of URLs.
+    """
+    items = scan_all(url_table, {
+        'ProjectionExpression': '#u, #p, fetched_at',
+        'ExpressionAttributeNames': {'#u': 'url', '#p': 'processed'}
+    })
+
+    if logger:
+        logger.debug(f"Read fetch state of {len(items)} tracked URLs")
+
+    return {item['url']: item for item in items}
+
+
+def load_favorite_ids(preferences_table, logger=None):
+    """property_ids that at least one user has favorited"""
+    if preferences_table is None:
+        return set()
+
+    items = scan_all(preferences_table, {
+        'FilterExpression': Attr('preference_type').eq('favorite'),
+        'ProjectionExpression': 'property_id'
+    })
+    favorite_ids = {item['property_id'] for item in items}
+
+    if logger:
+        logger.info(f"{len(favorite_ids)} favorited properties")
+
+    return favorite_ids
+
+
+def queue_refetch(client, table_name, candidate, now):
+    """
+    Put a processed URL back on the pending-index
+
+    attempts starts over; content_hash stays, so an unchanged page is
+    recognized. Returns False if the URL is no longer processed.
+    """
+    try:
+        client.update_item(
+            TableName=table_name,
+            Key={'url': candidate['url']},
+            UpdateExpression='SET #p = :empty, pending_shard = :shard, lease_expires = :zero, attempts = :zero, '
+                             'refetch_requested_at = :now, city = if_not_exists(city, :city)',
+            ConditionExpression='attribute_not_exists(#u) OR #p = :done',
+            ExpressionAttributeNames={'#p': 'processed', '#u': 'url'},
+            ExpressionAttributeValues={
+                ':empty': '', ':done': 'Y', ':zero': 0, ':now': now,
+                ':shard': pending_shard_for(candidate['url']), ':city': candidate.get('city', '')
+            }
+        )
+        return True
+    except ClientError as e:
+        if is_conditional_check_failure(e):
+            return False
+        raise
+
+
+def queue_refetches(candidates, url_table, logger=None):
+    """Queue the planned refetches; returns how many went back on the pending-index"""
+    client = url_table.meta.client
+    now = int(time.time())
+    queued = 0
+
+    for candidate in candidates:
+        try:
+            if queue_refetch(client, url_table.name, candidate, now):
+                queued += 1
+        except Exception as e:
+            if logger:
+                logger.warning(f"Failed to queue refetch of {candidate['url']}: {str(e)}")
+
+    return queued
+
+
+def run_refetch_policy(properties_table, url_table, preferences_table=None, budget=DEFAULT_REFETCH_BUDGET,
+                       dry_run=False, logger=None):
+    """
+    Score every stored home and queue the most overdue detail pages
+
+    Cost per run: one read of every META item (through the refetch-index)
+    and of every tracking item, each projected to the fields scored on.
+
+    Returns:
+        Summary dict with 'properties', 'favorites', 'due', 'queued' and the top 'candidates'
+    """
+    now = time.time()
+    properties = scan_refetch_properties(properties_table, logger)
+    fetch_states = scan_fetch_states(url_table, logger)
+    favorite_ids = load_favorite_ids(preferences_table, logger)
+
+    candidates = plan_refetches(properties, fetch_states, favorite_ids, len(properties), now)
+    planned = candidates[:budget]
+    queued = 0 if dry_run else queue_refetches(planned, url_table, logger)
+
+    summary = {
+        'properties': len(properties),
+        'favorites': len(favorite_ids),
+        'due': len(candidates),
+        'queued': queued,
+        'candidates': planned[:20]
+    }
+    if logger:
+        logger.info(f"Refetch policy: {len(candidates)}/{len(properties)} pages due, {queued} queued "
+                    f"(budget {budget}){' (dry run)' if dry_run else ''}")
+
+    return summary
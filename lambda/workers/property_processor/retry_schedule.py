@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Persistent retry schedule for failed detail fetches
+A failed URL's tracking item records its attempt count, last error class and
+next_attempt_at. lease_expires (the pending-index range key) is set to the
+same time, so claims skip the URL until it is due; permanent failures such
+as 404s leave the index in the terminal processed = 'F' state
+"""
+import time
+import random
+
+from botocore.exceptions import ClientError
+
+from url_leases import is_conditional_check_failure
+
+# processed value for URLs that will not be retried
+TERMINAL_STATE = 'F'
+
+DEFAULT_MAX_ATTEMPTS = 6
+MAX_BACKOFF_SECONDS = 7 * 24 * 3600
+
+# First retry delay per error class; it doubles with each further attempt
+BASE_DELAY_SECONDS = {
+    'blocked': 900,
+    'write': 300,
+    'parse': 3600,
+    'fetch': 3600,
+}
+
+# Always terminal
+PERMANENT_ERROR_CLASSES = ('not_found',)
+# Never terminal - these failures say nothing about the URL itself
+TRANSIENT_ERROR_CLASSES = ('blocked', 'write')
+
+
+def classify_error(error):
+    """Map a process_single_url error message to an error class"""
+    message = str(error or '')
+    if message.startswith(('404', '410')):
+        return 'not_found'
+    if message.startswith(('403', '429', 'Challenge page')):
+        return 'blocked'
+    if message == 'Failed to save':
+        return 'write'
+    if message == 'No data':
+        return 'parse'
+    return 'fetch'
+
+
+def is_terminal(error_class, attempts, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    if error_class in PERMANENT_ERROR_CLASSES:
+        return True
+    return error_class not in TRANSIENT_ERROR_CLASSES and attempts >= max_attempts
+
+
+def next_attempt_delay(error_class, attempts):
+    """Exponential backoff with +/-20% jitter, capped at a week"""
+    base = BASE_DELAY_SECONDS.get(error_class, BASE_DELAY_SECONDS['fetch'])
+    delay = min(base * (2 ** max(attempts - 1, 0)), MAX_BACKOFF_SECONDS)
+    return int(delay * random.uniform(0.8, 1.2))
+
+
+def build_failure_update(error, error_class, attempts, now, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    UpdateItem arguments recording one more failed attempt
+
+    Args:
+        attempts: Attempt count including this one
+
+    Returns:
+        (update kwargs, True if the URL is now terminal)
+    """
+    values = {
+        ':attempts': attempts,
+        ':class': error_class,
+        ':error': str(error)[:500],
+        ':now': now,
+        ':empty': ''
+    }
+    set_fields = 'attempts = :attempts, last_error_class = :class, last_error = :error, last_attempt_at = :now'
+
+    if is_terminal(error_class, attempts, max_attempts):
+        values[':terminal'] = TERMINAL_STATE
+        update = {
+            'UpdateExpression': f"SET {set_fields}, #p = :terminal "
+                                f"REMOVE pending_shard, lease_owner, lease_expires, next_attempt_at",
+            'ExpressionAttributeNames': {'#p': 'processed'}
+        }
+        terminal = True
+    else:
+        values[':next'] = now + next_attempt_delay(error_class, attempts)
+        update = {
+            'UpdateExpression': f"SET {set_fields}, next_attempt_at = :next, lease_expires = :next "
+                                f"REMOVE lease_owner",
+            'ExpressionAttributeNames': {'#p': 'processed'}
+        }
+        terminal = False
+
+    # Never touch a URL another worker has processed in the meantime
+    update['ConditionExpression'] = '#p = :empty'
+    update['ExpressionAttributeValues'] = values
+    return update, terminal
+
+
+def schedule_retries(failures, url_infos, url_table, max_attempts=DEFAULT_MAX_ATTEMPTS, logger=None):
+    """
+    Record failed URLs in the tracking table
+
+    Args:
+        failures: Error dicts from processing ({'url', 'error', 'error_class'})
+        url_infos: The claimed url_info dicts (carry the stored 'attempts')
+
+    Returns:
+        (counts {'scheduled', 'terminal'}, URLs whose failure could not be recorded)
+    """
+    client = url_table.meta.client
+    attempts_by_url = {url_info['url']: int(url_info.get('attempts', 0) or 0) for url_info in url_infos}
+    now = int(time.time())
+    counts = {'scheduled': 0, 'terminal': 0}
+    unrecorded = []
+
+    for failure in failures:
+        url = failure['url']
+        error_class = failure.get('error_class') or classify_error(failure.get('error'))
+        update, terminal = build_failure_update(
+            failure.get('error', 'Unknown'), error_class, attempts_by_url.get(url, 0) + 1, now, max_attempts
+        )
+
+        try:
+            client.update_item(TableName=url_table.name, Key={'url': url}, **update)
+            counts['terminal' if terminal else 'scheduled'] += 1
+        except ClientError as e:
+            if is_conditional_check_failure(e):
+                continue
+            if logger:
+                logger.warning(f"Failed to record retry for {url}: {str(e)}")
+            unrecorded.append(url)
+
+    if logger and failures:
+        logger.info(f"Retry schedule: {counts['scheduled']} scheduled, {counts['terminal']} terminal")
+
+    return counts, unrecorded
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Warm-container HTTP session pool
+Sessions (and their keep-alive connections and cookies) survive across warm
+Lambda invocations instead of being rebuilt and closed on every run
+"""
+import os
+import json
+import time
+import threading
+
+
+class PooledSession:
+    """
+    Session handed out by SessionPool
+
+    Forwards everything to the underlying session, counts requests, and
+    returns itself to the pool on close() instead of closing the connection.
+    """
+
+    def __init__(self, session, pool):
+        self._session = session
+        self._pool = pool
+        self.request_count = 0
+        self.blocked = False
+        self.created_at = time.time()
+        self.checked_out = False
+
+    def get(self, *args, **kwargs):
+        self.request_count += 1
+        return self._session.get(*args, **kwargs)
+
+    def post(self, *args, **kwargs):
+        self.request_count += 1
+        return self._session.post(*args, **kwargs)
+
+    def request(self, *args, **kwargs):
+        self.request_count += 1
+        return self._session.request(*args, **kwargs)
+
+    def mark_blocked(self):
+        """Flag the session (and its cookies) as burned - it is recycled on close()"""
+        self.blocked = True
+
+    def close(self):
+        self._pool.release(self)
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+class SessionPool:
+    """
+    Module-level pool of HTTP sessions
+
+    Args:
+        factory: Callable(logger) creating a new underlying session
+        max_requests_per_session: Recycle a session after this many requests
+        max_idle: Idle sessions kept for reuse
+        cookie_path: File the cookie jar is persisted to (None disables)
+    """
+
+    def __init__(self, factory, max_requests_per_session=200, max_idle=4, cookie_path=None):
+        self.factory = factory
+        self.max_requests_per_session = max_requests_per_session
+        self.max_idle = max_idle
+        self.cookie_path = cookie_path
+        self.lock = threading.Lock()
+        self.idle = []
+        self.stats = {'created': 0, 'reused': 0, 'recycled': 0, 'blocked': 0}
+
+    def acquire(self, logger=None):
+        """Return an idle session if one is warm, otherwise create one"""
+        with self.lock:
+            pooled = self.idle.pop() if self.idle else None
+            if pooled:
+                self.stats['reused'] += 1
+
+        if pooled is None:
+            pooled = PooledSession(self.factory(logger), self)
+            self.load_cookies(pooled)
+            with self.lock:
+                self.stats['created'] += 1
+        elif logger:
+            logger.debug(f"Reusing warm session ({pooled.request_count} requests so far)")
+
+        pooled.checked_out = True
+        return pooled
+
+    def release(self, pooled):
+        """Return a session to the pool, recycling it if it is worn out or blocked"""
+        if not pooled.checked_out:
+            return
+        pooled.checked_out = False
+
+        if pooled.blocked or pooled.request_count >= self.max_requests_per_session:
+            self.recycle(pooled)
+            return
+
+        self.save_cookies(pooled)
+
+        with self.lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append(pooled)
+                return
+
+        self._close(pooled)
+
+    def recycle(self, pooled):
+        """Close a session for good; a blocked session also discards the saved cookies"""
+        with self.lock:
+            self.stats['recycled'] += 1
+            if pooled.blocked:
+                self.stats['blocked'] += 1
+
+        if pooled.blocked:
+            self.clear_cookies()
+        else:
+            self.save_cookies(pooled)
+
+        self._close(pooled)
+
+    def _close(self, pooled):
+        try:
+            pooled._session.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for pooled in idle:
+            self._close(pooled)
+
+    # Cookie jar persistence
+
+    def save_cookies(self, pooled):
+        if not self.cookie_path:
+            return
+        jar = getattr(pooled._session.cookies, 'jar', pooled._session.cookies)
+        cookies = [{
+            'name': c.name,
+            'value': c.value,
+            'domain': c.domain,
+            'path': c.path,
+            'secure': bool(c.secure),
+            'expires': c.expires
+        } for c in jar]
+
+        tmp_path = f"{self.cookie_path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(cookies, f)
+            os.replace(tmp_path, self.cookie_path)
+        except OSError:
+            pass
+
+    def load_cookies(self, pooled):
+        if not self.cookie_path or not os.path.exists(self.cookie_path):
+            return
+        try:
+            with open(self.cookie_path) as f:
+                cookies = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        now = time.time()
+        for c in cookies:
+            if c.get('expires') and c['expires'] < now:
+                continue
+            try:
+                pooled._session.cookies.set(
+                    c['name'], c['value'], domain=c.get('domain', ''), path=c.get('path', '/')
+                )
+            except Exception:
+                continue
+
+    def clear_cookies(self):
+        if self.cookie_path:
+            try:
+                os.remove(self.cookie_path)
+            except OSError:
+                pass
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# test_async_pipeline.py
+"""
+Checks for the asyncio fetch -> parse -> write pipeline against a local
+stub server serving Redfin-like detail pages with a fixed latency.
+
+    python test_async_pipeline.py --urls 60 --latency 0.1
+"""
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from async_pipeline import process_urls_async
+from rate_limiter import RateLimiter
+
+DETAIL_PAGE = """<html><head>
+<meta name="twitter:text:price" content="$1,250,000">
+<meta name="twitter:text:beds" content="3">
+<meta name="twitter:text:baths" content="2">
+<meta name="twitter:text:sqft" content="1,600">
+<title>{home_id} Main St, San Jose, CA 95125 | Redfin</title>
+</head><body><div class="home-main-stats-variant">{filler}</div></body></html>"""
+
+
+class DetailServer(ThreadingHTTPServer):
+    """Stub server that counts requests in flight; the backlog fits every fetcher's connection"""
+
+    request_queue_size = 64
+
+    def __init__(self, address, handler):
+        super().__init__(address, handler)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+
+class DetailHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.in_flight += 1
+            self.server.peak_in_flight = max(self.server.peak_in_flight, self.server.in_flight)
+        try:
+            time.sleep(self.latency)
+            self.respond()
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+    def respond(self):
+        home_id = self.path.rsplit('/', 1)[-1]
+        if home_id == '403':
+            self.send_response(403)
+            self.end_headers()
+            return
+        if home_id == '404':
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = DETAIL_PAGE.format(home_id=home_id, filler='<p>detail</p>' * 200).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(latency):
+    handler = type('Handler', (DetailHandler,), {'latency': latency})
+    server = DetailServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class RecordingWriter:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.batches = []
+
+    def __call__(self, batch, logger=None):
+        time.sleep(self.latency)
+        self.batches.append(batch)
+        return [{'success': True, 'url': url_info['url']} for url_info, _ in batch]
+
+
+class ThreadRecordingBreaker:
+    """Never opens; records which thread each call ran on"""
+
+    def __init__(self):
+        self.calls = []
+
+    def is_open(self):
+        self.calls.append(('is_open', threading.get_ident()))
+        return False
+
+    def record_block(self, reason=''):
+        self.calls.append(('record_block', threading.get_ident()))
+
+    def record_success(self):
+        self.calls.append(('record_success', threading.get_ident()))
+
+
+def run(server, home_ids, fetch_workers, write_latency=0.0, breaker=None):
+    base = f"http://127.0.0.1:{server.server_address[1]}/CA/San-Jose/1-Main-St-95125/home/"
+    urls = [{'url': f"{base}{home_id}", 'city': 'San Jose'} for home_id in home_ids]
+    writer = RecordingWriter(write_latency)
+    limiter = RateLimiter(min_delay=0.0, max_delay=0.0, max_concurrency=fetch_workers)
+    config = {'fetch_workers': fetch_workers, 'parse_workers': 2, 'write_batch_size': 25,
+              'flush_interval_seconds': 0.2}
+
+    start = time.perf_counter()
+    results = process_urls_async(urls, config, limiter, writer, breaker=breaker)
+    return time.perf_counter() - start, results, writer
+
+
+def test_pipeline_results_and_summary():
+    server = start_server(0.0)
+    try:
+        home_ids = [str(1000 + i) for i in range(30)] + ['403', '404']
+        _, results, writer = run(server, home_ids, fetch_workers=4)
+    finally:
+        server.shutdown()
+
+    assert results['processed'] == 32
+    assert results['success'] == 30
+    assert results['failed'] == 2
+    assert sorted(e['error'] for e in results['errors']) == ['403 Forbidden', '404 Not Found']
+
+    written = [data for batch in writer.batches for _, data in batch]
+    assert all(len(batch) <= 25 for batch in writer.batches)
+    assert {d['redfin_id'] for d in written} == {str(1000 + i) for i in range(30)}
+    assert all(d['city'] == 'San Jose' for d in written)
+
+    pipeline = results['pipeline']
+    assert pipeline['stages']['fetch']['items'] == 32
+    assert pipeline['stages']['parse']['items'] == 30
+    assert pipeline['stages']['write']['items'] == 30
+    assert set(pipeline['queues']) == {'parse', 'write'}
+
+
+def test_breaker_calls_stay_off_the_event_loop():
+    server = start_server(0.0)
+    breaker = ThreadRecordingBreaker()
+    try:
+        run(server, ['4000', '4001', '403'], fetch_workers=2, breaker=breaker)
+    finally:
+        server.shutdown()
+
+    # asyncio.run drives the loop on this thread; DynamoDB-backed calls must not
+    assert {name for name, _ in breaker.calls} == {'is_open', 'record_block', 'record_success'}
+    assert all(thread != threading.get_ident() for _, thread in breaker.calls)
+
+
+def test_fetches_overlap():
+    home_ids = [str(2000 + i) for i in range(16)]
+    peaks = {}
+    for fetch_workers in (1, 8):
+        server = start_server(0.05)
+        try:
+            _, results, _ = run(server, home_ids, fetch_workers=fetch_workers)
+        finally:
+            server.shutdown()
+        assert results['success'] == 16
+        peaks[fetch_workers] = server.peak_in_flight
+
+    # Counted at the server rather than timed, so a slow machine cannot fail it
+    assert peaks[1] == 1
+    assert peaks[8] > 2
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--urls", type=int, default=60, help="URLs per run")
+    parser.add_argument("--latency", type=float, default=0.1, help="Simulated seconds per page fetch")
+    parser.add_argument("--write-latency", type=float, default=0.05, help="Simulated seconds per batch write")
+    args = parser.parse_args()
+
+    server = start_server(args.latency)
+    try:
+        home_ids = [str(3000 + i) for i in range(args.urls)]
+        print(f"{'fetchers':>8}  {'seconds':>8}  {'urls/s':>7}  {'max parse q':>11}  {'max write q':>11}")
+        for workers in (1, 2, 4, 8):
+            elapsed, results, _ = run(server, home_ids, workers, args.write_latency)
+            queues = results['pipeline']['queues']
+            print(f"{workers:>8}  {elapsed:>8.2f}  {args.urls / elapsed:>7.1f}  "
+                  f"{queues['parse']['max_depth']:>11}  {queues['write']['max_depth']:>11}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
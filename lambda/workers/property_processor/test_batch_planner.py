@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# test_batch_planner.py
+"""
+Checks for deadline-aware claiming in the polling processor.
+
+A simulated clock drives a fake Lambda context and a fake process_urls
+whose URLs take a drawn number of seconds each, over the in-memory URL
+table from test_url_leases. Run as a script to compare the old fixed batch
+against the planner on one 900 s invocation, at several URL latencies:
+
+    python test_batch_planner.py --urls 1000 --timeout 900
+"""
+import argparse
+import random
+from types import SimpleNamespace
+
+import app
+from batch_planner import FETCH_TIMEOUT_SECONDS, SETTLE_SECONDS, BatchPlanner
+from test_url_leases import UrlTableClient, make_table, pending_item
+
+
+class SimClock:
+    """Simulated wall clock with a Lambda context that times out at timeout seconds"""
+
+    def __init__(self, timeout=900.0):
+        self.now = 1_700_000_000.0
+        self.end = self.now + timeout
+        self.context = SimpleNamespace(aws_request_id='sim',
+                                       get_remaining_time_in_millis=lambda: max(0, (self.end - self.now) * 1000))
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class SimProcessor:
+    """Stands in for app.process_urls: each URL takes latency() seconds of the simulated clock"""
+
+    def __init__(self, clock, client, latency):
+        self.clock = clock
+        self.client = client
+        self.latency = latency
+        self.late = 0
+        self.parse_pools = []
+        self.archives = []
+        self.worker_tables = []
+
+    def __call__(self, urls, config, logger=None, rate_limiter=None, breaker=None, parse_pool=None, html_archive=None,
+                 worker_tables=None):
+        self.parse_pools.append(parse_pool)
+        self.archives.append(html_archive)
+        self.worker_tables.append(worker_tables)
+        deadline = self.clock.now + config['max_runtime_seconds']
+        results = {'processed': 0, 'success': 0, 'failed': 0, 'errors': [], 'unstarted': []}
+        for url_info in urls:
+            if self.clock.now > deadline:
+                results['unstarted'].append(url_info)
+                continue
+            self.clock.sleep(self.latency())
+            # Writes have to flush before the invocation ends
+            if self.clock.now > self.clock.end - config.get('flush_window_seconds', 30):
+                self.late += 1
+            self.client.items[url_info['url']].update(processed='Y')
+            for field in ('pending_shard', 'lease_owner', 'lease_expires'):
+                self.client.items[url_info['url']].pop(field, None)
+            results['processed'] += 1
+            results['success'] += 1
+        return results
+
+
+def run_planner(monkeypatch, urls, timeout, latency, config=None):
+    clock = SimClock(timeout)
+    client = UrlTableClient([pending_item(i) for i in range(urls)])
+    processor = SimProcessor(clock, client, latency)
+    monkeypatch.setattr(app, 'time', clock)
+    monkeypatch.setattr(app, 'process_urls', processor)
+    monkeypatch.setattr(app, 'setup_dynamodb', lambda: (None, make_table(client)))
+
+    config = dict({'max_runtime_seconds': 840, 'min_delay': 3.0, 'max_delay': 8.0, 'max_workers': 4,
+                   'flush_window_seconds': 30}, **(config or {}))
+    results = app.process_pending_urls(make_table(client), config, 'sim', clock.context)
+    return results, clock, processor
+
+
+def test_claims_shrink_as_the_deadline_nears():
+    remaining = {'ms': 900000}
+    context = SimpleNamespace(get_remaining_time_in_millis=lambda: remaining['ms'])
+    planner = BatchPlanner(context, flush_window=30, claim_increment=12, initial_url_seconds=5)
+    reserve = 30 + FETCH_TIMEOUT_SECONDS + SETTLE_SECONDS
+
+    assert planner.next_claim_size() == 12
+    remaining['ms'] = (reserve + 21) * 1000
+    assert planner.next_claim_size() == 4
+    remaining['ms'] = (reserve + 4) * 1000
+    assert planner.next_claim_size() == 0
+
+    planner.record_round(claimed=4, processed=2, elapsed=30)
+    assert planner.url_seconds == 10.0
+
+
+def test_fills_the_invocation_without_late_writes(monkeypatch):
+    results, clock, processor = run_planner(monkeypatch, 1000, 900, lambda: 5.0)
+
+    assert results['processed'] > 150
+    assert processor.late == 0
+    # Stopped inside the reserve, not long before it
+    assert clock.end - clock.now < 30 + FETCH_TIMEOUT_SECONDS + SETTLE_SECONDS + 2 * 5.0
+    assert results['planner']['rounds'] > 10
+
+
+def test_slow_urls_shrink_claims(monkeypatch):
+    results, clock, processor = run_planner(monkeypatch, 1000, 900, lambda: 25.0)
+
+    assert processor.late == 0
+    assert results['planner']['url_seconds'] > 20
+    # Nothing is left leased: URLs the last round did not start were released
+    assert not [item for item in processor.client.items.values() if 'lease_owner' in item]
+
+
+def test_stops_when_nothing_is_pending(monkeypatch):
+    results, clock, _ = run_planner(monkeypatch, 5, 900, lambda: 5.0)
+    assert results['processed'] == 5 and results['claimed'] == 5
+    assert clock.end - clock.now > 800
+
+
+def test_parse_pool_is_shared_by_all_rounds(monkeypatch):
+    pools = []
+
+    class FakeParsePool:
+        def __init__(self, processes, extractor=None, logger=None):
+            self.shutdowns = 0
+            pools.append(self)
+
+        def shutdown(self):
+            self.shutdowns += 1
+
+        def stats(self):
+            return {'pages': 0}
+
+    monkeypatch.setattr(app, 'ParsePool', FakeParsePool)
+    results, _, processor = run_planner(monkeypatch, 200, 900, lambda: 5.0, {'parse_processes': 2})
+
+    assert results['planner']['rounds'] > 1
+    assert len(pools) == 1 and pools[0].shutdowns == 1
+    assert all(pool is pools[0] for pool in processor.parse_pools)
+    assert results['parse_pool'] == {'pages': 0}
+
+
+def test_archive_and_worker_tables_are_shared_by_all_rounds(monkeypatch, tmp_path):
+    tables = []
+    monkeypatch.setattr(app, 'create_worker_tables', lambda max_workers: tables.append(max_workers) or ['tables'])
+    results, _, processor = run_planner(monkeypatch, 200, 900, lambda: 5.0, {'html_archive_dir': str(tmp_path)})
+
+    assert results['planner']['rounds'] > 1
+    assert tables == [4]
+    assert all(worker_tables == ['tables'] for worker_tables in processor.worker_tables)
+    assert processor.archives[0] and all(archive is processor.archives[0] for archive in processor.archives)
+    assert 'html_archive' in results
+
+
+def run_fixed(urls, timeout, latency, batch_size=50, max_runtime=840, flush_window=30):
+    """The old handler: one batch of batch_size, stop taking URLs at max_runtime"""
+    clock = SimClock(timeout)
+    deadline = clock.now + max_runtime
+    processed = late = 0
+    for _ in range(min(urls, batch_size)):
+        if clock.now > deadline:
+            break
+        clock.sleep(latency())
+        processed += 1
+        if clock.now > clock.end - flush_window:
+            late += 1
+    return processed, late, clock.end - clock.now
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--urls", type=int, default=1000, help="Pending URLs")
+    parser.add_argument("--timeout", type=float, default=900, help="Lambda timeout in seconds")
+    args = parser.parse_args()
+
+    class Patch:
+        """monkeypatch stand-in for script runs"""
+
+        def __init__(self):
+            self.saved = []
+
+        def setattr(self, target, name, value):
+            self.saved.append((target, name, getattr(target, name)))
+            setattr(target, name, value)
+
+        def undo(self):
+            for target, name, value in reversed(self.saved):
+                setattr(target, name, value)
+            self.saved = []
+
+    print(f"{args.urls} pending URLs, {args.timeout:.0f}s invocation")
+    print(f"{'latency':>8}  {'mode':>8}  {'processed':>9}  {'late':>5}  {'idle s':>7}")
+    for mean in (2.0, 5.5, 12.0, 25.0):
+        def latency(rng=random.Random(1), mean=mean):
+            return rng.uniform(0.5 * mean, 1.5 * mean)
+
+        processed, late, idle = run_fixed(args.urls, args.timeout, latency)
+        print(f"{mean:>8.1f}  {'fixed':>8}  {processed:>9}  {late:>5}  {idle:>7.0f}")
+
+        patch = Patch()
+        try:
+            results, clock, processor = run_planner(patch, args.urls, args.timeout, latency)
+        finally:
+            patch.undo()
+        print(f"{mean:>8.1f}  {'planner':>8}  {results['processed']:>9}  {processor.late:>5}  "
+              f"{clock.end - clock.now:>7.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# test_circuit_breaker.py
+"""
+Checks for challenge-page detection and the shared circuit breaker.
+
+An in-memory properties table holds the breaker's state item and applies
+its open-until condition; a simulated clock stands in for time. Run as a
+script to compare a day of hourly runs during a blocking spell, with and
+without the breaker:
+
+    python test_circuit_breaker.py --block-start 2 --block-hours 3 --runs 24
+"""
+import argparse
+import threading
+import time
+from queue import Queue
+from types import SimpleNamespace
+
+import app
+import circuit_breaker
+from circuit_breaker import CircuitBreaker, breaker_key
+from core_scraper import CHALLENGE_PAGE_MAX_BYTES, check_detail_response, detect_challenge_page
+from rate_limiter import RateLimiter
+from retry_schedule import classify_error
+from test_url_leases import UrlTableClient, conditional_check_failed, make_table, pending_item
+
+T0 = 1_700_000_000.0
+
+
+class BreakerTable:
+    """Properties-table client for the breaker item: get_item and SET-only update_item"""
+
+    def __init__(self, items=()):
+        self.name = 'properties'
+        self.items = {(item['property_id'], item['sort_key']): dict(item) for item in items}
+        self.meta = SimpleNamespace(client=self)
+
+    def get_item(self, TableName, Key, ConsistentRead=False):
+        item = self.items.get((Key['property_id'], Key['sort_key']))
+        return {'Item': dict(item)} if item else {}
+
+    def update_item(self, TableName, Key, UpdateExpression, ExpressionAttributeValues, ConditionExpression=None):
+        item = self.items.setdefault((Key['property_id'], Key['sort_key']), dict(Key))
+        values = ExpressionAttributeValues
+        if ConditionExpression and item.get('open_until', 0) >= values[':until']:
+            raise conditional_check_failed()
+        for assignment in UpdateExpression[len('SET '):].split(', '):
+            name, value = assignment.split(' = ')
+            item[name] = values[value]
+
+
+class SimClock:
+    def __init__(self):
+        self.now = T0
+
+    def time(self):
+        return self.now
+
+
+def open_item(seconds=600):
+    return dict(breaker_key('redfin'), open_until=int(time.time() + seconds), trips=1, reason='HTTP 403')
+
+
+def response(status_code, content):
+    return SimpleNamespace(status_code=status_code, content=content, headers={}, raise_for_status=lambda: None)
+
+
+def test_small_challenge_pages_are_flagged_before_parsing():
+    challenge = b'<html><body><div id="px-captcha"></div>Press & Hold to confirm you are a human</body></html>'
+    assert detect_challenge_page(challenge)
+
+    # A full listing page that loads a captcha widget somewhere is fine
+    listing = b'<html>' + b'<div class="home-facts">3 beds</div>' * 2000 + b'<script src="/captcha.js"></script>'
+    assert len(listing) > CHALLENGE_PAGE_MAX_BYTES
+    assert detect_challenge_page(listing) is None
+    assert detect_challenge_page(b'<html><title>1 Main St</title></html>') is None
+
+    marked = []
+    session = SimpleNamespace(mark_blocked=lambda: marked.append(True))
+    error = check_detail_response(response(200, challenge), 'https://www.redfin.com/x', session)
+    assert error['error'].startswith('Challenge page') and marked
+    assert classify_error(error['error']) == 'blocked'
+
+
+def test_blocks_and_empty_pages_are_classified_once():
+    url = 'https://www.redfin.com/x'
+    marked = []
+    session = SimpleNamespace(mark_blocked=lambda: marked.append(True))
+
+    forbidden = check_detail_response(response(403, b''), url, session)
+    assert forbidden['error'] == '403 Forbidden' and marked
+    assert classify_error(check_detail_response(response(429, b''), url)['error']) == 'blocked'
+
+    # An empty 200 is a failed fetch, not a block: the session is kept
+    marked.clear()
+    empty = check_detail_response(response(200, b''), url, session)
+    assert classify_error(empty['error']) == 'fetch' and not marked
+
+
+def test_opens_after_threshold_and_state_is_shared(monkeypatch):
+    clock = SimClock()
+    monkeypatch.setattr(circuit_breaker, 'time', clock)
+    table = BreakerTable()
+    breaker = CircuitBreaker(table, threshold=3, open_seconds=600)
+
+    # A success in between starts the count over
+    breaker.record_block('HTTP 403')
+    breaker.record_block('HTTP 403')
+    breaker.record_success()
+    breaker.record_block('HTTP 403')
+    breaker.record_block('HTTP 403')
+    assert not breaker.is_open()
+    breaker.record_block('Challenge page: empty page')
+    assert breaker.is_open()
+
+    # Another worker, or the next scheduled run, sees it open
+    other = CircuitBreaker(table, threshold=3, open_seconds=600)
+    assert other.is_open() and other.seconds_until_close() == 600
+
+    # Still blocked after it closes: the next trip stays open twice as long
+    clock.now += 601
+    assert not other.is_open()
+    for _ in range(3):
+        other.record_block('HTTP 403')
+    assert other.seconds_until_close() == 1200
+    assert table.items[('BREAKER#redfin', 'STATE')]['trips'] == 2
+
+    # A shorter open state written later does not cut it short
+    breaker.persist(int(clock.now + 60), 1, 'HTTP 429')
+    assert table.items[('BREAKER#redfin', 'STATE')]['open_until'] == int(clock.now + 1200)
+
+
+def test_workers_stop_taking_urls_once_open(monkeypatch):
+    blocked = {'success': False, 'error': 'Challenge page: HTTP 403', 'error_class': 'blocked'}
+    monkeypatch.setattr(app, 'setup_dynamodb', lambda: (None, None))
+    monkeypatch.setattr(app, 'create_session', lambda logger=None: SimpleNamespace(close=lambda: None))
+    monkeypatch.setattr(app, 'process_single_url', lambda url_info, *args: dict(blocked, url=url_info['url']))
+
+    url_queue = Queue()
+    for i in range(20):
+        url_queue.put(pending_item(i))
+    results = {'processed': 0, 'success': 0, 'failed': 0, 'errors': []}
+    breaker = CircuitBreaker(BreakerTable(), threshold=3)
+
+    app.process_url_queue(url_queue, results, 20, time.time() + 60, RateLimiter(min_delay=0.0, max_delay=0.0),
+                          threading.Lock(), breaker=breaker)
+
+    assert results['processed'] == 3 and url_queue.qsize() == 17
+    assert breaker.summary()['trips'] == 1
+
+
+def test_open_breaker_skips_the_polling_run(monkeypatch):
+    client = UrlTableClient([pending_item(i) for i in range(5)])
+    monkeypatch.setattr(app, 'setup_dynamodb', lambda: (BreakerTable([open_item()]), make_table(client)))
+    context = SimpleNamespace(aws_request_id='run', get_remaining_time_in_millis=lambda: 900000)
+
+    result = app.lambda_handler({}, context)
+
+    assert 'Circuit breaker open' in result['body']
+    assert 'update_item' not in client.calls
+
+
+def test_open_breaker_acknowledges_sqs_messages_without_claiming():
+    client = UrlTableClient([pending_item(i) for i in range(3)])
+    records = [{'messageId': f"m{i}", 'body': f'{{"url": "{url}"}}', 'eventSource': 'aws:sqs'}
+               for i, url in enumerate(client.items)]
+    records.append({'messageId': 'garbled', 'body': 'not json', 'eventSource': 'aws:sqs'})
+    breaker = CircuitBreaker(BreakerTable([open_item()]))
+
+    response, results = app.process_sqs_batch(records, None, make_table(client), {'max_runtime_seconds': 60},
+                                              'owner', breaker=breaker)
+
+    # The URLs stay pending for a polling run; only the unreadable message comes back
+    assert response['batchItemFailures'] == [{'itemIdentifier': 'garbled'}]
+    assert results['skipped'] == 3
+    assert 'update_item' not in client.calls
+
+
+def simulate(args, threshold):
+    """(pages fetched, seconds spent on blocked fetches, runs skipped) over hourly runs"""
+    clock = SimClock()
+    saved = circuit_breaker.time
+    circuit_breaker.time = clock
+    table = BreakerTable()
+    block_start = T0 + args.block_start * 3600
+    block_end = block_start + args.block_hours * 3600
+    fetched = wasted = skipped = 0
+
+    try:
+        for run in range(args.runs):
+            clock.now = start = T0 + run * 3600
+            breaker = CircuitBreaker(table, threshold=threshold, open_seconds=args.open_seconds) if threshold else None
+            if breaker and breaker.is_open():
+                skipped += 1
+                continue
+
+            while clock.now < start + args.run_seconds:
+                clock.now += args.url_seconds
+                if block_start <= clock.now < block_end:
+                    wasted += args.url_seconds
+                    if breaker:
+                        breaker.record_block('HTTP 403')
+                        if breaker.is_open():
+                            break
+                else:
+                    fetched += 1
+                    if breaker:
+                        breaker.record_success()
+    finally:
+        circuit_breaker.time = saved
+
+    return fetched, wasted, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--block-start", type=float, default=2, help="Hour Redfin starts blocking")
+    parser.add_argument("--block-hours", type=float, default=3, help="How long the blocking lasts")
+    parser.add_argument("--runs", type=int, default=24, help="Hourly scheduled runs")
+    parser.add_argument("--run-seconds", type=float, default=840, help="Fetch time per run")
+    parser.add_argument("--url-seconds", type=float, default=6.5, help="Delay plus fetch per URL")
+    parser.add_argument("--open-seconds", type=int, default=1800, help="First open period")
+    args = parser.parse_args()
+
+    print(f"{args.runs} hourly runs, blocked from hour {args.block_start:g} for {args.block_hours:g}h")
+    print(f"{'breaker':>10}  {'fetched':>8}  {'blocked s':>9}  {'runs skipped':>12}")
+    for name, threshold in (('off', 0), ('5 in a row', 5)):
+        fetched, wasted, skipped = simulate(args, threshold)
+        print(f"{name:>10}  {fetched:>8}  {wasted:>9.0f}  {skipped:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# test_detail_extractor.py
+"""
+Parity checks for the single-pass (lxml) detail page extractor against the
+saved pages in testdata/ and hand-written edge cases. CPU timings are in
+scripts/bench_extractors.py.
+"""
+from bs4 import BeautifulSoup
+
+from core_scraper import (
+    DetailPageScan, _parse_html_document, extract_html_data, get_detail_extractor,
+    parse_page_text_fields, parse_redfin_property_page, parse_redfin_property_page_fast
+)
+from saved_pages import load_saved_pages, without_timestamp
+
+URL = 'https://www.redfin.com/CA/San-Jose/1234-Willow-Glen-Way-95125/home/1234567'
+DETAIL_PAGES = 'redfin_detail_*.html'
+
+
+def assert_parity(html_text, label):
+    expected = without_timestamp(parse_redfin_property_page(html_text, URL))
+    actual = without_timestamp(parse_redfin_property_page_fast(html_text, URL))
+    assert actual == expected, f"{label}: property_data differs"
+    assert list(actual) == list(expected), f"{label}: field order differs"
+
+    # Text-derived fields are mostly shadowed by meta/JSON-LD - compare them directly
+    soup = BeautifulSoup(html_text, 'lxml')
+    scan = DetailPageScan()
+    root = _parse_html_document(html_text)
+    if root is not None:
+        scan.walk(root)
+    assert scan.page_text() == soup.get_text(' ', strip=True), f"{label}: page text differs"
+    assert parse_page_text_fields(scan.page_text()) == extract_html_data(soup), f"{label}: text fields differ"
+
+
+def test_fast_extractor_matches_soup_on_saved_pages():
+    pages = load_saved_pages(DETAIL_PAGES)
+    assert pages, "no saved detail pages in testdata/"
+
+    for name, html_text in pages:
+        assert_parity(html_text, name)
+
+
+def test_fast_extractor_matches_soup_on_edge_cases():
+    snippets = [
+        '',
+        '<html><body><p>Nothing here</p></body></html>',
+        '<?xml version="1.0" encoding="utf-8"?><html><head>'
+        '<meta name="twitter:text:price" content="$450,000"></head><body>Condo, HOA: $310</body></html>',
+        # First meta wins even when it has no content
+        '<meta name="twitter:text:beds" content=""><meta name="twitter:text:beds" content="4">',
+        # A bad price aborts the remaining meta fields (and ICBM) in both engines
+        '<meta name="twitter:text:price" content="$,"><meta name="twitter:text:beds" content="2">'
+        '<meta name="ICBM" content="1.0, 2.0">',
+        '<meta name="ICBM" content="37.1,-121.2,5"><meta name="twitter:text:baths" content="two">',
+        # An empty JSON-LD script stops JSON-LD parsing; later scripts are ignored
+        '<script type="application/ld+json">{"@type": "House", "name": "A"}</script>'
+        '<script type="application/ld+json"></script>'
+        '<script type="application/ld+json">{"@type": "House", "name": "B"}</script>',
+        '<script type="application/ld+json">[{"@type": "Product", "mainEntity": {"yearBuilt": "n/a"}}]</script>'
+        '<p>Year built 1999</p>',
+        # Text excluded by get_text(): scripts, styles, templates, ruby annotations, comments
+        '<body><script>year built 1901</script><style>hoa 5</style><template>built 1902</template>'
+        '<ruby>x<rt>MLS# 1</rt><rp>(</rp></ruby><!-- 3 days on redfin -->'
+        '<p>Lot size: about 5,000 sq ft</p>multi-family<b>townhome</b>tail vacant lot</body>',
+        '<p>Built 1799</p><p>1.5 acres</p><p>MLS #</p><p>MLS# 42</p><p>1 day on Redfin</p><p>Mobile home</p>',
+        '<p>condominium</p><p>single-family</p><p>land</p><p>0 ac</p><p>12,000.5 acres</p>',
+        # Image sources: names/properties, preload rel lists, data-src fallback, thumbnails
+        '<meta name="IMAGE" content="https://ssl.cdn-redfin.com/photo/1/a.jpg">'
+        '<meta property="og:image" content="https://ssl.cdn-redfin.com/photo/1/a.jpg">'
+        '<meta name="" property="og:image" content="https://ssl.cdn-redfin.com/photo/1/b.jpg">'
+        '<link rel="prefetch preload" as="image" href="https://ssl.cdn-redfin.com/photo/1/c.jpg">'
+        '<link rel="preload" as="Image" href="https://ssl.cdn-redfin.com/photo/1/d.jpg">'
+        '<link rel="preload" as="image">'
+        '<img src="" data-src="https://ssl.cdn-redfin.com/photo/1/bigphoto/e.jpg">'
+        '<img src="https://ssl.cdn-redfin.com/photo/1/islphoto/f.jpg" data-src="https://ssl.cdn-redfin.com/photo/1/bigphoto/g.jpg">'
+        '<img src="https://ssl.cdn-redfin.com/photo/1/mbpaddedwide/h.jpg">'
+        '<template><img src="https://ssl.cdn-redfin.com/photo/1/genMid.i.jpg"></template>',
+        'plain text with &amp; entities &nbsp; and non-breaking spaces 2 days on redfin',
+    ]
+    for index, snippet in enumerate(snippets):
+        assert_parity(snippet, f"snippet {index}")
+
+
+def test_get_detail_extractor():
+    assert get_detail_extractor('soup') is parse_redfin_property_page
+    assert get_detail_extractor('fast') is parse_redfin_property_page_fast
+    assert get_detail_extractor('unknown') is parse_redfin_property_page_fast
+
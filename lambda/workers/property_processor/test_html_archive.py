@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# test_html_archive.py
+"""
+Checks for the compressed, content-addressed HTML archive and offline
+re-extraction. Uses a local archive directory and in-memory tables, so no
+AWS access or HTTP is needed; run as a script to see compression on the
+saved pages:
+
+    python test_html_archive.py --copies 50
+"""
+import argparse
+import pathlib
+import tempfile
+from types import SimpleNamespace
+
+import app
+from html_archive import HtmlArchive, content_hash
+from rate_limiter import RateLimiter
+
+TESTDATA_DIR = pathlib.Path(__file__).parent / 'testdata'
+URL = 'https://www.redfin.com/CA/San-Jose/1234-Willow-Glen-Way-95125/home/1234567'
+
+
+def load_saved_pages():
+    return [p.read_bytes() for p in sorted(TESTDATA_DIR.glob('redfin_detail_*.html'))]
+
+
+class FakeTable:
+    def __init__(self):
+        self.name = 'properties'
+        self.items = {}
+        self.updates = []
+        self.meta = SimpleNamespace(client=self)
+
+    def get_item(self, Key, **kwargs):
+        return {'Item': self.items[Key['property_id']]} if Key['property_id'] in self.items else {}
+
+    def batch_get_item(self, RequestItems):
+        keys = RequestItems[self.name]['Keys']
+        found = [self.items[k['property_id']] for k in keys if k['property_id'] in self.items]
+        return {'Responses': {self.name: found}, 'UnprocessedKeys': {}}
+
+    def batch_write_item(self, RequestItems):
+        for request in RequestItems[self.name]:
+            self.put_item(Item=request['PutRequest']['Item'])
+        return {'UnprocessedItems': {}}
+
+    def put_item(self, Item, **kwargs):
+        self.items[Item['property_id']] = Item
+
+    def update_item(self, **kwargs):
+        self.updates.append(kwargs['Key'])
+
+
+class FakeSession:
+    def __init__(self, body):
+        self.body = body
+        self.requests = 0
+
+    def get(self, url, **kwargs):
+        self.requests += 1
+        return SimpleNamespace(status_code=200, content=self.body, text=self.body.decode('utf-8'),
+                               headers={}, raise_for_status=lambda: None)
+
+
+def test_put_get_and_dedup():
+    page = load_saved_pages()[0]
+    with tempfile.TemporaryDirectory() as root:
+        archive = HtmlArchive(root_dir=root)
+
+        sha256 = archive.put(URL, page, city='San Jose')
+        assert sha256 == content_hash(page)
+        assert archive.get(URL) == page
+        assert archive.get_pointer(URL)['city'] == 'San Jose'
+
+        # Same bytes under another URL: one object, two pointers
+        archive.put(URL + '?x', page)
+        fresh = HtmlArchive(root_dir=root)
+        fresh.put(URL + '?y', page)
+        assert fresh.stats['duplicates'] == 1 and fresh.stats['new_objects'] == 0
+        assert len(list(pathlib.Path(root, 'objects').rglob('*.zst'))) == 1
+        assert len(list(archive.iter_pointers())) == 3
+
+        # A refetch with new bytes moves the pointer
+        archive.put(URL, page + b'<!-- changed -->')
+        assert archive.get(URL).endswith(b'<!-- changed -->')
+
+        assert archive.stats['bytes_stored'] < archive.stats['bytes_in']
+        assert archive.get(URL + '/missing') is None
+
+
+def test_fetch_archives_before_parsing():
+    page = load_saved_pages()[0]
+    session = FakeSession(page)
+    properties, urls = FakeTable(), FakeTable()
+    limiter = RateLimiter(min_delay=0.0, max_delay=0.0)
+
+    with tempfile.TemporaryDirectory() as root:
+        archive = HtmlArchive(root_dir=root)
+        result = app.process_single_url({'url': URL, 'city': 'San Jose'}, session, limiter,
+                                        properties, urls, html_archive=archive)
+        assert result['success']
+        assert archive.get(URL) == page
+        assert session.requests == 1
+
+
+def test_reextract_makes_no_requests(monkeypatch):
+    pages = load_saved_pages()
+    properties, urls = FakeTable(), FakeTable()
+    monkeypatch.setattr(app, 'setup_dynamodb', lambda: (properties, urls))
+
+    def no_http(*args, **kwargs):
+        raise AssertionError("re-extraction must not open HTTP sessions")
+    monkeypatch.setattr(app, 'create_session', no_http)
+
+    with tempfile.TemporaryDirectory() as root:
+        archive = HtmlArchive(root_dir=root)
+        archived_urls = [f"https://www.redfin.com/CA/San-Jose/{i}-Main-St-95125/home/{9000 + i}" for i in range(30)]
+        for i, url in enumerate(archived_urls):
+            archive.put(url, pages[i % len(pages)], city='San Jose')
+
+        results = app.reextract_archive(archive, {'parse_processes': 2, 'max_workers': 4})
+        assert (results['archived'], results['success'], results['failed']) == (30, 30, 0)
+        metas = [item for item in properties.items.values() if item['sort_key'] == 'META']
+        assert {item['listing_url'] for item in metas} == set(archived_urls)
+        # URL tracking is not touched
+        assert urls.updates == []
+
+        subset = app.reextract_archive(archive, {'parse_processes': 1}, urls=archived_urls[:3] + ['missing'])
+        assert subset['archived'] == 3 and subset['success'] == 3
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--copies", type=int, default=50, help="Archive each saved page this many times")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        archive = HtmlArchive(root_dir=root)
+        for i in range(args.copies):
+            for index, page in enumerate(load_saved_pages()):
+                # Vary the bytes so every copy is a new object
+                archive.put(f"{URL}?copy={i}&page={index}", page + f"<!-- {i} -->".encode('utf-8'))
+        stats = archive.stats
+        print(f"{stats['pages']} pages, {stats['bytes_in'] / 1024:.0f} KB in, "
+              f"{stats['bytes_stored'] / 1024:.0f} KB stored ({stats['bytes_in'] / stats['bytes_stored']:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
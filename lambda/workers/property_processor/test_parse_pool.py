@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# test_parse_pool.py
+"""
+Checks for the process pool that parses detail pages off the fetch threads,
+against the saved pages in testdata/. Inline vs pooled throughput is in
+scripts/bench_extractors.py.
+"""
+import os
+
+import parse_pool
+from core_scraper import parse_redfin_property_page_fast
+from parse_pool import ParsePool, PipeProcessPool, parse_page_bytes
+from saved_pages import load_saved_pages, without_timestamp
+
+URL = 'https://www.redfin.com/CA/San-Jose/1234-Willow-Glen-Way-95125/home/1234567'
+DETAIL_PAGES = 'redfin_detail_*.html'
+
+
+def assert_pool_parity(pool):
+    for _, html_bytes in load_saved_pages(DETAIL_PAGES, binary=True):
+        expected = without_timestamp(parse_redfin_property_page_fast(html_bytes.decode('utf-8'), URL))
+        assert without_timestamp(pool.parse(html_bytes, URL)) == expected
+
+
+def test_process_pool_matches_inline():
+    pool = ParsePool(2)
+    try:
+        assert_pool_parity(pool)
+        stats = pool.stats()
+    finally:
+        pool.shutdown()
+
+    assert stats['pages'] == len(load_saved_pages(DETAIL_PAGES))
+    assert stats['failed'] == 0
+
+
+def test_falls_back_to_pipe_workers(monkeypatch):
+    # What Lambda does: no /dev/shm, so the executor's semaphores cannot be created
+    def unavailable(*args, **kwargs):
+        raise OSError(38, 'Function not implemented')
+
+    monkeypatch.setattr(parse_pool, 'ProcessPoolExecutor', unavailable)
+    pool = ParsePool(2)
+    try:
+        assert pool.kind == 'pipe_pool'
+        assert_pool_parity(pool)
+    finally:
+        pool.shutdown()
+
+
+def test_pipe_pool_reports_worker_errors():
+    pool = PipeProcessPool(1)
+    try:
+        future = pool.submit(int, 'not a number')
+        try:
+            future.result(timeout=10)
+            assert False, "expected ValueError"
+        except ValueError:
+            pass
+        # The worker survives a failed task
+        assert pool.submit(os.getpid).result(timeout=10) != os.getpid()
+    finally:
+        pool.shutdown()
+
+
+def test_undecodable_bytes_still_parse():
+    property_data = parse_page_bytes(b'<html><body>\xff\xfe Year built 1999</body></html>', URL)
+    assert property_data['listing_url'] == URL
+    assert property_data['year_built'] == 1999
+
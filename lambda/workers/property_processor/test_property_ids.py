@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# test_property_ids.py
+"""
+Checks for canonical property-ID resolution and the duplicate merge migration.
+
+An in-memory properties table (property_id + sort_key) stands in for
+DynamoDB and counts the items each call reads; run as a script to compare
+the old full-scan lookup against the ID map:
+
+    python test_property_ids.py --homes 2000 --lookups 50
+"""
+import argparse
+import threading
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from botocore.exceptions import ClientError
+
+import app
+from fix_property_id import create_or_get_property_id, get_existing_property_id
+from property_ids import (
+    ID_MAP_SORT_KEY, assign_canonical_ids, id_map_key, lookup_property_ids, merge_duplicate_properties,
+    register_property_id
+)
+
+
+class PropertiesTable:
+    """Table resource and client over {(property_id, sort_key): item}, counting items read"""
+
+    def __init__(self, items=(), key_fields=('property_id', 'sort_key'), page_size=100):
+        self.name = 'properties'
+        self.key_fields = key_fields
+        self.page_size = page_size
+        self.items = {self.key(item): dict(item) for item in items}
+        self.items_read = 0
+        self.updates = []
+        self.lock = threading.Lock()
+        self.meta = SimpleNamespace(client=self)
+
+    def key(self, item):
+        return tuple(item[field] for field in self.key_fields)
+
+    def get_item(self, Key, TableName=None, **kwargs):
+        item = self.items.get(self.key(Key))
+        self.items_read += 1
+        return {'Item': dict(item)} if item else {}
+
+    def batch_get_item(self, RequestItems):
+        request = RequestItems[self.name]
+        found = [dict(self.items[self.key(k)]) for k in request['Keys'] if self.key(k) in self.items]
+        self.items_read += len(request['Keys'])
+        return {'Responses': {self.name: found}, 'UnprocessedKeys': {}}
+
+    def put_item(self, Item, TableName=None, ConditionExpression=None):
+        with self.lock:
+            if ConditionExpression == 'attribute_not_exists(property_id)' and self.key(Item) in self.items:
+                raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'PutItem')
+            self.items[self.key(Item)] = dict(Item)
+
+    def update_item(self, Key, **kwargs):
+        self.updates.append(self.key(Key))
+
+    def delete_item(self, Key):
+        self.items.pop(self.key(Key), None)
+
+    def batch_write_item(self, RequestItems):
+        for request in RequestItems[self.name]:
+            self.put_item(Item=request['PutRequest']['Item'])
+        return {'UnprocessedItems': {}}
+
+    def scan(self, ExclusiveStartKey=None, **kwargs):
+        items = sorted(self.items.values(), key=self.key)
+        start = ExclusiveStartKey['index'] if ExclusiveStartKey else 0
+        page = items[start:start + self.page_size]
+        self.items_read += len(page)
+        response = {'Items': [dict(item) for item in page]}
+        if start + self.page_size < len(items):
+            response['LastEvaluatedKey'] = {'index': start + self.page_size}
+        return response
+
+    @contextmanager
+    def batch_writer(self, overwrite_by_pkeys=None):
+        yield self
+
+
+def meta(date, raw_id, **fields):
+    return dict({'property_id': f"PROP#{date}_{raw_id}", 'sort_key': 'META', 'redfin_id': raw_id,
+                 'listing_url': f"https://www.redfin.com/CA/San-Jose/1-Main-St-95125/home/{raw_id}",
+                 'first_seen_date': f"{date[:4]}-{date[4:6]}-{date[6:]}T00:00:00",
+                 'analysis_date': f"{date[:4]}-{date[4:6]}-{date[6:]}T00:00:00"}, **fields)
+
+
+def test_first_writer_registers_and_rescrapes_reuse_it():
+    table = PropertiesTable()
+    first = [{'property_id': 'PROP#20250101_111', 'redfin_id': '111'}]
+    assign_canonical_ids(first, table)
+    assert table.items[('REDFIN#111', ID_MAP_SORT_KEY)]['canonical_id'] == 'PROP#20250101_111'
+
+    rescrape = [{'property_id': 'PROP#20250301_111', 'redfin_id': '111'},
+                {'property_id': 'PROP#20250301_222', 'redfin_id': '222'},
+                {'property_id': 'PROP#20250301_slug'}]
+    assign_canonical_ids(rescrape, table)
+    assert [p['property_id'] for p in rescrape] == ['PROP#20250101_111', 'PROP#20250301_222', 'PROP#20250301_slug']
+
+
+def test_concurrent_first_writers_agree():
+    table = PropertiesTable()
+    table.put_item(Item=dict(id_map_key('333'), canonical_id='PROP#20250101_333'))
+    # A writer that missed the mapping in its lookup still ends up on the registered key
+    assert register_property_id('333', 'PROP#20250401_333', table) == 'PROP#20250101_333'
+
+
+def test_batch_write_uses_canonical_key():
+    table = PropertiesTable([meta('20250101', '444', price=500000)])
+    table.put_item(Item=dict(id_map_key('444'), canonical_id='PROP#20250101_444'))
+    urls = SimpleNamespace(name='urls', meta=SimpleNamespace(client=PropertiesTable(key_fields=('url',))))
+
+    url_info = {'url': meta('20250101', '444')['listing_url'], 'city': 'San Jose', 'price': 480000}
+    data = {'property_id': 'PROP#20250601_444', 'redfin_id': '444', 'listing_url': url_info['url'], 'price': 480000}
+    [outcome] = app.write_property_batch([(url_info, data)], table, urls)
+
+    assert outcome['success']
+    metas = [key for key in table.items if key[1] == 'META']
+    assert metas == [('PROP#20250101_444', 'META')]
+    assert table.updates == [('PROP#20250101_444', 'META')]
+
+
+def test_fix_property_id_uses_the_map():
+    table = PropertiesTable([meta('20250101', '555')])
+    table.put_item(Item=dict(id_map_key('555'), canonical_id='PROP#20250101_555'))
+    table.items_read = 0
+
+    assert get_existing_property_id('555', table) == 'PROP#20250101_555'
+    assert get_existing_property_id('999', table) is None
+    assert table.items_read == 2
+    assert create_or_get_property_id('999', table).endswith('_999')
+    assert create_or_get_property_id('999', table) == create_or_get_property_id('999', table)
+
+
+def test_merge_folds_duplicates_and_repoints_preferences():
+    table = PropertiesTable([
+        meta('20250101', '666', price=900000, beds=3),
+        meta('20250301', '666', price=875000, beds=3, baths=2),
+        {'property_id': 'PROP#20250301_666', 'sort_key': 'HIST#2025-03-01_00:00:00', 'price': 875000},
+        meta('20250201', '777', price=650000),
+        {'property_id': 'COLLECTOR#CA#San Jose', 'sort_key': 'WATERMARK'},
+    ])
+    preferences = PropertiesTable([
+        {'user_id': 'u1', 'property_id': 'PROP#20250301_666', 'preference_type': 'favorite'},
+        {'user_id': 'u1', 'property_id': 'PROP#20250201_777', 'preference_type': 'hidden'},
+    ], key_fields=('user_id', 'property_id'))
+
+    dry = merge_duplicate_properties(table, preferences, dry_run=True)
+    assert dry['merged'] == {'PROP#20250301_666': 'PROP#20250101_666'}
+    assert ('PROP#20250301_666', 'META') in table.items
+
+    summary = merge_duplicate_properties(table, preferences)
+    assert summary['duplicate_keys'] == 1 and summary['moved_preferences'] == 1
+
+    merged = table.items[('PROP#20250101_666', 'META')]
+    assert merged['price'] == 875000 and merged['baths'] == 2
+    assert merged['first_seen_date'].startswith('2025-01-01')
+    assert not [key for key in table.items if key[0] == 'PROP#20250301_666']
+    assert ('PROP#20250101_666', 'HIST#2025-03-01_00:00:00') in table.items
+    assert ('COLLECTOR#CA#San Jose', 'WATERMARK') in table.items
+
+    assert lookup_property_ids(['666', '777'], table) == {'666': 'PROP#20250101_666', '777': 'PROP#20250201_777'}
+    assert ('u1', 'PROP#20250101_666') in preferences.items
+    assert ('u1', 'PROP#20250301_666') not in preferences.items
+
+    # Running it again changes nothing
+    assert merge_duplicate_properties(table, preferences)['duplicate_keys'] == 0
+
+
+def old_scan_lookup(raw_id, table):
+    """The previous fix_property_id lookup: page through every META item"""
+    scan_kwargs = {}
+    while True:
+        response = table.scan(**scan_kwargs)
+        for item in response['Items']:
+            property_id = item.get('property_id', '')
+            if item.get('sort_key') == 'META' and property_id.split('#')[-1].split('_')[-1] == raw_id:
+                return property_id
+        if 'LastEvaluatedKey' not in response:
+            return None
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--homes", type=int, default=2000, help="Homes in the properties table")
+    parser.add_argument("--lookups", type=int, default=50, help="Re-scraped homes to resolve")
+    args = parser.parse_args()
+
+    table = PropertiesTable([meta('20250101', str(100000 + i)) for i in range(args.homes)])
+    merge_duplicate_properties(table)
+    raw_ids = [str(100000 + i * (args.homes // args.lookups)) for i in range(args.lookups)]
+
+    print(f"{args.homes} homes, {args.lookups} lookups")
+    print(f"{'lookup':>10}  {'items read':>10}  {'per lookup':>10}")
+    table.items_read = 0
+    for raw_id in raw_ids:
+        old_scan_lookup(raw_id, table)
+    print(f"{'full scan':>10}  {table.items_read:>10}  {table.items_read / args.lookups:>10.1f}")
+
+    table.items_read = 0
+    lookup_property_ids(raw_ids, table)
+    print(f"{'ID map':>10}  {table.items_read:>10}  {table.items_read / args.lookups:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# test_property_writes.py
+"""
+Checks for attribute-level upserts of property META records.
+
+An in-memory table applies the SET/REMOVE expressions the processor sends
+and counts write units (1 per KB of item, as DynamoDB bills them); run as a
+script to compare full put_item overwrites with upserts over a re-scrape:
+
+    python test_property_writes.py --properties 200 --changed 0.1
+"""
+import argparse
+import copy
+import json
+import re
+from decimal import Decimal
+from types import SimpleNamespace
+
+import app
+
+ASSIGNMENT_PATTERN = re.compile(r'(#\w+) = (if_not_exists\((#\w+), (:\w+)\)|:\w+)')
+
+
+def write_units(item):
+    size = len(json.dumps(item, default=str))
+    return max(1, -(-size // 1024))
+
+
+class MemoryTable:
+    """GetItem/BatchGetItem/PutItem/UpdateItem over a dict, counting write units"""
+
+    def __init__(self, items=None):
+        self.name = 'properties'
+        self.items = {item['property_id']: item for item in (items or [])}
+        self.calls = {'get_item': 0, 'batch_get_item': 0, 'put_item': 0, 'update_item': 0}
+        self.write_units = 0
+        self.meta = SimpleNamespace(client=self)
+
+    def project(self, item, projection, names):
+        fields = [names.get(name.strip(), name.strip()) for name in projection.split(',')]
+        return {f: copy.deepcopy(item[f]) for f in fields if f in item}
+
+    def get_item(self, Key, ProjectionExpression, ExpressionAttributeNames):
+        self.calls['get_item'] += 1
+        item = self.items.get(Key['property_id'])
+        return {'Item': self.project(item, ProjectionExpression, ExpressionAttributeNames)} if item else {}
+
+    def batch_get_item(self, RequestItems):
+        self.calls['batch_get_item'] += 1
+        request = RequestItems[self.name]
+        found = [self.project(self.items[k['property_id']], request['ProjectionExpression'],
+                              request['ExpressionAttributeNames'])
+                 for k in request['Keys'] if k['property_id'] in self.items]
+        return {'Responses': {self.name: found}, 'UnprocessedKeys': {}}
+
+    def put_item(self, Item):
+        self.calls['put_item'] += 1
+        self.items[Item['property_id']] = copy.deepcopy(Item)
+        self.write_units += write_units(Item)
+
+    def batch_write_item(self, RequestItems):
+        self.calls.setdefault('batch_write_item', 0)
+        self.calls['batch_write_item'] += 1
+        for request in RequestItems[self.name]:
+            self.put_item(Item=request['PutRequest']['Item'])
+        return {'UnprocessedItems': {}}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeNames, ExpressionAttributeValues):
+        self.calls['update_item'] += 1
+        item = self.items[Key['property_id']]
+        set_part, _, remove_part = UpdateExpression[len('SET '):].partition(' REMOVE ')
+        for name, value, _, default in ASSIGNMENT_PATTERN.findall(set_part):
+            field = ExpressionAttributeNames[name]
+            if default:
+                item.setdefault(field, ExpressionAttributeValues[default])
+            else:
+                item[field] = ExpressionAttributeValues[value]
+        for name in filter(None, (n.strip() for n in remove_part.split(','))):
+            item.pop(ExpressionAttributeNames[name], None)
+        self.write_units += write_units(item)
+
+
+class UrlTable:
+    def __init__(self):
+        self.name = 'urls'
+        self.processed = []
+        self.meta = SimpleNamespace(client=self)
+
+    def update_item(self, Key, **kwargs):
+        self.processed.append(Key['url'])
+
+    def batch_write_item(self, RequestItems):
+        self.processed.extend(r['PutRequest']['Item']['url'] for r in RequestItems[self.name])
+        return {'UnprocessedItems': {}}
+
+
+def make_property(index, price=1250000):
+    return {
+        'property_id': f"PROP#20250101_{index}",
+        'listing_url': f"https://www.redfin.com/CA/San-Jose/{index}-Main-St-95125/home/{index}",
+        'price': price,
+        'beds': 3,
+        'baths': 2.5,
+        'size_sqft': 1600,
+        'city': 'San Jose',
+        'state': 'CA',
+        'description': 'Bright single-family home close to downtown. ' * 12,
+        'amenities': ['Garage', 'Pool'],
+        'image_urls': [f"https://ssl.cdn-redfin.com/photo/1/bigphoto/{index}_{i}.jpg" for i in range(12)],
+        'image_count': 12,
+        'extraction_timestamp': '2025-01-02T00:00:00'
+    }
+
+
+def test_new_property_is_created():
+    table = MemoryTable()
+    assert app.save_property_to_dynamodb(make_property(1), table) == 'created'
+    assert table.items['PROP#20250101_1']['first_seen_date']
+
+
+def test_unchanged_page_sends_no_write():
+    table = MemoryTable()
+    app.save_property_to_dynamodb(make_property(1), table)
+    puts = table.calls['put_item']
+
+    assert app.save_property_to_dynamodb(make_property(1), table) == 'unchanged'
+    assert table.calls['put_item'] == puts
+    assert table.calls['update_item'] == 0
+
+
+def test_update_preserves_first_seen_and_analyzer_fields():
+    table = MemoryTable()
+    app.save_property_to_dynamodb(make_property(1), table)
+    item = table.items['PROP#20250101_1']
+    item['first_seen_date'] = '2024-06-01T00:00:00'
+    item['city_discount_pct'] = Decimal('-4.5')
+    item['original_price'] = 1300000
+
+    changed = make_property(1, price=1199000)
+    changed.pop('amenities')
+    assert app.save_property_to_dynamodb(changed, table) == 'updated'
+
+    item = table.items['PROP#20250101_1']
+    assert item['price'] == 1199000
+    assert 'amenities' not in item
+    assert item['first_seen_date'] == '2024-06-01T00:00:00'
+    assert item['city_discount_pct'] == Decimal('-4.5')
+    assert item['original_price'] == 1300000
+
+
+def test_update_expression_is_minimal():
+    record = app.build_property_record(make_property(1, price=1199000))
+    # parking is no longer on the page; legacy_field is not a processor field
+    existing = dict(app.build_property_record(make_property(1)), parking='Garage', legacy_field='x')
+    update = app.build_property_update(record, existing)
+
+    set_part, _, remove_part = update['UpdateExpression'].partition(' REMOVE ')
+    names = update['ExpressionAttributeNames']
+    assert {names[n] for n in re.findall(r'#\w+', set_part)} == \
+        {'price', 'analysis_date', 'first_seen_date', 'extraction_timestamp'}
+    assert {names[n] for n in re.findall(r'#\w+', remove_part)} == {'parking'}
+
+
+def test_batch_upsert():
+    table, urls = MemoryTable(), UrlTable()
+    batch = [({'url': p['listing_url']}, p) for p in (make_property(i) for i in range(3))]
+    outcomes = app.write_property_batch(batch, table, urls)
+    assert [o['write'] for o in outcomes] == ['created'] * 3
+
+    batch[1] = (batch[1][0], make_property(1, price=999000))
+    outcomes = app.write_property_batch(batch, table, urls)
+    assert [o['write'] for o in outcomes] == ['unchanged', 'updated', 'unchanged']
+    assert table.calls['batch_get_item'] == 2
+    assert table.calls['update_item'] == 1
+    assert len(urls.processed) == 6
+
+    outcomes = app.write_property_batch(batch, table, urls, upsert=False)
+    assert [o['write'] for o in outcomes] == ['replaced'] * 3
+
+
+def run_rescrape(count, changed_fraction, upsert):
+    table = MemoryTable()
+    for i in range(count):
+        app.save_property_to_dynamodb(make_property(i), table)
+    table.write_units = 0
+
+    every = max(1, round(1 / changed_fraction)) if changed_fraction else 0
+    for i in range(count):
+        price = 1199000 if every and i % every == 0 else 1250000
+        app.save_property_to_dynamodb(make_property(i, price=price), table, upsert=upsert)
+    return table.write_units
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--properties", type=int, default=200, help="Properties re-scraped")
+    parser.add_argument("--changed", type=float, default=0.1, help="Fraction whose price changed")
+    args = parser.parse_args()
+
+    put_units = run_rescrape(args.properties, args.changed, upsert=False)
+    upsert_units = run_rescrape(args.properties, args.changed, upsert=True)
+    print(f"{args.properties} properties, {args.changed:.0%} changed")
+    print(f"put_item: {put_units} WCU")
+    print(f"upsert:   {upsert_units} WCU")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# test_refetch_policy.py
+"""
+Checks for the detail-page refetch policy and the content-hash skip.
+
+The in-memory URL table from test_url_leases stands in for DynamoDB; run as
+a script to simulate a month of daily refetch budgets over homes whose pages
+change at age-dependent rates, comparing oldest-fetch-first against the policy:
+
+    python test_refetch_policy.py --homes 2000 --budget 150 --days 30
+"""
+import argparse
+import random
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from botocore.exceptions import ClientError
+
+import app
+from rate_limiter import RateLimiter
+from refetch_policy import (
+    MIN_REFETCH_HOURS, REFETCH_INDEX, plan_refetches, queue_refetches, refetch_interval_hours, refetch_score,
+    scan_refetch_properties
+)
+from test_url_leases import UrlTableClient, make_table
+from url_leases import claim_pending_urls
+
+NOW = datetime(2025, 6, 1, 12).timestamp()
+HOUR = 3600
+DAY = 86400
+
+
+def iso(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat()
+
+
+def home(i, age_days, fetched_hours_ago, **fields):
+    return dict({
+        'property_id': f"PROP#20250101_{i}",
+        'listing_url': f"https://www.redfin.com/CA/San-Jose/{i}-Main-St-95125/home/{i}",
+        'city': 'San Jose',
+        'days_on_market': age_days,
+        'extraction_timestamp': iso(NOW - fetched_hours_ago * HOUR)
+    }, **fields)
+
+
+def test_new_listings_and_favorites_are_due_sooner():
+    assert refetch_interval_hours(3) < refetch_interval_hours(45) < refetch_interval_hours(300)
+    assert refetch_interval_hours(300, favorited=True) == refetch_interval_hours(300) / 4
+    assert refetch_interval_hours(7) == 24 and refetch_interval_hours(10000) == 336
+
+    # Fetched 30 hours ago: due when new, not when six months old
+    assert refetch_score(home(1, 3, 30), now=NOW) >= 1.0
+    assert refetch_score(home(2, 180, 30), now=NOW) < 1.0
+    # ... unless someone favorited it and it has been four days
+    assert refetch_score(home(3, 180, 96), now=NOW) < 1.0
+    assert refetch_score(home(3, 180, 96), favorited=True, now=NOW) >= 1.0
+
+
+def test_card_changes_since_the_fetch_make_a_page_due():
+    old = home(4, 180, 30)
+    assert refetch_score(dict(old, last_price_update=iso(NOW - 2 * HOUR)), now=NOW) >= 1.0
+    assert refetch_score(dict(old, card_status_changed_at=iso(NOW - 2 * HOUR)), now=NOW) >= 1.0
+    # A change the last fetch already saw does not count
+    assert refetch_score(dict(old, last_price_update=iso(NOW - 40 * HOUR)), now=NOW) < 1.0
+    # Nothing is refetched within MIN_REFETCH_HOURS
+    recent = home(5, 2, MIN_REFETCH_HOURS - 1, last_price_update=iso(NOW - HOUR))
+    assert refetch_score(recent, now=NOW) == 0.0
+
+    # The tracking item's fetched_at wins over the extraction time
+    assert refetch_score(home(6, 3, 30), {'fetched_at': int(NOW - HOUR)}, now=NOW) == 0.0
+
+
+def test_plan_skips_pending_urls_and_keeps_to_budget():
+    homes = [home(i, 3, 24 + i) for i in range(10)]
+    states = {h['listing_url']: {'processed': 'Y'} for h in homes}
+    states[homes[9]['listing_url']] = {'processed': ''}
+    states[homes[8]['listing_url']] = {'processed': 'F'}
+
+    plan = plan_refetches(homes, states, set(), budget=3, now=NOW)
+    assert [c['property_id'] for c in plan] == ['PROP#20250101_7', 'PROP#20250101_6', 'PROP#20250101_5']
+
+
+class ScanTable:
+    """Scans return META items; the refetch-index can be missing"""
+
+    def __init__(self, items, has_index=True):
+        self.items = items
+        self.has_index = has_index
+        self.scans = []
+
+    def scan(self, **kwargs):
+        self.scans.append(kwargs.get('IndexName'))
+        if kwargs.get('IndexName') and not self.has_index:
+            raise ClientError({'Error': {'Code': 'ValidationException',
+                                         'Message': 'The table does not have the specified index'}}, 'Scan')
+        return {'Items': self.items}
+
+
+def test_properties_are_read_from_the_refetch_index():
+    homes = [home(i, 3, 24) for i in range(3)]
+    table = ScanTable(homes)
+    assert scan_refetch_properties(table) == homes
+    assert table.scans == [REFETCH_INDEX]
+
+    # While the index is being built the table itself is scanned
+    table = ScanTable(homes, has_index=False)
+    assert scan_refetch_properties(table) == homes
+    assert table.scans == [REFETCH_INDEX, None]
+
+
+def test_requeued_page_with_same_hash_is_not_parsed():
+    page = b'<html><head><meta name="twitter:text:price" content="$900,000"></head></html>'
+    url = home(7, 3, 48)['listing_url']
+    client = UrlTableClient([{'url': url, 'processed': 'Y', 'city': 'San Jose',
+                              'content_hash': app.detail_page_hash(page), 'fetched_at': int(NOW)}])
+    client.items['https://example.com/pending'] = {'url': 'https://example.com/pending', 'processed': ''}
+    table = make_table(client)
+
+    assert queue_refetches([{'url': url}, {'url': 'https://example.com/pending'}], table) == 1
+    [url_info] = claim_pending_urls(table, 'worker-a', 10)
+    assert url_info['content_hash'] == app.detail_page_hash(page)
+
+    class Buffer:
+        added = []
+
+        def add(self, url_info, property_data):
+            self.added.append(property_data)
+
+    session = SimpleNamespace(get=lambda url, **kwargs: SimpleNamespace(
+        status_code=200, content=page, headers={}, raise_for_status=lambda: None))
+    limiter = RateLimiter(min_delay=0.0, max_delay=0.0)
+    app.process_single_url(url_info, session, limiter, None, None, write_buffer=Buffer())
+    assert Buffer.added == [None]
+
+    # Marking it processed puts the hash and fetch time back on the tracking item
+    app.write_property_batch([(url_info, None)], make_table(None), table)
+    assert client.items[url]['processed'] == 'Y' and 'pending_shard' not in client.items[url]
+    assert client.items[url]['content_hash'] == app.detail_page_hash(page)
+    assert client.items[url]['fetched_at'] >= int(time.time()) - 5
+
+    # A changed page is parsed
+    url_info['content_hash'] = 'stale'
+    app.process_single_url(url_info, session, limiter, None, None, write_buffer=Buffer())
+    assert Buffer.added[-1]['price'] == 900000
+
+
+DETAIL_PAGE = """<html><head>
+<meta name="csrf-token" content="{token}">
+<meta name="twitter:text:price" content="{price}">
+<script nonce="{token}">window.__requestId = "{token}"; window.__ts = {ts};</script>
+<script type="application/ld+json">{{"@type": "SingleFamilyResidence", "name": "7 Main St"}}</script>
+</head><body>{spacing}<!-- rendered {ts} --><div class="home-main-stats-variant" data-rf-request-id="{token}">
+<p>3 beds</p></div></body></html>"""
+
+
+def detail_page(price='$900,000', token='a1b2', ts=1700000000, spacing=''):
+    return DETAIL_PAGE.format(price=price, token=token, ts=ts, spacing=spacing).encode('utf-8')
+
+
+def test_equivalent_pages_are_skipped_and_price_changes_are_not():
+    first = detail_page()
+    # Another fetch of the same listing: new tokens, timestamps and whitespace
+    again = detail_page(token='z9y8', ts=1700003600, spacing='\n  ')
+    repriced = detail_page(price='$875,000', token='q7r6', ts=1700007200)
+    assert first != again
+
+    url = home(8, 3, 48)['listing_url']
+    added = []
+    buffer = SimpleNamespace(add=lambda url_info, property_data: added.append(property_data))
+    limiter = RateLimiter(min_delay=0.0, max_delay=0.0)
+
+    def fetch(page, last_hash):
+        url_info = {'url': url, 'city': 'San Jose', 'content_hash': last_hash}
+        session = SimpleNamespace(get=lambda url, **kwargs: SimpleNamespace(
+            status_code=200, content=page, headers={}, raise_for_status=lambda: None))
+        app.process_single_url(url_info, session, limiter, None, None, write_buffer=buffer)
+        return url_info['content_hash']
+
+    last_hash = fetch(first, None)
+    assert added[-1]['price'] == 900000
+
+    assert fetch(again, last_hash) == last_hash
+    assert added[-1] is None
+
+    assert fetch(repriced, last_hash) != last_hash
+    assert added[-1]['price'] == 875000
+
+
+def change_rate(age_days):
+    """Daily probability that a listing's page changes (new listings change most)"""
+    return 0.3 if age_days < 7 else 0.1 if age_days < 30 else 0.04 if age_days < 90 else 0.01
+
+
+def simulate(homes, days, budget, policy, seed=1):
+    """Changed pages found and days stale records were shown, over daily refetch runs"""
+    rng = random.Random(seed)
+    items = {h['listing_url']: dict(h) for h in homes}
+    states = {url: {'processed': 'Y', 'fetched_at': NOW} for url in items}
+    stale = set()
+    found = stale_days = 0
+
+    for day in range(1, days + 1):
+        now = NOW + day * DAY
+        for url, item in items.items():
+            age = item['age'] + day
+            if rng.random() < change_rate(age) * (2 if item['favorite'] else 1):
+                stale.add(url)
+                # Half of all changes show up on the search card (price or status)
+                if rng.random() < 0.5:
+                    item['last_price_update'] = iso(now - HOUR)
+        stale_days += len(stale)
+
+        if policy:
+            favorites = {item['property_id'] for item in items.values() if item['favorite']}
+            chosen = [c['url'] for c in plan_refetches(list(items.values()), states, favorites, budget, now)]
+        else:
+            chosen = sorted(states, key=lambda url: states[url]['fetched_at'])[:budget]
+
+        for url in chosen:
+            states[url]['fetched_at'] = now
+            if url in stale:
+                stale.discard(url)
+                found += 1
+                items[url].update(days_on_market=items[url]['age'] + day, extraction_timestamp=iso(now))
+
+    return found, stale_days
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--homes", type=int, default=2000, help="Stored homes")
+    parser.add_argument("--budget", type=int, default=150, help="Detail refetches per day")
+    parser.add_argument("--days", type=int, default=30, help="Days to simulate")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    homes = []
+    for i in range(args.homes):
+        age = rng.randint(0, 180)
+        homes.append(dict(home(i, age, 0), age=age, favorite=rng.random() < 0.05))
+
+    fetches = args.budget * args.days
+    print(f"{args.homes} homes, {args.budget} refetches/day for {args.days} days")
+    print(f"{'policy':>14}  {'changed found':>13}  {'per fetch':>9}  {'stale home-days':>15}")
+    for name, policy in (('oldest first', False), ('freshness', True)):
+        found, stale_days = simulate(homes, args.days, args.budget, policy)
+        print(f"{name:>14}  {found:>13}  {found / fetches:>9.3f}  {stale_days:>15}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# test_retry_schedule.py
+"""
+Checks for the persistent retry schedule of failed detail fetches.
+
+Uses the in-memory URL table from test_url_leases; run as a script to
+simulate a day of hourly runs over a table with broken URLs and count the
+detail requests spent on them with and without the schedule:
+
+    python test_retry_schedule.py --urls 500 --broken 0.2 --hours 24
+"""
+import argparse
+import random
+import time
+
+from retry_schedule import (
+    BASE_DELAY_SECONDS, TERMINAL_STATE, classify_error, next_attempt_delay, schedule_retries
+)
+from test_url_leases import UrlTableClient, make_table, pending_item
+from url_leases import backfill_pending_index, claim_listed_urls, claim_pending_urls
+
+
+def claim_all(table, owner='worker-a'):
+    return claim_pending_urls(table, owner, 1000)
+
+
+def test_error_classes():
+    assert classify_error('404 Not Found') == 'not_found'
+    assert classify_error('403 Forbidden') == 'blocked'
+    assert classify_error('429 Too Many Requests') == 'blocked'
+    assert classify_error('No data') == 'parse'
+    assert classify_error('Failed to save') == 'write'
+    assert classify_error('Read timed out') == 'fetch'
+
+
+def test_backoff_doubles_and_is_capped():
+    delays = [next_attempt_delay('fetch', attempts) for attempts in range(1, 12)]
+    assert BASE_DELAY_SECONDS['fetch'] * 0.8 <= delays[0] <= BASE_DELAY_SECONDS['fetch'] * 1.2
+    assert delays[3] > delays[1] * 2
+    assert max(delays) <= 7 * 24 * 3600 * 1.2
+
+
+def test_failed_urls_are_skipped_until_due():
+    items = [pending_item(i) for i in range(3)]
+    client = UrlTableClient(items)
+    table = make_table(client)
+    claimed = claim_all(table)
+
+    counts, unrecorded = schedule_retries(
+        [{'url': items[0]['url'], 'error': 'Read timed out'}], claimed, table
+    )
+    assert counts == {'scheduled': 1, 'terminal': 0} and unrecorded == []
+
+    item = client.items[items[0]['url']]
+    assert item['attempts'] == 1 and item['last_error_class'] == 'fetch'
+    assert item['next_attempt_at'] == item['lease_expires'] > time.time() + 2000
+    assert 'lease_owner' not in item
+
+    # Neither the index claim nor a queued message picks it up before it is due
+    for other in items[1:]:
+        client.items[other['url']] = {'url': other['url'], 'processed': 'Y'}
+    assert claim_all(table, 'worker-b') == []
+    _, statuses = claim_listed_urls(table, [items[0]], 'worker-b')
+    assert statuses == {items[0]['url']: 'scheduled'}
+
+    # Once due, it is claimed with its attempt count
+    item['lease_expires'] = item['next_attempt_at'] = int(time.time()) - 1
+    [again] = claim_all(table, 'worker-b')
+    assert again['attempts'] == 1
+
+
+def test_not_found_is_terminal():
+    client = UrlTableClient([pending_item(1)])
+    table = make_table(client)
+    claimed = claim_all(table)
+
+    counts, _ = schedule_retries([{'url': claimed[0]['url'], 'error': '404 Not Found'}], claimed, table)
+    assert counts == {'scheduled': 0, 'terminal': 1}
+    item = client.items[claimed[0]['url']]
+    assert item['processed'] == TERMINAL_STATE and 'pending_shard' not in item
+    assert backfill_pending_index(table) == 0
+
+
+def test_repeated_parse_failures_give_up_but_blocks_do_not():
+    client = UrlTableClient([pending_item(1), pending_item(2)])
+    table = make_table(client)
+    parse_url, blocked_url = pending_item(1)['url'], pending_item(2)['url']
+
+    for _ in range(3):
+        claimed = claim_all(table)
+        schedule_retries([{'url': parse_url, 'error': 'No data'},
+                          {'url': blocked_url, 'error': '403 Forbidden'}], claimed, table, max_attempts=3)
+        for item in client.items.values():
+            if 'lease_expires' in item:
+                item['lease_expires'] = 0
+
+    assert client.items[parse_url]['processed'] == TERMINAL_STATE
+    assert client.items[blocked_url]['processed'] == '' and client.items[blocked_url]['attempts'] == 3
+
+
+def test_processed_urls_are_left_alone():
+    client = UrlTableClient([pending_item(1)])
+    table = make_table(client)
+    claimed = claim_all(table)
+    client.items[claimed[0]['url']] = {'url': claimed[0]['url'], 'processed': 'Y'}
+
+    counts, unrecorded = schedule_retries([{'url': claimed[0]['url'], 'error': 'No data'}], claimed, table)
+    assert counts == {'scheduled': 0, 'terminal': 0} and unrecorded == []
+    assert client.items[claimed[0]['url']] == {'url': claimed[0]['url'], 'processed': 'Y'}
+
+
+def test_backfill_keeps_scheduled_retries_off_the_index():
+    due_later = int(time.time()) + 3600
+    client = UrlTableClient([{'url': 'https://www.redfin.com/home/1', 'processed': '', 'next_attempt_at': due_later}])
+    table = make_table(client)
+
+    assert backfill_pending_index(table) == 1
+    assert client.items['https://www.redfin.com/home/1']['lease_expires'] == due_later
+    assert claim_all(table) == []
+
+
+def simulate(count, broken_share, hours, scheduled):
+    """Detail requests over hourly runs; broken URLs 404, all others succeed"""
+    items = [pending_item(i) for i in range(count)]
+    broken = {item['url'] for item in random.sample(items, int(count * broken_share))}
+    client = UrlTableClient(items)
+    table = make_table(client)
+    start = int(time.time())
+    requests = 0
+
+    for hour in range(hours):
+        now = start + hour * 3600
+        time.time = lambda: now  # simulated clock
+        claimed = claim_pending_urls(table, f"run-{hour}", count)
+        requests += len(claimed)
+
+        failures = [{'url': u['url'], 'error': '404 Not Found'} for u in claimed if u['url'] in broken]
+        for url_info in claimed:
+            if url_info['url'] not in broken:
+                client.items[url_info['url']] = {'url': url_info['url'], 'processed': 'Y'}
+        if scheduled:
+            schedule_retries(failures, claimed, table)
+        else:
+            # Old behaviour: the URL stays pending and comes back next hour
+            for failure in failures:
+                client.items[failure['url']]['lease_expires'] = 0
+                client.items[failure['url']].pop('lease_owner', None)
+
+    return requests
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--urls", type=int, default=500, help="Pending URLs")
+    parser.add_argument("--broken", type=float, default=0.2, help="Share of URLs that 404")
+    parser.add_argument("--hours", type=int, default=24, help="Hourly runs to simulate")
+    args = parser.parse_args()
+
+    real_time = time.time
+    try:
+        print(f"{args.urls} URLs, {args.broken:.0%} broken, {args.hours} hourly runs")
+        print(f"{'mode':>12}  {'requests':>8}")
+        for mode, scheduled in (('no schedule', False), ('scheduled', True)):
+            print(f"{mode:>12}  {simulate(args.urls, args.broken, args.hours, scheduled):>8}")
+    finally:
+        time.time = real_time
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# test_sqs_mode.py
+"""
+Checks for SQS-driven processing with partial batch failures.
+
+A local queue stands in for SQS and the Lambda event source mapping: it
+hands out batches of up to 10 messages, deletes the ones the handler does
+not report in batchItemFailures and redelivers the rest (moving them to a
+dead-letter list after max_receives). URL processing is replaced by a fake
+that fails chosen URLs, so only the queue/lease bookkeeping is exercised.
+Run as a script to drain a queue with duplicate messages and failing URLs:
+
+    python test_sqs_mode.py --urls 200 --duplicates 0.2 --flaky 0.1
+"""
+import argparse
+import json
+import os
+import random
+import time
+import uuid
+from types import SimpleNamespace
+
+import app
+from test_url_leases import UrlTableClient, make_table, pending_item
+
+
+class LocalQueue:
+    """Receive/delete/redeliver over a list of messages"""
+
+    def __init__(self, max_receives=5):
+        self.visible = []
+        self.dead_letters = []
+        self.max_receives = max_receives
+        self.receives = {}
+
+    def send(self, body):
+        self.visible.append({'messageId': uuid.uuid4().hex, 'body': json.dumps(body), 'eventSource': 'aws:sqs'})
+
+    def receive_batch(self, size=10):
+        batch, self.visible = self.visible[:size], self.visible[size:]
+        for record in batch:
+            self.receives[record['messageId']] = self.receives.get(record['messageId'], 0) + 1
+        return batch
+
+    def settle(self, batch, response):
+        """Delete processed messages; failures become visible again or go to the DLQ"""
+        failed = {failure['itemIdentifier'] for failure in response.get('batchItemFailures', [])}
+        for record in batch:
+            if record['messageId'] not in failed:
+                continue
+            if self.receives[record['messageId']] >= self.max_receives:
+                self.dead_letters.append(record)
+            else:
+                self.visible.append(record)
+
+
+class FakeProcessor:
+    """Stands in for app.process_urls: marks URLs processed unless they are set to fail"""
+
+    def __init__(self, client, failing=(), stop_after=None):
+        self.client = client
+        self.failing = set(failing)
+        self.stop_after = stop_after
+        self.processed = []
+        self.configs = []
+
+    def __call__(self, urls, config, logger=None, rate_limiter=None, breaker=None, parse_pool=None):
+        self.configs.append(config)
+        started = urls if self.stop_after is None else urls[:self.stop_after]
+        results = {'processed': 0, 'success': 0, 'failed': 0, 'errors': [],
+                   'unstarted': urls[len(started):]}
+        for url_info in started:
+            results['processed'] += 1
+            if url_info['url'] in self.failing:
+                results['failed'] += 1
+                results['errors'].append({'url': url_info['url'], 'error': 'HTTP 503'})
+                continue
+            self.processed.append(url_info['url'])
+            self.client.items[url_info['url']] = {'url': url_info['url'], 'processed': 'Y'}
+            results['success'] += 1
+        return results
+
+
+def make_context(remaining_ms=900000):
+    return SimpleNamespace(aws_request_id=uuid.uuid4().hex, get_remaining_time_in_millis=lambda: remaining_ms)
+
+
+def setup(monkeypatch, items, **processor_options):
+    client = UrlTableClient(items)
+    processor = FakeProcessor(client, **processor_options)
+    monkeypatch.setattr(app, 'setup_dynamodb', lambda: (None, make_table(client)))
+    monkeypatch.setattr(app, 'process_urls', processor)
+    # No properties table here (checked in test_circuit_breaker)
+    monkeypatch.setenv('BREAKER_THRESHOLD', '0')
+    return client, processor
+
+
+def message(item):
+    return {'url': item['url'], 'city': item['city'], 'price': item['price']}
+
+
+def drain(queue, context_factory=make_context):
+    batches = 0
+    while queue.visible:
+        batch = queue.receive_batch()
+        response = app.lambda_handler({'Records': batch}, context_factory())
+        queue.settle(batch, response)
+        batches += 1
+    return batches
+
+
+def test_failures_are_reported_per_message(monkeypatch):
+    items = [pending_item(i) for i in range(6)]
+    client, processor = setup(monkeypatch, items, failing=[items[1]['url']])
+    queue = LocalQueue()
+    for item in items:
+        queue.send(message(item))
+    batch = queue.receive_batch()
+    batch.append({'messageId': 'garbled', 'body': 'not json', 'eventSource': 'aws:sqs'})
+
+    response = app.lambda_handler({'Records': batch}, make_context())
+
+    # The failed URL waits in the retry schedule, so only the garbled message is redelivered
+    failed = {failure['itemIdentifier'] for failure in response['batchItemFailures']}
+    assert failed == {'garbled'}
+    scheduled = client.items[items[1]['url']]
+    assert scheduled['attempts'] == 1 and scheduled['lease_expires'] > time.time()
+    assert 'lease_owner' not in scheduled
+    assert len(processor.processed) == 5
+
+
+def test_runtime_is_bounded_by_remaining_time(monkeypatch):
+    items = [pending_item(i) for i in range(3)]
+    client, processor = setup(monkeypatch, items, stop_after=1)
+    queue = LocalQueue()
+    for item in items:
+        queue.send(message(item))
+    batch = queue.receive_batch()
+
+    response = app.lambda_handler({'Records': batch}, make_context(remaining_ms=300000))
+
+    assert processor.configs[0]['max_runtime_seconds'] == 300 - app.SQS_RUNTIME_MARGIN_SECONDS
+    # Unstarted URLs are retried and their leases released
+    assert len(response['batchItemFailures']) == 2
+    assert all(client.items[item['url']]['lease_expires'] == 0 for item in items[1:])
+
+
+def test_duplicates_and_polling_overlap_process_once(monkeypatch):
+    items = [pending_item(i) for i in range(12)]
+    client, processor = setup(monkeypatch, items)
+    # The polling processor holds a live lease on one URL
+    client.items[items[0]['url']].update(lease_owner='poller', lease_expires=int(time.time()) + 600)
+    queue = LocalQueue()
+    for item in items + items[5:8]:
+        queue.send(message(item))
+
+    drain(queue)
+    assert sorted(processor.processed) == sorted(item['url'] for item in items[1:])
+    # The leased URL keeps being retried, never processed twice
+    assert queue.dead_letters and {json.loads(r['body'])['url'] for r in queue.dead_letters} == {items[0]['url']}
+
+
+def test_handler_error_fails_whole_batch(monkeypatch):
+    items = [pending_item(i) for i in range(3)]
+    setup(monkeypatch, items)
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("table unavailable")
+    monkeypatch.setattr(app, 'claim_listed_urls', broken)
+
+    queue = LocalQueue()
+    for item in items:
+        queue.send(message(item))
+    batch = queue.receive_batch()
+    response = app.lambda_handler({'Records': batch}, make_context())
+    assert len(response['batchItemFailures']) == 3
+
+
+def test_only_queue_invocations_take_a_share_of_the_delay_budget(monkeypatch):
+    items = [pending_item(0)]
+    client, processor = setup(monkeypatch, items)
+    monkeypatch.setenv('MIN_DELAY', '2')
+    monkeypatch.setenv('MAX_DELAY', '5')
+    monkeypatch.setenv('RATE_LIMIT_SHARES', '4')
+
+    queue = LocalQueue()
+    queue.send(message(items[0]))
+    drain(queue)
+    config = processor.configs[0]
+    assert (config['min_delay'], config['max_delay']) == (8.0, 20.0)
+
+    # The polling run paces at the full budget
+    polled = []
+    monkeypatch.setattr(app, 'process_pending_urls',
+                        lambda url_table, config, *args: polled.append(config) or {'claimed': 0})
+    app.lambda_handler({}, make_context())
+    assert (polled[0]['min_delay'], polled[0]['max_delay']) == (2.0, 5.0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--urls", type=int, default=200, help="New URLs published by the collector")
+    parser.add_argument("--duplicates", type=float, default=0.2, help="Share of URLs delivered twice")
+    parser.add_argument("--flaky", type=float, default=0.1, help="Share of URLs whose fetch fails")
+    args = parser.parse_args()
+
+    items = [pending_item(i) for i in range(args.urls)]
+    client = UrlTableClient(items)
+    processor = FakeProcessor(client, failing=random.sample([i['url'] for i in items], int(args.urls * args.flaky)))
+    app.setup_dynamodb = lambda: (None, make_table(client))
+    app.process_urls = processor
+    os.environ['BREAKER_THRESHOLD'] = '0'
+
+    queue = LocalQueue()
+    for item in items:
+        queue.send(message(item))
+        if random.random() < args.duplicates:
+            queue.send(message(item))
+
+    sent = len(queue.visible)
+    batches = drain(queue)
+    scheduled = sum(1 for item in client.items.values() if 'next_attempt_at' in item)
+
+    print(f"{sent} messages for {args.urls} URLs in {batches} batches: {len(processor.processed)} processed, "
+          f"{len(set(processor.processed))} unique, {scheduled} waiting in the retry schedule, "
+          f"{len(queue.dead_letters)} dead-lettered")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# test_thumbnails.py
+"""
+Checks for the photo thumbnail stage.
+
+Photos are generated with Pillow and served by a fake session with a fixed
+latency; thumbnails go to a temporary directory. Run as a script to compare
+bytes per card tile and sequential vs concurrent downloads:
+
+    python test_thumbnails.py --properties 20 --latency 0.2
+"""
+import argparse
+import io
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+
+import app
+from rate_limiter import RateLimiter
+from thumbnails import (
+    MAX_DOWNLOAD_ATTEMPTS, PIL_AVAILABLE, ThumbnailStore, get_thumbnail_store, make_thumbnail, process_thumbnails
+)
+
+pytestmark = pytest.mark.skipif(not PIL_AVAILABLE, reason="Pillow not installed")
+
+if PIL_AVAILABLE:
+    from PIL import Image
+
+
+def make_photo(seed, size=(1280, 960)):
+    """A full-size listing photo stand-in (noisy, so it compresses like a real one)"""
+    image = Image.effect_noise(size, 40 + seed % 20).convert('RGB')
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=90)
+    return output.getvalue()
+
+
+class PhotoSession:
+    """Serves photos by URL; unknown URLs 404"""
+
+    def __init__(self, photos, latency=0.0):
+        self.photos = photos
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def __call__(self, logger=None):
+        return self
+
+    def get(self, url, timeout=None):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.latency)
+        with self.lock:
+            self.active -= 1
+
+        photo = self.photos.get(url)
+
+        class Response:
+            content = photo
+
+            def raise_for_status(self):
+                if photo is None:
+                    raise RuntimeError("404 Not Found")
+        return Response()
+
+    def close(self):
+        pass
+
+
+class MetaTable:
+    """Scan/UpdateItem over META items"""
+
+    def __init__(self, items):
+        self.items = {item['property_id']: dict(item) for item in items}
+
+    def scan(self, **kwargs):
+        return {'Items': [{'property_id': pid, 'image_urls': item['image_urls'],
+                           'thumbnail_attempts': item.get('thumbnail_attempts', 0)}
+                          for pid, item in self.items.items()
+                          if item.get('image_urls') and 'thumbnail_urls' not in item]}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues, **kwargs):
+        item = self.items[Key['property_id']]
+        if UpdateExpression.startswith('ADD thumbnail_attempts'):
+            item['thumbnail_attempts'] = item.get('thumbnail_attempts', 0) + ExpressionAttributeValues[':one']
+            return
+        item['thumbnail_urls'] = ExpressionAttributeValues[':urls']
+        item.pop('thumbnail_attempts', None)
+
+
+def unpaced(**config):
+    """Processor config with photo download pacing off"""
+    return dict({'thumbnail_min_delay': 0, 'thumbnail_max_delay': 0}, **config)
+
+
+def listing(i, photos, count=5):
+    urls = [f"https://ssl.cdn-redfin.com/photo/{i}/{n}.jpg" for n in range(count)]
+    for n, url in enumerate(urls):
+        photos[url] = make_photo(i * 10 + n)
+    return {'property_id': f"PROP#20250101_{i}", 'sort_key': 'META', 'image_urls': urls}
+
+
+def test_thumbnail_fits_box_and_is_small():
+    photo = make_photo(1)
+    thumbnail = make_thumbnail(photo, (480, 360))
+    with Image.open(io.BytesIO(thumbnail)) as image:
+        assert image.size[0] <= 480 and image.size[1] <= 360
+        assert image.format == 'JPEG'
+    assert len(thumbnail) * 10 < len(photo)
+
+
+def test_stage_records_first_photos_and_dedups():
+    photos = {}
+    items = [listing(i, photos) for i in range(3)]
+    # The same photo on two listings is stored once
+    items[2]['image_urls'][0] = items[1]['image_urls'][0]
+    # A dead photo is skipped
+    items[0]['image_urls'][1] = 'https://ssl.cdn-redfin.com/photo/missing.jpg'
+    table = MetaTable(items)
+
+    with tempfile.TemporaryDirectory() as root:
+        store = ThumbnailStore(root_dir=root)
+        results = process_thumbnails(table, store, unpaced(thumbnail_count=3, max_workers=4),
+                                     session_factory=PhotoSession(photos))
+
+        assert results['properties'] == 3 and results['thumbnails'] == 8
+        assert len(table.items['PROP#20250101_0']['thumbnail_urls']) == 2
+        thumbnails = {pid: item['thumbnail_urls'] for pid, item in table.items.items()}
+        assert thumbnails['PROP#20250101_1'][0] == thumbnails['PROP#20250101_2'][0]
+        assert store.stats['new_thumbnails'] == 7 and store.stats['duplicates'] == 1
+        assert all(os.path.exists(url) for item in table.items.values() for url in item['thumbnail_urls'])
+
+        # Nothing left to do on the next run
+        assert process_thumbnails(table, store, unpaced(), session_factory=PhotoSession(photos))['properties'] == 0
+
+
+def test_downloads_run_concurrently():
+    photos = {}
+    table = MetaTable([listing(i, photos, count=3) for i in range(4)])
+    session = PhotoSession(photos, latency=0.05)
+
+    with tempfile.TemporaryDirectory() as root:
+        process_thumbnails(table, ThumbnailStore(root_dir=root), unpaced(thumbnail_count=3, max_workers=6),
+                           session_factory=session)
+    assert session.peak > 3
+
+
+def test_download_threads_reuse_their_sessions():
+    photos = {}
+    table = MetaTable([listing(i, photos, count=3) for i in range(6)])
+    served = PhotoSession(photos)
+    opened = []
+
+    class CountingSession:
+        def __init__(self):
+            self.closed = False
+            opened.append(self)
+
+        def get(self, url, timeout=None):
+            return served.get(url, timeout)
+
+        def close(self):
+            self.closed = True
+
+    with tempfile.TemporaryDirectory() as root:
+        results = process_thumbnails(table, ThumbnailStore(root_dir=root), unpaced(thumbnail_count=3, max_workers=2),
+                                     session_factory=lambda logger=None: CountingSession())
+    assert results['thumbnails'] == 18
+    # One session per download thread, not one per photo, and all closed at the end
+    assert 1 <= len(opened) <= 2
+    assert all(session.closed for session in opened)
+
+
+def test_failed_downloads_are_retried_then_given_up():
+    photos = {}
+    good = listing(1, photos, count=2)
+    dead = {'property_id': 'PROP#20250101_2', 'sort_key': 'META',
+            'image_urls': ['https://ssl.cdn-redfin.com/photo/gone/0.jpg', 'https://ssl.cdn-redfin.com/photo/gone/1.jpg']}
+    table = MetaTable([good, dead])
+
+    with tempfile.TemporaryDirectory() as root:
+        store = ThumbnailStore(root_dir=root)
+        for run in range(1, MAX_DOWNLOAD_ATTEMPTS):
+            results = process_thumbnails(table, store, unpaced(), session_factory=PhotoSession(photos))
+            # No thumbnail_urls, so the next scan picks the home up again
+            assert results['retry'] == 1
+            assert 'thumbnail_urls' not in table.items[dead['property_id']]
+            assert table.items[dead['property_id']]['thumbnail_attempts'] == run
+
+        results = process_thumbnails(table, store, unpaced(), session_factory=PhotoSession(photos))
+        assert results['retry'] == 0 and results['properties'] == 1
+        assert table.items[dead['property_id']]['thumbnail_urls'] == []
+        assert len(table.items[good['property_id']]['thumbnail_urls']) == 2
+
+
+def test_downloads_are_paced():
+    photos = {}
+    table = MetaTable([listing(i, photos, count=3) for i in range(3)])
+    limiter = RateLimiter(min_delay=0.0, max_delay=0.0, max_concurrency=2)
+
+    with tempfile.TemporaryDirectory() as root:
+        process_thumbnails(table, ThumbnailStore(root_dir=root), {'thumbnail_count': 3, 'max_workers': 4},
+                           session_factory=PhotoSession(photos), rate_limiter=limiter)
+    assert limiter.requests == 9 and limiter.successes == 9
+
+
+def test_s3_thumbnails_need_a_base_url():
+    assert get_thumbnail_store({'thumbnail_bucket': 'data'}) is None
+    with pytest.raises(ValueError):
+        ThumbnailStore(bucket='data')
+
+    store = get_thumbnail_store({'thumbnail_bucket': 'data', 'thumbnail_base_url': 'https://img.example.com/'})
+    assert store.thumbnail_url('thumbnails/480x360/ab/abc.jpg') == 'https://img.example.com/thumbnails/480x360/ab/abc.jpg'
+
+
+def test_new_photos_invalidate_thumbnails():
+    stored = {'property_id': 'PROP#1', 'image_urls': ['a.jpg'], 'thumbnail_urls': ['t.jpg']}
+    record = {'property_id': 'PROP#1', 'analysis_date': '2025-01-01', 'image_urls': ['b.jpg']}
+    update = app.build_property_update(record, stored)
+    assert {'thumbnail_urls', 'thumbnail_attempts'} <= set(update['ExpressionAttributeNames'].values())
+    assert ' REMOVE ' in update['UpdateExpression']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--properties", type=int, default=20, help="Listings to thumbnail")
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated seconds per photo download")
+    args = parser.parse_args()
+
+    photos = {}
+    items = [listing(i, photos, count=3) for i in range(args.properties)]
+    full_size = sum(len(photos[item['image_urls'][0]]) for item in items) / len(items)
+
+    print(f"{args.properties} listings x 3 photos, {args.latency * 1000:.0f} ms per download")
+    print(f"{'workers':>8}  {'seconds':>8}  {'tile bytes':>10}")
+    print(f"{'full':>8}  {'':>8}  {full_size:>10.0f}")
+    for workers in (1, 8):
+        table = MetaTable([dict(item) for item in items])
+        with tempfile.TemporaryDirectory() as root:
+            store = ThumbnailStore(root_dir=root)
+            start = time.perf_counter()
+            process_thumbnails(table, store, unpaced(max_workers=workers),
+                               session_factory=PhotoSession(photos, args.latency))
+            elapsed = time.perf_counter() - start
+        print(f"{workers:>8}  {elapsed:>8.2f}  {store.stats['bytes_out'] / store.stats['new_thumbnails']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# test_url_leases.py
+"""
+Checks for lease-based claiming from the sparse pending-index.
+
+An in-memory URL table answers pending-index queries and applies the
+claim/release conditions atomically, as DynamoDB does; run as a script to
+race several claimers over one table:
+
+    python test_url_leases.py --urls 2000 --claimers 8 --batch 50
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from botocore.exceptions import ClientError
+
+from url_leases import (
+    PENDING_INDEX, backfill_pending_index, claim_pending_urls, pending_shard_for, release_leases
+)
+from write_buffer import mark_urls_processed
+
+
+def conditional_check_failed():
+    return ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'UpdateItem')
+
+
+def apply_processed_update(items, Key, UpdateExpression, values):
+    """The mark-processed update of write_buffer.processed_url_update, with its condition"""
+    item = items.get(Key['url'])
+    if not item or (':owner' in values and item.get('lease_owner') != values[':owner']):
+        raise conditional_check_failed()
+    item['processed'] = 'Y'
+    for field in ('content_hash', 'fetched_at'):
+        if f":{field}" in values:
+            item[field] = values[f":{field}"]
+    for field in UpdateExpression.split(' REMOVE ')[1].split(', '):
+        item.pop(field, None)
+
+
+class UrlTableClient:
+    """The URL-tracking operations the processor uses, over a dict"""
+
+    def __init__(self, items, stale_reads=False):
+        self.items = {item['url']: dict(item) for item in items}
+        self.stale_reads = stale_reads
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def _count(self, name):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def query(self, TableName, IndexName, KeyConditionExpression, ExpressionAttributeValues, Limit,
+              ExclusiveStartKey=None):
+        self._count('query')
+        assert IndexName == PENDING_INDEX
+        shard, now = ExpressionAttributeValues[':shard'], ExpressionAttributeValues[':now']
+        with self.lock:
+            # A stale index still lists URLs that were just leased or processed
+            matches = sorted(
+                (item for item in self.items.values()
+                 if self.stale_reads or (item.get('pending_shard') == shard and item.get('lease_expires', 0) < now)),
+                key=lambda item: (item.get('lease_expires', 0), item['url'])
+            )
+        if self.stale_reads:
+            matches = [m for m in matches if pending_shard_for(m['url']) == shard]
+        start = 0
+        if ExclusiveStartKey:
+            start = [m['url'] for m in matches].index(ExclusiveStartKey['url']) + 1
+        page = matches[start:start + Limit]
+        response = {'Items': [{'url': m['url']} for m in page]}
+        if start + Limit < len(matches):
+            response['LastEvaluatedKey'] = {'url': page[-1]['url']}
+        return response
+
+    def update_item(self, TableName, Key, UpdateExpression, ExpressionAttributeValues,
+                    ConditionExpression=None, ReturnValues=None, ExpressionAttributeNames=None):
+        self._count('update_item')
+        values = ExpressionAttributeValues
+        with self.lock:
+            item = self.items.get(Key['url'])
+            if UpdateExpression.startswith('SET lease_owner'):
+                if not item or 'pending_shard' not in item or item.get('lease_expires', 0) >= values[':now']:
+                    raise conditional_check_failed()
+                item['lease_owner'] = values[':owner']
+                item['lease_expires'] = values[':expires']
+            elif UpdateExpression.startswith('SET lease_expires = :zero'):
+                if not item or 'pending_shard' not in item or item.get('lease_owner') != values[':owner']:
+                    raise conditional_check_failed()
+                item['lease_expires'] = 0
+                item.pop('lease_owner', None)
+            elif UpdateExpression.startswith('SET pending_shard'):
+                if not item or item.get('processed') != '':
+                    raise conditional_check_failed()
+                item['pending_shard'] = values[':shard']
+                item['lease_expires'] = item.get('next_attempt_at', values[':zero'])
+            elif UpdateExpression.startswith('SET attempts'):
+                if not item or item.get('processed') != '':
+                    raise conditional_check_failed()
+                item.update(attempts=values[':attempts'], last_error_class=values[':class'],
+                            last_error=values[':error'], last_attempt_at=values[':now'])
+                item.pop('lease_owner', None)
+                if ':terminal' in values:
+                    item['processed'] = values[':terminal']
+                    for field in ('pending_shard', 'lease_expires', 'next_attempt_at'):
+                        item.pop(field, None)
+                else:
+                    item['next_attempt_at'] = item['lease_expires'] = values[':next']
+            elif UpdateExpression.startswith('SET #p = :p'):
+                apply_processed_update(self.items, Key, UpdateExpression, values)
+            elif UpdateExpression.startswith('SET #p = :empty'):
+                # Refetch: a processed (or untracked) URL goes back on the index
+                if item and item.get('processed') != values[':done']:
+                    raise conditional_check_failed()
+                item = self.items.setdefault(Key['url'], {'url': Key['url'], 'city': values[':city']})
+                item.update(processed='', pending_shard=values[':shard'], lease_expires=0, attempts=0,
+                            refetch_requested_at=values[':now'])
+            else:
+                raise AssertionError(f"unexpected update {UpdateExpression}")
+            return {'Attributes': dict(item)} if ReturnValues == 'ALL_NEW' else {}
+
+    def get_item(self, TableName, Key, ConsistentRead=False):
+        self._count('get_item')
+        with self.lock:
+            item = self.items.get(Key['url'])
+            return {'Item': dict(item)} if item else {}
+
+    def scan(self, TableName, FilterExpression, ExpressionAttributeValues, ProjectionExpression,
+             ExclusiveStartKey=None):
+        self._count('scan')
+        with self.lock:
+            return {'Items': [{'url': item['url']} for item in self.items.values()
+                              if item.get('processed') == '' and 'pending_shard' not in item]}
+
+    def batch_write_item(self, RequestItems):
+        self._count('batch_write_item')
+        with self.lock:
+            for request in next(iter(RequestItems.values())):
+                item = request['PutRequest']['Item']
+                self.items[item['url']] = dict(item)
+        return {'UnprocessedItems': {}}
+
+
+def make_table(client):
+    return SimpleNamespace(name='urls', meta=SimpleNamespace(client=client))
+
+
+def pending_item(i):
+    url = f"https://www.redfin.com/CA/San-Jose/{i}-Main-St-95125/home/{i}"
+    return {'url': url, 'processed': '', 'city': 'San Jose', 'price': 1000000 + i,
+            'pending_shard': pending_shard_for(url), 'lease_expires': 0}
+
+
+def test_claim_sets_owner_and_returns_tracking_fields():
+    client = UrlTableClient([pending_item(i) for i in range(20)])
+    claimed = claim_pending_urls(make_table(client), 'worker-a', 5, lease_seconds=600)
+
+    assert len(claimed) == 5
+    assert claimed[0]['city'] == 'San Jose' and claimed[0]['price'] >= 1000000
+    leased = [item for item in client.items.values() if item.get('lease_owner') == 'worker-a']
+    assert len(leased) == 5
+    assert all(item['lease_expires'] > time.time() + 500 for item in leased)
+
+    # Leased URLs are not handed out again
+    again = claim_pending_urls(make_table(client), 'worker-b', 100)
+    assert len(again) == 15
+    assert not {u['url'] for u in claimed} & {u['url'] for u in again}
+
+
+def test_parallel_claimers_never_share_a_url():
+    client = UrlTableClient([pending_item(i) for i in range(400)], stale_reads=True)
+    table = make_table(client)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        batches = list(executor.map(lambda n: claim_pending_urls(table, f"worker-{n}", 60), range(8)))
+
+    claimed = [u['url'] for batch in batches for u in batch]
+    assert len(claimed) == len(set(claimed)) == 400
+
+
+def test_expired_leases_are_reclaimed():
+    crashed = dict(pending_item(1), lease_owner='crashed', lease_expires=int(time.time()) - 1)
+    live = dict(pending_item(2), lease_owner='running', lease_expires=int(time.time()) + 600)
+    client = UrlTableClient([crashed, live])
+
+    claimed = claim_pending_urls(make_table(client), 'worker-b', 10)
+    assert [u['url'] for u in claimed] == [crashed['url']]
+    assert client.items[crashed['url']]['lease_owner'] == 'worker-b'
+
+
+def test_release_and_processed_urls_leave_the_index():
+    client = UrlTableClient([pending_item(i) for i in range(4)])
+    table = make_table(client)
+    claimed = claim_pending_urls(table, 'worker-a', 4)
+
+    # Only the owner can release
+    assert release_leases(claimed[:1], table, 'someone-else') == 0
+    assert release_leases(claimed[:2], table, 'worker-a') == 2
+
+    mark_urls_processed(claimed[2:], table)
+    for url_info in claimed[2:]:
+        assert 'pending_shard' not in client.items[url_info['url']]
+
+    again = claim_pending_urls(table, 'worker-b', 10)
+    assert {u['url'] for u in again} == {u['url'] for u in claimed[:2]}
+
+
+def test_backfill_adds_old_pending_urls():
+    old = [{'url': f"https://www.redfin.com/home/{i}", 'processed': ''} for i in range(3)]
+    done = {'url': 'https://www.redfin.com/home/done', 'processed': 'Y'}
+    client = UrlTableClient(old + [done])
+    table = make_table(client)
+
+    assert backfill_pending_index(table) == 3
+    assert 'pending_shard' not in client.items[done['url']]
+    assert len(claim_pending_urls(table, 'worker-a', 10)) == 3
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--urls", type=int, default=2000, help="Pending URLs")
+    parser.add_argument("--claimers", type=int, default=8, help="Parallel processor invocations")
+    parser.add_argument("--batch", type=int, default=50, help="URLs claimed per invocation")
+    args = parser.parse_args()
+
+    # A mostly processed table: the old Scan(Limit=batch) reads batch items and finds few pending ones
+    processed = [{'url': f"https://www.redfin.com/home/done-{i}", 'processed': 'Y'} for i in range(args.urls * 9)]
+    client = UrlTableClient(processed + [pending_item(i) for i in range(args.urls)])
+    table = make_table(client)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.claimers) as executor:
+        batches = list(executor.map(lambda n: claim_pending_urls(table, f"worker-{n}", args.batch),
+                                    range(args.claimers)))
+    claimed = [u['url'] for batch in batches for u in batch]
+    print(f"{args.claimers} claimers x {args.batch}: {len(claimed)} claimed, {len(set(claimed))} unique, "
+          f"{client.calls} in {time.perf_counter() - start:.2f}s")
+    print(f"old scan: ~{args.batch // 10} pending URLs per Scan(Limit={args.batch}) on this table")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# test_write_buffer.py
+"""
+Checks for buffered batch writes of property records and URL state flips.
+
+A fake DynamoDB client with a fixed per-call latency (and optional
+UnprocessedItems/throttling) stands in for both tables; run as a script
+to compare round trips per URL against per-URL writes:
+
+    python test_write_buffer.py --urls 500 --latency 0.01
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from botocore.exceptions import ClientError
+
+import app
+import write_buffer
+from test_url_leases import apply_processed_update
+from write_buffer import WriteBuffer, batch_write_items, mark_urls_processed
+
+
+class FakeClient:
+    """BatchWriteItem/BatchGetItem/PutItem/UpdateItem over dicts, with scripted failures"""
+
+    def __init__(self, latency=0.0, unprocessed=0, throttles=0):
+        self.latency = latency
+        self.unprocessed = unprocessed
+        self.throttles = throttles
+        self.tables = {'properties': {}, 'urls': {}}
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def _call(self, name):
+        time.sleep(self.latency)
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def batch_write_item(self, RequestItems):
+        self._call('batch_write_item')
+        table_name, requests = next(iter(RequestItems.items()))
+        assert len(requests) <= 25
+
+        if self.throttles:
+            self.throttles -= 1
+            raise ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException'}}, 'BatchWriteItem')
+
+        # Leave the last `unprocessed` requests for the caller to retry
+        keep = len(requests) - min(self.unprocessed, len(requests) - 1)
+        self.unprocessed = 0
+        for request in requests[:keep]:
+            item = request['PutRequest']['Item']
+            key = item.get('property_id') or item['url']
+            self.tables[table_name][key] = item
+        left = requests[keep:]
+        return {'UnprocessedItems': {table_name: left} if left else {}}
+
+    def batch_get_item(self, RequestItems):
+        self._call('batch_get_item')
+        table_name, request = next(iter(RequestItems.items()))
+        found = [self.tables[table_name][k['property_id']] for k in request['Keys']
+                 if k['property_id'] in self.tables[table_name]]
+        return {'Responses': {table_name: found}, 'UnprocessedKeys': {}}
+
+    def update_item(self, Key, TableName=None, **kwargs):
+        self._call('update_item')
+        if 'url' in Key:
+            with self.lock:
+                apply_processed_update(self.tables['urls'], Key, kwargs['UpdateExpression'],
+                                       kwargs['ExpressionAttributeValues'])
+
+    def put_item(self, Item):
+        self._call('put_item')
+        self.tables['properties'][Item['property_id']] = Item
+
+    def get_item(self, Key, **kwargs):
+        self._call('get_item')
+        item = self.tables['properties'].get(Key['property_id'])
+        return {'Item': item} if item else {}
+
+    def round_trips(self):
+        return sum(self.calls.values())
+
+
+def make_tables(client):
+    properties = SimpleNamespace(name='properties', meta=SimpleNamespace(client=client),
+                                 get_item=client.get_item, put_item=client.put_item, update_item=client.update_item)
+    urls = SimpleNamespace(name='urls', meta=SimpleNamespace(client=client), update_item=client.update_item)
+    return properties, urls
+
+
+def make_url(i):
+    return {'url': f"https://www.redfin.com/CA/San-Jose/{i}-Main-St-95125/home/{i}", 'city': 'San Jose', 'price': 1000000}
+
+
+def make_property(i):
+    return {'property_id': f"PROP#20250101_{i}", 'listing_url': make_url(i)['url'], 'price': 1000000, 'beds': 3}
+
+
+def test_batch_write_retries_unprocessed_and_throttling(monkeypatch):
+    monkeypatch.setattr(write_buffer.time, 'sleep', lambda seconds: None)
+    client = FakeClient(unprocessed=5, throttles=1)
+    items = [{'url': f"u{i}", 'processed': 'Y'} for i in range(60)] + [{'url': 'u0', 'processed': 'Y', 'price': 1}]
+
+    failed = batch_write_items(client, 'urls', items, ('url',))
+    assert failed == []
+    assert len(client.tables['urls']) == 60
+    # Duplicate key within a call: the later item wins
+    assert client.tables['urls']['u0']['price'] == 1
+    # 3 chunks + 1 throttled + 1 UnprocessedItems retry
+    assert client.calls['batch_write_item'] == 5
+
+
+def test_batch_write_gives_up_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(write_buffer.time, 'sleep', lambda seconds: None)
+    client = FakeClient(throttles=10)
+    failed = batch_write_items(client, 'urls', [{'url': 'a'}, {'url': 'b'}], ('url',), max_attempts=3)
+    assert [item['url'] for item in failed] == ['a', 'b']
+
+
+def tracked_url(i, **fields):
+    return dict(make_url(i), **dict({
+        'processed': '', 'attempts': 2, 'last_error': 'HTTP 503', 'last_error_class': 'fetch',
+        'refetch_requested_at': 1700000000, 'pending_shard': '3', 'lease_owner': 'worker-a', 'lease_expires': 1
+    }, **fields))
+
+
+def test_mark_urls_processed_keeps_tracking_fields():
+    client = FakeClient()
+    _, urls = make_tables(client)
+    client.tables['urls'] = {make_url(i)['url']: tracked_url(i) for i in range(2)}
+
+    claimed = dict(make_url(0), lease_owner='worker-a', content_hash='abc', fetched_at=1700000500)
+    assert mark_urls_processed([claimed, {'url': 'untracked'}], urls) == ['untracked']
+
+    row = client.tables['urls'][make_url(0)['url']]
+    assert row['processed'] == 'Y' and row['content_hash'] == 'abc' and row['fetched_at'] == 1700000500
+    assert (row['attempts'], row['last_error'], row['refetch_requested_at']) == (2, 'HTTP 503', 1700000000)
+    assert not {'pending_shard', 'lease_owner', 'lease_expires'} & set(row)
+    # Never creates a row for a URL that is not tracked
+    assert 'untracked' not in client.tables['urls']
+
+
+def test_stale_flush_does_not_mark_a_reclaimed_url():
+    client = FakeClient()
+    _, urls = make_tables(client)
+    client.tables['urls'] = {make_url(1)['url']: tracked_url(1, lease_owner='worker-b')}
+
+    # worker-a's lease ran out and worker-b claimed the URL before the flush
+    assert mark_urls_processed([dict(make_url(1), lease_owner='worker-a')], urls) == [make_url(1)['url']]
+    row = client.tables['urls'][make_url(1)['url']]
+    assert row['processed'] == '' and row['lease_owner'] == 'worker-b'
+
+
+def test_buffer_flushes_full_batches_and_remainder():
+    client = FakeClient()
+    properties, urls = make_tables(client)
+    client.tables['urls'] = {make_url(i)['url']: tracked_url(i, lease_owner='') for i in range(60)}
+    outcomes = []
+    buffer = WriteBuffer(lambda batch, logger: app.write_property_batch(batch, properties, urls, logger),
+                         outcomes.append)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda i: buffer.add(make_url(i), make_property(i)), range(60)))
+    assert buffer.stats['flushes'] == 2 and len(outcomes) == 50
+    buffer.flush()
+
+    assert len(outcomes) == 60 and all(o['success'] for o in outcomes)
+    assert len(client.tables['properties']) == 60
+    assert all(item['processed'] == 'Y' for item in client.tables['urls'].values())
+    # Properties go out in batches; each URL flip is its own conditional update
+    assert client.calls['batch_write_item'] == 3 and client.calls['update_item'] == 60
+
+
+def test_buffer_flushes_inside_deadline_window():
+    outcomes = []
+    buffer = WriteBuffer(lambda batch, logger: [{'success': True, 'url': u['url']} for u, _ in batch],
+                         outcomes.append, deadline=time.time() + 10, flush_window=30)
+    buffer.add(make_url(1), make_property(1))
+    assert len(outcomes) == 1
+    assert buffer.stats['deadline_flushes'] == 1
+
+
+def run_sweep(count, latency, buffered):
+    client = FakeClient(latency)
+    properties, urls = make_tables(client)
+    start = time.perf_counter()
+    if buffered:
+        buffer = WriteBuffer(lambda batch, logger: app.write_property_batch(batch, properties, urls, logger),
+                             lambda outcome: None)
+        for i in range(count):
+            buffer.add(make_url(i), make_property(i))
+        buffer.flush()
+    else:
+        for i in range(count):
+            app.save_property_to_dynamodb(make_property(i), properties)
+            app.mark_url_processed(make_url(i)['url'], urls)
+    return time.perf_counter() - start, client
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--urls", type=int, default=500, help="Processed URLs to write")
+    parser.add_argument("--latency", type=float, default=0.01, help="Simulated seconds per DynamoDB call")
+    args = parser.parse_args()
+
+    print(f"{args.urls} new properties, {args.latency * 1000:.0f} ms per call")
+    print(f"{'mode':>8}  {'seconds':>8}  {'calls':>6}  {'calls/URL':>9}")
+    for mode, buffered in (('per-URL', False), ('buffered', True)):
+        elapsed, client = run_sweep(args.urls, args.latency, buffered)
+        print(f"{mode:>8}  {elapsed:>8.2f}  {client.round_trips():>6}  {client.round_trips() / args.urls:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Card thumbnails for property photos
+A background stage downloads the first few photos of properties that have no
+thumbnails yet, shrinks them to small progressive JPEGs and records their
+URLs on the META item as thumbnail_urls, so card grids load kilobytes per
+tile instead of full-size Redfin photos
+
+Thumbnails are content-addressed by the source photo (local directory or S3
+bucket, same keys under the prefix):
+    <width>x<height>/ab/<sha256 of source bytes>.jpg
+
+The bucket itself stays private: S3 thumbnails are only recorded when a
+base_url (a CDN or public prefix serving the thumbnails/ keys) is configured
+"""
+import io
+import os
+import time
+import hashlib
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.dynamodb.conditions import Attr
+
+from core_scraper import create_image_session, download_image
+from rate_limiter import RateLimiter
+
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    Image = ImageOps = None
+    PIL_AVAILABLE = False
+
+DEFAULT_PREFIX = 'thumbnails/'
+DEFAULT_SIZE = (480, 360)
+DEFAULT_QUALITY = 72
+DEFAULT_MAX_IMAGES = 3
+# Runs in a row in which none of a home's photos downloaded before it gets an empty list
+MAX_DOWNLOAD_ATTEMPTS = 3
+# Photo CDN pacing (seconds between downloads), lighter than detail-page pacing
+DEFAULT_MIN_DELAY = 0.5
+DEFAULT_MAX_DELAY = 1.5
+
+
+def make_thumbnail(image_bytes, size=DEFAULT_SIZE, quality=DEFAULT_QUALITY):
+    """Resize a photo to fit size and encode it as a progressive JPEG"""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        # JPEG decoders can downscale while decoding - much cheaper than a full decode
+        image.draft('RGB', (size[0] * 2, size[1] * 2))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(size, Image.LANCZOS)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=quality, optimize=True, progressive=True)
+        return output.getvalue()
+
+
+class ThumbnailStore:
+    """
+    Content-addressed thumbnail store
+
+    Uses a local directory when root_dir is given (tests, local runs) and S3
+    otherwise. S3 needs base_url (e.g. a CDN in front of the thumbnails
+    prefix): the bucket is private, so its own URLs would not load.
+    """
+
+    def __init__(self, bucket=None, root_dir=None, prefix=DEFAULT_PREFIX, base_url=None,
+                 size=DEFAULT_SIZE, quality=DEFAULT_QUALITY, logger=None):
+        if not PIL_AVAILABLE:
+            raise ImportError("Pillow is required for thumbnails")
+        if not bucket and not root_dir:
+            raise ValueError("ThumbnailStore needs a bucket or a root_dir")
+        if bucket and not root_dir and not base_url:
+            raise ValueError("ThumbnailStore needs a base_url to serve S3 thumbnails")
+
+        self.bucket = bucket
+        self.root_dir = root_dir
+        self.prefix = prefix if bucket else ''
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.size = tuple(size)
+        self.quality = quality
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.known_keys = set()
+        self._s3 = None
+        self.stats = {'images': 0, 'new_thumbnails': 0, 'duplicates': 0, 'bytes_in': 0, 'bytes_out': 0,
+                      'failed': 0}
+
+    def _s3_client(self):
+        # Worker threads share one client; creating it is not thread-safe, using it is
+        with self.lock:
+            if self._s3 is None:
+                self._s3 = boto3.client('s3', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
+        return self._s3
+
+    def _count(self, **increments):
+        with self.lock:
+            for stat, value in increments.items():
+                self.stats[stat] += value
+
+    def thumbnail_key(self, image_bytes):
+        sha256 = hashlib.sha256(image_bytes).hexdigest()
+        return f"{self.prefix}{self.size[0]}x{self.size[1]}/{sha256[:2]}/{sha256}.jpg"
+
+    def thumbnail_url(self, key):
+        if self.base_url:
+            return f"{self.base_url}/{key}"
+        return os.path.join(self.root_dir, key)
+
+    def _exists(self, key):
+        if self.root_dir:
+            return os.path.exists(os.path.join(self.root_dir, key))
+        try:
+            self._s3_client().head_object(Bucket=self.bucket, Key=key)
+            return True
+        except Exception:
+            return False
+
+    def _write(self, key, data):
+        if self.root_dir:
+            path = os.path.join(self.root_dir, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        else:
+            self._s3_client().put_object(
+                Bucket=self.bucket, Key=key, Body=data, ContentType='image/jpeg',
+                CacheControl='public, max-age=31536000, immutable'
+            )
+
+    def put(self, image_bytes):
+        """
+        Store the thumbnail of a downloaded photo
+
+        Returns the thumbnail URL, or None if the photo could not be converted (never raises)
+        """
+        try:
+            key = self.thumbnail_key(image_bytes)
+            with self.lock:
+                known = key in self.known_keys
+
+            if known or self._exists(key):
+                self._count(images=1, duplicates=1, bytes_in=len(image_bytes))
+            else:
+                thumbnail = make_thumbnail(image_bytes, self.size, self.quality)
+                self._write(key, thumbnail)
+                self._count(images=1, new_thumbnails=1, bytes_in=len(image_bytes), bytes_out=len(thumbnail))
+            with self.lock:
+                self.known_keys.add(key)
+
+            return self.thumbnail_url(key)
+
+        except Exception as e:
+            self._count(images=1, failed=1)
+            if self.logger:
+                self.logger.warning(f"Thumbnail failed: {str(e)}")
+            return None
+
+
+def get_thumbnail_store(config, logger=None):
+    """Build the store from processor config, or None when thumbnails are off"""
+    if not (config.get('thumbnail_dir') or config.get('thumbnail_bucket')):
+        return None
+    if not config.get('thumbnail_dir') and not config.get('thumbnail_base_url'):
+        if logger:
+            logger.warning("THUMBNAIL_BASE_URL not set, thumbnails disabled (cards keep the listing photos)")
+        return None
+    if not PIL_AVAILABLE:
+        if logger:
+            logger.warning("Pillow not available, thumbnails disabled")
+        return None
+
+    return ThumbnailStore(
+        bucket=config.get('thumbnail_bucket') or None,
+        root_dir=config.get('thumbnail_dir') or None,
+        base_url=config.get('thumbnail_base_url') or None,
+        logger=logger
+    )
+
+
+def scan_missing_thumbnails(table, limit=100, logger=None):
+    """META items that have photos but no thumbnail_urls yet ({'property_id', 'image_urls', ...})"""
+    scan_kwargs = {
+        'FilterExpression': Attr('sort_key').eq('META') & Attr('image_urls').exists() &
+        Attr('thumbnail_urls').not_exists(),
+        'ProjectionExpression': 'property_id, image_urls, thumbnail_attempts'
+    }
+    items = []
+
+    while len(items) < limit:
+        response = table.scan(**scan_kwargs)
+        items.extend(item for item in response.get('Items', []) if item.get('image_urls'))
+
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    if logger:
+        logger.info(f"Found {len(items[:limit])} properties without thumbnails")
+
+    return items[:limit]
+
+
+class ThreadSessions:
+    """One HTTP session per download thread, reused for every photo it fetches"""
+
+    def __init__(self, session_factory=create_image_session, logger=None):
+        self.session_factory = session_factory
+        self.logger = logger
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.sessions = []
+
+    def get(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.session_factory(self.logger)
+            self.local.session = session
+            with self.lock:
+                self.sessions.append(session)
+        return session
+
+    def close(self):
+        """Close every thread's session; call once the download threads are done"""
+        with self.lock:
+            sessions, self.sessions = self.sessions, []
+        for session in sessions:
+            session.close()
+
+
+def fetch_image(url, sessions, rate_limiter, logger=None):
+    with rate_limiter.slot():
+        image_bytes = download_image(url, sessions.get(), logger=logger)
+    if image_bytes:
+        rate_limiter.record_success()
+    else:
+        rate_limiter.record_error()
+    return image_bytes
+
+
+def start_downloads(image_urls, executor, sessions, rate_limiter, logger=None):
+    """Submit photo downloads; returns one future per URL"""
+    return [executor.submit(fetch_image, url, sessions, rate_limiter, logger) for url in image_urls]
+
+
+def store_thumbnails(downloads, store):
+    """
+    Thumbnail downloaded photos as they complete
+
+    Returns thumbnail URLs in photo order (photos that failed are left out),
+    or None when no photo downloaded at all
+    """
+    thumbnail_urls = []
+    downloaded = 0
+    for future in downloads:
+        image_bytes = future.result()
+        if not image_bytes:
+            continue
+        downloaded += 1
+        thumbnail_url = store.put(image_bytes)
+        if thumbnail_url:
+            thumbnail_urls.append(thumbnail_url)
+
+    return thumbnail_urls if downloaded or not downloads else None
+
+
+def record_thumbnails(table, property_id, thumbnail_urls):
+    """Set thumbnail_urls on an existing META item"""
+    table.update_item(
+        Key={'property_id': property_id, 'sort_key': 'META'},
+        UpdateExpression='SET thumbnail_urls = :urls, thumbnails_updated_at = :now REMOVE thumbnail_attempts',
+        ConditionExpression='attribute_exists(property_id)',
+        ExpressionAttributeValues={':urls': thumbnail_urls, ':now': datetime.now().isoformat()}
+    )
+
+
+def record_download_failure(table, property_id):
+    """Count a run in which none of a home's photos downloaded; thumbnail_urls stays unset"""
+    table.update_item(
+        Key={'property_id': property_id, 'sort_key': 'META'},
+        UpdateExpression='ADD thumbnail_attempts :one',
+        ConditionExpression='attribute_exists(property_id)',
+        ExpressionAttributeValues={':one': 1}
+    )
+
+
+def create_download_limiter(config):
+    """RateLimiter pacing photo downloads across the download threads"""
+    return RateLimiter(
+        min_delay=float(config.get('thumbnail_min_delay', DEFAULT_MIN_DELAY)),
+        max_delay=float(config.get('thumbnail_max_delay', DEFAULT_MAX_DELAY)),
+        max_concurrency=max(1, int(config.get('max_workers', 4)))
+    )
+
+
+def process_thumbnails(table, store, config, logger=None, session_factory=create_image_session, rate_limiter=None):
+    """
+    Thumbnail the first few photos of properties that have none
+
+    Photos of several properties download at once on max_workers threads,
+    paced by rate_limiter (thumbnail_min_delay/thumbnail_max_delay by
+    default), and are resized as they arrive; the run stops taking new
+    properties at max_runtime_seconds. A property none of whose photos
+    downloaded is left without thumbnail_urls so the next run retries it;
+    after MAX_DOWNLOAD_ATTEMPTS such runs it gets an empty list, and is not
+    retried until its image_urls change.
+
+    Returns:
+        Results dict with 'properties', 'thumbnails', 'retry', 'failed' and the store stats
+    """
+    max_images = int(config.get('thumbnail_count', DEFAULT_MAX_IMAGES))
+    max_workers = max(1, int(config.get('max_workers', 4)))
+    deadline = time.time() + config.get('max_runtime_seconds', 840)
+    rate_limiter = rate_limiter or create_download_limiter(config)
+    results = {'properties': 0, 'thumbnails': 0, 'retry': 0, 'failed': 0}
+
+    items = scan_missing_thumbnails(table, int(config.get('thumbnail_batch_size', 100)), logger)
+
+    # Enough properties in flight to keep every download thread busy
+    chunk_size = max(1, max_workers // max_images + 1)
+
+    sessions = ThreadSessions(session_factory, logger)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for start in range(0, len(items), chunk_size):
+                if time.time() > deadline:
+                    if logger:
+                        logger.info(f"Max runtime reached, {len(items) - start} properties left for the next run")
+                    break
+
+                # Resizing one property's photos overlaps the downloads of the rest
+                chunk = items[start:start + chunk_size]
+                downloads = [
+                    start_downloads(item['image_urls'][:max_images], executor, sessions, rate_limiter, logger)
+                    for item in chunk
+                ]
+
+                for item, item_downloads in zip(chunk, downloads, strict=True):
+                    thumbnail_urls = store_thumbnails(item_downloads, store)
+                    try:
+                        if thumbnail_urls is None and \
+                                int(item.get('thumbnail_attempts', 0)) + 1 < MAX_DOWNLOAD_ATTEMPTS:
+                            record_download_failure(table, item['property_id'])
+                            results['retry'] += 1
+                            continue
+                        record_thumbnails(table, item['property_id'], thumbnail_urls or [])
+                        results['properties'] += 1
+                        results['thumbnails'] += len(thumbnail_urls or [])
+                    except Exception as e:
+                        results['failed'] += 1
+                        if logger:
+                            logger.warning(f"Failed to record thumbnails for {item['property_id']}: {str(e)}")
+    finally:
+        sessions.close()
+
+    results['store'] = dict(store.stats)
+    if logger:
+        logger.info(f"Thumbnails: {results['thumbnails']} for {results['properties']} properties, "
+                    f"{results['store']['bytes_in']} bytes in, {results['store']['bytes_out']} bytes out")
+
+    return results
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Lease-based claiming of pending URLs
+Pending URL-tracking items carry pending_shard and lease_expires, the keys of
+the sparse pending-index GSI; processed items drop both and leave the index.
+A processor claims a URL with a conditional update that sets lease_owner and
+a future lease_expires, so parallel invocations never take the same URL and a
+crashed invocation's URLs come back once their leases run out
+"""
+import json
+import time
+import random
+import zlib
+
+from botocore.exceptions import ClientError
+
+PENDING_INDEX = 'pending-index'
+# Pending URLs are spread over shards so parallel claimers start on different partitions
+PENDING_SHARDS = 8
+DEFAULT_LEASE_SECONDS = 900
+
+
+def pending_shard_for(url):
+    """Stable shard (as the GSI partition key string) for a URL"""
+    return str(zlib.crc32(url.encode('utf-8')) % PENDING_SHARDS)
+
+
+def is_conditional_check_failure(error):
+    return isinstance(error, ClientError) and \
+        error.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException'
+
+
+def query_claimable(client, table_name, shard, now, limit, start_key=None):
+    """One page of pending URLs in a shard whose lease is unset or expired"""
+    kwargs = {
+        'TableName': table_name,
+        'IndexName': PENDING_INDEX,
+        'KeyConditionExpression': 'pending_shard = :shard AND lease_expires < :now',
+        'ExpressionAttributeValues': {':shard': shard, ':now': now},
+        'Limit': limit
+    }
+    if start_key:
+        kwargs['ExclusiveStartKey'] = start_key
+    return client.query(**kwargs)
+
+
+def claimed_url_info(item, url_info=None):
+    """url_info dict for a claimed tracking item (content_hash is the page's hash from its last fetch)"""
+    url_info = url_info or {}
+    claimed = {
+        'url': item['url'],
+        'city': item.get('city') or url_info.get('city', ''),
+        'price': item.get('price', url_info.get('price', 0)),
+        'attempts': int(item.get('attempts', 0))
+    }
+    # Marking the URL processed later is conditional on still holding this lease
+    if item.get('lease_owner'):
+        claimed['lease_owner'] = item['lease_owner']
+    if item.get('content_hash'):
+        claimed['content_hash'] = item['content_hash']
+    return claimed
+
+
+def claim_url(client, table_name, url, owner, now, lease_seconds):
+    """
+    Conditionally lease one URL
+
+    Returns the claimed item, or None if it was processed or leased by someone else
+    """
+    try:
+        response = client.update_item(
+            TableName=table_name,
+            Key={'url': url},
+            UpdateExpression='SET lease_owner = :owner, lease_expires = :expires',
+            ConditionExpression='attribute_exists(pending_shard) AND lease_expires < :now',
+            ExpressionAttributeValues={':owner': owner, ':expires': now + lease_seconds, ':now': now},
+            ReturnValues='ALL_NEW'
+        )
+        return response.get('Attributes')
+    except ClientError as e:
+        if is_conditional_check_failure(e):
+            return None
+        raise
+
+
+def claim_pending_urls(url_table, owner, limit, lease_seconds=DEFAULT_LEASE_SECONDS, logger=None):
+    """
+    Claim up to limit pending URLs for owner
+
+    Shards are visited from a random starting point. The index is eventually
+    consistent, so a candidate may already be gone - the conditional update
+    is what makes a claim exclusive.
+
+    Returns:
+        List of url_info dicts ({'url', 'city', 'price', 'attempts'}) now leased to owner
+    """
+    client = url_table.meta.client
+    now = int(time.time())
+    claimed = []
+    lost = 0
+    start = random.randrange(PENDING_SHARDS)
+
+    for offset in range(PENDING_SHARDS):
+        shard = str((start + offset) % PENDING_SHARDS)
+        start_key = None
+
+        while len(claimed) < limit:
+            response = query_claimable(client, url_table.name, shard, now, limit - len(claimed), start_key)
+            for candidate in response.get('Items', []):
+                item = claim_url(client, url_table.name, candidate['url'], owner, now, lease_seconds)
+                if item is None:
+                    lost += 1
+                    continue
+                claimed.append(claimed_url_info(item))
+
+            start_key = response.get('LastEvaluatedKey')
+            if not start_key:
+                break
+
+        if len(claimed) >= limit:
+            break
+
+    if logger:
+        logger.info(f"Claimed {len(claimed)} pending URLs ({lost} taken by other workers)")
+
+    return claimed
+
+
+def claim_listed_urls(url_table, url_infos, owner, lease_seconds=DEFAULT_LEASE_SECONDS, logger=None):
+    """
+    Claim specific URLs (e.g. from queue messages) for owner
+
+    A URL whose claim fails is read back to tell why: 'done' if it is
+    processed or no longer tracked, 'scheduled' if it failed before and its
+    next attempt is not due, 'busy' if another worker holds its lease.
+
+    Returns:
+        (claimed url_info dicts, {url: 'claimed' | 'done' | 'scheduled' | 'busy'})
+    """
+    client = url_table.meta.client
+    now = int(time.time())
+    claimed = []
+    statuses = {}
+
+    for url_info in url_infos:
+        url = url_info['url']
+        if url in statuses:
+            continue
+
+        item = claim_url(client, url_table.name, url, owner, now, lease_seconds)
+        if item is not None:
+            statuses[url] = 'claimed'
+            claimed.append(claimed_url_info(item, url_info))
+            continue
+
+        current = client.get_item(
+            TableName=url_table.name, Key={'url': url}, ConsistentRead=True
+        ).get('Item')
+        if not current or current.get('processed') == 'Y' or 'pending_shard' not in current:
+            statuses[url] = 'done'
+        elif 'lease_owner' not in current:
+            statuses[url] = 'scheduled'
+        else:
+            statuses[url] = 'busy'
+
+    if logger:
+        counts = {status: list(statuses.values()).count(status) for status in ('claimed', 'done', 'scheduled', 'busy')}
+        logger.info(f"Listed URL claims: {json.dumps(counts)}")
+
+    return claimed, statuses
+
+
+def release_leases(url_infos, url_table, owner, logger=None):
+    """Hand unstarted URLs back immediately instead of waiting for their leases to expire"""
+    client = url_table.meta.client
+    released = 0
+
+    for url_info in url_infos:
+        try:
+            client.update_item(
+                TableName=url_table.name,
+                Key={'url': url_info['url']},
+                UpdateExpression='SET lease_expires = :zero REMOVE lease_owner',
+                ConditionExpression='attribute_exists(pending_shard) AND lease_owner = :owner',
+                ExpressionAttributeValues={':zero': 0, ':owner': owner}
+            )
+            released += 1
+        except ClientError as e:
+            if not is_conditional_check_failure(e) and logger:
+                logger.warning(f"Failed to release lease on {url_info['url']}: {str(e)}")
+
+    if logger and url_infos:
+        logger.info(f"Released {released}/{len(url_infos)} unstarted URL leases")
+
+    return released
+
+
+def backfill_pending_index(url_table, logger=None):
+    """
+    Add pending_shard/lease_expires to pending URLs written before the index existed
+
+    URLs that already have a retry scheduled stay off the index until it is due
+
+    Returns the number of URLs added to the index
+    """
+    client = url_table.meta.client
+    scan_kwargs = {
+        'TableName': url_table.name,
+        'FilterExpression': 'processed = :empty AND attribute_not_exists(pending_shard)',
+        'ExpressionAttributeValues': {':empty': ''},
+        'ProjectionExpression': 'url'
+    }
+    added = 0
+
+    while True:
+        response = client.scan(**scan_kwargs)
+        for item in response.get('Items', []):
+            try:
+                client.update_item(
+                    TableName=url_table.name,
+                    Key={'url': item['url']},
+                    UpdateExpression='SET pending_shard = :shard, '
+                                     'lease_expires = if_not_exists(next_attempt_at, :zero)',
+                    ConditionExpression='processed = :empty',
+                    ExpressionAttributeValues={':shard': pending_shard_for(item['url']), ':zero': 0, ':empty': ''}
+                )
+                added += 1
+            except ClientError as e:
+                if not is_conditional_check_failure(e):
+                    raise
+
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    if logger:
+        logger.info(f"Added {added} pending URLs to {PENDING_INDEX}")
+
+    return added
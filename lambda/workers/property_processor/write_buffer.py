@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Buffered DynamoDB writes for the property processor
+Extracted properties are queued and written a batch at a time: records go out
+in 25-item BatchWriteItem calls and the batch's URL-tracking items are flipped
+to processed with parallel conditional updates, so a flush costs a few round
+trips of latency instead of two per URL
+"""
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from url_leases import is_conditional_check_failure
+
+MAX_BATCH_ITEMS = 25
+THROTTLE_ERROR_CODES = ('ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded')
+
+
+def batch_write_items(client, table_name, items, key_fields, logger=None, max_attempts=6, base_delay=0.05):
+    """
+    Put items with 25-item BatchWriteItem calls, retrying UnprocessedItems with backoff
+
+    Args:
+        client: DynamoDB client (table.meta.client - takes plain Python values)
+        key_fields: Primary key attribute names; a later item replaces an
+            earlier one with the same key (BatchWriteItem rejects duplicates)
+
+    Returns:
+        Items still unwritten after max_attempts (empty list on success)
+    """
+    unique = {}
+    for item in items:
+        unique[tuple(item[field] for field in key_fields)] = item
+    items = list(unique.values())
+    failed = []
+
+    for start in range(0, len(items), MAX_BATCH_ITEMS):
+        request_items = {
+            table_name: [{'PutRequest': {'Item': item}} for item in items[start:start + MAX_BATCH_ITEMS]]
+        }
+
+        for attempt in range(max_attempts):
+            try:
+                response = client.batch_write_item(RequestItems=request_items)
+                request_items = response.get('UnprocessedItems') or {}
+            except ClientError as e:
+                # Throttled as a whole: retry the same request
+                if e.response.get('Error', {}).get('Code') not in THROTTLE_ERROR_CODES:
+                    raise
+
+            if not request_items:
+                break
+            if attempt < max_attempts - 1:
+                # Exponential backoff with jitter, capped at 2 seconds
+                time.sleep(min(base_delay * (2 ** attempt), 2.0) * random.uniform(0.5, 1.0))
+
+        if request_items:
+            unwritten = [request['PutRequest']['Item'] for request in request_items[table_name]]
+            failed.extend(unwritten)
+            if logger:
+                logger.warning(f"{len(unwritten)} items unprocessed in {table_name} after {max_attempts} attempts")
+
+    return failed
+
+
+def processed_url_update(url_info):
+    """
+    UpdateItem arguments flipping one URL-tracking item to processed
+
+    Only processed, content_hash and fetched_at are set and the pending-index
+    keys are removed; attempts, errors and everything else on the row stay.
+    A leased URL (url_info['lease_owner']) is only marked while that lease is
+    still held, so a late flush cannot mark a URL that another worker has
+    claimed or that was queued for a refetch since.
+    """
+    assignments = ['#p = :p']
+    names = {'#p': 'processed'}
+    values = {':p': 'Y'}
+    # Hash and time of the fetch, for the refetch policy
+    for field in ('content_hash', 'fetched_at'):
+        if url_info.get(field):
+            assignments.append(f"{field} = :{field}")
+            values[f":{field}"] = url_info[field]
+
+    if url_info.get('lease_owner'):
+        condition = 'lease_owner = :owner'
+        values[':owner'] = url_info['lease_owner']
+    else:
+        condition = 'attribute_exists(#u)'
+        names['#u'] = 'url'
+
+    return {
+        'Key': {'url': url_info['url']},
+        'UpdateExpression': f"SET {', '.join(assignments)} "
+                            "REMOVE pending_shard, lease_owner, lease_expires, next_attempt_at",
+        'ConditionExpression': condition,
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values
+    }
+
+
+def mark_urls_processed(url_infos, url_table, logger=None, max_workers=8):
+    """
+    Flip URL-tracking items to processed, max_workers updates at a time
+
+    Args:
+        url_infos: Claimed or scanned url_info dicts ({'url', 'lease_owner', 'content_hash', ...})
+
+    Returns:
+        URLs that could not be marked (lease lost, untracked, or the update failed)
+    """
+    if not url_infos:
+        return []
+
+    # The low-level client is thread-safe; the table resource is not
+    client = url_table.meta.client
+    unique = list({url_info['url']: url_info for url_info in url_infos}.values())
+
+    def mark(url_info):
+        try:
+            client.update_item(TableName=url_table.name, **processed_url_update(url_info))
+            return None
+        except ClientError as e:
+            if is_conditional_check_failure(e):
+                return 'lost'
+            error = e
+        except Exception as e:
+            error = e
+        if logger:
+            logger.warning(f"Failed to mark {url_info['url']} processed: {str(error)}")
+        return 'failed'
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique)))) as executor:
+        results = list(executor.map(mark, unique))
+
+    unmarked = [url_info['url'] for url_info, result in zip(unique, results, strict=True) if result]
+    if logger:
+        lost = results.count('lost')
+        logger.debug(f"Marked {len(unique) - len(unmarked)}/{len(unique)} URLs processed"
+                     f"{f' ({lost} no longer leased to this worker)' if lost else ''}")
+
+    return unmarked
+
+
+class WriteBuffer:
+    """
+    Thread-safe buffer of extracted properties written a batch at a time
+
+    Workers add (url_info, property_data) pairs. A full batch, or any add
+    inside the flush window before the deadline, flushes through write_batch;
+    flushes are serialized, so write_batch may use non-thread-safe table
+    resources. Each item's outcome is passed to on_outcome.
+    """
+
+    def __init__(self, write_batch, on_outcome, batch_size=MAX_BATCH_ITEMS, deadline=None,
+                 flush_window=30.0, logger=None):
+        self.write_batch = write_batch
+        self.on_outcome = on_outcome
+        self.batch_size = max(1, min(int(batch_size), MAX_BATCH_ITEMS))
+        self.deadline = deadline
+        self.flush_window = flush_window
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pending = []
+        self.stats = {'flushes': 0, 'deadline_flushes': 0, 'items': 0}
+
+    def deadline_near(self):
+        return self.deadline is not None and time.time() >= self.deadline - self.flush_window
+
+    def add(self, url_info, property_data):
+        with self.lock:
+            self.pending.append((url_info, property_data))
+            near_deadline = self.deadline_near()
+            if len(self.pending) < self.batch_size and not near_deadline:
+                return
+            batch, self.pending = self.pending, []
+            if near_deadline and len(batch) < self.batch_size:
+                self.stats['deadline_flushes'] += 1
+
+        self._flush(batch)
+
+    def flush(self):
+        """Write everything still buffered"""
+        with self.lock:
+            batch, self.pending = self.pending, []
+        if batch:
+            self._flush(batch)
+
+    def _flush(self, batch):
+        with self.flush_lock:
+            try:
+                outcomes = self.write_batch(batch, self.logger)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Error writing batch of {len(batch)}: {str(e)}")
+                outcomes = [{'success': False, 'url': url_info['url'], 'error': str(e)} for url_info, _ in batch]
+
+            with self.lock:
+                self.stats['flushes'] += 1
+                self.stats['items'] += len(batch)
+
+        for outcome in outcomes:
+            self.on_outcome(outcome)
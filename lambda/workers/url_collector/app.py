@@ -6,8 +6,6 @@ Uses curl_cffi for browser impersonation to bypass bot detection
 import os
 import time
 import json
-import random
-import threading
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import boto3
@@ -20,45 +18,6 @@ except ImportError:
     config = None  # Fallback to environment variables
 
 
-class RateLimiter:
-    """Thread-safe rate limiter for parallel requests"""
-
-    def __init__(self, min_delay=3.0, max_delay=8.0):
-        self.min_delay = min_delay
-        self.max_delay = max_delay
-        self.last_request_time = 0
-        self.lock = threading.Lock()
-        self.consecutive_errors = 0
-        self.backoff_multiplier = 1.0
-
-    def wait(self):
-        """Wait for appropriate delay between requests"""
-        with self.lock:
-            current_time = time.time()
-            base_delay = random.uniform(self.min_delay, self.max_delay)
-            delay = base_delay * self.backoff_multiplier
-
-            elapsed_since_last = current_time - self.last_request_time
-            if elapsed_since_last < delay:
-                sleep_time = delay - elapsed_since_last
-                time.sleep(sleep_time)
-
-            self.last_request_time = time.time()
-
-    def record_error(self, is_rate_limit=False):
-        """Record an error and increase backoff if needed"""
-        with self.lock:
-            self.consecutive_errors += 1
-            if is_rate_limit or self.consecutive_errors > 3:
-                self.backoff_multiplier = min(self.backoff_multiplier * 1.5, 5.0)
-
-    def record_success(self):
-        """Record successful request and reset backoff"""
-        with self.lock:
-            self.consecutive_errors = 0
-            self.backoff_multiplier = max(self.backoff_multiplier * 0.9, 1.0)
-
-
 class SessionLogger:
     """Simple logger that automatically includes session_id in all messages"""
 
@@ -83,14 +42,29 @@ class SessionLogger:
 
 # Import from other modules
 from core_scraper import (
-    create_session, collect_redfin_listings, get_target_cities
+    create_session, get_session_pool, collect_redfin_listings, collect_redfin_listings_json,
+    get_target_cities, normalize_city_entry, full_sweep_due
 )
 from dynamodb_utils import (
-    setup_dynamodb_client, load_all_existing_properties,
-    extract_property_id_from_url, batch_update_price_changes,
+    setup_dynamodb_client, open_table, load_all_existing_properties, PropertyIndex,
+    extract_redfin_home_id, batch_update_price_changes, batch_update_card_statuses,
     setup_url_tracking_table, put_urls_batch_to_tracking_table,
-    load_all_urls_from_tracking_table
+    load_all_urls_from_tracking_table, load_city_watermark,
+    save_city_watermark, filter_untracked_urls
 )
+from page_cache import PageCache, DEFAULT_CACHE_DIR
+from rate_limiter import RateLimiter
+from url_membership import load_url_membership, save_membership_snapshot, UrlMembership
+from url_publisher import get_url_publisher
+
+
+def parse_bool(value, default=False):
+    """Parse a boolean flag from an event or environment value"""
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y', 'on')
 
 
 def parse_lambda_event(event):
@@ -117,11 +91,44 @@ def parse_lambda_event(event):
         'target_state': event.get('target_state', redfin_config.get('TARGET_STATE', os.environ.get('TARGET_STATE', 'CO'))),
         'city_id': event.get('city_id', int(redfin_config.get('CITY_ID', os.environ.get('CITY_ID', '14856')))),
         'max_pages': event.get('max_pages', int(redfin_config.get('MAX_PAGES', os.environ.get('MAX_PAGES', '10')))),
+        'target_cities': resolve_target_cities(event, redfin_config),
+        'newest_first': parse_bool(event.get('newest_first', redfin_config.get('NEWEST_FIRST', os.environ.get('NEWEST_FIRST'))), default=True),
+        'full_sweep_hours': float(event.get('full_sweep_hours', redfin_config.get('FULL_SWEEP_HOURS', os.environ.get('FULL_SWEEP_HOURS', '24')))),
+        'listing_extractor': event.get('listing_extractor', redfin_config.get('LISTING_EXTRACTOR', os.environ.get('LISTING_EXTRACTOR', 'fast'))),
+        'collection_mode': event.get('collection_mode', redfin_config.get('COLLECTION_MODE', os.environ.get('COLLECTION_MODE', 'html'))),
+        'page_cache': parse_bool(event.get('page_cache', redfin_config.get('PAGE_CACHE', os.environ.get('PAGE_CACHE'))), default=True),
+        'page_cache_bucket': event.get('page_cache_bucket', os.environ.get('PAGE_CACHE_BUCKET', '')),
+        'property_index': event.get('property_index', os.environ.get('PROPERTY_INDEX', 'lookup')),
+        'membership_snapshot': parse_bool(event.get('membership_snapshot', os.environ.get('MEMBERSHIP_SNAPSHOT')), default=True),
+        'snapshot_bucket': event.get('snapshot_bucket', os.environ.get('SNAPSHOT_BUCKET', '')),
+        'snapshot_max_age_hours': float(event.get('snapshot_max_age_hours', os.environ.get('SNAPSHOT_MAX_AGE_HOURS', '24'))),
+        'max_concurrent_cities': int(event.get('max_concurrent_cities', scraper_config.get('MAX_CONCURRENT_CITIES', os.environ.get('MAX_CONCURRENT_CITIES', '2')))),
+        'price_update_workers': int(event.get('price_update_workers', os.environ.get('PRICE_UPDATE_WORKERS', '8'))),
+        'property_queue_url': event.get('property_queue_url', os.environ.get('PROPERTY_QUEUE_URL', '')),
         'min_delay': float(scraper_config.get('MIN_DELAY_SECONDS', 3)),
         'max_delay': float(scraper_config.get('MAX_DELAY_SECONDS', 8))
     }
 
 
+def resolve_target_cities(event, redfin_config):
+    """
+    Resolve the list of cities for a multi-city run.
+
+    Order of precedence: event 'target_cities', TARGET_CITIES env var
+    (semicolon-separated 'City, ST, city_id' entries), then TARGET_CITIES in
+    the redfin config. Returns an empty list for a single-city run.
+    """
+    entries = event.get('target_cities')
+    if not entries and os.environ.get('TARGET_CITIES'):
+        entries = [e for e in os.environ['TARGET_CITIES'].split(';') if e.strip()]
+    if entries:
+        cities = [normalize_city_entry(e) for e in entries]
+        return [c for c in cities if c]
+    if redfin_config.get('TARGET_CITIES'):
+        return get_target_cities({'redfin': redfin_config})
+    return []
+
+
 def get_collector_config(args):
     """Get URL collector configuration"""
     return {
@@ -132,114 +139,335 @@ def get_collector_config(args):
         'target_state': args['target_state'],
         'city_id': args['city_id'],
         'max_pages': args['max_pages'],
+        'target_cities': args['target_cities'],
+        'max_concurrent_cities': args['max_concurrent_cities'],
+        'price_update_workers': args['price_update_workers'],
+        'property_queue_url': args['property_queue_url'],
+        'newest_first': args['newest_first'],
+        'full_sweep_hours': args['full_sweep_hours'],
+        'listing_extractor': args['listing_extractor'],
+        'collection_mode': args['collection_mode'],
+        'page_cache': args['page_cache'],
+        'page_cache_bucket': args['page_cache_bucket'],
+        'property_index': args['property_index'],
+        'membership_snapshot': args['membership_snapshot'],
+        'snapshot_bucket': args['snapshot_bucket'],
+        'snapshot_max_age_hours': args['snapshot_max_age_hours'],
         'min_delay': args['min_delay'],
         'max_delay': args['max_delay']
     }
 
 
+def get_cities_to_collect(collector_config):
+    """Return the list of cities for this run (falls back to the single target city)"""
+    cities = collector_config.get('target_cities') or []
+    if cities:
+        return cities
+    return [{
+        'city': collector_config['target_city'],
+        'state': collector_config['target_state'],
+        'city_id': collector_config.get('city_id', 0)
+    }]
+
+
+def collect_city_urls(city_info, collector_config, existing_urls, existing_properties,
+                      url_tracking_table_name, table_name, rate_limiter, logger=None, page_cache=None,
+                      url_publisher=None):
+    """
+    Collect URLs for a single city and track new ones
+
+    Each call uses its own HTTP session, boto3 Session and table resources;
+    the rate limiter is shared between cities so all workers stay inside one
+    request budget for Redfin.
+    """
+    city_name = city_info['city']
+    state = city_info['state']
+
+    if logger:
+        logger.info(f"Starting URL collection for {city_name}, {state}")
+
+    # Neither curl_cffi sessions nor boto3 resources are thread-safe, so each city gets its own
+    aws_session = boto3.session.Session()
+    table = open_table(table_name, aws_session)
+    url_tracking_table = open_table(url_tracking_table_name, aws_session)
+    session = create_session(logger)
+
+    newest_first = collector_config.get('newest_first', False)
+    watermark = load_city_watermark(table, city_name, state, logger) if newest_first else {}
+
+    # A periodic full sweep revisits older cards for price and status changes
+    full_sweep = newest_first and full_sweep_due(watermark, collector_config.get('full_sweep_hours', 24))
+    stop_early = newest_first and not full_sweep
+    if full_sweep and logger:
+        logger.info(f"Full sweep for {city_name}, {state} (last: {watermark.get('full_sweep_at') or 'never'})")
+
+    try:
+        listings = None
+
+        # JSON mode: one request per city, falls back to HTML paging on failure
+        if collector_config.get('collection_mode', 'html') == 'json':
+            listings = collect_redfin_listings_json(
+                city=city_name,
+                state=state,
+                city_id=city_info.get('city_id', 0),
+                session=session,
+                logger=logger,
+                rate_limiter=rate_limiter,
+                newest_first=newest_first
+            )
+            if listings is None and logger:
+                logger.warning(f"JSON collection unavailable for {city_name}, {state} - falling back to HTML")
+
+        if listings is None:
+            # Collect listings from Redfin
+            listings = collect_redfin_listings(
+                city=city_name,
+                state=state,
+                max_pages=collector_config['max_pages'],
+                city_id=city_info.get('city_id', 0),
+                session=session,
+                logger=logger,
+                rate_limiter=rate_limiter,
+                newest_first=newest_first,
+                known_urls=existing_urls if stop_early else None,
+                watermark=watermark if stop_early else None,
+                extractor=collector_config.get('listing_extractor', 'fast'),
+                page_cache=page_cache
+            )
+
+        # Newest-first results start with the newest listing on Redfin
+        if newest_first and listings:
+            save_city_watermark(table, city_name, state, listings[0], logger, full_sweep=full_sweep)
+
+        # Look up only the stored homes on this city's cards
+        if isinstance(existing_properties, PropertyIndex):
+            existing_properties.prefetch(
+                listing.get('property_id') or extract_redfin_home_id(listing['url']) for listing in listings
+            )
+
+        # Categorize URLs
+        new_urls = []
+        price_changes = []
+        status_changes = []
+        unchanged_urls = []
+
+        for listing in listings:
+            url = listing['url']
+            list_page_price = listing.get('price', 0)
+            city = listing.get('city', city_name)
+            home_id = listing.get('property_id') or extract_redfin_home_id(url)
+            existing_property = existing_properties.get(home_id) if home_id else None
+
+            if existing_property:
+                # Listing status (JSON cards only) feeds the detail refetch policy
+                card_status = listing.get('status')
+                if card_status and card_status != existing_property.get('card_status'):
+                    status_changes.append({
+                        'property_id': existing_property['property_id'],
+                        'old_status': existing_property.get('card_status', ''),
+                        'new_status': card_status
+                    })
+                    existing_property['card_status'] = card_status
+
+                # Stored home - apply price changes straight from the card price
+                stored_price = existing_property.get('price', 0)
+
+                if list_page_price > 0 and stored_price > 0 and list_page_price != stored_price:
+                    price_changes.append({
+                        'property_id': existing_property['property_id'],
+                        'url': url,
+                        'old_price': stored_price,
+                        'new_price': list_page_price
+                    })
+                    # The same home can show up under more than one city
+                    existing_property['price'] = list_page_price
+                else:
+                    unchanged_urls.append(url)
+            elif url in existing_urls:
+                # Tracked but not processed yet
+                unchanged_urls.append(url)
+            else:
+                # New URL
+                new_urls.append({
+                    'url': url,
+                    'city': city,
+                    'price': list_page_price
+                })
+
+        # A snapshot can lag the table - confirm new URLs really are untracked
+        if new_urls and isinstance(existing_urls, UrlMembership):
+            untracked = set(filter_untracked_urls([u['url'] for u in new_urls], url_tracking_table, logger))
+            for url_item in new_urls:
+                if url_item['url'] not in untracked:
+                    unchanged_urls.append(url_item['url'])
+                    existing_urls.add(url_item['url'])
+            new_urls = [u for u in new_urls if u['url'] in untracked]
+
+        # Batch update new URLs to tracking table
+        if new_urls:
+            put_urls_batch_to_tracking_table(
+                new_urls,
+                url_tracking_table,
+                city=city_name,
+                logger=logger
+            )
+            # Keep the membership current for the other cities and the next run
+            existing_urls.update(u['url'] for u in new_urls)
+
+            # Hand new URLs straight to the processor (tracking rows are written first)
+            if url_publisher:
+                url_publisher.publish(new_urls, city=city_name)
+
+        # Batch update price changes
+        price_update = batch_update_price_changes(
+            price_changes, table, logger,
+            max_workers=collector_config.get('price_update_workers', 8)
+        )
+        status_update = batch_update_card_statuses(
+            status_changes, table, logger,
+            max_workers=collector_config.get('price_update_workers', 8)
+        )
+
+        if logger:
+            logger.info(f"{city_name}, {state}: {len(new_urls)} new, {len(price_changes)} price changes, {len(unchanged_urls)} unchanged")
+
+        return {
+            'city': city_name,
+            'state': state,
+            'total_urls_found': len(listings),
+            'new_urls_tracked': len(new_urls),
+            'existing_listings': len(unchanged_urls),
+            'price_changed_listings': len(price_changes),
+            'price_updates_failed': price_update['failed'] + price_update['not_found'],
+            'status_changed_listings': status_update['updated'],
+            'full_sweep': full_sweep,
+            'success': True
+        }
+
+    finally:
+        session.close()
+
+
 def collect_urls_and_track_new(collector_config, logger=None):
-    """Collect URLs from Redfin and track new ones"""
+    """Collect URLs from Redfin for every target city and track new ones"""
+    cities = get_cities_to_collect(collector_config)
+
     if logger:
-        logger.info(f"Starting URL collection for {collector_config['target_city']}, {collector_config['target_state']}")
+        logger.info(f"Starting URL collection for {len(cities)} city(s): " +
+                    ", ".join(f"{c['city']}, {c['state']}" for c in cities))
 
     try:
-        # Load existing properties (for price comparison)
+        # Stored properties for price comparison - looked up per city from the
+        # cards through the ID map, or a full table scan with PROPERTY_INDEX=scan
         dynamodb, table = setup_dynamodb_client(logger)
-        existing_properties = load_all_existing_properties(table, logger)
+        if collector_config.get('property_index', 'lookup') == 'scan':
+            existing_properties = load_all_existing_properties(table, logger)
+        else:
+            existing_properties = PropertyIndex(table, logger)
 
         # Setup URL tracking table
         _, url_tracking_table = setup_url_tracking_table(collector_config['url_tracking_table'], logger)
 
-        # Load existing URLs from tracking table
-        existing_urls = load_all_urls_from_tracking_table(url_tracking_table, logger)
+        # Load existing URLs - from the membership snapshot when enabled
+        if collector_config.get('membership_snapshot'):
+            existing_urls = load_url_membership(
+                url_tracking_table,
+                load_all_urls_from_tracking_table,
+                bucket=collector_config.get('snapshot_bucket') or None,
+                max_age_hours=collector_config.get('snapshot_max_age_hours', 24),
+                logger=logger
+            )
+        else:
+            existing_urls = load_all_urls_from_tracking_table(url_tracking_table, logger)
 
         if logger:
-            logger.info(f"Loaded {len(existing_properties)} existing properties, {len(existing_urls)} tracked URLs")
+            if isinstance(existing_properties, PropertyIndex):
+                logger.info(f"Loaded {len(existing_urls)} tracked URLs, stored properties are looked up per city")
+            else:
+                logger.info(f"Loaded {len(existing_properties)} existing properties, {len(existing_urls)} tracked URLs")
 
-        # Create rate limiter with configured delays
+        # One rate limiter for all cities - they share the same host
         rate_limiter = RateLimiter(
             min_delay=collector_config['min_delay'],
-            max_delay=collector_config['max_delay']
+            max_delay=collector_config['max_delay'],
+            max_concurrency=collector_config.get('max_concurrent_cities', 1)
         )
 
-        # Create session
-        session = create_session(logger)
-
-        try:
-            # Collect listings from Redfin
-            listings = collect_redfin_listings(
-                city=collector_config['target_city'],
-                state=collector_config['target_state'],
-                max_pages=collector_config['max_pages'],
-                city_id=collector_config.get('city_id', 0),
-                session=session,
-                logger=logger,
-                rate_limiter=rate_limiter
+        # Shared search-page cache (conditional GETs, skip parsing unchanged pages)
+        page_cache = None
+        if collector_config.get('page_cache'):
+            page_cache = PageCache(
+                cache_dir=DEFAULT_CACHE_DIR,
+                bucket=collector_config.get('page_cache_bucket') or None,
+                logger=logger
             )
 
-            # Categorize URLs
-            new_urls = []
-            price_changes = []
-            unchanged_urls = []
-
-            for listing in listings:
-                url = listing['url']
-                list_page_price = listing.get('price', 0)
-                city = listing.get('city', collector_config['target_city'])
-
-                if url in existing_urls:
-                    # URL exists, check for price changes
-                    raw_property_id = extract_property_id_from_url(url)
-                    if raw_property_id and raw_property_id in existing_properties:
-                        existing_property = existing_properties[raw_property_id]
-                        stored_price = existing_property.get('price', 0)
-
-                        if list_page_price > 0 and stored_price > 0 and list_page_price != stored_price:
-                            price_changes.append({
-                                'property_id': existing_property['property_id'],
-                                'url': url,
-                                'old_price': stored_price,
-                                'new_price': list_page_price
-                            })
-                        else:
-                            unchanged_urls.append(url)
-                    else:
-                        unchanged_urls.append(url)
-                else:
-                    # New URL
-                    new_urls.append({
-                        'url': url,
-                        'city': city,
-                        'price': list_page_price
-                    })
+        # SQS publisher for new URLs (event-driven processing)
+        url_publisher = get_url_publisher(collector_config.get('property_queue_url'), logger)
 
-            # Batch update new URLs to tracking table
-            if new_urls:
-                put_urls_batch_to_tracking_table(
-                    new_urls,
-                    url_tracking_table,
-                    city=collector_config['target_city'],
-                    logger=logger
-                )
-
-            # Batch update price changes
-            if price_changes:
-                batch_update_price_changes(price_changes, table, logger)
-
-            if logger:
-                logger.info(f"Collection complete: {len(new_urls)} new, {len(price_changes)} price changes, {len(unchanged_urls)} unchanged")
-
-            return {
-                'total_urls_found': len(listings),
-                'new_urls_tracked': len(new_urls),
-                'existing_listings': len(unchanged_urls),
-                'price_changed_listings': len(price_changes),
-                'successful_cities': 1,
-                'failed_cities': 0
+        max_workers = max(1, min(len(cities), collector_config.get('max_concurrent_cities', 1)))
+        city_results = []
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(
+                    collect_city_urls, city_info, collector_config,
+                    existing_urls, existing_properties,
+                    url_tracking_table.name, table.name, rate_limiter, logger, page_cache, url_publisher
+                ): city_info
+                for city_info in cities
             }
 
-        finally:
-            session.close()
+            for future in as_completed(futures):
+                city_info = futures[future]
+                try:
+                    city_results.append(future.result())
+                except Exception as e:
+                    if logger:
+                        logger.error(f"Error collecting URLs for {city_info['city']}, {city_info['state']}: {str(e)}")
+                    city_results.append({
+                        'city': city_info['city'],
+                        'state': city_info['state'],
+                        'total_urls_found': 0,
+                        'new_urls_tracked': 0,
+                        'existing_listings': 0,
+                        'price_changed_listings': 0,
+                        'price_updates_failed': 0,
+                        'status_changed_listings': 0,
+                        'success': False,
+                        'error': str(e)
+                    })
+
+        if isinstance(existing_urls, UrlMembership) and existing_urls.dirty:
+            save_membership_snapshot(
+                existing_urls,
+                bucket=collector_config.get('snapshot_bucket') or None,
+                logger=logger
+            )
+
+        summary = {
+            'total_urls_found': sum(r['total_urls_found'] for r in city_results),
+            'new_urls_tracked': sum(r['new_urls_tracked'] for r in city_results),
+            'existing_listings': sum(r['existing_listings'] for r in city_results),
+            'price_changed_listings': sum(r['price_changed_listings'] for r in city_results),
+            'price_updates_failed': sum(r['price_updates_failed'] for r in city_results),
+            'status_changed_listings': sum(r['status_changed_listings'] for r in city_results),
+            'successful_cities': sum(1 for r in city_results if r['success']),
+            'failed_cities': sum(1 for r in city_results if not r['success']),
+            'cities': city_results
+        }
+        summary['rate_limiter'] = rate_limiter.stats()
+        if page_cache:
+            summary['page_cache'] = dict(page_cache.stats)
+        if url_publisher:
+            summary['url_queue'] = dict(url_publisher.stats)
+        summary['session_pool'] = dict(get_session_pool().stats)
+
+        if logger:
+            logger.info(f"Collection complete: {summary['new_urls_tracked']} new, {summary['price_changed_listings']} price changes, "
+                        f"{summary['existing_listings']} unchanged across {summary['successful_cities']}/{len(cities)} cities")
+
+        return summary
 
     except Exception as e:
         if logger:
@@ -250,7 +478,7 @@ def collect_urls_and_track_new(collector_config, logger=None):
             'existing_listings': 0,
             'price_changed_listings': 0,
             'successful_cities': 0,
-            'failed_cities': 1,
+            'failed_cities': len(cities),
             'error': str(e)
         }
 
@@ -277,7 +505,8 @@ def main(event=None):
     collector_config = get_collector_config(args)
 
     logger.info(f"Starting URL collector - Session: {collector_config['session_id']}")
-    logger.info(f"Target: {collector_config['target_city']}, {collector_config['target_state']}")
+    cities = get_cities_to_collect(collector_config)
+    logger.info(f"Target: {', '.join(c['city'] + ', ' + c['state'] for c in cities)}")
 
     try:
         # Collect URLs
@@ -298,6 +527,13 @@ def main(event=None):
             "new_urls_tracked": collection_summary.get('new_urls_tracked', 0),
             "existing_listings": collection_summary.get('existing_listings', 0),
             "price_changed_listings": collection_summary.get('price_changed_listings', 0),
+            "price_updates_failed": collection_summary.get('price_updates_failed', 0),
+            "successful_cities": collection_summary.get('successful_cities', 0),
+            "failed_cities": collection_summary.get('failed_cities', 0),
+            "cities": collection_summary.get('cities', []),
+            "page_cache": collection_summary.get('page_cache', {}),
+            "rate_limiter": collection_summary.get('rate_limiter', {}),
+            "session_pool": collection_summary.get('session_pool', {}),
             "status": "SUCCESS" if collection_summary.get('new_urls_tracked', 0) >= 0 else "FAILED"
         }
 
@@ -3,12 +3,16 @@
 Core scraping functionality for Redfin (US market)
 Uses curl_cffi for browser impersonation to bypass bot detection
 """
+import os
 import time
 import random
 import re
 import json
 from bs4 import BeautifulSoup
-from datetime import datetime
+from lxml import etree
+from datetime import datetime, timedelta
+
+from session_pool import SessionPool
 
 # Use curl_cffi for browser impersonation
 try:
@@ -18,8 +22,10 @@ except ImportError:
     import requests as curl_requests
     CURL_CFFI_AVAILABLE = False
 
+DEFAULT_COOKIE_PATH = '/tmp/redfin_cookies.json'
 
-def create_session(logger=None):
+
+def _create_http_session(logger=None):
     """Create HTTP session with browser impersonation"""
     if CURL_CFFI_AVAILABLE:
         # Use curl_cffi with Chrome browser impersonation
@@ -42,6 +48,36 @@ def create_session(logger=None):
     return session
 
 
+# Sessions survive warm Lambda invocations: keep-alive connections (HTTP/2 via
+# curl_cffi's Chrome impersonation) and cookies are reused instead of rebuilt
+_session_pool = None
+
+
+def get_session_pool():
+    """Return the module-level session pool, creating it on first use"""
+    global _session_pool
+    if _session_pool is None:
+        _session_pool = SessionPool(
+            _create_http_session,
+            max_requests_per_session=int(os.environ.get('SESSION_MAX_REQUESTS', '200')),
+            max_idle=int(os.environ.get('SESSION_POOL_SIZE', '4')),
+            cookie_path=os.environ.get('SESSION_COOKIE_PATH', DEFAULT_COOKIE_PATH) or None
+        )
+    return _session_pool
+
+
+def create_session(logger=None):
+    """
+    Get an HTTP session with browser impersonation
+
+    Sessions come from the warm pool unless SESSION_POOL=false; close() hands
+    the session back to the pool.
+    """
+    if os.environ.get('SESSION_POOL', 'true').lower() in ('false', '0', 'no'):
+        return _create_http_session(logger)
+    return get_session_pool().acquire(logger)
+
+
 def parse_us_price(price_text):
     """
     Parse US price text like '$450,000' or '450000' to numeric value in USD
@@ -158,7 +194,229 @@ def extract_listing_urls_from_redfin_html(html_content, city, state, logger=None
     return results
 
 
-def collect_redfin_listings(city, state, max_pages=10, city_id=None, session=None, logger=None, rate_limiter=None):
+# Precompiled patterns for the fast (lxml) search-results extractor
+HOME_ID_PATTERN = re.compile(r'/home/(\d+)')
+ADDRESS_PATTERN = re.compile(r'/([^/]+)/home/\d+')
+CARD_CLASS_PATTERN = re.compile(r'home|card|listing', re.I)
+PRICE_CLASS_PATTERN = re.compile(r'price', re.I)
+PRICE_TEXT_PATTERN = re.compile(r'\$[\d,]+')
+
+# Tags whose strings BeautifulSoup leaves out of get_text()
+NON_TEXT_TAGS = frozenset(['script', 'style', 'template', 'rt', 'rp'])
+
+
+def _element_text(element):
+    """Concatenate an element's text the way BeautifulSoup's get_text() does"""
+    for ancestor in element.iterancestors():
+        if ancestor.tag in NON_TEXT_TAGS:
+            return ''
+
+    parts = []
+
+    def walk(node):
+        if node.tag in NON_TEXT_TAGS:
+            return
+        if node.text:
+            parts.append(node.text)
+        for child in node:
+            if isinstance(child.tag, str):
+                walk(child)
+            if child.tail:
+                parts.append(child.tail)
+
+    walk(element)
+    return ''.join(parts)
+
+
+def _find_string(element, pattern):
+    """Return the first string under element (comments and scripts included) matching pattern"""
+    if element.text and pattern.search(element.text):
+        return element.text
+    for child in element:
+        if isinstance(child.tag, str):
+            found = _find_string(child, pattern)
+            if found:
+                return found
+        elif child.text and pattern.search(child.text):
+            # Comment node
+            return child.text
+        if child.tail and pattern.search(child.tail):
+            return child.tail
+    return None
+
+
+def _find_card_price(card):
+    """Find a card's price using the same rules as the BeautifulSoup extractor"""
+    price = None
+
+    for element in card.iterdescendants():
+        if not isinstance(element.tag, str):
+            continue
+        class_attr = element.get('class')
+        if class_attr and PRICE_CLASS_PATTERN.search(class_attr):
+            price = parse_us_price(_element_text(element))
+            break
+
+    if not price:
+        price_text = _find_string(card, PRICE_TEXT_PATTERN)
+        if price_text:
+            price = parse_us_price(price_text)
+
+    return price
+
+
+def _parse_html_document(html_content):
+    """Parse HTML with lxml, returning the root element or None for empty input"""
+    parser = etree.HTMLParser()
+    try:
+        return etree.fromstring(html_content, parser)
+    except ValueError:
+        # lxml rejects str input that carries an XML encoding declaration
+        if isinstance(html_content, str):
+            return etree.fromstring(html_content.encode('utf-8'), parser)
+        raise
+    except etree.XMLSyntaxError:
+        return None
+
+
+def extract_listing_urls_from_redfin_html_fast(html_content, city, state, logger=None):
+    """
+    Extract property listing URLs and basic info from Redfin search results HTML
+
+    Single lxml pass with precompiled patterns - returns exactly what
+    extract_listing_urls_from_redfin_html returns without building a
+    BeautifulSoup tree. Card price lookups are cached per card element.
+    """
+    results = []
+    seen_urls = set()
+
+    root = _parse_html_document(html_content) if html_content else None
+    if root is None:
+        return results
+
+    state_fragment = f'/{state}/'
+    card_prices = {}
+
+    for link in root.iter('a'):
+        href = link.get('href', '')
+
+        if state_fragment not in href or '/home/' not in href:
+            continue
+
+        # Skip if already seen or not a valid property link
+        if href in seen_urls:
+            continue
+
+        property_id_match = HOME_ID_PATTERN.search(href)
+        if not property_id_match:
+            continue
+
+        # Build full URL
+        if href.startswith('/'):
+            full_url = f"https://www.redfin.com{href}"
+        elif href.startswith('http'):
+            full_url = href
+        else:
+            continue
+
+        if full_url in seen_urls:
+            continue
+        seen_urls.add(full_url)
+
+        address_match = ADDRESS_PATTERN.search(href)
+        address = address_match.group(1).replace('-', ' ') if address_match else None
+
+        # Nearest enclosing card (div/article with a home/card/listing class)
+        price = None
+        for ancestor in link.iterancestors('div', 'article'):
+            class_attr = ancestor.get('class')
+            if class_attr and CARD_CLASS_PATTERN.search(class_attr):
+                if ancestor not in card_prices:
+                    card_prices[ancestor] = _find_card_price(ancestor)
+                price = card_prices[ancestor]
+                break
+
+        results.append({
+            'url': full_url,
+            'price': price or 0,
+            'city': city,
+            'state': state,
+            'address': address,
+            'property_id': property_id_match.group(1),
+            'source': 'redfin'
+        })
+
+    if logger:
+        logger.debug(f"Extracted {len(results)} property URLs from Redfin HTML (fast extractor)")
+
+    return results
+
+
+LISTING_EXTRACTORS = {
+    'soup': extract_listing_urls_from_redfin_html,
+    'fast': extract_listing_urls_from_redfin_html_fast,
+}
+
+
+def get_listing_extractor(name=None):
+    """Return the search-results extractor for a flag value ('fast' or 'soup')"""
+    return LISTING_EXTRACTORS.get((name or 'fast').lower(), extract_listing_urls_from_redfin_html_fast)
+
+
+# Redfin search filter that orders results by days on market (newest first)
+NEWEST_FIRST_FILTER = 'filter/sort=lo-days'
+
+
+def reached_watermark(page_listings, known_urls=None, watermark=None):
+    """
+    Check whether a newest-first page contains nothing newer than the last run
+
+    A page is stale when it contains the listing recorded as the newest one on
+    the previous run (the watermark), or when every URL on it is already in
+    the tracking table.
+    """
+    if watermark:
+        newest_url = watermark.get('newest_url')
+        newest_home_id = str(watermark.get('newest_home_id') or '')
+        for listing in page_listings:
+            if newest_url and listing['url'] == newest_url:
+                return True
+            if newest_home_id and listing.get('property_id') == newest_home_id:
+                return True
+
+    if known_urls is not None and page_listings:
+        return all(listing['url'] in known_urls for listing in page_listings)
+
+    return False
+
+
+def full_sweep_due(watermark, full_sweep_hours, now=None):
+    """
+    Check whether a city is due for a full newest-first sweep
+
+    Stopping at the watermark means older cards are never revisited, so their
+    price and status changes would go unseen. Every full_sweep_hours a run
+    pages through all listings instead. A city that never had a full sweep is
+    due; full_sweep_hours <= 0 turns sweeps off.
+    """
+    if not full_sweep_hours or full_sweep_hours <= 0:
+        return False
+
+    last_sweep = (watermark or {}).get('full_sweep_at')
+    if not last_sweep:
+        return True
+
+    try:
+        last_sweep_time = datetime.fromisoformat(last_sweep)
+    except ValueError:
+        return True
+
+    return (now or datetime.now()) - last_sweep_time >= timedelta(hours=full_sweep_hours)
+
+
+def collect_redfin_listings(city, state, max_pages=10, city_id=None, session=None, logger=None, rate_limiter=None,
+                            newest_first=False, known_urls=None, watermark=None, extractor='fast',
+                            page_cache=None):
     """
     Collect property listings from Redfin for a given city
 
@@ -170,9 +428,16 @@ def collect_redfin_listings(city, state, max_pages=10, city_id=None, session=Non
         session: curl_cffi Session object
         logger: Logger instance
         rate_limiter: RateLimiter instance
+        newest_first: Sort results newest-first and stop at the first stale page
+        known_urls: Set of URLs already in the tracking table (newest_first only)
+        watermark: Dict with 'newest_url'/'newest_home_id' from the previous run
+        extractor: Search-results extractor, 'fast' (lxml) or 'soup' (BeautifulSoup)
+        page_cache: PageCache instance - sends conditional requests and skips
+            parsing pages whose normalized body hash matches the last run
 
     Returns:
         List of dicts: [{'url': str, 'price': int, 'city': str, ...}, ...]
+        With newest_first, the first listing is the newest one on Redfin.
     """
     if session is None:
         session = create_session(logger)
@@ -187,9 +452,14 @@ def collect_redfin_listings(city, state, max_pages=10, city_id=None, session=Non
         # Alternative URL format without city_id
         base_url = f"https://www.redfin.com/city/{city_id or 0}/{state}/{city_formatted}"
 
+    if newest_first:
+        base_url = f"{base_url}/{NEWEST_FIRST_FILTER}"
+
     if logger:
         logger.info(f"Starting Redfin collection for {city}, {state}")
 
+    extract_listings = get_listing_extractor(extractor)
+
     all_listings = []
     seen_urls = set()
 
@@ -207,25 +477,34 @@ def collect_redfin_listings(city, state, max_pages=10, city_id=None, session=Non
             logger.debug(f"Fetching page {page}: {url}")
 
         try:
-            response = session.get(url, timeout=30)
+            cache_entry = page_cache.get(url) if page_cache else None
+            request_headers = page_cache.conditional_headers(cache_entry) if page_cache else {}
+
+            response = session.get(url, headers=request_headers, timeout=30)
 
             # Check for blocking/rate limiting
             if response.status_code == 403:
                 if logger:
                     logger.warning(f"403 Forbidden on page {page} - blocked")
+                # Cookies/connection are burned - the pool replaces this session
+                if hasattr(session, 'mark_blocked'):
+                    session.mark_blocked()
                 if rate_limiter:
-                    rate_limiter.record_error(is_rate_limit=True)
+                    rate_limiter.record_error(is_rate_limit=True, retry_after=response.headers.get('Retry-After'))
                 break
 
             if response.status_code == 429:
                 if logger:
                     logger.warning(f"429 Too Many Requests on page {page}")
+                retry_after = response.headers.get('Retry-After')
                 if rate_limiter:
-                    rate_limiter.record_error(is_rate_limit=True)
-                # Wait longer and retry once
-                time.sleep(10)
-                response = session.get(url, timeout=30)
-                if response.status_code != 200:
+                    rate_limiter.record_error(is_rate_limit=True, retry_after=retry_after)
+                    # Retry once, after the limiter's Retry-After/backoff window
+                    rate_limiter.wait()
+                else:
+                    time.sleep(10)
+                response = session.get(url, headers=request_headers, timeout=30)
+                if response.status_code not in (200, 304):
                     break
 
             if response.status_code == 404:
@@ -238,10 +517,16 @@ def collect_redfin_listings(city, state, max_pages=10, city_id=None, session=Non
             if rate_limiter:
                 rate_limiter.record_success()
 
-            # Parse listings from this page
-            page_listings = extract_listing_urls_from_redfin_html(
-                response.text, city, state, logger
-            )
+            # Parse listings from this page (cached pages skip parsing)
+            if page_cache:
+                page_listings = page_cache.listings_for_response(
+                    url, response, cache_entry,
+                    lambda html_text: extract_listings(html_text, city, state, logger)
+                )
+            else:
+                page_listings = extract_listings(
+                    response.text, city, state, logger
+                )
 
             if not page_listings:
                 if logger:
@@ -265,6 +550,12 @@ def collect_redfin_listings(city, state, max_pages=10, city_id=None, session=Non
                     logger.info(f"No new listings on page {page} - stopping")
                 break
 
+            # Newest-first: everything past a stale page is older still
+            if newest_first and reached_watermark(page_listings, known_urls, watermark):
+                if logger:
+                    logger.info(f"Page {page} has nothing newer than the last run - stopping")
+                break
+
             # Delay between pages to be respectful
             if page < max_pages:
                 delay = random.uniform(2.0, 4.0)
@@ -285,16 +576,212 @@ def collect_redfin_listings(city, state, max_pages=10, city_id=None, session=Non
     return all_listings
 
 
+# Redfin map-search endpoint - returns up to num_homes listings as JSON
+REDFIN_GIS_URL = "https://www.redfin.com/stingray/api/gis"
+REDFIN_REGION_TYPE_CITY = 6
+
+
+def parse_stingray_json(text):
+    """Parse a Redfin stingray response (JSON prefixed with '{}&&')"""
+    if text.startswith('{}&&'):
+        text = text[4:]
+    return json.loads(text)
+
+
+def _stingray_value(field):
+    """Unwrap Redfin's {'value': x} fields, passing plain values through"""
+    if isinstance(field, dict):
+        return field.get('value')
+    return field
+
+
+def extract_listings_from_gis_payload(data, city, state, logger=None):
+    """
+    Extract listing dicts from a Redfin gis JSON response
+
+    Returns the same dicts as extract_listing_urls_from_redfin_html, with the
+    extra card fields the JSON carries (beds, baths, sqft, coordinates, ...).
+    """
+    results = []
+    seen_urls = set()
+
+    homes = (data.get('payload') or {}).get('homes') or []
+
+    for home in homes:
+        href = home.get('url') or ''
+        property_id_match = HOME_ID_PATTERN.search(href)
+        if not property_id_match:
+            continue
+
+        if href.startswith('/'):
+            full_url = f"https://www.redfin.com{href}"
+        elif href.startswith('http'):
+            full_url = href
+        else:
+            continue
+
+        if full_url in seen_urls:
+            continue
+        seen_urls.add(full_url)
+
+        # Same address format as the HTML extractor (from the URL slug)
+        address_match = ADDRESS_PATTERN.search(href)
+        address = address_match.group(1).replace('-', ' ') if address_match else None
+
+        price = parse_us_price(_stingray_value(home.get('price')))
+        lat_long = _stingray_value(home.get('latLong')) or {}
+
+        results.append({
+            'url': full_url,
+            'price': price or 0,
+            'city': city,
+            'state': state,
+            'address': address,
+            'property_id': property_id_match.group(1),
+            'source': 'redfin',
+            'street_address': _stingray_value(home.get('streetLine')) or '',
+            'zip_code': home.get('zip') or home.get('postalCode') or '',
+            'beds': home.get('beds') or 0,
+            'baths': home.get('baths') or 0,
+            'sqft': _stingray_value(home.get('sqFt')) or 0,
+            'latitude': lat_long.get('latitude') or 0,
+            'longitude': lat_long.get('longitude') or 0,
+            'mls_id': _stingray_value(home.get('mlsId')) or '',
+            'listing_id': home.get('listingId') or '',
+            'days_on_market': _stingray_value(home.get('dom')) or 0,
+            'status': home.get('mlsStatus') or '',
+        })
+
+    if logger:
+        logger.debug(f"Extracted {len(results)} property URLs from Redfin JSON")
+
+    return results
+
+
+def collect_redfin_listings_json(city, state, city_id, session=None, logger=None, rate_limiter=None,
+                                 num_homes=350, newest_first=False, base_url=REDFIN_GIS_URL):
+    """
+    Collect property listings for a city from Redfin's gis JSON endpoint
+
+    One request returns up to num_homes listings, so this replaces paging
+    through the HTML search results.
+
+    Returns:
+        List of listing dicts (newest first if newest_first), or None if the
+        endpoint could not be used and the caller should fall back to HTML
+    """
+    if not city_id or int(city_id) <= 0:
+        if logger:
+            logger.warning(f"No Redfin city_id for {city}, {state} - JSON collection unavailable")
+        return None
+
+    if session is None:
+        session = create_session(logger)
+
+    params = {
+        'al': 1,
+        'num_homes': num_homes,
+        'ord': 'days-on-redfin-asc' if newest_first else 'redfin-recommended-asc',
+        'page_number': 1,
+        'region_id': city_id,
+        'region_type': REDFIN_REGION_TYPE_CITY,
+        'status': 9,
+        'uipt': '1,2,3,4,5,6,7,8',
+        'v': 8,
+    }
+    headers = {'Referer': f"https://www.redfin.com/city/{city_id}/{state}/{city.replace(' ', '-')}"}
+
+    if logger:
+        logger.info(f"Starting Redfin JSON collection for {city}, {state}")
+
+    try:
+        if rate_limiter:
+            rate_limiter.wait()
+
+        response = session.get(base_url, params=params, headers=headers, timeout=30)
+
+        if response.status_code in (403, 429):
+            if logger:
+                logger.warning(f"{response.status_code} from Redfin JSON endpoint for {city}, {state}")
+            if response.status_code == 403 and hasattr(session, 'mark_blocked'):
+                session.mark_blocked()
+            if rate_limiter:
+                rate_limiter.record_error(is_rate_limit=True, retry_after=response.headers.get('Retry-After'))
+            return None
+
+        response.raise_for_status()
+
+        data = parse_stingray_json(response.text)
+        if data.get('resultCode', 0) != 0:
+            if logger:
+                logger.warning(f"Redfin JSON endpoint error for {city}, {state}: {data.get('errorMessage', data.get('resultCode'))}")
+            return None
+
+        if rate_limiter:
+            rate_limiter.record_success()
+
+        listings = extract_listings_from_gis_payload(data, city, state, logger)
+
+        if logger:
+            logger.info(f"JSON collection complete for {city}, {state}: {len(listings)} total listings")
+
+        return listings
+
+    except Exception as e:
+        if logger:
+            logger.error(f"Error fetching Redfin JSON for {city}, {state}: {str(e)}")
+        if rate_limiter:
+            rate_limiter.record_error()
+        return None
+
+
 # Alias for backwards compatibility
 def collect_realtor_listings(*args, **kwargs):
     """Backwards compatibility alias - now uses Redfin"""
     return collect_redfin_listings(*args, **kwargs)
 
 
+def normalize_city_entry(entry, default_state=None):
+    """
+    Normalize a target city entry into {'city': str, 'state': str, 'city_id': int}
+
+    Accepts dicts (keys 'city'/'state'/'city_id', upper-case config keys also work)
+    or strings like 'Paonia, CO'. Returns None if the entry has no city name.
+    """
+    if isinstance(entry, dict):
+        city = entry.get('city') or entry.get('TARGET_CITY')
+        state = entry.get('state') or entry.get('TARGET_STATE') or default_state
+        city_id = entry.get('city_id', entry.get('CITY_ID', 0))
+    elif isinstance(entry, str):
+        parts = [p.strip() for p in entry.split(',')]
+        city = parts[0]
+        state = parts[1] if len(parts) > 1 and parts[1] else default_state
+        city_id = parts[2] if len(parts) > 2 else 0
+    else:
+        return None
+
+    if not city:
+        return None
+
+    try:
+        city_id = int(city_id or 0)
+    except (ValueError, TypeError):
+        city_id = 0
+
+    return {
+        'city': city,
+        'state': state or 'CO',
+        'city_id': city_id
+    }
+
+
 def get_target_cities(config, logger=None):
     """
     Get list of target cities to scrape based on configuration
 
+    Uses the TARGET_CITIES list from the 'redfin' section when present,
+    otherwise falls back to the single TARGET_CITY/TARGET_STATE/CITY_ID entry.
+
     Args:
         config: Configuration dict with 'redfin' section
         logger: Logger instance
@@ -309,11 +796,24 @@ def get_target_cities(config, logger=None):
     target_state = redfin_config.get('TARGET_STATE', 'CO')
     city_id = redfin_config.get('CITY_ID', 0)  # 0 means auto-detect
 
-    cities = [{
-        'city': target_city,
-        'state': target_state,
-        'city_id': city_id
-    }]
+    cities = []
+    seen = set()
+    for entry in redfin_config.get('TARGET_CITIES') or []:
+        city_info = normalize_city_entry(entry, default_state=target_state)
+        if not city_info:
+            continue
+        key = (city_info['city'].lower(), city_info['state'].upper())
+        if key in seen:
+            continue
+        seen.add(key)
+        cities.append(city_info)
+
+    if not cities:
+        cities = [{
+            'city': target_city,
+            'state': target_state,
+            'city_id': city_id
+        }]
 
     if logger:
         logger.info(f"Target cities: {cities}")
@@ -5,9 +5,22 @@ DynamoDB utilities for deduplication and data persistence (US market)
 import boto3
 import os
 import re
+import zlib
 from datetime import datetime
 import time
+import threading
 from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+# Pending URLs carry the keys of the sparse pending-index GSI the processor
+# claims work from; must match property_processor/url_leases.py
+PENDING_SHARDS = 8
+
+
+def pending_shard_for(url):
+    """Stable pending-index shard (GSI partition key string) for a URL"""
+    return str(zlib.crc32(url.encode('utf-8')) % PENDING_SHARDS)
 
 
 def get_aws_region():
@@ -37,14 +50,39 @@ def setup_dynamodb_client(logger=None):
         raise
 
 
+def open_table(table_name, session=None):
+    """
+    Table resource on its own boto3 Session
+
+    boto3 resources are not thread-safe and creating them concurrently on the
+    default session races, so every collector thread opens its own.
+    """
+    session = session or boto3.session.Session()
+    return session.resource('dynamodb', region_name=get_aws_region()).Table(table_name)
+
+
+REDFIN_HOME_ID_PATTERN = re.compile(r'/home/(\d+)')
+
+
+def extract_redfin_home_id(url):
+    """Return the numeric Redfin home ID in a listing URL (/home/77583431), or None"""
+    match = REDFIN_HOME_ID_PATTERN.search(url or '')
+    return match.group(1) if match else None
+
+
 def extract_property_id_from_url(url):
     """
-    Extract property ID from realtor.com listing URL
+    Extract property ID from a listing URL
 
     URL formats:
+    - Redfin: /CA/San-Jose/123-Main-St-95125/home/77583431
     - /realestateandhomes-detail/123-Main-St_Paonia_CO_81428_M12345-67890
     - /realestateandhomes-detail/address_M12345-67890
     """
+    home_id = extract_redfin_home_id(url)
+    if home_id:
+        return home_id
+
     patterns = [
         # Realtor.com MLS ID pattern (M followed by numbers)
         r'_M(\d+-\d+)$',
@@ -79,16 +117,51 @@ def create_property_id_key(raw_property_id, date_str=None):
     return f"PROP#{date_str}_{raw_property_id}"
 
 
+# META attributes the collector compares cards against
+PROPERTY_INDEX_PROJECTION = 'property_id, price, listing_url, analysis_date, redfin_id, card_status'
+
+# Per-home ID mapping items written by the property processor (property_ids.py)
+ID_MAP_SORT_KEY = 'REDFIN_ID'
+
+
+def property_index_entry(item):
+    """Home-index entry for a stored META item"""
+    return {
+        'property_id': item.get('property_id'),
+        'price': int(item.get('price', 0)),
+        'listing_url': item.get('listing_url', ''),
+        'analysis_date': item.get('analysis_date', ''),
+        'card_status': item.get('card_status', '')
+    }
+
+
 def load_all_existing_properties(table, logger=None):
-    """Load all existing properties from DynamoDB with robust ID extraction"""
+    """
+    Load the Redfin home-ID index of stored properties for card comparison
+
+    Built once per run from a projected META scan. The FilterExpression does
+    not reduce the read: every item in the table is read on every run, so
+    this is only the PROPERTY_INDEX=scan fallback for homes written before
+    the REDFIN# ID map existed; the default is load_properties_for_homes().
+
+    Keys are Redfin numeric home IDs taken from redfin_id, then listing_url,
+    then the PROP# key, so collector cards can be matched by the /home/<id>
+    in their URL. When a home has several META items the most recently
+    analyzed one wins.
+
+    Returns:
+        dict of home ID -> {'property_id', 'price', 'listing_url', 'analysis_date', 'card_status'}
+    """
     if logger:
         logger.info("Loading existing properties from DynamoDB...")
 
     existing_properties = {}
 
     try:
+        # Only the fields needed for price and status comparison, not full property items
         scan_kwargs = {
-            'FilterExpression': boto3.dynamodb.conditions.Attr('sort_key').eq('META')
+            'FilterExpression': boto3.dynamodb.conditions.Attr('sort_key').eq('META'),
+            'ProjectionExpression': PROPERTY_INDEX_PROJECTION
         }
 
         items_processed = 0
@@ -97,46 +170,23 @@ def load_all_existing_properties(table, logger=None):
             items = response.get('Items', [])
 
             for item in items:
-                property_id = item.get('property_id', '')
-                raw_property_id = None
-
-                # Method 1: Extract from property_id field
-                if property_id and '#' in property_id:
-                    try:
-                        parts = property_id.split('#')
-                        if len(parts) >= 2:
-                            id_part = parts[1]  # Get everything after #
-                            if '_' in id_part:
-                                # Format: PROP#YYYYMMDD_123456
-                                raw_property_id = id_part.split('_', 1)[1]
-                            else:
-                                # Format: PROP#123456
-                                raw_property_id = id_part
-                    except (IndexError, ValueError):
-                        pass
-
-                # Method 2: Fallback to extracting from listing_url
-                if not raw_property_id:
-                    listing_url = item.get('listing_url', '')
-                    if listing_url:
-                        raw_property_id = extract_property_id_from_url(listing_url)
-
-                # If we successfully extracted an ID, add it to the dictionary
-                if raw_property_id:
-                    existing_properties[raw_property_id] = {
-                        'property_id': item.get('property_id'),
-                        'price': int(item.get('price', 0)),
-                        'listing_url': item.get('listing_url', ''),
-                        'analysis_date': item.get('analysis_date', '')
-                    }
-                    items_processed += 1
+                home_id = get_item_home_id(item)
+                if not home_id:
+                    continue
+
+                entry = property_index_entry(item)
+                current = existing_properties.get(home_id)
+                if current is None or (entry['analysis_date'], entry['property_id']) > \
+                        (current['analysis_date'], current['property_id']):
+                    existing_properties[home_id] = entry
+                items_processed += 1
 
             if 'LastEvaluatedKey' not in response:
                 break
             scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
 
         if logger:
-            logger.debug(f"Loaded {items_processed} existing properties")
+            logger.debug(f"Indexed {len(existing_properties)} Redfin homes from {items_processed} properties")
 
         return existing_properties
 
@@ -146,6 +196,206 @@ def load_all_existing_properties(table, logger=None):
         return {}
 
 
+def batch_get_items(table, keys, projection):
+    """
+    BatchGetItem keys from a table (100 per call, unprocessed keys retried)
+
+    Uses the table's low-level client, which is safe to share between threads.
+    Raises RuntimeError if keys are still unprocessed after the retries.
+    """
+    client = table.meta.client
+    found = []
+
+    for start in range(0, len(keys), 100):
+        request_items = {
+            table.name: {
+                'Keys': keys[start:start + 100],
+                'ProjectionExpression': projection
+            }
+        }
+
+        for attempt in range(5):
+            response = client.batch_get_item(RequestItems=request_items)
+            found.extend(response.get('Responses', {}).get(table.name, []))
+
+            request_items = response.get('UnprocessedKeys') or {}
+            if not request_items:
+                break
+            time.sleep(0.1 * (2 ** attempt))
+
+        if request_items:
+            raise RuntimeError(f"{len(request_items[table.name]['Keys'])} keys unprocessed after retries")
+
+    return found
+
+
+def load_properties_for_homes(home_ids, table, logger=None):
+    """
+    Load home-index entries for the homes seen on search cards
+
+    Resolves each Redfin home ID through its REDFIN#<id> / REDFIN_ID mapping
+    item, then reads the mapped META items - two BatchGetItem round trips
+    per 100 homes instead of a scan of the whole table. Homes without a
+    mapping (new, or stored before the map and not yet migrated with
+    merge_duplicates) are left out.
+
+    Returns:
+        dict of home ID -> entry, as load_all_existing_properties()
+    """
+    home_ids = [h for h in dict.fromkeys(home_ids) if h]
+    if not home_ids:
+        return {}
+
+    mappings = batch_get_items(
+        table,
+        [{'property_id': f"REDFIN#{home_id}", 'sort_key': ID_MAP_SORT_KEY} for home_id in home_ids],
+        'property_id, canonical_id'
+    )
+    canonical_ids = {item['canonical_id']: item['property_id'].split('#', 1)[1] for item in mappings}
+    if not canonical_ids:
+        return {}
+
+    metas = batch_get_items(
+        table,
+        [{'property_id': property_id, 'sort_key': 'META'} for property_id in canonical_ids],
+        PROPERTY_INDEX_PROJECTION
+    )
+    found = {canonical_ids[item['property_id']]: property_index_entry(item) for item in metas}
+
+    if logger:
+        logger.debug(f"Looked up {len(found)}/{len(home_ids)} homes through the ID map")
+
+    return found
+
+
+class PropertyIndex(dict):
+    """
+    Home ID -> stored-property entry, filled per city from its cards
+
+    Shared by the city threads: prefetch() looks up the homes not seen yet
+    (under a lock, through the thread-safe low-level client) so a home that
+    shows up in two cities is read once and its entry is shared.
+    """
+
+    def __init__(self, table, logger=None):
+        super().__init__()
+        self.table = table
+        self.logger = logger
+        self.lock = threading.Lock()
+        self._looked_up = set()
+
+    def prefetch(self, home_ids):
+        with self.lock:
+            missing = [h for h in dict.fromkeys(home_ids) if h and h not in self._looked_up]
+            if not missing:
+                return
+            try:
+                self.update(load_properties_for_homes(missing, self.table, self.logger))
+            except Exception as e:
+                # Unmatched cards fall back to the URL membership check
+                if self.logger:
+                    self.logger.error(f"Failed to look up stored properties: {str(e)}")
+                return
+            self._looked_up.update(missing)
+
+
+def get_item_home_id(item):
+    """Resolve the Redfin home ID of a stored property item"""
+    redfin_id = str(item.get('redfin_id') or '')
+    if redfin_id.isdigit():
+        return redfin_id
+
+    home_id = extract_redfin_home_id(item.get('listing_url', ''))
+    if home_id:
+        return home_id
+
+    # Format: PROP#YYYYMMDD_123456 or PROP#123456
+    property_id = item.get('property_id') or ''
+    if property_id.startswith('PROP#'):
+        raw_property_id = property_id[5:].split('_', 1)[-1]
+        if raw_property_id.isdigit():
+            return raw_property_id
+
+    return None
+
+
+# Collector Watermark Functions
+
+def create_watermark_key(city, state):
+    """Create the properties-table key for a city's collection watermark"""
+    return {
+        'property_id': f"COLLECTOR#{state.upper()}#{city}",
+        'sort_key': 'WATERMARK'
+    }
+
+
+def load_city_watermark(table, city, state, logger=None):
+    """
+    Load the newest-listing watermark stored for a city
+
+    Returns dict with 'newest_url', 'newest_home_id', 'updated_at',
+    'full_sweep_at' or {} if none
+    """
+    try:
+        response = table.get_item(Key=create_watermark_key(city, state))
+        item = response.get('Item')
+        if not item:
+            return {}
+
+        return {
+            'newest_url': item.get('newest_url', ''),
+            'newest_home_id': str(item.get('newest_home_id', '')),
+            'updated_at': item.get('updated_at', ''),
+            'full_sweep_at': item.get('full_sweep_at', '')
+        }
+
+    except Exception as e:
+        if logger:
+            logger.warning(f"Failed to load watermark for {city}, {state}: {str(e)}")
+        return {}
+
+
+def save_city_watermark(table, city, state, newest_listing, logger=None, full_sweep=False):
+    """
+    Persist the newest listing seen for a city (stored outside the META items)
+
+    full_sweep records that this run paged through every listing; other runs
+    leave the last full_sweep_at in place.
+    """
+    if not newest_listing or not newest_listing.get('url'):
+        return False
+
+    try:
+        now = datetime.now().isoformat()
+        update_expression = ('SET target_city = :city, target_state = :state, newest_url = :url, '
+                             'newest_home_id = :home_id, updated_at = :now')
+        expression_values = {
+            ':city': city,
+            ':state': state,
+            ':url': newest_listing['url'],
+            ':home_id': newest_listing.get('property_id') or '',
+            ':now': now
+        }
+        if full_sweep:
+            update_expression += ', full_sweep_at = :now'
+
+        table.update_item(
+            Key=create_watermark_key(city, state),
+            UpdateExpression=update_expression,
+            ExpressionAttributeValues=expression_values
+        )
+
+        if logger:
+            logger.debug(f"Saved watermark for {city}, {state}: {expression_values[':home_id']}")
+
+        return True
+
+    except Exception as e:
+        if logger:
+            logger.warning(f"Failed to save watermark for {city}, {state}: {str(e)}")
+        return False
+
+
 # URL Tracking Table Functions
 
 def setup_url_tracking_table(table_name=None, logger=None):
@@ -179,6 +429,8 @@ def put_url_to_tracking_table(url, table, city=None, logger=None):
         item = {
             'url': url,
             'processed': '',
+            'pending_shard': pending_shard_for(url),
+            'lease_expires': 0
         }
         if city:
             item['city'] = city
@@ -215,6 +467,8 @@ def put_urls_batch_to_tracking_table(urls, table, city=None, logger=None):
                     item = {
                         'url': url,
                         'processed': '',
+                        'pending_shard': pending_shard_for(url),
+                        'lease_expires': 0,
                         'price': price
                     }
                     if item_city:
@@ -289,7 +543,10 @@ def load_all_urls_from_tracking_table(table, logger=None, city=None, exclude_cit
     tracking_urls = set()
 
     try:
-        scan_kwargs = {}
+        scan_kwargs = {
+            'ProjectionExpression': '#u',
+            'ExpressionAttributeNames': {'#u': 'url'}
+        }
 
         # Add filter expression based on parameters
         if city:
@@ -323,6 +580,56 @@ def load_all_urls_from_tracking_table(table, logger=None, city=None, exclude_cit
         return set()
 
 
+def filter_untracked_urls(urls, table, logger=None):
+    """
+    Return the subset of urls that have no item in the tracking table
+
+    Uses BatchGetItem (100 keys per call) so a stale membership snapshot does
+    not cause an existing row - and its processed flag - to be overwritten.
+    URLs the check cannot answer for are returned as untracked: a lost new
+    URL is never seen again, a rewritten row is only processed once more.
+    """
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        return []
+
+    # The resource's client (de)serializes attribute values like the Table does
+    client = table.meta.client
+    tracked = set()
+
+    try:
+        for start in range(0, len(urls), 100):
+            request_items = {
+                table.name: {
+                    'Keys': [{'url': url} for url in urls[start:start + 100]],
+                    'ProjectionExpression': '#u',
+                    'ExpressionAttributeNames': {'#u': 'url'}
+                }
+            }
+
+            for attempt in range(5):
+                response = client.batch_get_item(RequestItems=request_items)
+                for item in response.get('Responses', {}).get(table.name, []):
+                    tracked.add(item['url'])
+
+                request_items = response.get('UnprocessedKeys') or {}
+                if not request_items:
+                    break
+                time.sleep(0.1 * (2 ** attempt))
+
+            # Keys still unprocessed after the retries are trusted to the snapshot
+            unchecked = request_items.get(table.name, {}).get('Keys', [])
+            if unchecked and logger:
+                logger.warning(f"{len(unchecked)} URLs unchecked after retries - treating them as new")
+
+    except Exception as e:
+        if logger:
+            logger.error(f"Failed to check tracked URLs: {str(e)}")
+
+    # On failure this fails open: the snapshot already says these are new - never drop new URLs
+    return [url for url in urls if url not in tracked]
+
+
 def mark_url_processed(url, table, logger=None):
     """Mark URL as processed by setting processed = 'Y'"""
     try:
@@ -340,9 +647,90 @@ def mark_url_processed(url, table, logger=None):
         return False
 
 
-def batch_update_price_changes(price_changes, table, logger=None):
+def prefetch_price_tracking(property_ids, table, logger=None):
     """
-    Batch update all price changes - simplified version with price tracking fields.
+    BatchGetItem original_price/price_update_count for META items (100 keys per call)
+
+    Returns dict of property_id -> item for the properties that exist
+    """
+    items = batch_get_items(
+        table,
+        [{'property_id': pid, 'sort_key': 'META'} for pid in property_ids],
+        'property_id, original_price, price_update_count'
+    )
+    found = {item['property_id']: item for item in items}
+
+    if logger:
+        logger.debug(f"Prefetched price tracking for {len(found)}/{len(property_ids)} properties")
+
+    return found
+
+
+def build_price_update(change, existing_item, now):
+    """Build the UpdateItem arguments for one price change"""
+    old_price = change['old_price']
+    new_price = change['new_price']
+
+    # Calculate price change metrics
+    price_change_amt = new_price - old_price
+    price_change_pct = (price_change_amt / old_price * 100) if old_price > 0 else 0
+
+    # First time tracking price - original_price is the old price
+    existing_original_price = existing_item.get('original_price')
+    original_price = float(existing_original_price) if existing_original_price is not None else old_price
+    total_change = new_price - original_price
+    total_change_pct = (total_change / original_price * 100) if original_price > 0 else 0
+
+    # if_not_exists keeps original_price and the counter correct even if another
+    # writer touched the item after the prefetch
+    update_expression = """
+        SET price = :new_price,
+            original_price = if_not_exists(original_price, :old_price),
+            previous_price = :old_price,
+            last_price_change = :last_change,
+            last_price_change_pct = :last_change_pct,
+            total_price_change = :total_change,
+            total_price_change_pct = :total_change_pct,
+            price_update_count = if_not_exists(price_update_count, :zero) + :one,
+            last_price_update = :now,
+            price_history = list_append(if_not_exists(price_history, :empty_list), :price_entry)
+    """
+
+    expression_values = {
+        ':new_price': Decimal(str(new_price)),
+        ':old_price': Decimal(str(old_price)),
+        ':last_change': Decimal(str(price_change_amt)),
+        ':last_change_pct': Decimal(str(round(price_change_pct, 2))),
+        ':total_change': Decimal(str(total_change)),
+        ':total_change_pct': Decimal(str(round(total_change_pct, 2))),
+        ':zero': 0,
+        ':one': 1,
+        ':now': now.isoformat(),
+        ':empty_list': [],
+        ':price_entry': [{
+            'date': now.strftime('%Y-%m-%d'),
+            'price': Decimal(str(new_price))
+        }]
+    }
+
+    return {
+        'Key': {
+            'property_id': change['property_id'],
+            'sort_key': 'META'
+        },
+        'UpdateExpression': update_expression,
+        'ExpressionAttributeValues': expression_values,
+        'ConditionExpression': "attribute_exists(property_id)"
+    }
+
+
+def batch_update_price_changes(price_changes, table, logger=None, max_workers=8):
+    """
+    Batch update all price changes with price tracking fields.
+
+    Existing tracking fields are prefetched with BatchGetItem, then the
+    updates run concurrently on a bounded thread pool (the low-level client
+    is thread-safe, the Table resource is not).
 
     Price tracking fields added/updated:
     - price: Current price (updated)
@@ -355,136 +743,69 @@ def batch_update_price_changes(price_changes, table, logger=None):
     - price_update_count: Number of times price has been updated
     - last_price_update: Timestamp of this price update
     - price_history: Simple list of {date, price} entries
+
+    Returns:
+        dict with 'updated', 'not_found', 'failed' counts and per-item 'outcomes'
+        ({'property_id', 'url', 'status', 'error'})
     """
-    successful_updates = 0
-    failed_updates = 0
-    now = datetime.now()
+    results = {'updated': 0, 'not_found': 0, 'failed': 0, 'outcomes': []}
 
     if not price_changes:
-        return 0
+        return results
 
+    now = datetime.now()
+
+    # One update per property - the latest change wins
+    changes = {}
     for change in price_changes:
-        try:
-            property_id = change['property_id']
-            old_price = change['old_price']
-            new_price = change['new_price']
+        changes[change['property_id']] = change
 
-            # Calculate price change metrics
-            price_change_amt = new_price - old_price
-            price_change_pct = (price_change_amt / old_price * 100) if old_price > 0 else 0
+    def outcome(change, status, error=None):
+        results[status] += 1
+        results['outcomes'].append({
+            'property_id': change['property_id'],
+            'url': change.get('url', ''),
+            'status': status,
+            'error': error
+        })
 
-            # Get the current record to check for original_price
-            try:
-                response = table.get_item(
-                    Key={
-                        'property_id': property_id,
-                        'sort_key': 'META'
-                    },
-                    ProjectionExpression='original_price, price_update_count'
-                )
-
-                if 'Item' not in response:
-                    if logger:
-                        logger.warning(f"Property {property_id} not found in database")
-                    failed_updates += 1
-                    continue
+    try:
+        existing_items = prefetch_price_tracking(list(changes), table, logger)
+    except Exception as e:
+        if logger:
+            logger.error(f"Failed to prefetch price tracking fields: {str(e)}")
+        for change in changes.values():
+            outcome(change, 'failed', str(e))
+        return results
+
+    to_update = []
+    for property_id, change in changes.items():
+        if property_id in existing_items:
+            to_update.append(change)
+        else:
+            if logger:
+                logger.warning(f"Property {property_id} not found in database")
+            outcome(change, 'not_found')
 
-                existing_item = response['Item']
-                existing_original_price = existing_item.get('original_price')
-                existing_update_count = int(existing_item.get('price_update_count', 0))
+    client = table.meta.client
 
-            except Exception as e:
-                if logger:
-                    logger.error(f"Failed to get existing record for {property_id}: {str(e)}")
-                failed_updates += 1
-                continue
-
-            # Build the update expression based on whether original_price exists
-            if existing_original_price is None:
-                # First time tracking price - set original_price to the old price
-                original_price = old_price
-                total_change = new_price - original_price
-                total_change_pct = (total_change / original_price * 100) if original_price > 0 else 0
-
-                update_expression = """
-                    SET price = :new_price,
-                        original_price = :original_price,
-                        previous_price = :old_price,
-                        last_price_change = :last_change,
-                        last_price_change_pct = :last_change_pct,
-                        total_price_change = :total_change,
-                        total_price_change_pct = :total_change_pct,
-                        price_update_count = :update_count,
-                        last_price_update = :now,
-                        price_history = list_append(if_not_exists(price_history, :empty_list), :price_entry)
-                """
-
-                expression_values = {
-                    ':new_price': Decimal(str(new_price)),
-                    ':original_price': Decimal(str(old_price)),
-                    ':old_price': Decimal(str(old_price)),
-                    ':last_change': Decimal(str(price_change_amt)),
-                    ':last_change_pct': Decimal(str(round(price_change_pct, 2))),
-                    ':total_change': Decimal(str(total_change)),
-                    ':total_change_pct': Decimal(str(round(total_change_pct, 2))),
-                    ':update_count': existing_update_count + 1,
-                    ':now': now.isoformat(),
-                    ':empty_list': [],
-                    ':price_entry': [{
-                        'date': now.strftime('%Y-%m-%d'),
-                        'price': Decimal(str(new_price))
-                    }]
-                }
-            else:
-                # Original price already exists - calculate total change from original
-                original_price = float(existing_original_price)
-                total_change = new_price - original_price
-                total_change_pct = (total_change / original_price * 100) if original_price > 0 else 0
-
-                update_expression = """
-                    SET price = :new_price,
-                        previous_price = :old_price,
-                        last_price_change = :last_change,
-                        last_price_change_pct = :last_change_pct,
-                        total_price_change = :total_change,
-                        total_price_change_pct = :total_change_pct,
-                        price_update_count = :update_count,
-                        last_price_update = :now,
-                        price_history = list_append(if_not_exists(price_history, :empty_list), :price_entry)
-                """
-
-                expression_values = {
-                    ':new_price': Decimal(str(new_price)),
-                    ':old_price': Decimal(str(old_price)),
-                    ':last_change': Decimal(str(price_change_amt)),
-                    ':last_change_pct': Decimal(str(round(price_change_pct, 2))),
-                    ':total_change': Decimal(str(total_change)),
-                    ':total_change_pct': Decimal(str(round(total_change_pct, 2))),
-                    ':update_count': existing_update_count + 1,
-                    ':now': now.isoformat(),
-                    ':empty_list': [],
-                    ':price_entry': [{
-                        'date': now.strftime('%Y-%m-%d'),
-                        'price': Decimal(str(new_price))
-                    }]
-                }
+    def apply(change):
+        client.update_item(TableName=table.name, **build_price_update(change, existing_items[change['property_id']], now))
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {executor.submit(apply, change): change for change in to_update}
 
-            # Update the property record
+        for future in as_completed(futures):
+            change = futures[future]
+            property_id = change['property_id']
             try:
-                table.update_item(
-                    Key={
-                        'property_id': property_id,
-                        'sort_key': 'META'
-                    },
-                    UpdateExpression=update_expression,
-                    ExpressionAttributeValues=expression_values,
-                    ConditionExpression="attribute_exists(property_id)"
-                )
-
-                successful_updates += 1
+                future.result()
+                outcome(change, 'updated')
 
                 if logger:
-                    direction = "+" if price_change_amt > 0 else ""
+                    old_price, new_price = change['old_price'], change['new_price']
+                    price_change_pct = ((new_price - old_price) / old_price * 100) if old_price > 0 else 0
+                    direction = "+" if new_price > old_price else ""
                     logger.info(f"Price updated for {property_id}: ${old_price:,} -> ${new_price:,} "
                                f"({direction}{price_change_pct:.1f}%)")
 
@@ -492,18 +813,85 @@ def batch_update_price_changes(price_changes, table, logger=None):
                 if 'ConditionalCheckFailedException' in str(e):
                     if logger:
                         logger.warning(f"Property {property_id} not found in database")
+                    outcome(change, 'not_found')
                 else:
                     if logger:
                         logger.error(f"Failed to update price for {property_id}: {str(e)}")
-                failed_updates += 1
-
-        except Exception as e:
-            failed_updates += 1
-            if logger:
-                logger.error(f"Error processing price change: {str(e)}")
+                    outcome(change, 'failed', str(e))
 
     # Summary logging
     if logger:
-        logger.info(f"Price update complete: {successful_updates} successful, {failed_updates} failed")
+        logger.info(f"Price update complete: {results['updated']} successful, "
+                    f"{results['not_found']} not found, {results['failed']} failed")
+
+    return results
+
+
+def build_status_update(change, now):
+    """
+    Build the UpdateItem arguments for one card status change
+
+    card_status_changed_at is only set when the home had a status before - the
+    first status seen for a home is not a change
+    """
+    update_expression = 'SET card_status = :status'
+    expression_values = {':status': change['new_status']}
+    if change.get('old_status'):
+        update_expression += ', card_status_changed_at = :now, previous_card_status = :old_status'
+        expression_values[':now'] = now.isoformat()
+        expression_values[':old_status'] = change['old_status']
+
+    return {
+        'Key': {
+            'property_id': change['property_id'],
+            'sort_key': 'META'
+        },
+        'UpdateExpression': update_expression,
+        'ExpressionAttributeValues': expression_values,
+        'ConditionExpression': "attribute_exists(property_id)"
+    }
+
+
+def batch_update_card_statuses(status_changes, table, logger=None, max_workers=8):
+    """
+    Record listing status changes seen on search cards (Active -> Pending, ...)
+
+    The detail refetch policy treats a status change since the last fetch
+    like a price change. Updates run concurrently like price changes.
+
+    Returns:
+        dict with 'updated', 'not_found', 'failed' counts
+    """
+    results = {'updated': 0, 'not_found': 0, 'failed': 0}
+
+    if not status_changes:
+        return results
+
+    now = datetime.now()
+    changes = {change['property_id']: change for change in status_changes}
+    client = table.meta.client
+
+    def apply(change):
+        client.update_item(TableName=table.name, **build_status_update(change, now))
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {executor.submit(apply, change): change for change in changes.values()}
+
+        for future in as_completed(futures):
+            property_id = futures[future]['property_id']
+            try:
+                future.result()
+                results['updated'] += 1
+            except Exception as e:
+                if 'ConditionalCheckFailedException' in str(e):
+                    results['not_found'] += 1
+                else:
+                    results['failed'] += 1
+                    if logger:
+                        logger.error(f"Failed to update card status for {property_id}: {str(e)}")
+
+    if logger:
+        logger.info(f"Card status update complete: {results['updated']} successful, "
+                    f"{results['not_found']} not found, {results['failed']} failed")
 
-    return successful_updates
+    return results
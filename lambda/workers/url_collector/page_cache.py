@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Page cache for Redfin search result pages
+Keeps ETag/Last-Modified validators, a hash of the normalized page body and
+the listings extracted from it per page URL, so unchanged pages cost one
+conditional request and no parsing
+"""
+import os
+import re
+import json
+import hashlib
+import threading
+from datetime import datetime
+
+import boto3
+
+DEFAULT_CACHE_DIR = '/tmp/redfin_page_cache'
+
+# Parts of a search page that change on every request without the listings changing
+VOLATILE_PATTERNS = [
+    re.compile(r'<script\b[^>]*>.*?</script>', re.I | re.S),
+    re.compile(r'<style\b[^>]*>.*?</style>', re.I | re.S),
+    re.compile(r'<!--.*?-->', re.S),
+    re.compile(r'\s(?:nonce|data-reactid|data-rf-request-id)="[^"]*"', re.I),
+]
+INTER_TAG_WHITESPACE_PATTERN = re.compile(r'>\s+<')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_page_body(html_content):
+    """Strip scripts, styles, comments and per-request attributes, collapse whitespace"""
+    text = html_content or ''
+    for pattern in VOLATILE_PATTERNS:
+        text = pattern.sub('', text)
+    text = INTER_TAG_WHITESPACE_PATTERN.sub('><', text)
+    return WHITESPACE_PATTERN.sub(' ', text).strip()
+
+
+def hash_page_body(html_content):
+    """SHA-256 of the normalized page body"""
+    return hashlib.sha256(normalize_page_body(html_content).encode('utf-8')).hexdigest()
+
+
+class PageCache:
+    """
+    Per-URL cache of search page validators, body hash and extracted listings
+
+    Entries live in a local directory (kept warm across Lambda invocations)
+    and, when a bucket is given, in S3 so cold starts can reuse them too.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, bucket=None, prefix='page-cache/', logger=None):
+        self.cache_dir = cache_dir
+        self.bucket = bucket
+        self.prefix = prefix
+        self.logger = logger
+        self.lock = threading.Lock()
+        self._s3 = None
+        self.stats = {'not_modified': 0, 'hash_hits': 0, 'misses': 0}
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _key(self, url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def _s3_client(self):
+        # Worker threads share one client; creating it is not thread-safe, using it is
+        with self.lock:
+            if self._s3 is None:
+                self._s3 = boto3.client('s3', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
+        return self._s3
+
+    def _count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def get(self, url):
+        """Return the cache entry for a page URL or None"""
+        key = self._key(url)
+
+        if self.cache_dir:
+            path = os.path.join(self.cache_dir, f"{key}.json")
+            try:
+                with open(path) as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+
+        if self.bucket:
+            try:
+                response = self._s3_client().get_object(Bucket=self.bucket, Key=f"{self.prefix}{key}.json")
+                entry = json.loads(response['Body'].read())
+                self._write_local(key, entry)
+                return entry
+            except Exception as e:
+                if self.logger and 'NoSuchKey' not in str(e):
+                    self.logger.debug(f"Page cache S3 read failed for {url}: {str(e)}")
+
+        return None
+
+    def _write_local(self, key, entry):
+        if not self.cache_dir:
+            return
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            if self.logger:
+                self.logger.debug(f"Page cache write failed: {str(e)}")
+
+    def put(self, url, headers, body_hash, listings):
+        """Store validators, body hash and extracted listings for a page URL"""
+        headers = headers or {}
+        entry = {
+            'url': url,
+            'etag': headers.get('ETag') or headers.get('etag') or '',
+            'last_modified': headers.get('Last-Modified') or headers.get('last-modified') or '',
+            'body_hash': body_hash,
+            'listings': listings,
+            'cached_at': datetime.now().isoformat()
+        }
+        key = self._key(url)
+        self._write_local(key, entry)
+
+        if self.bucket:
+            try:
+                self._s3_client().put_object(
+                    Bucket=self.bucket,
+                    Key=f"{self.prefix}{key}.json",
+                    Body=json.dumps(entry).encode('utf-8'),
+                    ContentType='application/json'
+                )
+            except Exception as e:
+                if self.logger:
+                    self.logger.debug(f"Page cache S3 write failed for {url}: {str(e)}")
+
+    def conditional_headers(self, entry):
+        """Build If-None-Match / If-Modified-Since headers from a cache entry"""
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def listings_for_response(self, url, response, entry, extract):
+        """
+        Return listings for a fetched page, parsing only when the page changed
+
+        Args:
+            url: Page URL
+            response: HTTP response (200 or 304)
+            entry: Cache entry loaded before the request (or None)
+            extract: Callable taking the page HTML and returning listings
+        """
+        if response.status_code == 304 and entry:
+            self._count('not_modified')
+            if self.logger:
+                self.logger.debug(f"Page not modified (304): {url}")
+            return entry.get('listings', [])
+
+        body_hash = hash_page_body(response.text)
+        if entry and entry.get('body_hash') == body_hash:
+            self._count('hash_hits')
+            if self.logger:
+                self.logger.debug(f"Page body unchanged, skipping parse: {url}")
+            # Refresh validators if the server rotated them, so the next run can get a 304
+            new_validators = self.conditional_headers({
+                'etag': response.headers.get('ETag', ''),
+                'last_modified': response.headers.get('Last-Modified', '')
+            })
+            if new_validators and new_validators != self.conditional_headers(entry):
+                self.put(url, response.headers, body_hash, entry.get('listings', []))
+            return entry.get('listings', [])
+
+        self._count('misses')
+        listings = extract(response.text)
+        self.put(url, response.headers, body_hash, listings)
+        return listings
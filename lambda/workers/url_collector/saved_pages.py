@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+Saved Redfin pages for the extractor parity checks
+Loads pages from testdata/ (or given paths) for the tests and for
+scripts/bench_extractors.py
+"""
+import pathlib
+
+TESTDATA_DIR = pathlib.Path(__file__).parent / 'testdata'
+
+
+def load_saved_pages(pattern='*.html', paths=None, binary=False):
+    """
+    Return (name, content) for each saved page
+
+    Args:
+        pattern: Glob for files in testdata/ (ignored when paths are given)
+        paths: Explicit page files
+        binary: Return page bytes instead of text
+    """
+    files = [pathlib.Path(p) for p in paths] if paths else sorted(TESTDATA_DIR.glob(pattern))
+    return [(f.name, f.read_bytes() if binary else f.read_text(encoding='utf-8')) for f in files]
+
+
+def without_timestamp(property_data):
+    """Extracted property data without the per-call extraction_timestamp"""
+    property_data = dict(property_data)
+    property_data.pop('extraction_timestamp', None)
+    return property_data
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# test_json_collection.py
+"""
+Runs the JSON (gis endpoint) collection mode against a local stub server.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+from core_scraper import (
+    create_session,
+    collect_redfin_listings_json,
+    extract_listing_urls_from_redfin_html
+)
+
+GIS_HOMES = [
+    {
+        'url': '/CO/Paonia/123-Grand-Ave-81428/home/18012345',
+        'propertyId': 18012345,
+        'listingId': 170001,
+        'price': {'value': 525000, 'level': 1},
+        'streetLine': {'value': '123 Grand Ave', 'level': 1},
+        'zip': '81428',
+        'beds': 3,
+        'baths': 2.5,
+        'sqFt': {'value': 1840, 'level': 1},
+        'latLong': {'value': {'latitude': 38.868, 'longitude': -107.592}, 'level': 1},
+        'mlsId': {'value': '812345', 'level': 1},
+        'dom': {'value': 4, 'level': 1},
+    },
+    {
+        'url': '/CO/Paonia/9-Bross-Ave-81428/unit-2/home/18054321',
+        'propertyId': 18054321,
+        'price': {'value': 310000, 'level': 1},
+        'beds': 2,
+        'baths': 1,
+    },
+    # Duplicate and malformed entries are dropped
+    {'url': '/CO/Paonia/123-Grand-Ave-81428/home/18012345', 'price': {'value': 525000}},
+    {'url': '/CO/Paonia/no-id', 'price': {'value': 100000}},
+]
+
+
+class StubRedfinHandler(BaseHTTPRequestHandler):
+    requests_seen = []
+    status_code = 200
+    result_code = 0
+
+    def do_GET(self):
+        StubRedfinHandler.requests_seen.append(self.path)
+        body = '{}&&' + json.dumps({
+            'version': 8,
+            'errorMessage': 'Success' if self.result_code == 0 else 'Invalid argument',
+            'resultCode': self.result_code,
+            'payload': {'homes': GIS_HOMES if self.result_code == 0 else []},
+        })
+        self.send_response(self.status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(body.encode('utf-8'))
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    StubRedfinHandler.requests_seen = []
+    StubRedfinHandler.status_code = 200
+    StubRedfinHandler.result_code = 0
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubRedfinHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/stingray/api/gis"
+    server.shutdown()
+    server.server_close()
+
+
+def test_json_mode_returns_listing_dicts(stub_server):
+    session = create_session()
+    try:
+        listings = collect_redfin_listings_json(
+            'Paonia', 'CO', 14856, session=session, newest_first=True, base_url=stub_server
+        )
+    finally:
+        session.close()
+
+    assert [l['property_id'] for l in listings] == ['18012345', '18054321']
+
+    first = listings[0]
+    assert first['url'] == 'https://www.redfin.com/CO/Paonia/123-Grand-Ave-81428/home/18012345'
+    assert first['price'] == 525000
+    assert first['address'] == '123 Grand Ave 81428'
+    assert first['street_address'] == '123 Grand Ave'
+    assert (first['beds'], first['baths'], first['sqft']) == (3, 2.5, 1840)
+    assert first['latitude'] == 38.868
+
+    # Same core keys as the HTML extractor
+    html = '<div class="HomeCard"><a href="/CO/Paonia/1-A-St/home/1">a</a><b class="price">$300,000</b></div>'
+    html_keys = set(extract_listing_urls_from_redfin_html(html, 'Paonia', 'CO')[0])
+    assert html_keys <= set(first)
+
+    # One request for the whole city
+    assert len(StubRedfinHandler.requests_seen) == 1
+    query = parse_qs(urlparse(StubRedfinHandler.requests_seen[0]).query)
+    assert query['region_id'] == ['14856']
+    assert query['region_type'] == ['6']
+    assert query['ord'] == ['days-on-redfin-asc']
+
+
+def test_json_mode_signals_fallback_on_block(stub_server):
+    StubRedfinHandler.status_code = 403
+    session = create_session()
+    try:
+        assert collect_redfin_listings_json('Paonia', 'CO', 14856, session=session, base_url=stub_server) is None
+    finally:
+        session.close()
+
+
+def test_json_mode_signals_fallback_on_api_error(stub_server):
+    StubRedfinHandler.result_code = 101
+    session = create_session()
+    try:
+        assert collect_redfin_listings_json('Paonia', 'CO', 14856, session=session, base_url=stub_server) is None
+    finally:
+        session.close()
+
+
+def test_json_mode_requires_city_id():
+    assert collect_redfin_listings_json('Paonia', 'CO', 0, session=object()) is None
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# test_listing_extractor.py
+"""
+Parity checks for the fast (lxml) search-results extractor against the
+saved pages in testdata/ and hand-written edge cases. Throughput is in
+scripts/bench_extractors.py.
+"""
+from core_scraper import (
+    extract_listing_urls_from_redfin_html,
+    extract_listing_urls_from_redfin_html_fast,
+    get_listing_extractor
+)
+from saved_pages import load_saved_pages
+
+SEARCH_PAGES = 'redfin_search_*.html'
+
+
+def test_fast_extractor_matches_soup_on_saved_pages():
+    pages = load_saved_pages(SEARCH_PAGES)
+    assert pages, "no saved search pages in testdata/"
+
+    for name, html_text in pages:
+        for city, state in [('Paonia', 'CO'), ('Denver', 'CO'), ('Austin', 'TX')]:
+            expected = extract_listing_urls_from_redfin_html(html_text, city, state)
+            actual = extract_listing_urls_from_redfin_html_fast(html_text, city, state)
+            assert actual == expected, f"{name} ({city}, {state}) differs"
+
+
+def test_fast_extractor_matches_soup_on_edge_cases():
+    snippets = [
+        '',
+        '<html><body><p>No results</p></body></html>',
+        '<?xml version="1.0" encoding="utf-8"?><html><body>'
+        '<div class="HomeCard"><a href="/CO/Paonia/1-A-St/home/1">a</a><b class="price">$300,000</b></div>'
+        '</body></html>',
+        # Nested cards - the innermost matching ancestor wins
+        '<article class="listing"><span>$900,000</span><div class="HomeCardInner">'
+        '<a href="/CO/Paonia/2-B-St/home/2">b</a></div></article>',
+        # Price split across children and a trailing tail string
+        '<div class="card"><a href="/CO/Paonia/3-C-St/home/3">c</a>'
+        '<span class="Price"><b>$4</b>50,000</span> after</div>',
+        # Duplicate hrefs, relative href without leading slash, non-numeric id
+        '<div class="home"><a href="/CO/Paonia/4-D-St/home/4">d</a><a href="/CO/Paonia/4-D-St/home/4">d</a>'
+        '<a href="CO/Paonia/5-E-St/home/5">e</a><a href="/CO/Paonia/6-F-St/home/abc">f</a>$1,200,000</div>',
+    ]
+
+    for html_text in snippets:
+        expected = extract_listing_urls_from_redfin_html(html_text, 'Paonia', 'CO')
+        actual = extract_listing_urls_from_redfin_html_fast(html_text, 'Paonia', 'CO')
+        assert actual == expected, html_text
+
+
+def test_extractor_flag_selects_implementation():
+    assert get_listing_extractor('soup') is extract_listing_urls_from_redfin_html
+    assert get_listing_extractor('fast') is extract_listing_urls_from_redfin_html_fast
+    assert get_listing_extractor(None) is extract_listing_urls_from_redfin_html_fast
+
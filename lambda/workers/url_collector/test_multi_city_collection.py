@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# test_multi_city_collection.py
+"""
+Checks for concurrent multi-city collection: every city thread gets its own
+HTTP session and table resources, and the per-city results are merged into
+one summary. Redfin and DynamoDB are replaced by in-memory fakes.
+"""
+import threading
+from types import SimpleNamespace
+
+import app
+
+CITIES = [
+    {'city': 'Paonia', 'state': 'CO', 'city_id': 14856},
+    {'city': 'Hotchkiss', 'state': 'CO', 'city_id': 8471},
+    {'city': 'Delta', 'state': 'CO', 'city_id': 5148},
+]
+
+
+class FakeSession:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def listing(home_id, price, city):
+    return {
+        'url': f"https://www.redfin.com/CO/{city}/{home_id}-Main-St-81428/home/{home_id}",
+        'property_id': str(home_id),
+        'price': price,
+        'city': city
+    }
+
+
+def make_config(**overrides):
+    config = {
+        'session_id': 'test',
+        'dynamodb_table': 'properties',
+        'url_tracking_table': 'urls',
+        'target_city': 'Paonia',
+        'target_state': 'CO',
+        'city_id': 14856,
+        'max_pages': 2,
+        'target_cities': CITIES,
+        'max_concurrent_cities': 3,
+        'price_update_workers': 2,
+        'property_queue_url': '',
+        'newest_first': False,
+        'listing_extractor': 'fast',
+        'collection_mode': 'html',
+        'page_cache': False,
+        'page_cache_bucket': '',
+        'property_index': 'scan',
+        'membership_snapshot': False,
+        'snapshot_bucket': '',
+        'snapshot_max_age_hours': 24,
+        'min_delay': 0,
+        'max_delay': 0
+    }
+    config.update(overrides)
+    return config
+
+
+def install_fakes(monkeypatch):
+    """Patch app's Redfin/DynamoDB calls; returns what each city thread touched"""
+    seen = {'sessions': {}, 'tables': [], 'writes': {}, 'price_changes': []}
+    lock = threading.Lock()
+    barrier = threading.Barrier(len(CITIES), timeout=5)
+
+    # Home 100 is stored at 500k and shows up in Paonia at 480k
+    existing = {'100': {'property_id': 'PROP#20250101_100', 'price': 500000, 'card_status': ''}}
+    main_table = SimpleNamespace(name='properties')
+    main_url_table = SimpleNamespace(name='urls')
+
+    def open_table(table_name, session=None):
+        table = SimpleNamespace(name=table_name, session=session, thread=threading.get_ident())
+        with lock:
+            seen['tables'].append(table)
+        return table
+
+    def create_session(logger=None):
+        return FakeSession()
+
+    def collect_redfin_listings(city, state, session=None, **kwargs):
+        with lock:
+            seen['sessions'][city] = (session, threading.get_ident())
+        # All cities are in flight at the same time
+        barrier.wait()
+        if city == 'Paonia':
+            return [listing(100, 480000, city), listing(101, 300000, city)]
+        return [listing(200 + len(city), 250000, city)]
+
+    def put_urls(urls, table, city=None, logger=None):
+        with lock:
+            seen['writes'][city] = (table, [u['url'] for u in urls])
+        return len(urls)
+
+    def update_prices(changes, table, logger=None, max_workers=8):
+        with lock:
+            seen['price_changes'].extend(changes)
+        return {'updated': len(changes), 'not_found': 0, 'failed': 0, 'outcomes': []}
+
+    monkeypatch.setattr(app, 'setup_dynamodb_client', lambda logger=None: (None, main_table))
+    monkeypatch.setattr(app, 'load_all_existing_properties', lambda table, logger=None: existing)
+    monkeypatch.setattr(app, 'setup_url_tracking_table', lambda name, logger=None: (None, main_url_table))
+    monkeypatch.setattr(app, 'load_all_urls_from_tracking_table', lambda table, logger=None: set())
+    monkeypatch.setattr(app, 'open_table', open_table)
+    monkeypatch.setattr(app, 'create_session', create_session)
+    monkeypatch.setattr(app, 'collect_redfin_listings', collect_redfin_listings)
+    monkeypatch.setattr(app, 'put_urls_batch_to_tracking_table', put_urls)
+    monkeypatch.setattr(app, 'batch_update_price_changes', update_prices)
+    monkeypatch.setattr(app, 'batch_update_card_statuses',
+                        lambda changes, table, logger=None, max_workers=8: {'updated': 0, 'not_found': 0, 'failed': 0})
+    monkeypatch.setattr(app, 'get_url_publisher', lambda queue_url, logger=None: None)
+    return seen
+
+
+def test_each_city_gets_its_own_sessions_and_tables(monkeypatch):
+    seen = install_fakes(monkeypatch)
+    app.collect_urls_and_track_new(make_config())
+
+    sessions = [session for session, _ in seen['sessions'].values()]
+    assert len({id(s) for s in sessions}) == len(CITIES)
+    assert all(s.closed for s in sessions)
+
+    # Two tables per city, both on that city's own boto3 Session and thread
+    assert len(seen['tables']) == 2 * len(CITIES)
+    assert len({id(t.session) for t in seen['tables']}) == len(CITIES)
+    for city, (_, thread) in seen['sessions'].items():
+        tables = [t for t in seen['tables'] if t.thread == thread]
+        assert sorted(t.name for t in tables) == ['properties', 'urls']
+        assert seen['writes'][city][0] in tables
+
+
+def test_city_results_are_merged(monkeypatch):
+    seen = install_fakes(monkeypatch)
+    summary = app.collect_urls_and_track_new(make_config())
+
+    assert summary['successful_cities'] == len(CITIES) and summary['failed_cities'] == 0
+    assert summary['total_urls_found'] == 4
+    assert summary['new_urls_tracked'] == 3
+    assert summary['price_changed_listings'] == 1
+    assert sorted(r['city'] for r in summary['cities']) == sorted(c['city'] for c in CITIES)
+    assert seen['price_changes'][0]['new_price'] == 480000
+    assert seen['writes']['Paonia'][1] == [listing(101, 300000, 'Paonia')['url']]
+
+
+def test_city_concurrency_has_its_own_setting(monkeypatch):
+    scraper = {'MAX_CONCURRENT_REQUESTS': 1}
+    monkeypatch.setattr(app, 'config', SimpleNamespace(load_config=lambda: {'scraper': scraper},
+                                                       get_env_var=lambda name: ''))
+    monkeypatch.setenv('MAX_CONCURRENT_CITIES', '4')
+    assert app.parse_lambda_event({})['max_concurrent_cities'] == 4
+
+    scraper['MAX_CONCURRENT_CITIES'] = 3
+    assert app.parse_lambda_event({})['max_concurrent_cities'] == 3
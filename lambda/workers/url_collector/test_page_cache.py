@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# test_page_cache.py
+"""
+Checks for the search page cache: conditional request headers, 304 and
+body-hash hits that reuse the cached listings, and re-parsing when the
+listings on a page change.
+"""
+from types import SimpleNamespace
+
+from page_cache import PageCache, hash_page_body
+
+PAGE_URL = 'https://www.redfin.com/city/14856/CO/Paonia/page-2'
+
+PAGE = '''<html><head><script nonce="a1">window.t = 1;</script></head>
+<body><div class="HomeCard"><a href="/CO/Paonia/1-Main-St-81428/home/1">$400,000</a></div></body></html>'''
+
+# Same listings, different script payload, nonce and whitespace
+SAME_LISTINGS_PAGE = '''<html><head><script nonce="b2">window.t = 2;</script></head>
+<body>
+  <div class="HomeCard">  <a href="/CO/Paonia/1-Main-St-81428/home/1">$400,000</a></div>
+</body></html>'''
+
+CHANGED_PAGE = PAGE.replace('$400,000', '$390,000')
+
+
+def response(status_code=200, text='', headers=None):
+    return SimpleNamespace(status_code=status_code, text=text, headers=headers or {})
+
+
+class Extractor:
+    """Counts parses; listings carry the page's price text"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, html_text):
+        self.calls += 1
+        price = '$390,000' if '$390,000' in html_text else '$400,000'
+        return [{'url': 'https://www.redfin.com/CO/Paonia/1-Main-St-81428/home/1', 'price_text': price}]
+
+
+def make_cache(tmp_path):
+    return PageCache(cache_dir=str(tmp_path / 'pages'))
+
+
+def test_validators_become_conditional_headers(tmp_path):
+    cache = make_cache(tmp_path)
+    assert cache.get(PAGE_URL) is None
+    assert cache.conditional_headers(None) == {}
+
+    cache.listings_for_response(PAGE_URL, response(text=PAGE, headers={
+        'ETag': '"v1"', 'Last-Modified': 'Wed, 04 Jun 2025 10:00:00 GMT'
+    }), None, Extractor())
+
+    entry = cache.get(PAGE_URL)
+    assert cache.conditional_headers(entry) == {
+        'If-None-Match': '"v1"',
+        'If-Modified-Since': 'Wed, 04 Jun 2025 10:00:00 GMT'
+    }
+    # Survives a new cache instance on the same directory (warm invocation)
+    assert make_cache(tmp_path).get(PAGE_URL)['etag'] == '"v1"'
+
+
+def test_not_modified_returns_cached_listings(tmp_path):
+    cache = make_cache(tmp_path)
+    extract = Extractor()
+    first = cache.listings_for_response(PAGE_URL, response(text=PAGE, headers={'ETag': '"v1"'}), None, extract)
+
+    listings = cache.listings_for_response(PAGE_URL, response(304), cache.get(PAGE_URL), extract)
+    assert listings == first
+    assert extract.calls == 1
+    assert cache.stats == {'not_modified': 1, 'hash_hits': 0, 'misses': 1}
+
+
+def test_identical_body_hash_skips_parsing(tmp_path):
+    cache = make_cache(tmp_path)
+    extract = Extractor()
+    assert hash_page_body(PAGE) == hash_page_body(SAME_LISTINGS_PAGE)
+
+    first = cache.listings_for_response(PAGE_URL, response(text=PAGE, headers={'ETag': '"v1"'}), None, extract)
+    listings = cache.listings_for_response(
+        PAGE_URL, response(text=SAME_LISTINGS_PAGE, headers={'ETag': '"v2"'}), cache.get(PAGE_URL), extract
+    )
+    assert listings == first
+    assert extract.calls == 1
+    assert cache.stats['hash_hits'] == 1
+    # A rotated ETag is stored so the next request can get a 304
+    assert cache.get(PAGE_URL)['etag'] == '"v2"'
+
+
+def test_changed_body_is_parsed_and_replaces_the_entry(tmp_path):
+    cache = make_cache(tmp_path)
+    extract = Extractor()
+    cache.listings_for_response(PAGE_URL, response(text=PAGE), None, extract)
+
+    listings = cache.listings_for_response(PAGE_URL, response(text=CHANGED_PAGE), cache.get(PAGE_URL), extract)
+    assert listings[0]['price_text'] == '$390,000'
+    assert extract.calls == 2
+    assert cache.stats['misses'] == 2
+
+    entry = cache.get(PAGE_URL)
+    assert entry['body_hash'] == hash_page_body(CHANGED_PAGE)
+    assert entry['listings'] == listings
+
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# test_price_updates.py
+"""
+Checks for the batched, parallel price-change writer.
+
+A fake DynamoDB client with a fixed per-call latency stands in for the
+table; run as a script to compare worker counts:
+
+    python test_price_updates.py --changes 200 --latency 0.02
+"""
+import argparse
+import threading
+import time
+from types import SimpleNamespace
+
+from dynamodb_utils import batch_update_card_statuses, batch_update_price_changes
+
+
+class FakeClient:
+    """In-memory BatchGetItem/UpdateItem with a fixed round-trip latency"""
+
+    def __init__(self, items, latency=0.0, unprocessed_once=False):
+        self.items = items
+        self.latency = latency
+        self.unprocessed_once = unprocessed_once
+        self.lock = threading.Lock()
+        self.calls = {'batch_get_item': 0, 'update_item': 0}
+        self.updates = []
+
+    def batch_get_item(self, RequestItems):
+        time.sleep(self.latency)
+        self.calls['batch_get_item'] += 1
+        table_name, request = next(iter(RequestItems.items()))
+        keys = request['Keys']
+        unprocessed = {}
+        if self.unprocessed_once and len(keys) > 1:
+            self.unprocessed_once = False
+            keys, rest = keys[:1], keys[1:]
+            unprocessed = {table_name: dict(request, Keys=rest)}
+        found = [self.items[k['property_id']] for k in keys if k['property_id'] in self.items]
+        return {'Responses': {table_name: found}, 'UnprocessedKeys': unprocessed}
+
+    def update_item(self, TableName, Key, UpdateExpression, ExpressionAttributeValues, ConditionExpression):
+        time.sleep(self.latency)
+        with self.lock:
+            self.calls['update_item'] += 1
+            self.updates.append((Key['property_id'], ExpressionAttributeValues))
+
+
+def make_table(client):
+    return SimpleNamespace(name='properties', meta=SimpleNamespace(client=client))
+
+
+def make_changes(count):
+    return [{
+        'property_id': f"PROP#20250101_{i}",
+        'url': f"https://www.redfin.com/CA/San-Jose/{i}-Main-St-95125/home/{i}",
+        'old_price': 1000000,
+        'new_price': 950000
+    } for i in range(count)]
+
+
+def test_outcomes_and_tracking_fields():
+    items = {
+        'PROP#20250101_0': {'property_id': 'PROP#20250101_0'},
+        'PROP#20250101_1': {'property_id': 'PROP#20250101_1', 'original_price': 1200000, 'price_update_count': 2},
+    }
+    client = FakeClient(items, unprocessed_once=True)
+    results = batch_update_price_changes(make_changes(3), make_table(client))
+
+    assert (results['updated'], results['not_found'], results['failed']) == (2, 1, 0)
+    statuses = {o['property_id']: o['status'] for o in results['outcomes']}
+    assert statuses['PROP#20250101_2'] == 'not_found'
+
+    values = dict(client.updates)
+    # No original_price yet: totals are relative to the old price
+    assert float(values['PROP#20250101_0'][':total_change']) == -50000
+    # Existing original_price: totals are relative to it
+    assert float(values['PROP#20250101_1'][':total_change']) == -250000
+    assert float(values['PROP#20250101_1'][':total_change_pct']) == round(-250000 / 1200000 * 100, 2)
+
+
+def test_empty_changes():
+    results = batch_update_price_changes([], make_table(FakeClient({})))
+    assert results == {'updated': 0, 'not_found': 0, 'failed': 0, 'outcomes': []}
+
+
+def test_card_status_changes_are_timestamped():
+    client = FakeClient({})
+    results = batch_update_card_statuses([
+        {'property_id': 'PROP#20250101_0', 'old_status': 'Active', 'new_status': 'Pending'},
+        {'property_id': 'PROP#20250101_1', 'old_status': '', 'new_status': 'Active'},
+    ], make_table(client))
+
+    assert results == {'updated': 2, 'not_found': 0, 'failed': 0}
+    values = dict(client.updates)
+    assert values['PROP#20250101_0'][':status'] == 'Pending' and ':now' in values['PROP#20250101_0']
+    # The first status seen for a home is not a change
+    assert ':now' not in values['PROP#20250101_1']
+
+
+def run_sweep(count, latency, workers):
+    changes = make_changes(count)
+    client = FakeClient({c['property_id']: {'property_id': c['property_id']} for c in changes}, latency)
+    start = time.perf_counter()
+    results = batch_update_price_changes(changes, make_table(client), max_workers=workers)
+    return time.perf_counter() - start, results, client
+
+
+def test_updates_run_concurrently():
+    serial_time, _, client = run_sweep(40, 0.01, 1)
+    parallel_time, results, _ = run_sweep(40, 0.01, 8)
+
+    assert results['updated'] == 40
+    # One BatchGetItem round trip instead of a GetItem per change
+    assert client.calls['batch_get_item'] == 1
+    assert parallel_time < serial_time / 3
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--changes", type=int, default=200, help="Price changes per sweep")
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated seconds per DynamoDB call")
+    args = parser.parse_args()
+
+    # Previous writer: GetItem + UpdateItem per change, in series
+    legacy = args.changes * 2 * args.latency
+    print(f"{args.changes} changes, {args.latency * 1000:.0f} ms per call")
+    print(f"{'workers':>7}  {'seconds':>8}  {'calls':>6}")
+    print(f"{'legacy':>7}  {legacy:>8.2f}  {args.changes * 2:>6}")
+    for workers in (1, 4, 8, 16):
+        elapsed, _, client = run_sweep(args.changes, args.latency, workers)
+        print(f"{workers:>7}  {elapsed:>8.2f}  {sum(client.calls.values()):>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# test_property_index.py
+"""
+Checks for the Redfin home-ID property index used for price-change detection:
+the per-city lookups through the REDFIN# ID map and the full-scan fallback.
+
+    python test_property_index.py
+"""
+from decimal import Decimal
+from types import SimpleNamespace
+
+import boto3.dynamodb.conditions  # noqa: F401 - loaded by boto3.resource() in the Lambda
+
+import dynamodb_utils
+from dynamodb_utils import (
+    PropertyIndex, extract_property_id_from_url, extract_redfin_home_id, filter_untracked_urls,
+    get_item_home_id, load_all_existing_properties, load_properties_for_homes
+)
+
+
+class FakeTable:
+    """Returns the given items over two scan pages"""
+
+    def __init__(self, items):
+        self.items = items
+        self.scans = []
+
+    def scan(self, **kwargs):
+        self.scans.append(kwargs)
+        half = len(self.items) // 2
+        if 'ExclusiveStartKey' not in kwargs:
+            return {'Items': self.items[:half], 'LastEvaluatedKey': {'property_id': 'x'}}
+        return {'Items': self.items[half:]}
+
+
+class BatchGetClient:
+    """BatchGetItem over a dict keyed by (property_id, sort_key) or url"""
+
+    def __init__(self, items, unprocessed=False):
+        self.items = items
+        self.unprocessed = unprocessed
+        self.calls = []
+
+    def batch_get_item(self, RequestItems):
+        table_name, request = next(iter(RequestItems.items()))
+        self.calls.append([dict(k) for k in request['Keys']])
+        if self.unprocessed:
+            return {'Responses': {table_name: []}, 'UnprocessedKeys': RequestItems}
+        found = [self.items[key] for key in (tuple(k.values()) for k in request['Keys']) if key in self.items]
+        return {'Responses': {table_name: found}, 'UnprocessedKeys': {}}
+
+
+def make_client_table(client):
+    return SimpleNamespace(name='properties', meta=SimpleNamespace(client=client))
+
+
+def mapped_home(home_id, property_id, price):
+    return {
+        (f"REDFIN#{home_id}", 'REDFIN_ID'): {'property_id': f"REDFIN#{home_id}", 'canonical_id': property_id},
+        (property_id, 'META'): {'property_id': property_id, 'price': Decimal(str(price)),
+                                'analysis_date': '2025-03-01T00:00:00', 'card_status': 'Active'}
+    }
+
+
+def test_redfin_urls_resolve_to_home_id():
+    url = 'https://www.redfin.com/CA/San-Jose/123-Main-St-95125/home/77583431'
+    assert extract_redfin_home_id(url) == '77583431'
+    assert extract_property_id_from_url(url) == '77583431'
+    assert extract_redfin_home_id('https://www.redfin.com/CA/San-Jose/unit-4/home/193987083') == '193987083'
+    assert extract_redfin_home_id('https://www.redfin.com/city/17420/CA/San-Jose') is None
+
+
+def test_item_home_id_sources():
+    assert get_item_home_id({'redfin_id': '111', 'listing_url': '/home/222'}) == '111'
+    assert get_item_home_id({'redfin_id': '', 'listing_url': 'https://www.redfin.com/x/home/222'}) == '222'
+    assert get_item_home_id({'property_id': 'PROP#20250101_333'}) == '333'
+    assert get_item_home_id({'property_id': 'PROP#444'}) == '444'
+    assert get_item_home_id({'property_id': 'PROP#20250101_CA_San-Jose_x'}) is None
+
+
+def test_index_keeps_most_recent_duplicate():
+    table = FakeTable([
+        {'property_id': 'PROP#20250101_555', 'price': Decimal('900000'),
+         'listing_url': 'https://www.redfin.com/CA/San-Jose/1-A-St-95125/home/555',
+         'analysis_date': '2025-01-01T00:00:00', 'redfin_id': '555'},
+        {'property_id': 'PROP#20250301_555', 'price': Decimal('875000'),
+         'listing_url': 'https://www.redfin.com/CA/San-Jose/1-A-St-95125/home/555',
+         'analysis_date': '2025-03-01T00:00:00', 'redfin_id': '555'},
+        {'property_id': 'PROP#20250201_666', 'price': Decimal('650000'), 'listing_url': ''},
+        {'property_id': 'PROP#20250201_no-id', 'price': Decimal('1')},
+    ])
+
+    index = load_all_existing_properties(table)
+
+    assert set(index) == {'555', '666'}
+    assert index['555']['property_id'] == 'PROP#20250301_555'
+    assert index['555']['price'] == 875000
+    assert index['666']['price'] == 650000
+    assert 'redfin_id' in table.scans[0]['ProjectionExpression']
+
+
+def test_homes_resolve_through_the_id_map():
+    items = {}
+    items.update(mapped_home('555', 'PROP#20250101_555', 875000))
+    items.update(mapped_home('666', 'PROP#20250201_666', 650000))
+    client = BatchGetClient(items)
+
+    found = load_properties_for_homes(['555', '666', '777', '555', None], make_client_table(client))
+
+    assert set(found) == {'555', '666'}
+    assert found['555'] == {'property_id': 'PROP#20250101_555', 'price': 875000, 'listing_url': '',
+                            'analysis_date': '2025-03-01T00:00:00', 'card_status': 'Active'}
+    # One round trip for the mappings, one for the META items - no scan
+    assert len(client.calls) == 2
+    assert len(client.calls[0]) == 3
+    assert {k['sort_key'] for k in client.calls[1]} == {'META'}
+
+
+def test_shared_index_looks_each_home_up_once():
+    client = BatchGetClient(mapped_home('555', 'PROP#20250101_555', 875000))
+    index = PropertyIndex(make_client_table(client))
+
+    index.prefetch(['555', '777'])
+    index['555']['price'] = 860000  # a price change applied by one city
+    index.prefetch(['555', '777'])
+
+    assert index['555']['price'] == 860000 and '777' not in index
+    assert len(client.calls) == 2
+
+
+def test_failed_lookup_leaves_homes_unmatched(monkeypatch):
+    monkeypatch.setattr(dynamodb_utils, 'time', SimpleNamespace(sleep=lambda seconds: None))
+    index = PropertyIndex(make_client_table(BatchGetClient({}, unprocessed=True)))
+    index.prefetch(['555'])
+    assert index == {}
+
+
+def test_unchecked_urls_count_as_untracked(monkeypatch):
+    monkeypatch.setattr(dynamodb_utils, 'time', SimpleNamespace(sleep=lambda seconds: None))
+    urls = ['https://www.redfin.com/CO/Paonia/1-A-St-81428/home/1',
+            'https://www.redfin.com/CO/Paonia/2-B-St-81428/home/2']
+    client = BatchGetClient({(urls[0],): {'url': urls[0]}})
+    assert filter_untracked_urls(urls, make_client_table(client)) == [urls[1]]
+
+    # Throttled until the retries run out: never drop URLs the snapshot says are new
+    unchecked = BatchGetClient({}, unprocessed=True)
+    assert filter_untracked_urls(urls, make_client_table(unchecked)) == urls
+
+
+def main():
+    for name, test in sorted(globals().items()):
+        if name.startswith('test_') and callable(test):
+            if test.__code__.co_argcount:
+                print(f"skip {name} (needs pytest fixtures)")
+                continue
+            test()
+            print(f"ok  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# test_rate_limiter.py
+"""
+Behaviour checks for the token-bucket RateLimiter.
+
+The contention check runs threads that each pace a request, do some
+simulated work and record success - the pattern used by the collector and
+processor - against the token bucket and the previous lock-holding limiter.
+"""
+import random
+import threading
+import time
+
+from rate_limiter import RateLimiter, parse_retry_after
+
+
+class LegacyRateLimiter:
+    """The previous limiter: sleeps while holding its lock"""
+
+    def __init__(self, min_delay=3.0, max_delay=8.0):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.last_request_time = 0
+        self.lock = threading.Lock()
+        self.consecutive_errors = 0
+        self.backoff_multiplier = 1.0
+
+    def wait(self):
+        with self.lock:
+            current_time = time.time()
+            delay = random.uniform(self.min_delay, self.max_delay) * self.backoff_multiplier
+            elapsed = current_time - self.last_request_time
+            if elapsed < delay:
+                time.sleep(delay - elapsed)
+            self.last_request_time = time.time()
+
+    def record_success(self):
+        with self.lock:
+            self.consecutive_errors = 0
+            self.backoff_multiplier = max(self.backoff_multiplier * 0.9, 1.0)
+
+
+def run_contention(limiter, threads, total_requests, work_seconds):
+    """Return (requests/second, mean seconds spent in record_success)"""
+    remaining = [total_requests]
+    counter_lock = threading.Lock()
+    record_times = []
+
+    def worker():
+        while True:
+            with counter_lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            limiter.wait()
+            time.sleep(work_seconds)
+            start = time.perf_counter()
+            limiter.record_success()
+            elapsed = time.perf_counter() - start
+            with counter_lock:
+                record_times.append(elapsed)
+
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    duration = time.perf_counter() - start
+    return total_requests / duration, sum(record_times) / len(record_times)
+
+
+def test_requests_are_spaced_without_holding_the_lock():
+    limiter = RateLimiter(min_delay=0.05, max_delay=0.05)
+    limiter.wait()
+
+    sleeper = threading.Thread(target=limiter.wait)
+    sleeper.start()
+    time.sleep(0.01)
+
+    # Another thread can record outcomes while the sleeper waits for its slot
+    start = time.perf_counter()
+    limiter.record_success()
+    assert time.perf_counter() - start < 0.01
+
+    sleeper.join()
+    stats = limiter.stats()
+    assert stats['requests'] == 2
+    assert stats['max_wait_seconds'] >= 0.03
+
+
+def test_burst_allows_back_to_back_requests():
+    limiter = RateLimiter(min_delay=0.2, max_delay=0.2, burst=3)
+    limiter.next_send_time = time.monotonic() - 10
+
+    start = time.perf_counter()
+    for _ in range(3):
+        limiter.wait()
+    assert time.perf_counter() - start < 0.1
+
+
+def test_retry_after_pauses_all_requests():
+    limiter = RateLimiter(min_delay=0.0, max_delay=0.0)
+    limiter.record_error(is_rate_limit=True, retry_after='0.2')
+
+    start = time.perf_counter()
+    limiter.wait()
+    assert time.perf_counter() - start >= 0.15
+
+
+def test_aimd_concurrency_limit():
+    limiter = RateLimiter(min_delay=0.0, max_delay=0.0, max_concurrency=8)
+    assert limiter.stats()['concurrency_limit'] == 8
+
+    limiter.record_error(is_rate_limit=True)
+    assert limiter.stats()['concurrency_limit'] == 4
+    limiter.record_error(is_rate_limit=True)
+    limiter.record_error(is_rate_limit=True)
+    limiter.record_error(is_rate_limit=True)
+    assert limiter.stats()['concurrency_limit'] == 1
+
+    # Additive increase: roughly one extra slot per window of successes
+    for _ in range(2):
+        limiter.record_success()
+    assert limiter.stats()['concurrency_limit'] == 2
+
+    assert limiter.acquire_slot(timeout=0.1)
+    assert limiter.acquire_slot(timeout=0.1)
+    assert not limiter.acquire_slot(timeout=0.05)
+    limiter.release_slot()
+    assert limiter.acquire_slot(timeout=0.1)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('120') == 120.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('not a date') is None
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0
+
+
+def test_contention_throughput_scales_with_threads():
+    interval, work, requests = 0.005, 0.02, 80
+
+    single, _ = run_contention(RateLimiter(interval, interval), 1, requests, work)
+    parallel, record_wait = run_contention(RateLimiter(interval, interval), 8, requests, work)
+    _, legacy_record_wait = run_contention(LegacyRateLimiter(interval, interval), 8, requests, work)
+
+    print(f"\n1 thread: {single:.0f} req/s, 8 threads: {parallel:.0f} req/s "
+          f"(record_success {record_wait * 1000:.2f} ms vs legacy {legacy_record_wait * 1000:.2f} ms)")
+    assert parallel > single * 2
+    assert record_wait < legacy_record_wait
+
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# test_session_pool.py
+"""
+Checks for the warm-container session pool: reuse, recycling after N
+requests or a block, and cookie jar persistence between sessions.
+
+    python test_session_pool.py
+"""
+import os
+import tempfile
+from http.cookiejar import Cookie, CookieJar
+
+from session_pool import SessionPool
+
+
+class FakeCookies:
+    """Minimal stand-in for curl_cffi's Cookies (jar + set)"""
+
+    def __init__(self):
+        self.jar = CookieJar()
+
+    def set(self, name, value, domain='', path='/', secure=False):
+        self.jar.set_cookie(Cookie(
+            0, name, value, None, False, domain, bool(domain), domain.startswith('.'),
+            path, True, secure, None, False, None, None, {}
+        ))
+
+
+class FakeSession:
+    def __init__(self):
+        self.cookies = FakeCookies()
+        self.closed = False
+        self.headers = {}
+
+    def get(self, url, **kwargs):
+        return url
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(**kwargs):
+    created = []
+
+    def factory(logger=None):
+        session = FakeSession()
+        created.append(session)
+        return session
+
+    return SessionPool(factory, **kwargs), created
+
+
+def test_session_is_reused_across_invocations():
+    pool, created = make_pool()
+    session = pool.acquire()
+    session.get('https://www.redfin.com/')
+    session.close()
+    session.close()  # double close is a no-op
+
+    again = pool.acquire()
+    assert len(created) == 1
+    assert again.request_count == 1
+    assert again.headers is created[0].headers
+    assert pool.stats['reused'] == 1
+    assert not created[0].closed
+
+
+def test_session_recycled_after_max_requests():
+    pool, created = make_pool(max_requests_per_session=3)
+    session = pool.acquire()
+    for _ in range(3):
+        session.get('https://www.redfin.com/')
+    session.close()
+
+    assert created[0].closed
+    pool.acquire()
+    assert len(created) == 2
+    assert pool.stats['recycled'] == 1
+
+
+def test_blocked_session_discards_cookies():
+    with tempfile.TemporaryDirectory() as tmp:
+        cookie_path = os.path.join(tmp, 'cookies.json')
+        pool, created = make_pool(cookie_path=cookie_path)
+
+        session = pool.acquire()
+        session.cookies.set('RF_BROWSER_ID', 'abc', domain='.redfin.com')
+        session.close()
+        assert os.path.exists(cookie_path)
+
+        session = pool.acquire()
+        session.mark_blocked()
+        session.close()
+        assert created[0].closed
+        assert not os.path.exists(cookie_path)
+        assert pool.stats['blocked'] == 1
+
+
+def test_cookies_restored_into_new_session():
+    with tempfile.TemporaryDirectory() as tmp:
+        cookie_path = os.path.join(tmp, 'cookies.json')
+        pool, _ = make_pool(cookie_path=cookie_path)
+        session = pool.acquire()
+        session.cookies.set('RF_BROWSER_ID', 'abc', domain='.redfin.com')
+        session.close()
+
+        # A cold container with the same /tmp starts from the saved jar
+        cold_pool, _ = make_pool(cookie_path=cookie_path)
+        restored = cold_pool.acquire()
+        assert [(c.name, c.value) for c in restored.cookies.jar] == [('RF_BROWSER_ID', 'abc')]
+
+
+def main():
+    for name, test in sorted(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"ok  {name}")
+
+
+if __name__ == "__main__":
+    main()
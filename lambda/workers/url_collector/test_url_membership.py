@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# test_url_membership.py
+"""
+Checks for the tracked-URL membership snapshot: serialization round trip,
+incremental adds, staleness-driven rebuilds and the memory -> /tmp -> S3
+load order. S3 is replaced by an in-memory fake.
+"""
+import time
+import zlib
+
+import pytest
+
+import url_membership
+from url_membership import UrlMembership, load_url_membership, save_membership_snapshot
+
+
+def home_url(home_id):
+    return f"https://www.redfin.com/CO/Paonia/{home_id}-Main-St-81428/home/{home_id}"
+
+
+OTHER_URL = 'https://www.redfin.com/CO/Paonia/lot-without-id'
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = Body
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise Exception('An error occurred (NoSuchKey) when calling the GetObject operation')
+        body = self.objects[(Bucket, Key)]
+        return {'Body': type('Body', (), {'read': lambda self: body})()}
+
+
+class Scanner:
+    """Stands in for load_all_urls_from_tracking_table and counts full scans"""
+
+    def __init__(self, urls):
+        self.urls = urls
+        self.scans = 0
+
+    def __call__(self, table, logger=None):
+        self.scans += 1
+        return set(self.urls)
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch):
+    """No warm snapshot from another test, and a fake S3"""
+    s3 = FakeS3()
+    monkeypatch.setattr(url_membership, '_warm_snapshot', None)
+    monkeypatch.setattr(url_membership, '_s3_client', lambda: s3)
+    return s3
+
+
+def test_round_trip():
+    membership = UrlMembership.from_urls([home_url(3), home_url(1), OTHER_URL], built_at=1700000000.0)
+    membership.add(home_url(2))
+
+    restored = UrlMembership.from_bytes(membership.to_bytes())
+
+    assert restored.built_at == 1700000000.0
+    assert len(restored) == 4
+    for url in (home_url(1), home_url(2), home_url(3), OTHER_URL):
+        assert url in restored
+    assert home_url(4) not in restored
+    # Matching is by home ID, not by the exact URL
+    assert 'https://www.redfin.com/CO/Paonia/renamed/home/3' in restored
+
+
+def test_unknown_version_is_rejected():
+    data = UrlMembership.from_urls([home_url(1)]).to_bytes()
+    version = url_membership.SNAPSHOT_VERSION
+    raw = zlib.decompress(data).replace(f'"version": {version}'.encode(), f'"version": {version + 1}'.encode())
+    with pytest.raises(ValueError):
+        UrlMembership.from_bytes(zlib.compress(raw))
+
+
+def test_incremental_add():
+    membership = UrlMembership.from_urls([home_url(1)])
+    assert not membership.dirty
+
+    membership.add(home_url(1))
+    assert not membership.dirty
+
+    membership.update([home_url(5), OTHER_URL])
+    assert membership.dirty
+    assert home_url(5) in membership and OTHER_URL in membership
+    assert len(membership) == 3
+
+    membership.compact()
+    assert home_url(5) in membership and len(membership) == 3
+
+
+def test_fresh_snapshot_skips_the_scan(tmp_path):
+    path = str(tmp_path / 'membership.snapshot')
+    scanner = Scanner([home_url(1), home_url(2)])
+
+    first = load_url_membership(None, scanner, path=path)
+    second = load_url_membership(None, scanner, path=path)
+
+    assert scanner.scans == 1
+    assert second is first and home_url(2) in second
+
+
+def test_stale_snapshot_is_rebuilt(tmp_path, monkeypatch):
+    path = str(tmp_path / 'membership.snapshot')
+    save_membership_snapshot(UrlMembership.from_urls([home_url(1)], built_at=time.time() - 2 * 3600), path=path)
+    monkeypatch.setattr(url_membership, '_warm_snapshot', None)
+    scanner = Scanner([home_url(1), home_url(9)])
+
+    assert home_url(9) not in load_url_membership(None, scanner, path=path, max_age_hours=3)
+    assert scanner.scans == 0
+
+    monkeypatch.setattr(url_membership, '_warm_snapshot', None)
+    rebuilt = load_url_membership(None, scanner, path=path, max_age_hours=1)
+    assert scanner.scans == 1
+    assert home_url(9) in rebuilt and rebuilt.age_seconds() < 60
+    # The rebuild replaces the file for the next cold start
+    with open(path, 'rb') as f:
+        assert home_url(9) in UrlMembership.from_bytes(f.read())
+
+
+def test_cold_start_falls_back_to_s3(tmp_path, isolated):
+    bucket = 'collector-state'
+    save_membership_snapshot(UrlMembership.from_urls([home_url(7)]), path=str(tmp_path / 'old'), bucket=bucket)
+    assert (bucket, url_membership.DEFAULT_SNAPSHOT_KEY) in isolated.objects
+
+    # New container: nothing in memory or /tmp
+    url_membership._warm_snapshot = None
+    path = str(tmp_path / 'new')
+    scanner = Scanner([])
+    membership = load_url_membership(None, scanner, path=path, bucket=bucket)
+
+    assert scanner.scans == 0
+    assert home_url(7) in membership
+
+
+def test_unreadable_tmp_file_falls_back_to_s3(tmp_path, isolated):
+    bucket = 'collector-state'
+    path = str(tmp_path / 'membership.snapshot')
+    save_membership_snapshot(UrlMembership.from_urls([home_url(8)]), path=None, bucket=bucket)
+    url_membership._warm_snapshot = None
+    with open(path, 'wb') as f:
+        f.write(b'not a snapshot')
+
+    scanner = Scanner([])
+    assert home_url(8) in load_url_membership(None, scanner, path=path, bucket=bucket)
+    assert scanner.scans == 0
+
+
+def test_no_snapshot_anywhere_scans(tmp_path):
+    scanner = Scanner([home_url(1)])
+    membership = load_url_membership(None, scanner, path=str(tmp_path / 'missing'), bucket='collector-state')
+    assert scanner.scans == 1
+    assert home_url(1) in membership and not membership.dirty
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# test_url_publisher.py
+"""
+Checks for publishing newly tracked URLs to the processing queue.
+
+A local in-memory queue stands in for SQS (SendMessageBatch with optional
+per-entry failures); run as a script to publish a batch and print the stats:
+
+    python test_url_publisher.py --urls 95
+"""
+import argparse
+import json
+
+import url_publisher
+from url_publisher import MAX_BATCH_MESSAGES, UrlPublisher, get_url_publisher
+
+
+class LocalQueue:
+    """SendMessageBatch over a list; the first `fail_entries` entries fail once"""
+
+    def __init__(self, fail_entries=0, sender_fault=False):
+        self.messages = []
+        self.fail_entries = fail_entries
+        self.sender_fault = sender_fault
+        self.calls = 0
+
+    def send_message_batch(self, QueueUrl, Entries):
+        assert len(Entries) <= MAX_BATCH_MESSAGES
+        self.calls += 1
+        failing = Entries[:self.fail_entries]
+        self.fail_entries = 0
+        for entry in Entries[len(failing):]:
+            self.messages.append(json.loads(entry['MessageBody']))
+        return {
+            'Successful': [{'Id': entry['Id']} for entry in Entries[len(failing):]],
+            'Failed': [{'Id': entry['Id'], 'SenderFault': self.sender_fault, 'Code': 'InternalError'}
+                       for entry in failing]
+        }
+
+
+def new_urls(count):
+    return [{'url': f"https://www.redfin.com/CA/San-Jose/{i}-Main-St-95125/home/{i}", 'price': 900000 + i}
+            for i in range(count)]
+
+
+def test_publish_batches_by_ten(monkeypatch):
+    monkeypatch.setattr(url_publisher.time, 'sleep', lambda seconds: None)
+    queue = LocalQueue()
+    publisher = UrlPublisher('local://queue', sqs_client=queue)
+
+    assert publisher.publish(new_urls(23), city='San Jose') == 23
+    assert queue.calls == 3
+    assert queue.messages[0] == {'url': new_urls(1)[0]['url'], 'city': 'San Jose', 'price': 900000}
+    assert publisher.stats == {'sent': 23, 'failed': 0, 'calls': 3}
+
+
+def test_failed_entries_are_retried(monkeypatch):
+    monkeypatch.setattr(url_publisher.time, 'sleep', lambda seconds: None)
+    queue = LocalQueue(fail_entries=4)
+    publisher = UrlPublisher('local://queue', sqs_client=queue)
+
+    assert publisher.publish(new_urls(10)) == 10
+    assert len({m['url'] for m in queue.messages}) == 10
+    assert publisher.stats['calls'] == 2
+
+
+def test_sender_faults_are_not_retried(monkeypatch):
+    monkeypatch.setattr(url_publisher.time, 'sleep', lambda seconds: None)
+    queue = LocalQueue(fail_entries=2, sender_fault=True)
+    publisher = UrlPublisher('local://queue', sqs_client=queue)
+
+    assert publisher.publish(new_urls(5)) == 3
+    assert publisher.stats == {'sent': 3, 'failed': 2, 'calls': 1}
+
+
+def test_no_queue_configured():
+    assert get_url_publisher('') is None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--urls", type=int, default=95, help="New URLs to publish")
+    args = parser.parse_args()
+
+    url_publisher.time.sleep = lambda seconds: None
+    queue = LocalQueue(fail_entries=3)
+    publisher = UrlPublisher('local://queue', sqs_client=queue)
+    sent = publisher.publish(new_urls(args.urls), city='San Jose')
+    print(f"{sent}/{args.urls} queued, {len(queue.messages)} messages, stats {publisher.stats}")
+
+
+if __name__ == "__main__":
+    main()
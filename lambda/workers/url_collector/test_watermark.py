@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# test_watermark.py
+"""
+Checks for newest-first collection: the stale-page test, the per-city
+watermark item and the periodic full sweep that ignores the watermark.
+"""
+from datetime import datetime, timedelta
+
+import app
+from core_scraper import full_sweep_due, reached_watermark
+from dynamodb_utils import create_watermark_key, load_city_watermark, save_city_watermark
+
+
+class FakeTable:
+    """get_item/update_item over a dict, enough for SET a = :a, b = :b"""
+
+    def __init__(self):
+        self.items = {}
+
+    def get_item(self, Key):
+        item = self.items.get((Key['property_id'], Key['sort_key']))
+        return {'Item': dict(item)} if item else {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues):
+        item = self.items.setdefault((Key['property_id'], Key['sort_key']), dict(Key))
+        for assignment in UpdateExpression[len('SET '):].split(','):
+            name, value = (part.strip() for part in assignment.split('='))
+            item[name] = ExpressionAttributeValues[value]
+
+
+def listing(home_id):
+    return {'url': f"https://www.redfin.com/CO/Paonia/{home_id}-Main-St-81428/home/{home_id}",
+            'property_id': str(home_id), 'price': 400000}
+
+
+def test_page_with_the_watermark_listing_is_stale():
+    page = [listing(3), listing(2)]
+    assert reached_watermark(page, watermark={'newest_url': listing(2)['url']})
+    assert reached_watermark(page, watermark={'newest_home_id': '3'})
+    assert not reached_watermark(page, watermark={'newest_home_id': '1'})
+
+
+def test_page_of_known_urls_is_stale():
+    page = [listing(3), listing(2)]
+    assert reached_watermark(page, known_urls={listing(3)['url'], listing(2)['url']})
+    assert not reached_watermark(page, known_urls={listing(3)['url']})
+    assert not reached_watermark([], known_urls=set())
+    assert not reached_watermark(page)
+
+
+def test_watermark_round_trip_keeps_the_last_full_sweep():
+    table = FakeTable()
+    assert load_city_watermark(table, 'Paonia', 'CO') == {}
+
+    assert save_city_watermark(table, 'Paonia', 'CO', listing(5), full_sweep=True)
+    swept = load_city_watermark(table, 'Paonia', 'CO')
+    assert (swept['newest_url'], swept['newest_home_id']) == (listing(5)['url'], '5')
+    assert swept['full_sweep_at'] == swept['updated_at']
+
+    assert save_city_watermark(table, 'Paonia', 'CO', listing(6))
+    watermark = load_city_watermark(table, 'Paonia', 'CO')
+    assert watermark['newest_home_id'] == '6'
+    assert watermark['full_sweep_at'] == swept['full_sweep_at']
+
+    # Stored under its own sort key, outside every META scan
+    assert ('COLLECTOR#CO#Paonia', 'WATERMARK') in table.items
+    assert create_watermark_key('Paonia', 'co')['property_id'] == 'COLLECTOR#CO#Paonia'
+    assert not save_city_watermark(table, 'Paonia', 'CO', {})
+
+
+def test_full_sweep_due():
+    now = datetime(2025, 6, 1, 12, 0)
+    assert full_sweep_due({}, 24, now)
+    assert full_sweep_due({'full_sweep_at': 'garbage'}, 24, now)
+    assert not full_sweep_due({'full_sweep_at': (now - timedelta(hours=2)).isoformat()}, 24, now)
+    assert full_sweep_due({'full_sweep_at': (now - timedelta(hours=25)).isoformat()}, 24, now)
+    assert not full_sweep_due({}, 0, now)
+
+
+def run_city(monkeypatch, table):
+    """collect_city_urls with Redfin/DynamoDB faked; returns the collector's paging arguments"""
+    calls = []
+
+    def collect_redfin_listings(**kwargs):
+        calls.append(kwargs)
+        return [listing(9), listing(8)]
+
+    monkeypatch.setattr(app, 'open_table', lambda name, session=None: table)
+    monkeypatch.setattr(app, 'create_session', lambda logger=None: type('S', (), {'close': lambda self: None})())
+    monkeypatch.setattr(app, 'collect_redfin_listings', collect_redfin_listings)
+    monkeypatch.setattr(app, 'put_urls_batch_to_tracking_table', lambda urls, table, city=None, logger=None: len(urls))
+
+    config = {'newest_first': True, 'full_sweep_hours': 24, 'max_pages': 5, 'price_update_workers': 1}
+    result = app.collect_city_urls({'city': 'Paonia', 'state': 'CO', 'city_id': 1}, config, set(), {},
+                                   'urls', 'properties', None)
+    return result, calls[0]
+
+
+def test_collection_stops_early_between_full_sweeps(monkeypatch):
+    table = FakeTable()
+    save_city_watermark(table, 'Paonia', 'CO', listing(5), full_sweep=True)
+
+    result, kwargs = run_city(monkeypatch, table)
+    assert not result['full_sweep']
+    assert kwargs['newest_first'] and kwargs['known_urls'] is not None
+    assert kwargs['watermark']['newest_home_id'] == '5'
+    assert load_city_watermark(table, 'Paonia', 'CO')['newest_home_id'] == '9'
+
+
+def test_stale_sweep_pages_through_everything(monkeypatch):
+    table = FakeTable()
+    save_city_watermark(table, 'Paonia', 'CO', listing(5), full_sweep=True)
+    stale = (datetime.now() - timedelta(days=2)).isoformat()
+    table.items[('COLLECTOR#CO#Paonia', 'WATERMARK')]['full_sweep_at'] = stale
+
+    result, kwargs = run_city(monkeypatch, table)
+    assert result['full_sweep']
+    # Still sorted newest-first, but nothing to stop at
+    assert kwargs['newest_first'] and kwargs['known_urls'] is None and kwargs['watermark'] is None
+    assert load_city_watermark(table, 'Paonia', 'CO')['full_sweep_at'] > stale
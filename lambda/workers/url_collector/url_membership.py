@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Compact URL-membership snapshot for the URL tracking table
+Replaces the full tracking-table scan at collector start with a sorted array
+of Redfin home IDs, kept warm across invocations and persisted to /tmp and S3
+"""
+import os
+import re
+import json
+import zlib
+import time
+import bisect
+import threading
+from array import array
+
+import boto3
+
+DEFAULT_SNAPSHOT_PATH = '/tmp/url_membership.snapshot'
+DEFAULT_SNAPSHOT_KEY = 'collector-state/url_membership.snapshot'
+SNAPSHOT_VERSION = 1
+
+HOME_ID_PATTERN = re.compile(r'/home/(\d+)')
+
+# Snapshot kept in memory between warm Lambda invocations
+_warm_snapshot = None
+
+
+def home_id_from_url(url):
+    """Return the Redfin numeric home ID in a URL, or None"""
+    match = HOME_ID_PATTERN.search(url or '')
+    return int(match.group(1)) if match else None
+
+
+class UrlMembership:
+    """
+    Set-like membership test for tracked URLs
+
+    Redfin URLs are stored as a sorted int64 array of home IDs (8 bytes each,
+    binary search lookups); anything without a home ID falls back to a set of
+    URL strings. New URLs go to a small pending set until compact() merges them.
+    """
+
+    def __init__(self, home_ids=None, other_urls=None, built_at=None):
+        self._ids = array('q', sorted(set(home_ids or [])))
+        self._pending = set()
+        self._other_urls = set(other_urls or [])
+        self.built_at = built_at or time.time()
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_urls(cls, urls, built_at=None):
+        home_ids = []
+        other_urls = []
+        for url in urls:
+            home_id = home_id_from_url(url)
+            if home_id is None:
+                other_urls.append(url)
+            else:
+                home_ids.append(home_id)
+        return cls(home_ids, other_urls, built_at)
+
+    def __contains__(self, url):
+        home_id = home_id_from_url(url)
+        if home_id is None:
+            return url in self._other_urls
+        if home_id in self._pending:
+            return True
+        index = bisect.bisect_left(self._ids, home_id)
+        return index < len(self._ids) and self._ids[index] == home_id
+
+    def __len__(self):
+        return len(self._ids) + len(self._pending) + len(self._other_urls)
+
+    def add(self, url):
+        if url in self:
+            return
+        with self.lock:
+            home_id = home_id_from_url(url)
+            if home_id is None:
+                self._other_urls.add(url)
+            else:
+                self._pending.add(home_id)
+            self.dirty = True
+
+    def update(self, urls):
+        for url in urls:
+            self.add(url)
+
+    def compact(self):
+        """Merge pending IDs into the sorted array"""
+        with self.lock:
+            if self._pending:
+                merged = set(self._ids)
+                merged.update(self._pending)
+                self._ids = array('q', sorted(merged))
+                self._pending = set()
+
+    def to_bytes(self):
+        self.compact()
+        header = json.dumps({
+            'version': SNAPSHOT_VERSION,
+            'built_at': self.built_at,
+            'count': len(self._ids),
+            'other_urls': sorted(self._other_urls)
+        }).encode('utf-8')
+        return zlib.compress(len(header).to_bytes(4, 'big') + header + self._ids.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data):
+        raw = zlib.decompress(data)
+        header_length = int.from_bytes(raw[:4], 'big')
+        header = json.loads(raw[4:4 + header_length])
+        if header.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {header.get('version')}")
+
+        membership = cls(other_urls=header.get('other_urls', []), built_at=header.get('built_at'))
+        ids = array('q')
+        ids.frombytes(raw[4 + header_length:])
+        membership._ids = ids
+        return membership
+
+    def age_seconds(self):
+        return time.time() - self.built_at
+
+
+def _s3_client():
+    return boto3.client('s3', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
+
+
+def save_membership_snapshot(membership, path=DEFAULT_SNAPSHOT_PATH, bucket=None,
+                             key=DEFAULT_SNAPSHOT_KEY, logger=None):
+    """Persist the snapshot to /tmp and (optionally) S3"""
+    global _warm_snapshot
+    _warm_snapshot = membership
+
+    data = membership.to_bytes()
+
+    if path:
+        try:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            if logger:
+                logger.warning(f"Failed to write membership snapshot to {path}: {str(e)}")
+
+    if bucket:
+        try:
+            _s3_client().put_object(Bucket=bucket, Key=key, Body=data)
+        except Exception as e:
+            if logger:
+                logger.warning(f"Failed to upload membership snapshot: {str(e)}")
+                return False
+
+    membership.dirty = False
+
+    if logger:
+        logger.debug(f"Saved membership snapshot ({len(membership)} URLs, {len(data)} bytes)")
+
+    return True
+
+
+def _read_snapshot(path, bucket, key, logger=None):
+    """Read a snapshot from /tmp first, then S3"""
+    if path and os.path.exists(path):
+        try:
+            with open(path, 'rb') as f:
+                return UrlMembership.from_bytes(f.read())
+        except (OSError, ValueError, zlib.error) as e:
+            if logger:
+                logger.warning(f"Ignoring unreadable membership snapshot {path}: {str(e)}")
+
+    if bucket:
+        try:
+            response = _s3_client().get_object(Bucket=bucket, Key=key)
+            return UrlMembership.from_bytes(response['Body'].read())
+        except Exception as e:
+            if logger and 'NoSuchKey' not in str(e):
+                logger.warning(f"Failed to read membership snapshot from S3: {str(e)}")
+
+    return None
+
+
+def load_url_membership(url_tracking_table, load_all_urls, path=DEFAULT_SNAPSHOT_PATH, bucket=None,
+                        key=DEFAULT_SNAPSHOT_KEY, max_age_hours=24, logger=None):
+    """
+    Load the tracked-URL membership, scanning the table only when no fresh snapshot exists
+
+    Args:
+        url_tracking_table: DynamoDB URL tracking table
+        load_all_urls: Callable(table, logger) returning all tracked URLs (full scan)
+        path: Local snapshot path (survives warm invocations)
+        bucket: S3 bucket for the snapshot (survives cold starts)
+        max_age_hours: Rebuild from a full scan when the snapshot is older than this
+
+    Returns:
+        UrlMembership
+    """
+    global _warm_snapshot
+    max_age_seconds = max_age_hours * 3600
+
+    membership = _warm_snapshot
+    source = 'memory'
+    if membership is None or membership.age_seconds() > max_age_seconds:
+        membership = _read_snapshot(path, bucket, key, logger)
+        source = 'snapshot'
+
+    if membership is not None and membership.age_seconds() <= max_age_seconds:
+        _warm_snapshot = membership
+        if logger:
+            logger.info(f"Loaded {len(membership)} tracked URLs from {source} "
+                        f"(age {membership.age_seconds() / 60:.0f} min)")
+        return membership
+
+    if logger:
+        logger.info("No fresh membership snapshot - rebuilding from tracking table scan")
+
+    membership = UrlMembership.from_urls(load_all_urls(url_tracking_table, logger))
+    save_membership_snapshot(membership, path, bucket, key, logger)
+    return membership
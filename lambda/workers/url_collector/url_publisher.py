@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Publishes newly tracked property URLs to the processing queue
+The property processor consumes the queue through an SQS event source, so new
+URLs are processed as they are discovered instead of on the next polling run
+"""
+import os
+import json
+import time
+import threading
+
+import boto3
+
+# SendMessageBatch limit
+MAX_BATCH_MESSAGES = 10
+
+
+class UrlPublisher:
+    """
+    Sends {'url', 'city', 'price'} messages to an SQS queue, 10 per call
+
+    Failed entries are retried with backoff; URLs that still fail stay
+    pending in the tracking table, where the polling processor finds them.
+    """
+
+    def __init__(self, queue_url, sqs_client=None, max_attempts=3, logger=None):
+        self.queue_url = queue_url
+        self.sqs = sqs_client or boto3.client('sqs', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
+        self.max_attempts = max_attempts
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.stats = {'sent': 0, 'failed': 0, 'calls': 0}
+
+    def _count(self, **increments):
+        with self.lock:
+            for stat, value in increments.items():
+                self.stats[stat] += value
+
+    def publish(self, url_items, city=None):
+        """
+        Queue URL items (dicts with url/city/price, or bare URLs)
+
+        Returns the number of URLs queued
+        """
+        messages = []
+        for url_item in url_items:
+            if isinstance(url_item, dict):
+                body = {'url': url_item['url'], 'city': url_item.get('city') or city or '',
+                        'price': url_item.get('price', 0)}
+            else:
+                body = {'url': url_item, 'city': city or '', 'price': 0}
+            messages.append(json.dumps(body, default=str))
+
+        sent = 0
+        for start in range(0, len(messages), MAX_BATCH_MESSAGES):
+            sent += self._send_batch(messages[start:start + MAX_BATCH_MESSAGES])
+
+        if self.logger and messages:
+            self.logger.debug(f"Queued {sent}/{len(messages)} new URLs for processing")
+
+        return sent
+
+    def _send_batch(self, bodies):
+        entries = [{'Id': str(index), 'MessageBody': body} for index, body in enumerate(bodies)]
+        sent = 0
+
+        for attempt in range(self.max_attempts):
+            try:
+                self._count(calls=1)
+                response = self.sqs.send_message_batch(QueueUrl=self.queue_url, Entries=entries)
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning(f"SendMessageBatch failed: {str(e)}")
+                response = {'Failed': [{'Id': entry['Id'], 'SenderFault': False} for entry in entries]}
+
+            sent += len(response.get('Successful', []))
+            failed_ids = {f['Id'] for f in response.get('Failed', []) if not f.get('SenderFault')}
+            entries = [entry for entry in entries if entry['Id'] in failed_ids]
+            if not entries:
+                break
+            time.sleep(0.2 * (2 ** attempt))
+
+        failed = len(bodies) - sent
+        self._count(sent=sent, failed=failed)
+        if failed and self.logger:
+            self.logger.warning(f"{failed} URLs not queued, they stay pending for the polling processor")
+
+        return sent
+
+
+def get_url_publisher(queue_url, logger=None):
+    """Build the publisher when a queue is configured, else None"""
+    if not queue_url:
+        return None
+    return UrlPublisher(queue_url, logger=logger)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Benchmark the Redfin page extractors on saved pages
+
+    python scripts/bench_extractors.py listing --iterations 20
+    python scripts/bench_extractors.py detail --html page1.html page2.html --iterations 50
+    python scripts/bench_extractors.py parse-pool --pages 200 --processes 1 2 4
+
+Pages default to the Lambda's testdata/ directory. Each target imports the
+modules of its own Lambda (url_collector for listing, property_processor
+for detail and parse-pool), so run one target per invocation.
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+WORKERS_DIR = Path(__file__).resolve().parent.parent / 'lambda' / 'workers'
+DETAIL_URL = 'https://www.redfin.com/CA/San-Jose/1234-Willow-Glen-Way-95125/home/1234567'
+
+
+def use_lambda(name):
+    """Make a Lambda's modules importable"""
+    sys.path.insert(0, str(WORKERS_DIR / name))
+
+
+def bench_listing(args):
+    """Search-results extractor: soup vs fast (lxml) wall time"""
+    use_lambda('url_collector')
+    from core_scraper import extract_listing_urls_from_redfin_html, extract_listing_urls_from_redfin_html_fast
+    from saved_pages import load_saved_pages
+
+    pages = load_saved_pages('redfin_search_*.html', args.html)
+    if not pages:
+        sys.exit("No saved search pages found")
+
+    mismatches = [name for name, html_text in pages
+                  if extract_listing_urls_from_redfin_html(html_text, 'Paonia', 'CO') !=
+                  extract_listing_urls_from_redfin_html_fast(html_text, 'Paonia', 'CO')]
+    for name in mismatches:
+        print(f"Output differs on {name}")
+
+    def run(extractor):
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            for _, html_text in pages:
+                extractor(html_text, 'Paonia', 'CO')
+        return time.perf_counter() - start
+
+    total_pages = len(pages) * args.iterations
+    soup_seconds = run(extract_listing_urls_from_redfin_html)
+    fast_seconds = run(extract_listing_urls_from_redfin_html_fast)
+    print(f"Pages parsed per extractor: {total_pages}")
+    print(f"  soup: {soup_seconds:.3f}s  ({total_pages / soup_seconds:.1f} pages/s)")
+    print(f"  fast: {fast_seconds:.3f}s  ({total_pages / fast_seconds:.1f} pages/s)")
+    print(f"  speedup: {soup_seconds / fast_seconds:.1f}x")
+    return 1 if mismatches else 0
+
+
+def bench_detail(args):
+    """Detail page extractor: soup vs fast (lxml) CPU time per page"""
+    use_lambda('property_processor')
+    from core_scraper import parse_redfin_property_page, parse_redfin_property_page_fast
+    from saved_pages import load_saved_pages, without_timestamp
+
+    pages = load_saved_pages('redfin_detail_*.html', args.html)
+    if not pages:
+        sys.exit("No saved detail pages found")
+
+    mismatches = [name for name, html_text in pages
+                  if without_timestamp(parse_redfin_property_page(html_text, DETAIL_URL)) !=
+                  without_timestamp(parse_redfin_property_page_fast(html_text, DETAIL_URL))]
+    for name in mismatches:
+        print(f"Output differs on {name}")
+
+    def run(extractor):
+        start = time.process_time()
+        for _ in range(args.iterations):
+            for _, html_text in pages:
+                extractor(html_text, DETAIL_URL)
+        return time.process_time() - start
+
+    runs = args.iterations * len(pages)
+    soup_seconds = run(parse_redfin_property_page)
+    fast_seconds = run(parse_redfin_property_page_fast)
+    print(f"soup: {soup_seconds / runs * 1000:.2f} ms CPU/page")
+    print(f"fast: {fast_seconds / runs * 1000:.2f} ms CPU/page ({soup_seconds / fast_seconds:.1f}x)")
+    return 1 if mismatches else 0
+
+
+def bench_parse_pool(args):
+    """Detail page parsing inline vs in 1..N worker processes"""
+    use_lambda('property_processor')
+    from parse_pool import ParsePool, parse_page_bytes
+    from saved_pages import load_saved_pages
+
+    saved = [html_bytes for _, html_bytes in load_saved_pages('redfin_detail_*.html', args.html, binary=True)]
+    if not saved:
+        sys.exit("No saved detail pages found")
+    pages = [saved[i % len(saved)] for i in range(args.pages)]
+
+    def run(processes):
+        if not processes:
+            start = time.perf_counter()
+            for html_bytes in pages:
+                parse_page_bytes(html_bytes, DETAIL_URL)
+            return time.perf_counter() - start, 'inline'
+
+        pool = ParsePool(processes)
+        try:
+            start = time.perf_counter()
+            futures = [pool.submit(html_bytes, DETAIL_URL) for html_bytes in pages]
+            for future in futures:
+                future.result()
+            return time.perf_counter() - start, pool.kind
+        finally:
+            pool.shutdown()
+
+    print(f"{args.pages} pages, {os.cpu_count()} CPU(s)")
+    print(f"{'processes':>9}  {'kind':>12}  {'seconds':>8}  {'pages/s':>8}")
+    for processes in [0] + args.processes:
+        elapsed, kind = run(processes)
+        print(f"{processes:>9}  {kind:>12}  {elapsed:>8.2f}  {args.pages / elapsed:>8.1f}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Redfin page extractors")
+    targets = parser.add_subparsers(dest='target', required=True)
+
+    listing = targets.add_parser('listing', help=bench_listing.__doc__)
+    listing.add_argument("--html", nargs="*", help="Saved Redfin search pages (default: testdata/)")
+    listing.add_argument("--iterations", type=int, default=20, help="Passes over the page set per extractor")
+    listing.set_defaults(run=bench_listing)
+
+    detail = targets.add_parser('detail', help=bench_detail.__doc__)
+    detail.add_argument("--html", nargs="*", help="Saved Redfin detail pages (default: testdata/)")
+    detail.add_argument("--iterations", type=int, default=50, help="Parses per page per extractor")
+    detail.set_defaults(run=bench_detail)
+
+    pool = targets.add_parser('parse-pool', help=bench_parse_pool.__doc__)
+    pool.add_argument("--html", nargs="*", help="Saved Redfin detail pages (default: testdata/)")
+    pool.add_argument("--pages", type=int, default=200, help="Pages parsed per run")
+    pool.add_argument("--processes", type=int, nargs="*", default=[1, 2, 4], help="Worker process counts")
+    pool.set_defaults(run=bench_parse_pool)
+
+    args = parser.parse_args()
+    sys.exit(args.run(args))
+
+
+if __name__ == "__main__":
+    main()